@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+"""
+准入控制 - 按令牌 / 应用限制同时进行的上游调用数，超出部分进入有界等待队列；
+队列已满或排队超过期限时快速拒绝，并给出建议的重试等待时间
+"""
+
+import asyncio
+import bisect
+import math
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional, Sequence
+
+# 排队等待时间分桶（秒）
+WAIT_TIME_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# 到达时队列深度分桶
+QUEUE_DEPTH_BUCKETS = (0, 1, 2, 4, 8, 16, 32, 64, 128)
+
+
+class AdmissionRejected(Exception):
+    """请求未被准入"""
+
+    def __init__(self, name: str, status_code: int, reason: str, retry_after: float):
+        self.name = name
+        self.status_code = status_code
+        self.reason = reason
+        self.retry_after = retry_after
+        super().__init__(f"上游并发已满（{name}，{reason}），请 {math.ceil(retry_after)} 秒后重试")
+
+
+class Histogram:
+    """固定分桶直方图"""
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> Optional[float]:
+        """按分桶上界估算分位数；落在最后一个开区间时返回None"""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= target:
+                return bound
+        return None
+
+    def snapshot(self) -> Dict[str, Any]:
+        buckets = {f"le_{bound:g}": count for bound, count in zip(self.buckets, self.counts)}
+        buckets["le_inf"] = self.counts[-1]
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 4),
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+            "buckets": buckets
+        }
+
+
+class ConcurrencyLimiter:
+    """
+    并发限制器
+
+    释放时把名额直接交给队首的等待者，不会被新到达的请求插队。
+    """
+
+    def __init__(self, name: str, max_concurrency: int, max_queue: int):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.in_flight = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._hold_started: Dict[int, float] = {}
+        self.avg_hold = 0.0  # 名额占用时长的指数滑动平均，用于估算Retry-After
+        self.admitted = 0
+        self.rejected_full = 0
+        self.rejected_timeout = 0
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    @property
+    def idle(self) -> bool:
+        return self.in_flight == 0 and not self._waiters
+
+    def retry_after(self) -> float:
+        """按平均占用时长估算排到当前队尾所需的时间"""
+        hold = self.avg_hold or 1.0
+        return max(1.0, hold * (len(self._waiters) + 1) / self.max_concurrency)
+
+    async def acquire(self, deadline: float) -> float:
+        """
+        获取一个名额，返回排队等待的秒数
+
+        Raises:
+            AdmissionRejected: 队列已满（429）或超过排队期限（503）
+        """
+        if self.in_flight < self.max_concurrency and not self._waiters:
+            self.in_flight += 1
+            self.admitted += 1
+            return 0.0
+
+        if len(self._waiters) >= self.max_queue:
+            self.rejected_full += 1
+            raise AdmissionRejected(self.name, 429, "等待队列已满", self.retry_after())
+
+        started = time.monotonic()
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, timeout=max(0.0, deadline - started))
+        except asyncio.TimeoutError:
+            if waiter.done() and not waiter.cancelled():
+                # 超时与移交同时发生：名额已交给本等待者，归还给下一个等待者
+                self.release()
+            else:
+                self._discard(waiter)
+            self.rejected_timeout += 1
+            raise AdmissionRejected(self.name, 503, "排队超时", self.retry_after())
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # 名额已移交但调用者被取消，归还给下一个等待者
+                self.release()
+            else:
+                self._discard(waiter)
+            raise
+
+        self.admitted += 1
+        return time.monotonic() - started
+
+    def release(self, held: Optional[float] = None):
+        """归还名额；held为本次占用时长"""
+        if held is not None:
+            self.avg_hold = held if not self.avg_hold else 0.8 * self.avg_hold + 0.2 * held
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.in_flight -= 1
+
+    def _discard(self, waiter: asyncio.Future):
+        try:
+            self._waiters.remove(waiter)
+        except ValueError:
+            pass
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "in_flight": self.in_flight,
+            "queued": len(self._waiters),
+            "admitted": self.admitted,
+            "rejected_full": self.rejected_full,
+            "rejected_timeout": self.rejected_timeout,
+            "avg_hold": round(self.avg_hold, 3)
+        }
+
+
+class AdmissionTicket:
+    """已获得的准入名额，release() 可重复调用"""
+
+    __slots__ = ('_limiters', '_started', 'released')
+
+    def __init__(self, limiters: List[ConcurrencyLimiter]):
+        self._limiters = limiters
+        self._started = time.monotonic()
+        self.released = False
+
+    def release(self):
+        if self.released:
+            return
+        self.released = True
+        held = time.monotonic() - self._started
+        for limiter in reversed(self._limiters):
+            limiter.release(held)
+
+
+def _mask_token(token: str) -> str:
+    """统计输出中不暴露完整令牌"""
+    return f"***{token[-4:]}" if len(token) > 8 else "***"
+
+
+class AdmissionController:
+    """准入控制器 - 先占令牌级名额，再占应用级名额，两级共用同一个排队期限"""
+
+    def __init__(self, token_concurrency: int = 32, app_concurrency: int = 0, max_queue: int = 64,
+                 queue_timeout: float = 10.0, max_keys: int = 256):
+        """
+        Args:
+            token_concurrency: 每个授权令牌的最大上游并发数，0表示不限制
+            app_concurrency: 每个(令牌, 应用)的最大上游并发数，0表示不限制
+            max_queue: 每个限制器的最大排队数
+            queue_timeout: 排队期限（秒）
+            max_keys: 每级最多保留的限制器数量，超出时清理空闲的限制器
+        """
+        self.token_concurrency = token_concurrency
+        self.app_concurrency = app_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.max_keys = max_keys
+        self._token_limiters: Dict[str, ConcurrencyLimiter] = {}
+        self._app_limiters: Dict[tuple, ConcurrencyLimiter] = {}
+        self.wait_time = Histogram(WAIT_TIME_BUCKETS)
+        self.queue_depth = Histogram(QUEUE_DEPTH_BUCKETS)
+
+    def _limiter(self, table: Dict[Any, ConcurrencyLimiter], key: Any, name: str,
+                 limit: int) -> ConcurrencyLimiter:
+        limiter = table.get(key)
+        if limiter is None:
+            if len(table) >= self.max_keys:
+                for idle_key in [k for k, v in table.items() if v.idle]:
+                    del table[idle_key]
+            limiter = ConcurrencyLimiter(name, limit, self.max_queue)
+            table[key] = limiter
+        return limiter
+
+    def _limiters_for(self, token: str, app_id: str) -> List[ConcurrencyLimiter]:
+        limiters = []
+        if self.token_concurrency > 0:
+            limiters.append(self._limiter(
+                self._token_limiters, token, f"token {_mask_token(token)}", self.token_concurrency
+            ))
+        if self.app_concurrency > 0:
+            limiters.append(self._limiter(
+                self._app_limiters, (token, app_id), f"app {app_id}", self.app_concurrency
+            ))
+        return limiters
+
+    async def acquire(self, token: str, app_id: str) -> AdmissionTicket:
+        """
+        获取上游调用名额
+
+        Raises:
+            AdmissionRejected: 未被准入
+        """
+        deadline = time.monotonic() + self.queue_timeout
+        limiters = self._limiters_for(token, app_id)
+        acquired: List[ConcurrencyLimiter] = []
+        waited = 0.0
+        try:
+            for limiter in limiters:
+                self.queue_depth.observe(limiter.queued)
+                waited += await limiter.acquire(deadline)
+                acquired.append(limiter)
+        except BaseException:
+            for limiter in reversed(acquired):
+                limiter.release()
+            raise
+
+        self.wait_time.observe(waited)
+        return AdmissionTicket(acquired)
+
+    @asynccontextmanager
+    async def slot(self, token: str, app_id: str) -> AsyncIterator[AdmissionTicket]:
+        """在async with块内占用一个名额"""
+        ticket = await self.acquire(token, app_id)
+        try:
+            yield ticket
+        finally:
+            ticket.release()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "token_concurrency": self.token_concurrency,
+            "app_concurrency": self.app_concurrency,
+            "max_queue": self.max_queue,
+            "queue_timeout": self.queue_timeout,
+            "limiters": {
+                limiter.name: limiter.snapshot()
+                for limiter in list(self._token_limiters.values()) + list(self._app_limiters.values())
+            },
+            "wait_time_seconds": self.wait_time.snapshot(),
+            "queue_depth_on_arrival": self.queue_depth.snapshot()
+        }
+
+
+# 全局实例
+admission_controller = AdmissionController(
+    token_concurrency=int(os.getenv('ADMISSION_TOKEN_CONCURRENCY', 32)),
+    app_concurrency=int(os.getenv('ADMISSION_APP_CONCURRENCY', 0)),
+    max_queue=int(os.getenv('ADMISSION_MAX_QUEUE', 64)),
+    queue_timeout=float(os.getenv('ADMISSION_QUEUE_TIMEOUT', 10))
+)
@@ -0,0 +1,362 @@
+#!/usr/bin/env python3
+"""
+无状态问答缓存 - 按 (app_id, 规范化问题) 缓存快速对话的答案，LRU + TTL，按条目数和字节数限制内存
+
+缓存键不含令牌和对话，同一问题的答案返回给所有调用方，因此只缓存答案内容（shareable_answer），
+不缓存首个调用方的上游对话ID和消息ID。
+
+AnswerStore是其持久层（SQLite），保存预热任务（answer_warmup）预先向上游问好的答案：
+重启或部署后仍然有效，同一主机的各worker共用。持久层的有效答案由后台任务（线程中读取SQLite）
+每ANSWER_STORE_RELOAD秒整体载入内存，请求路径上只查内存，不在事件循环中访问数据库。
+"""
+
+import asyncio
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from conversation_db import connect
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE = re.compile(r'\s+')
+# 问题末尾的标点不影响语义
+_TRAILING_PUNCTUATION = '?？!！。.~～ '
+
+
+def normalize_query(query: str) -> str:
+    """规范化问题文本：全角转半角、合并空白、统一小写、去掉末尾标点"""
+    text = unicodedata.normalize('NFKC', query)
+    text = _WHITESPACE.sub(' ', text).strip().lower()
+    return text.rstrip(_TRAILING_PUNCTUATION)
+
+
+# 上游结果中只属于发起调用的那次对话的字段；缓存的答案会返回给其他调用方（可能使用其他令牌），不保存这些字段
+PER_CONVERSATION_FIELDS = ('conversation_id', 'message_id', 'request_id')
+
+
+def shareable_answer(value: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    可缓存的值：只保留答案内容，conversation为空，与本地FAQ答案的格式一致
+
+    Args:
+        value: {'conversation': 创建对话的结果, 'message_response': 上游消息结果}
+    """
+    message = value.get('message_response') or {}
+    return {
+        'conversation': {},
+        'message_response': {key: item for key, item in message.items() if key not in PER_CONVERSATION_FIELDS}
+    }
+
+
+STORE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS answers (
+    app_id TEXT NOT NULL,
+    query TEXT NOT NULL,
+    prompt TEXT NOT NULL,
+    value TEXT NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (app_id, query)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS leases (
+    name TEXT PRIMARY KEY,
+    holder TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+"""
+
+
+class AnswerStore:
+    """
+    持久化的答案（同一主机的多个worker共用一个SQLite文件）
+
+    条目按写入时间判断是否有效（超过ttl秒不再返回），由预热任务定期重新写入；
+    leases表用于多个进程之间的互斥（同一时间只有一个进程执行预热）。
+    """
+
+    errors = (sqlite3.Error,)
+
+    def __init__(self, path: str, ttl: float = 7 * 86400.0):
+        """
+        Args:
+            path: SQLite文件路径，为空表示禁用
+            ttl: 答案有效期（秒）
+        """
+        self.path = path
+        self.ttl = ttl
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path) and self.ttl > 0
+
+    def _connection(self) -> sqlite3.Connection:
+        # 首次使用时打开，未启用预热的部署不会创建数据库文件
+        if self._conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = connect(self.path)
+            conn.executescript(STORE_SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    def _execute(self, sql: str, params: tuple = ()) -> list:
+        with self._lock:
+            return self._connection().execute(sql, params).fetchall()
+
+    def put(self, app_id: str, query: str, value: Any):
+        self._execute("INSERT OR REPLACE INTO answers (app_id, query, prompt, value, updated_at) "
+                      "VALUES (?, ?, ?, ?, ?)",
+                      (app_id, normalize_query(query), query, json.dumps(value, ensure_ascii=False, default=str),
+                       time.time()))
+
+    def load(self) -> Dict[Tuple[str, str], Tuple[float, Any]]:
+        """全部有效的答案 {(app_id, 规范化问题): (过期时间, 值)}"""
+        if not self.enabled:
+            return {}
+        rows = self._execute("SELECT app_id, query, value, updated_at FROM answers WHERE updated_at > ?",
+                             (time.time() - self.ttl,))
+        # 早先写入的答案可能带有预热时的对话ID
+        return {(app_id, query): (updated_at + self.ttl, shareable_answer(json.loads(value)))
+                for app_id, query, value, updated_at in rows}
+
+    def updated_times(self, app_id: str) -> Dict[str, float]:
+        """{规范化问题: 写入时间}"""
+        return dict(self._execute("SELECT query, updated_at FROM answers WHERE app_id = ?", (app_id,)))
+
+    def purge_expired(self) -> int:
+        with self._lock:
+            cursor = self._connection().execute("DELETE FROM answers WHERE updated_at <= ?", (time.time() - self.ttl,))
+            return cursor.rowcount
+
+    def try_lease(self, name: str, holder: str, seconds: float) -> bool:
+        """取得名为name的租约（未被其他进程持有或已过期时），seconds秒后自动失效"""
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute("SELECT holder, expires_at FROM leases WHERE name = ?", (name,)).fetchone()
+                acquired = row is None or row[0] == holder or row[1] <= now
+                if acquired:
+                    conn.execute("INSERT OR REPLACE INTO leases (name, holder, expires_at) VALUES (?, ?, ?)",
+                                 (name, holder, now + seconds))
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+        return acquired
+
+    def release_lease(self, name: str, holder: str):
+        self._execute("DELETE FROM leases WHERE name = ? AND holder = ?", (name, holder))
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+class AnswerCache:
+    """答案缓存 - 最久未使用的条目优先淘汰，过期条目在读取时丢弃"""
+
+    def __init__(self, max_entries: int = 1024, max_bytes: int = 32 * 1024 * 1024, ttl: float = 3600.0,
+                 store: Optional[AnswerStore] = None, reload_interval: float = 300.0):
+        """
+        Args:
+            max_entries: 最大条目数，0表示禁用缓存
+            max_bytes: 缓存值（按JSON编码后的UTF-8字节数估算）的总大小上限
+            ttl: 条目有效期（秒）
+            store: 持久层，其有效答案载入内存，LRU未命中时查找（查到的答案放入LRU）
+            reload_interval: 后台重新载入持久层的间隔（秒），其他进程写入的答案在下次载入后可见
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.store = store
+        self.reload_interval = reload_interval
+        # 持久层答案的内存副本 {(app_id, 规范化问题): (过期时间（墙钟）, 值)}，整体替换
+        self._stored: Dict[Tuple[str, str], Tuple[float, Any]] = {}
+        self.store_loaded_at: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[float, int, Any]]" = OrderedDict()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.store_hits = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 and self.max_bytes > 0 and self.ttl > 0
+
+    @staticmethod
+    def make_key(app_id: str, query: str) -> Tuple[str, str]:
+        return (app_id, normalize_query(query))
+
+    def get(self, app_id: str, query: str) -> Optional[Any]:
+        """读取缓存，未命中或已过期时返回None"""
+        if not self.enabled:
+            return self._from_store(app_id, query)
+
+        key = self.make_key(app_id, query)
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] <= time.monotonic():
+            self._remove(key)
+            self.expirations += 1
+            entry = None
+        if entry is None:
+            value = self._from_store(app_id, query)
+            if value is None:
+                self.misses += 1
+            return value
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[2]
+
+    def stored(self, app_id: str, query: str) -> Optional[Any]:
+        """持久层答案（内存副本）中有效的答案，不访问数据库"""
+        entry = self._stored.get(self.make_key(app_id, query))
+        if entry is None or entry[0] <= time.time():
+            return None
+        return entry[1]
+
+    def _from_store(self, app_id: str, query: str) -> Optional[Any]:
+        """从持久层的内存副本读取，读到时计入命中并放入LRU"""
+        value = self.stored(app_id, query)
+        if value is not None:
+            self.hits += 1
+            self.store_hits += 1
+            self.put(app_id, query, value)
+        return value
+
+    def remember(self, app_id: str, query: str, value: Any):
+        """本进程写入持久层的答案立即加入内存副本，不必等下次载入"""
+        if self.store is not None and self.store.enabled:
+            self._stored[self.make_key(app_id, query)] = (time.time() + self.store.ttl, value)
+
+    async def load_store(self) -> bool:
+        """在线程中读取持久层的全部有效答案并替换内存副本，失败时保留原副本"""
+        if self.store is None or not self.store.enabled:
+            return False
+        try:
+            self._stored = await asyncio.to_thread(self.store.load)
+        except self.store.errors as e:
+            logger.warning(f"载入持久化答案失败: {e}")
+            return False
+        self.store_loaded_at = time.time()
+        return True
+
+    async def _reload_loop(self):
+        while True:
+            await self.load_store()
+            await asyncio.sleep(self.reload_interval)
+
+    async def start(self):
+        """开始定期载入持久层（服务启动时调用，第一次立即载入）"""
+        if self.store is None or not self.store.enabled or self._task is not None:
+            return
+        if self.reload_interval > 0:
+            self._task = asyncio.create_task(self._reload_loop())
+        else:
+            await self.load_store()
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def put(self, app_id: str, query: str, value: Any):
+        """写入缓存；单个值超过总字节上限时不缓存"""
+        if not self.enabled:
+            return
+
+        size = len(json.dumps(value, ensure_ascii=False, default=str).encode('utf-8'))
+        if size > self.max_bytes:
+            return
+
+        key = self.make_key(app_id, query)
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (time.monotonic() + self.ttl, size, value)
+        self.total_bytes += size
+
+        while len(self._entries) > self.max_entries or self.total_bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def invalidate(self, app_id: str, query: str) -> bool:
+        key = self.make_key(app_id, query)
+        if key in self._entries:
+            self._remove(key)
+            return True
+        return False
+
+    def clear(self):
+        self._entries.clear()
+        self.total_bytes = 0
+
+    def _remove(self, key: Tuple[str, str]):
+        _, size, _ = self._entries.pop(key)
+        self.total_bytes -= size
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "store_hits": self.store_hits,
+            "store": self._store_stats()
+        }
+
+    def _store_stats(self) -> Optional[Dict[str, Any]]:
+        """持久层概况，按内存副本统计（不在事件循环中访问数据库）"""
+        if self.store is None:
+            return None
+        if not self.store.enabled:
+            return {"enabled": False}
+        return {"enabled": True, "path": self.store.path, "ttl": self.store.ttl, "entries": len(self._stored),
+                "loaded_at": self.store_loaded_at, "reload_interval": self.reload_interval}
+
+
+def _store_path() -> str:
+    """ANSWER_STORE_PATH，相对路径基于backend目录；设为空字符串时返回空（禁用）"""
+    path = os.getenv('ANSWER_STORE_PATH', os.path.join('data', 'answers.db'))
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), path) if path else ''
+
+
+# 全局实例
+answer_store = AnswerStore(
+    path=_store_path(),
+    ttl=float(os.getenv('ANSWER_STORE_TTL', 7 * 86400))
+)
+answer_cache = AnswerCache(
+    max_entries=int(os.getenv('ANSWER_CACHE_MAX_ENTRIES', 1024)),
+    max_bytes=int(os.getenv('ANSWER_CACHE_MAX_BYTES', 32 * 1024 * 1024)),
+    ttl=float(os.getenv('ANSWER_CACHE_TTL', 3600)),
+    store=answer_store,
+    reload_interval=float(os.getenv('ANSWER_STORE_RELOAD', 300))
+)
@@ -0,0 +1,320 @@
+#!/usr/bin/env python3
+"""
+答案预热 - 预先向千帆问好每个地标的aiPrompt，答案写入持久化的答案缓存
+
+点击地球上的地标时发给AI的第一句话就是该地标固定的aiPrompt（frontend/script.js的landmarkData），
+一次上游调用要10~30秒。预热任务把全部aiPrompt依次发给上游（每个问题使用一个新对话，答案不受上下文影响），
+答案写入AnswerStore（SQLite，重启和部署后仍然有效，同一主机的各worker共用）：
+    限流    最多ANSWER_WARMUP_CONCURRENCY个问题同时请求，每秒最多开始ANSWER_WARMUP_RATE个问题
+    跳过    本地FAQ能回答的问题（对话接口先查FAQ，不会请求上游）和写入未满ANSWER_WARMUP_REFRESH秒的答案
+    互斥    多个worker（以及命令行）通过AnswerStore中的租约保证同一时间只有一个进程在预热
+服务启动后每ANSWER_WARMUP_INTERVAL秒执行一次（只刷新缺失和将要过期的答案），也可以由cron调用命令行。
+各worker的AnswerCache在后台把这些答案载入内存。新对话的第一轮在FAQ之后按规范化后的问题原文
+查找预热的答案（warm_match，只查内存），命中时本地作答；快速对话在内存缓存未命中时同样使用这些答案。
+
+用法: python answer_warmup.py run [--force] [--concurrency 2] [--rate 0.5] [--dry-run]
+      python answer_warmup.py status
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import socket
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from answer_cache import AnswerCache, AnswerStore, answer_cache, answer_store, normalize_query, shareable_answer
+from client_registry import client_registry
+from faq_engine import FAQEngine, FAQMatch, QAPair, faq_engine
+from kb_ingest import resolve_path
+from landmark_facts import DEFAULT_SCRIPT_PATH, parse_landmarks
+from qianfan_client import QianfanClient, close_shared_session
+from resilience import CircuitOpenError
+
+logger = logging.getLogger(__name__)
+
+LEASE_NAME = 'answer_warmup'
+# 预热答案在FAQ命中信息中的来源
+WARMUP_SOURCE = 'landmark_warmup'
+
+
+class RateLimiter:
+    """每秒最多放行rate次（按固定间隔排队），rate为0表示不限"""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        async with self._lock:
+            now = time.monotonic()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+def landmark_prompts(script_path: str = DEFAULT_SCRIPT_PATH) -> List[Tuple[str, str]]:
+    """全部地标的 (名称, aiPrompt)，priority小的在前，相同的问题只保留一个"""
+    with open(script_path, encoding='utf-8') as f:
+        landmarks = parse_landmarks(f.read())
+    landmarks.sort(key=lambda landmark: landmark.priority if landmark.priority is not None else 99)
+    prompts = {}
+    for landmark in landmarks:
+        if landmark.ai_prompt.strip():
+            prompts.setdefault(normalize_query(landmark.ai_prompt), (landmark.name, landmark.ai_prompt))
+    return list(prompts.values())
+
+
+def answer_of(value: Any) -> Optional[str]:
+    """预热写入的值（与快速对话的缓存值格式相同）中的答案文本"""
+    if isinstance(value, dict) and isinstance(value.get('message_response'), dict):
+        return value['message_response'].get('answer') or None
+    return None
+
+
+class AnswerWarmer:
+    """把地标的aiPrompt预先发给上游，答案写入AnswerStore"""
+
+    def __init__(self, store: AnswerStore, app_id: str, token: str, base_url: str,
+                 script_path: str = DEFAULT_SCRIPT_PATH, faq: Optional[FAQEngine] = None,
+                 concurrency: int = 2, rate: float = 0.5, refresh_age: float = 86400.0,
+                 interval: float = 3600.0, enabled: bool = True, cache: Optional[AnswerCache] = None):
+        """
+        Args:
+            store: 写入答案的持久层
+            app_id: 千帆应用ID（预热的答案只用于该应用）
+            token: 千帆授权令牌
+            base_url: 千帆API基础URL
+            script_path: 定义landmarkData的前端脚本
+            faq: 本地FAQ引擎，能回答的问题不预热
+            concurrency: 同时请求上游的问题数
+            rate: 每秒最多开始的问题数（每个问题创建对话和发送消息两次上游调用），0表示不限
+            refresh_age: 答案写入多久之后重新预热（秒），应小于store的ttl
+            interval: 服务内定期执行的间隔（秒），0表示只由命令行执行
+            enabled: 为False时start不做任何事
+            cache: 读取预热答案的内存缓存，本进程预热的答案写入后立即加入
+        """
+        self.store = store
+        self.app_id = app_id
+        self.token = token
+        self.base_url = base_url
+        self.script_path = script_path
+        self.faq = faq
+        self.concurrency = max(1, concurrency)
+        self.rate = rate
+        self.refresh_age = refresh_age
+        self.interval = interval
+        self.enabled = enabled
+        self.cache = cache
+        self.holder = f"{socket.gethostname()}:{os.getpid()}"
+        self._task: Optional[asyncio.Task] = None
+        self.runs = 0
+        self.last_run: Optional[Dict[str, Any]] = None
+
+    @property
+    def configured(self) -> bool:
+        return bool(self.token and self.app_id and self.store.enabled)
+
+    def client(self) -> QianfanClient:
+        token = self.token if self.token.startswith('Bearer ') else f'Bearer {self.token}'
+        return client_registry.get(token, self.base_url, pinned=True)
+
+    def plan(self, force: bool = False) -> Tuple[List[Tuple[str, str]], Dict[str, int]]:
+        """
+        需要预热的 (名称, aiPrompt) 和跳过的数量
+
+        Args:
+            force: 为True时已有的答案也重新预热
+        """
+        updated = {} if force else self.store.updated_times(self.app_id)
+        fresh_after = time.time() - self.refresh_age
+        todo = []
+        skipped = {"faq": 0, "fresh": 0}
+        for name, prompt in landmark_prompts(self.script_path):
+            if self.faq is not None and self.faq.lookup(prompt) is not None:
+                skipped["faq"] += 1
+            elif updated.get(normalize_query(prompt), 0) > fresh_after:
+                skipped["fresh"] += 1
+            else:
+                todo.append((name, prompt))
+        return todo, skipped
+
+    async def _warm_one(self, client: QianfanClient, limiter: RateLimiter, semaphore: asyncio.Semaphore,
+                        name: str, prompt: str) -> bool:
+        await limiter.wait()
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                conversation = await client.create_conversation(self.app_id)
+                conversation_id = conversation.get('conversation_id')
+                if not conversation_id:
+                    raise RuntimeError(f"创建对话失败: {conversation}")
+                message = await client.send_message(self.app_id, conversation_id, prompt, stream=False)
+            except CircuitOpenError:
+                raise
+            except Exception as e:
+                logger.warning(f"预热失败 {name}: {e!r}")
+                return False
+        if not message.get('answer') or message.get('error'):
+            logger.warning(f"预热失败 {name}: 上游没有返回答案")
+            return False
+        value = shareable_answer({'conversation': conversation, 'message_response': message})
+        await asyncio.to_thread(self.store.put, self.app_id, prompt, value)
+        if self.cache is not None:
+            self.cache.remember(self.app_id, prompt, value)
+        logger.info(f"预热完成 {name}（{time.perf_counter() - started:.1f}s）: {prompt}")
+        return True
+
+    async def run(self, force: bool = False, dry_run: bool = False) -> Dict[str, Any]:
+        """执行一次预热，返回统计"""
+        started = time.perf_counter()
+        result: Dict[str, Any] = {"at": time.time()}
+        if not self.configured:
+            result["error"] = "未配置QIANFAN_TOKEN、QIANFAN_APP_ID或ANSWER_STORE_PATH"
+            return result
+        todo, skipped = await asyncio.to_thread(self.plan, force)
+        result.update({"prompts": len(todo) + sum(skipped.values()), "todo": len(todo), "skipped": skipped})
+        if dry_run or not todo:
+            return result
+        # 租约覆盖整次预热的预计时长，进程中途退出时到期自动释放
+        lease_seconds = max(600.0, len(todo) / max(self.rate, 0.01) + 120.0)
+        if not await asyncio.to_thread(self.store.try_lease, LEASE_NAME, self.holder, lease_seconds):
+            result["error"] = "其他进程正在预热"
+            return result
+
+        client = self.client()
+        limiter = RateLimiter(self.rate)
+        semaphore = asyncio.Semaphore(self.concurrency)
+        tasks = [asyncio.create_task(self._warm_one(client, limiter, semaphore, name, prompt))
+                 for name, prompt in todo]
+        try:
+            outcomes = await asyncio.gather(*tasks, return_exceptions=True)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.to_thread(self.store.release_lease, LEASE_NAME, self.holder)
+        result["warmed"] = sum(outcome is True for outcome in outcomes)
+        result["failed"] = len(outcomes) - result["warmed"]
+        if any(isinstance(outcome, CircuitOpenError) for outcome in outcomes):
+            result["error"] = "上游熔断，未完成的问题留到下次预热"
+        result["purged"] = await asyncio.to_thread(self.store.purge_expired)
+        result["seconds"] = round(time.perf_counter() - started, 3)
+        return result
+
+    async def start(self):
+        """开始定期预热（服务启动时调用，第一次在启动后立即执行）"""
+        if not self.enabled or self.interval <= 0 or not self.configured or self._task is not None:
+            return
+        self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _loop(self):
+        while True:
+            try:
+                self.last_run = await self.run()
+                self.runs += 1
+                if self.last_run.get("todo"):
+                    logger.info(f"答案预热: {self.last_run}")
+            except Exception as e:
+                logger.error(f"答案预热失败: {e!r}")
+            await asyncio.sleep(self.interval)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled and self.configured,
+            "interval": self.interval,
+            "concurrency": self.concurrency,
+            "rate": self.rate,
+            "refresh_age": self.refresh_age,
+            "runs": self.runs,
+            "last_run": self.last_run
+        }
+
+
+def warm_match(app_id: str, message: str) -> Optional[FAQMatch]:
+    """
+    问题与预热过的aiPrompt相同（规范化后）时，以FAQ命中的形式返回预热的答案
+
+    只查answer_cache中持久层答案的内存副本；预热答案用新对话问得，只适用于新对话的第一轮
+    （由调用方chat_api.match_faq保证）
+    """
+    answer = answer_of(answer_cache.stored(app_id, message))
+    if answer is None:
+        return None
+    return FAQMatch(QAPair(message.strip(), answer, WARMUP_SOURCE), 1.0, 'warmup')
+
+
+# 全局实例
+answer_warmer = AnswerWarmer(
+    answer_store,
+    app_id=os.getenv('QIANFAN_APP_ID', ''),
+    token=os.getenv('QIANFAN_TOKEN', ''),
+    base_url=os.getenv('QIANFAN_API_BASE_URL', 'https://qianfan.baidubce.com'),
+    script_path=resolve_path(os.getenv('LANDMARK_SCRIPT_PATH', DEFAULT_SCRIPT_PATH)),
+    faq=faq_engine,
+    concurrency=int(os.getenv('ANSWER_WARMUP_CONCURRENCY', 2)),
+    rate=float(os.getenv('ANSWER_WARMUP_RATE', 0.5)),
+    refresh_age=float(os.getenv('ANSWER_WARMUP_REFRESH', 86400)),
+    interval=float(os.getenv('ANSWER_WARMUP_INTERVAL', 3600)),
+    enabled=os.getenv('ANSWER_WARMUP_ENABLED', 'true').lower() not in ('0', 'false', 'no'),
+    cache=answer_cache
+)
+
+
+async def _run_cli(args) -> Dict[str, Any]:
+    try:
+        return await answer_warmer.run(force=args.force, dry_run=args.dry_run)
+    finally:
+        await client_registry.close_all()
+        await close_shared_session()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="地标aiPrompt答案预热")
+    parser.add_argument("command", choices=("run", "status"), help="run: 执行一次预热；status: 查看已有的答案")
+    parser.add_argument("--force", action="store_true", help="已有的答案也重新预热")
+    parser.add_argument("--dry-run", action="store_true", help="只列出需要预热的问题，不请求上游")
+    parser.add_argument("--concurrency", type=int, default=answer_warmer.concurrency, help="同时请求上游的问题数")
+    parser.add_argument("--rate", type=float, default=answer_warmer.rate, help="每秒最多开始的问题数")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    answer_warmer.concurrency = max(1, args.concurrency)
+    answer_warmer.rate = args.rate
+
+    if args.command == 'status':
+        updated = answer_store.updated_times(answer_warmer.app_id)
+        now = time.time()
+        for name, prompt in landmark_prompts(answer_warmer.script_path):
+            at = updated.get(normalize_query(prompt))
+            if answer_warmer.faq is not None and answer_warmer.faq.lookup(prompt) is not None:
+                state = "FAQ"
+            elif at is None:
+                state = "无"
+            else:
+                state = f"{(now - at) / 3600:.1f}小时前" + ("（已过期）" if now - at > answer_store.ttl else "")
+            print(f"{name:<12} {state:<16} {prompt}")
+        return
+
+    if args.dry_run:
+        todo, _ = answer_warmer.plan(args.force)
+        for name, prompt in todo:
+            print(f"{name:<12} {prompt}")
+    result = asyncio.run(_run_cli(args))
+    print(result)
+    if result.get("error"):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+对话持久化基准测试
+
+模拟大量并发请求持续写入对话（创建 + 记录一轮问答 + 使用），比较：
+    逐条提交     每个写操作单独一个事务（naive做法）
+    组提交       写操作入队，由后台写入任务按时间窗口合并到同一事务
+并测量缓存未命中时从SQLite读穿透的速度。
+
+用法: python bench_conversation_db.py --seconds 10 --concurrency 200
+"""
+
+import argparse
+import asyncio
+import os
+import sqlite3
+import tempfile
+import time
+import uuid
+
+from conversation_db import SQL_APPEND_MESSAGE, SQL_TOUCH, SQL_UPSERT_CONVERSATION, SQLiteConversationBackend
+from conversation_store import ConversationStore
+
+
+def bench_naive(path: str, total: int) -> float:
+    """每个写操作单独提交，返回操作数/秒"""
+    backend = SQLiteConversationBackend(path)
+    conn = backend._writer
+    started = time.perf_counter()
+    for _ in range(total // 3):
+        conversation_id = str(uuid.uuid4())
+        now = time.time()
+        for sql, params in (
+            (SQL_UPSERT_CONVERSATION, (conversation_id, "bench-app", now, now, None)),
+            (SQL_APPEND_MESSAGE, (conversation_id, 1, "user", "你好", now, None)),
+            (SQL_TOUCH, (now + 1, conversation_id, now + 1)),
+        ):
+            conn.execute("BEGIN")
+            conn.execute(sql, params)
+            conn.execute("COMMIT")
+    elapsed = time.perf_counter() - started
+    backend.close()
+    return (total // 3) * 3 / elapsed
+
+
+async def bench_group_commit(path: str, seconds: float, concurrency: int, flush_interval: float):
+    """多个并发"请求"持续写入，后台任务组提交，返回(操作数/秒, 写入统计, store)"""
+    backend = SQLiteConversationBackend(path, flush_interval=flush_interval)
+    store = ConversationStore(max_entries=10_000, backend=backend)
+    await store.start()
+    deadline = time.perf_counter() + seconds
+
+    async def worker():
+        while time.perf_counter() < deadline:
+            conversation_id = str(uuid.uuid4())
+            store.put(conversation_id, "bench-app")
+            store.append_turn(conversation_id, "你好", "你好，我是球球")
+            store.get(conversation_id)
+            # 模拟一次请求处理中让出事件循环
+            await asyncio.sleep(0)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    await backend.wait_idle()
+    elapsed = time.perf_counter() - started
+    stats = backend.stats()
+    await store.stop()
+    return stats["ops_written"] / elapsed, stats
+
+
+def bench_read_through(path: str, samples: int) -> float:
+    """缓存为空时按ID读取（全部走SQLite），返回次数/秒"""
+    backend = SQLiteConversationBackend(path)
+    conn = sqlite3.connect(path)
+    ids = [row[0] for row in conn.execute(
+        "SELECT conversation_id FROM conversations ORDER BY RANDOM() LIMIT ?", (samples,))]
+    conn.close()
+    store = ConversationStore(max_entries=samples, backend=backend)
+    started = time.perf_counter()
+    for conversation_id in ids:
+        store.get(conversation_id)
+    rate = len(ids) / (time.perf_counter() - started)
+    backend.close()
+    return rate
+
+
+def main():
+    parser = argparse.ArgumentParser(description="对话持久化基准测试")
+    parser.add_argument("--seconds", type=float, default=10.0, help="组提交写入持续时间")
+    parser.add_argument("--concurrency", type=int, default=200, help="并发写入协程数")
+    parser.add_argument("--flush-interval", type=float, default=0.02, help="组提交窗口（秒）")
+    parser.add_argument("--naive-ops", type=int, default=3000, help="逐条提交的操作数")
+    parser.add_argument("--dir", default=None, help="数据库目录（默认临时目录，注意应与生产磁盘一致）")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(dir=args.dir) as directory:
+        print("🔬 对话持久化基准测试")
+        print("=" * 72)
+        naive_rate = bench_naive(os.path.join(directory, "naive.db"), args.naive_ops)
+        print(f"逐条提交: {naive_rate:,.0f} 操作/秒")
+
+        path = os.path.join(directory, "group.db")
+        group_rate, stats = asyncio.run(
+            bench_group_commit(path, args.seconds, args.concurrency, args.flush_interval))
+        print(f"组提交:   {group_rate:,.0f} 操作/秒（{group_rate / naive_rate:.1f}x）")
+        print(f"          事务 {stats['batches']} 个，平均 {stats['avg_batch']} 个操作/事务，"
+              f"最大 {stats['max_batch']}，写入线程耗时 {stats['write_seconds']}s")
+
+        read_rate = bench_read_through(path, 20_000)
+        print(f"读穿透:   {read_rate:,.0f} 次/秒（缓存未命中，从SQLite加载）")
+        print(f"数据库:   {os.path.getsize(path) / 1048576:.1f} MB")
+        print("=" * 72)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+多worker共享对话状态基准测试
+
+启动多个进程模拟多个uvicorn worker，测量每个请求在对话存储上的耗时：
+    首条消息  创建对话（带元数据）+ 记录一轮问答
+    后续消息  对话由另一个worker创建：读取对话并检查元数据 + 记录一轮问答，每10个请求读一次历史
+并统计后续消息找不到对话或元数据的次数。local为进程内存储（对照，跨worker必然丢失），
+sqlite默认放在/dev/shm（即共享内存），redis需要指定一个可用的Redis兼容服务。
+
+用法: python bench_conversation_shared.py --workers 4 --conversations 2000 \
+          --backends local,sqlite,redis --redis-url redis://127.0.0.1:6379/0
+"""
+
+import argparse
+import multiprocessing
+import os
+import statistics
+import tempfile
+import time
+import uuid
+
+from conversation_db import SQLiteConversationState
+from conversation_store import ConversationStore, SharedConversationStore
+
+QUESTION = "什么是板块构造？"
+ANSWER = "板块构造理论认为地球的岩石圈分为若干板块，" * 8
+
+
+def make_store(backend: str, target: str):
+    if backend == 'local':
+        return ConversationStore()
+    if backend == 'sqlite':
+        return SharedConversationStore(SQLiteConversationState(target))
+    from conversation_redis import RedisConversationState
+    url, prefix = target.split('|')
+    return SharedConversationStore(RedisConversationState(url, prefix=prefix))
+
+
+def worker(backend: str, target: str, index: int, workers: int, conversations: int, barrier, results):
+    store = make_store(backend, target)
+    created, followed, misses = [], [], 0
+
+    for i in range(conversations):
+        started = time.perf_counter()
+        conversation_id = f"{index}-{i}"
+        store.put(conversation_id, "bench-app", {"worker": index})
+        store.append_turn(conversation_id, QUESTION, ANSWER, f"m-{conversation_id}-1")
+        created.append(time.perf_counter() - started)
+
+    barrier.wait()
+    owner = (index + 1) % workers
+    for i in range(conversations):
+        started = time.perf_counter()
+        conversation_id = f"{owner}-{i}"
+        record = store.get(conversation_id)
+        if record is None or record.metadata.get("worker") != owner:
+            misses += 1
+        store.append_turn(conversation_id, QUESTION, ANSWER, f"m-{conversation_id}-2")
+        if i % 10 == 0:
+            store.history(conversation_id, limit=50)
+        followed.append(time.perf_counter() - started)
+
+    results.put((created, followed, misses))
+
+
+def percentile(values, fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def run(backend: str, target: str, workers: int, conversations: int):
+    context = multiprocessing.get_context('spawn')
+    barrier = context.Barrier(workers)
+    results = context.Queue()
+    processes = [
+        context.Process(target=worker, args=(backend, target, index, workers, conversations, barrier, results))
+        for index in range(workers)
+    ]
+    started = time.perf_counter()
+    for process in processes:
+        process.start()
+    outcomes = [results.get() for _ in processes]
+    elapsed = time.perf_counter() - started
+    for process in processes:
+        process.join()
+
+    created = [value for outcome in outcomes for value in outcome[0]]
+    followed = [value for outcome in outcomes for value in outcome[1]]
+    misses = sum(outcome[2] for outcome in outcomes)
+    print(f"{backend:>8} "
+          f"{statistics.mean(created) * 1000:>10.3f} {percentile(created, 0.99) * 1000:>10.3f} "
+          f"{statistics.mean(followed) * 1000:>10.3f} {percentile(followed, 0.99) * 1000:>10.3f} "
+          f"{misses:>8} {(len(created) + len(followed)) / elapsed:>12,.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="多worker共享对话状态基准测试")
+    parser.add_argument("--workers", type=int, default=min(4, os.cpu_count() or 1),
+                        help="worker进程数（默认不超过CPU核数，超出时测到的主要是进程调度等待）")
+    parser.add_argument("--conversations", type=int, default=2000, help="每个worker创建的对话数")
+    parser.add_argument("--backends", default="local,sqlite", help="逗号分隔：local / sqlite / redis")
+    parser.add_argument("--redis-url", default="redis://127.0.0.1:6379/0", help="redis后端使用的服务地址")
+    parser.add_argument("--dir", default="/dev/shm" if os.path.isdir("/dev/shm") else None,
+                        help="sqlite数据库目录（默认/dev/shm）")
+    args = parser.parse_args()
+
+    print("🔬 多worker共享对话状态基准测试")
+    print(f"{args.workers} 个worker，每个 {args.conversations} 个对话；耗时为每个请求在对话存储上的毫秒数")
+    print("=" * 72)
+    print(f"{'后端':>8} {'首条平均':>10} {'首条p99':>10} {'后续平均':>10} {'后续p99':>10} "
+          f"{'跨worker丢失':>8} {'请求/秒':>12}")
+    for backend in args.backends.split(','):
+        if backend == 'sqlite':
+            with tempfile.TemporaryDirectory(dir=args.dir) as directory:
+                run(backend, os.path.join(directory, "shared.db"), args.workers, args.conversations)
+        elif backend == 'redis':
+            from conversation_redis import RedisConversationState
+            prefix = f"bench:{uuid.uuid4().hex[:8]}:"
+            run(backend, f"{args.redis_url}|{prefix}", args.workers, args.conversations)
+            client = RedisConversationState(args.redis_url, prefix=prefix).client
+            keys = list(client.scan_iter(match=f"{prefix}*", count=1000))
+            for start in range(0, len(keys), 1000):
+                client.delete(*keys[start:start + 1000])
+        else:
+            run(backend, '', args.workers, args.conversations)
+    print("=" * 72)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+对话存储基准测试
+
+持续写入远多于上限的对话，观察条目数与进程内存是否稳定在上限附近，
+并测量写入、读取、按最近使用分页列出和过期清理的吞吐量。
+
+用法: python bench_conversation_store.py --total 3000000 --max-entries 1000000
+"""
+
+import argparse
+import os
+import time
+import uuid
+
+from conversation_store import ConversationStore
+
+
+def rss_mb() -> float:
+    """当前进程常驻内存（MB），仅支持Linux"""
+    try:
+        with open('/proc/self/statm') as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError):
+        return float('nan')
+
+
+def main():
+    parser = argparse.ArgumentParser(description="对话存储基准测试")
+    parser.add_argument("--total", type=int, default=3_000_000, help="写入的对话总数")
+    parser.add_argument("--max-entries", type=int, default=1_000_000, help="存储条目上限")
+    parser.add_argument("--max-mb", type=int, default=1024, help="存储估算内存上限（MB）")
+    parser.add_argument("--checkpoints", type=int, default=6, help="打印内存的次数")
+    args = parser.parse_args()
+
+    store = ConversationStore(max_entries=args.max_entries, max_bytes=args.max_mb * 1024 * 1024)
+    print("🔬 对话存储基准测试")
+    print("=" * 72)
+    print(f"{'已写入':>10} {'条目数':>10} {'估算(MB)':>10} {'RSS(MB)':>10} {'写入(万/秒)':>12}")
+    print(f"{0:>10} {0:>10} {0:>10.1f} {rss_mb():>10.1f} {'-':>12}")
+
+    step = max(1, args.total // args.checkpoints)
+    written = 0
+    while written < args.total:
+        batch = min(step, args.total - written)
+        ids = [str(uuid.uuid4()) for _ in range(batch)]
+        started = time.perf_counter()
+        for conversation_id in ids:
+            store.put(conversation_id, "bench-app")
+        elapsed = time.perf_counter() - started
+        written += batch
+        del ids
+        print(f"{written:>10} {len(store):>10} {store.total_bytes / 1048576:>10.1f} {rss_mb():>10.1f} "
+              f"{batch / elapsed / 10000:>12.1f}")
+
+    sample = [conversation_id for conversation_id, _ in store.list(100_000)]
+    started = time.perf_counter()
+    for conversation_id in sample:
+        store.get(conversation_id)
+    get_rate = len(sample) / (time.perf_counter() - started)
+
+    started = time.perf_counter()
+    for _ in range(1000):
+        store.list(50)
+    top_ms = (time.perf_counter() - started) * 1000 / 1000
+
+    # 从第10万条开始键集翻页
+    cursor = store.recency_key(sample[-1])
+    started = time.perf_counter()
+    pages = 0
+    while cursor is not None and pages < 1000:
+        page = store.list(50, before=cursor)
+        cursor = store.recency_key(page[-1][0]) if page else None
+        pages += 1
+    page_ms = (time.perf_counter() - started) * 1000 / pages
+
+    started = time.perf_counter()
+    removed = store.sweep_expired(now=time.time() + store.ttl + 1)
+    sweep_elapsed = time.perf_counter() - started
+
+    print("-" * 72)
+    print(f"读取: {get_rate / 10000:.1f} 万次/秒")
+    print(f"列出最近50条: {top_ms:.3f}ms/次，深度键集翻页: {page_ms:.3f}ms/页")
+    print(f"过期清理: {removed} 条，耗时 {sweep_elapsed:.2f}s（{removed / sweep_elapsed / 10000:.1f} 万条/秒）")
+    print(f"统计: {store.stats()}")
+    print("=" * 72)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+FAQ语义匹配（哈希TF-IDF + IVF近似最近邻）基准测试
+
+三部分：
+    召回与延迟  整理好的问题及其改写、换说法的问题、库外问题作为查询集，IVF与暴力计算（与全部向量求内积）
+                比较：recall@1（第一名相同的比例）、recall@5（暴力top-5中被找回的比例）和单次查询耗时，
+                并对nprobe做扫描；同时给出随机投影LSH（SimHash）在相同查询集上的召回作对照
+    匹配效果    换说法的问题（人工整理，标注应命中的问题）只用字面匹配 / 再加语义匹配时的命中数和正确数，
+                以及库外问题（含知识库未覆盖的地球科学问题）的误命中数，可用于调整
+                FAQ_SEMANTIC_THRESHOLD / FAQ_SEMANTIC_MARGIN：命中但不正确和库外误命中都应为0
+    规模        用知识库答案中的句子两两拼接成合成问题，把向量数扩大到--scales指定的规模，按不同的探查比例
+                比较IVF与暴力计算。合成问题没有明显的簇结构，查询的近邻相似度接近，recall偏保守，
+                另给出top-1相似度比（IVF第一名与真正第一名的相似度之比）
+
+用法: python bench_faq_ann.py --nprobe 1,2,3,4 --scales 1000,10000,50000 --fractions 0.05,0.1,0.2
+"""
+
+import argparse
+import random
+import re
+import time
+
+import numpy as np
+
+from bench_faq_engine import variants
+from faq_ann import HashedTfidf, IVFIndex
+from faq_engine import DEFAULT_KB_DIR, FAQEngine, split_term_keys
+
+# 换了说法的问题及其应命中的问题（取问题中的一段文字）
+PARAPHRASES = [
+    ("板块为什么会动", "地幔对流"), ("地球为什么越来越热", "温室效应"), ("石油怎么来的", "什么是石油"),
+    ("恐龙怎么没的", "恐龙"), ("化石是怎么变成的", "化石"), ("地下的水从哪里来", "地下水"),
+    ("水是怎样在地球上循环的", "水循环"), ("地磁场是怎么产生的", "发电机"), ("印度雨季是怎么来的", "印度季风的形成"),
+    ("厄尔尼诺是怎么回事", "厄尔尼诺"), ("大峡谷是怎么形成的", "大峡谷"), ("世界上最深的海沟怎么形成的", "马里亚纳海沟是如何形成"),
+    ("桂林山水是怎么形成的", "喀斯特"), ("岩石为什么会碎裂", "风化"), ("艾尔斯岩为什么是红色的", "艾尔斯岩"),
+    ("稀土为什么这么重要", "稀土"), ("宝石是怎么形成的", "宝石"), ("人类是怎么进化来的", "人类"),
+    ("寒武纪为什么突然出现那么多生物", "寒武纪"), ("地球历史上有过几次大灭绝", "大灭绝"), ("地震波能告诉我们什么", "地震波"),
+    ("墨西哥湾流对气候有什么作用", "墨西哥湾流如何影响"), ("北极冷空气为什么会南下", "极地涡旋"),
+    ("加州为什么老地震", "圣安德烈亚斯"), ("乌尤尼盐湖怎么形成的", "乌尤尼盐沼是如何形成"),
+    ("阿尔卑斯山怎么来的", "阿尔卑斯造山带是如何形成"), ("秘鲁渔场为什么那么丰富", "秘鲁寒流对沿岸生态"),
+    ("遥感能用来做什么", "遥感"), ("气候系统会不会突然崩溃", "气候临界点"), ("矿物有哪些种类", "矿物是如何分类"),
+    ("岩层是怎么被挤弯的", "褶皱带是如何形成"), ("加拉帕戈斯群岛为什么有那么多特有物种", "加拉帕戈斯热点如何创造"),
+    ("冰岛为什么有那么多火山", "冰岛裂谷"), ("地中海为什么老地震", "地中海地区地震"), ("湾流是怎么产生的", "墨西哥湾流是如何形成"),
+    ("东亚冬天为什么那么冷", "亚洲高压如何影响"),
+]
+
+OUT_OF_DOMAIN = [
+    "你好", "你是谁", "今天天气怎么样", "讲个笑话", "帮我写一首诗", "地球是圆的吗", "珠穆朗玛峰有多高",
+    "什么是板块构造", "火山为什么会喷发", "月球是怎么形成的", "北京明天会下雨吗", "推荐几本地理书",
+    "长江有多长", "太阳系有几颗行星", "台风和飓风有什么区别", "海水为什么是咸的", "如何预测地震",
+    "黄河为什么是黄色的", "南极和北极哪个更冷",
+    # 地球科学范围内、但知识库没有整理答案的问题（与整理好的问题用词相近，最容易误命中）
+    "地震是怎么产生的", "海啸是怎么形成的", "为什么会有四季", "彩虹是怎么形成的", "雷电是怎么产生的",
+    "地球有多少岁了", "冰川是怎么移动的", "火山灰对气候有什么影响", "台风是怎么形成的", "月球对潮汐有什么影响",
+    "臭氧层为什么会出现空洞", "珊瑚礁是怎么形成的", "沙尘暴是怎么形成的", "地球内部有几层", "为什么天空是蓝色的",
+    "极光是怎么产生的", "河流是怎么改道的", "湖泊是怎么形成的", "地热能怎么利用", "海平面为什么会上升"
+]
+
+
+def percentile(values, fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def compare(index, queries, repeat: int):
+    """IVF与暴力计算的 (recall@1, recall@5, top-1相似度比, IVF耗时列表, 暴力耗时列表)"""
+    top1 = top5 = expected5 = 0
+    ratios = []
+    ann_times, exact_times = [], []
+    for buckets, weights in queries:
+        for _ in range(repeat):
+            started = time.perf_counter()
+            ann_rows, ann_scores = index.search(buckets, weights, 5)
+            ann_times.append(time.perf_counter() - started)
+            started = time.perf_counter()
+            exact_rows, exact_scores = index.brute_force(buckets, weights, 5)
+            exact_times.append(time.perf_counter() - started)
+        if len(exact_scores) and exact_scores[0] > 0:
+            ratios.append(ann_scores[0] / exact_scores[0] if len(ann_scores) else 0.0)
+        exact_rows = exact_rows[exact_scores > 0]
+        top1 += not len(exact_rows) or (len(ann_rows) > 0 and ann_rows[0] == exact_rows[0])
+        top5 += len(set(ann_rows.tolist()) & set(exact_rows.tolist()))
+        expected5 += len(exact_rows)
+    return (top1 / len(queries), top5 / expected5 if expected5 else 1.0, float(np.mean(ratios)) if ratios else 1.0,
+            ann_times, exact_times)
+
+
+def lsh_recall(vectors, queries, tables: int = 8, bits: int = 10, seed: int = 0):
+    """随机投影LSH（SimHash，每个表bits位签名）的recall@1和平均候选比例，作为IVF的对照"""
+    rng = np.random.default_rng(seed)
+    planes = rng.standard_normal((vectors.shape[1], tables * bits)).astype(np.float32)
+    powers = 1 << np.arange(bits)
+    doc_codes = ((vectors @ planes) > 0).reshape(-1, tables, bits) @ powers
+    hits = candidates = 0
+    for buckets, weights in queries:
+        codes = ((weights @ planes[buckets]) > 0).reshape(tables, bits) @ powers
+        rows = np.flatnonzero((doc_codes == codes).any(axis=1))
+        exact = np.asarray(vectors @ np.bincount(buckets, weights, vectors.shape[1])).ravel()
+        best = int(exact.argmax())
+        hits += exact[best] <= 0 or best in rows
+        candidates += len(rows)
+    return hits / len(queries), candidates / len(queries) / vectors.shape[0]
+
+
+def synthetic_questions(directory: str, count: int, seed: int = 0):
+    """知识库答案中的句子两两拼接成的合成问题"""
+    from faq_engine import load_qa_pairs
+    sentences = [sentence for pair in load_qa_pairs(directory)
+                 for sentence in re.split(r'[。！？\n]', pair.answer) if 6 <= len(sentence) <= 40]
+    rng = random.Random(seed)
+    return [rng.choice(sentences)[:20] + rng.choice(sentences)[:20] for _ in range(count)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="FAQ语义匹配基准测试")
+    parser.add_argument("--dir", default=DEFAULT_KB_DIR, help="问答Markdown所在目录")
+    parser.add_argument("--nprobe", default="1,2,3,4", help="逗号分隔的nprobe取值")
+    parser.add_argument("--scales", default="1000,10000,50000", help="逗号分隔的合成向量规模")
+    parser.add_argument("--fractions", default="0.05,0.1,0.2", help="规模测试中探查的簇占全部簇的比例")
+    parser.add_argument("--repeat", type=int, default=5, help="测耗时时每个查询重复的次数")
+    args = parser.parse_args()
+
+    engine = FAQEngine(args.dir, semantic=True)
+    vector_index = engine.vector_index
+    pairs = engine.index.pairs
+    texts = ([pair.question for pair in pairs] + [v for pair in pairs for v in variants(pair.question)[1:]]
+             + [query for query, _ in PARAPHRASES] + OUT_OF_DOMAIN)
+    queries = [vector_index.vector(text) for text in texts]
+
+    print("🔬 FAQ语义匹配基准测试")
+    print(f"问答对 {len(pairs)}，向量 {len(vector_index.ann)}，查询 {len(queries)} 条；耗时为单次查询的微秒数")
+    print("=" * 80)
+    print(f"{'nprobe':>8} {'簇数':>5} {'recall@1':>9} {'recall@5':>9} {'相似度比':>8} {'IVF平均':>8} {'IVF p99':>8} "
+          f"{'暴力平均':>8} {'暴力p99':>8}")
+    for nprobe in (int(value) for value in args.nprobe.split(',')):
+        index = IVFIndex(vector_index.ann.vectors[np.argsort(vector_index.ann.rows)], nprobe=nprobe)
+        recall1, recall5, ratio, ann_times, exact_times = compare(index, queries, args.repeat)
+        print(f"{nprobe:>8} {index.lists:>5} {recall1:>9.1%} {recall5:>9.1%} {ratio:>8.3f} "
+              f"{np.mean(ann_times) * 1e6:>8.1f} {percentile(ann_times, 0.99) * 1e6:>8.1f} "
+              f"{np.mean(exact_times) * 1e6:>8.1f} {percentile(exact_times, 0.99) * 1e6:>8.1f}")
+    for tables, bits in ((8, 10), (16, 6), (16, 4)):
+        recall1, scanned = lsh_recall(vector_index.ann.vectors, queries, tables, bits)
+        print(f"对照 LSH {tables}表×{bits}位: recall@1 {recall1:.1%}，平均候选占全部向量 {scanned:.1%}")
+
+    print("-" * 80)
+    lexical = FAQEngine(args.dir, semantic=False)
+    for label, matcher in (("只用字面匹配", lexical), ("字面 + 语义", engine)):
+        hits = correct = 0
+        for query, expected in PARAPHRASES:
+            match = matcher.match(query)
+            if match is not None:
+                hits += 1
+                correct += expected in match.pair.question
+        false_hits = [query for query in OUT_OF_DOMAIN if matcher.match(query) is not None]
+        print(f"{label:<8} 换说法的问题 {len(PARAPHRASES)} 个：命中 {hits}，正确 {correct}；"
+              f"库外问题 {len(OUT_OF_DOMAIN)} 个误命中 {len(false_hits)}" + (f" {false_hits}" if false_hits else ""))
+    started = time.perf_counter()
+    for query, _ in PARAPHRASES * args.repeat:
+        engine.match(query)
+    print(f"完整匹配（字面 + 语义）平均 {(time.perf_counter() - started) / len(PARAPHRASES) / args.repeat * 1000:.3f}ms")
+
+    print("-" * 80)
+    print(f"{'向量数':>8} {'簇数':>5} {'建索引ms':>9} {'nprobe':>6} {'recall@1':>9} {'recall@5':>9} {'相似度比':>8} "
+          f"{'IVF平均':>8} {'IVF p99':>8} {'暴力平均':>8} {'暴力p99':>8}")
+    for scale in (int(value) for value in args.scales.split(',')):
+        keys = split_term_keys(synthetic_questions(args.dir, scale))
+        vectorizer = HashedTfidf().fit(keys)
+        index = IVFIndex(vectorizer.transform_many(keys))
+        scale_queries = [vectorizer.transform(query_keys) for query_keys in split_term_keys(texts)]
+        for fraction in (float(value) for value in args.fractions.split(',')):
+            index.nprobe = max(1, int(round(index.lists * fraction)))
+            recall1, recall5, ratio, ann_times, exact_times = compare(index, scale_queries, 1)
+            print(f"{scale:>8} {index.lists:>5} {index.build_seconds * 1000:>9.0f} {index.nprobe:>6} "
+                  f"{recall1:>9.1%} {recall5:>9.1%} {ratio:>8.3f} "
+                  f"{np.mean(ann_times) * 1e6:>8.1f} {percentile(ann_times, 0.99) * 1e6:>8.1f} "
+                  f"{np.mean(exact_times) * 1e6:>8.1f} {percentile(exact_times, 0.99) * 1e6:>8.1f}")
+    print("=" * 80)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+本地FAQ问答引擎基准测试
+
+用知识库中的问题本身及其改写（换同义疑问词、去标点、只问复合问题的第一问）作为命中测试集，
+用一批知识库没有覆盖的问题、以及知识库问题后附加回答要求（"用一句话"）的说法测误命中，
+统计命中率、命中正确率、误命中率和单次匹配耗时，可用于调整FAQ_MATCH_THRESHOLD / FAQ_MATCH_MARGIN /
+FAQ_MATCH_MAX_EXTRA。只测字面匹配，语义匹配见bench_faq_ann。
+
+用法: python bench_faq_engine.py --threshold 0.8 --margin 0.05 --max-extra 0.1
+"""
+
+import argparse
+import re
+import time
+
+from faq_engine import DEFAULT_KB_DIR, FAQEngine
+
+# 疑问词的常见说法替换
+REWRITES = [("如何", "怎么"), ("是怎样", "是怎么"), ("有什么", "有哪些"), ("为什么", "为何"), ("什么是", "啥是")]
+
+OUT_OF_DOMAIN = [
+    "你好", "你是谁", "今天天气怎么样", "讲个笑话", "帮我写一首诗", "地球是圆的吗", "珠穆朗玛峰有多高",
+    "什么是板块构造", "火山为什么会喷发", "月球是怎么形成的", "北京明天会下雨吗", "推荐几本地理书",
+    "长江有多长", "太阳系有几颗行星", "恐龙是怎么灭绝的", "台风和飓风有什么区别", "海水为什么是咸的",
+    "如何预测地震", "黄河为什么是黄色的", "南极和北极哪个更冷"
+]
+
+# 附加在问题后的回答要求，整理好的答案满足不了，应转发上游
+INSTRUCTION_SUFFIXES = ["用一句话", "详细说明", "用英文回答", "举三个例子", "写成小学生能懂的话"]
+
+
+def variants(question: str):
+    """问题的若干改写"""
+    stripped = re.sub(r'[？?！!。]+$', '', question)
+    result = [question, stripped]
+    for old, new in REWRITES:
+        if old in stripped:
+            result.append(stripped.replace(old, new, 1))
+    first = re.split(r'[？?]', question)[0]
+    if first and first != stripped:
+        result.append(first)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地FAQ问答引擎基准测试")
+    parser.add_argument("--dir", default=DEFAULT_KB_DIR, help="问答Markdown所在目录")
+    parser.add_argument("--threshold", type=float, default=0.8, help="命中阈值")
+    parser.add_argument("--margin", type=float, default=0.05, help="第一名领先第二名的最小差距")
+    parser.add_argument("--max-extra", type=float, default=0.1, help="用户问题多出的字符数上限（问题长度的比例）")
+    parser.add_argument("--repeat", type=int, default=20, help="测耗时时每个问题重复的次数")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    engine = FAQEngine(args.dir, threshold=args.threshold, margin=args.margin, semantic=False,
+                       max_extra=args.max_extra)
+    load_ms = (time.perf_counter() - started) * 1000
+    pairs = engine.index.pairs
+
+    print("🔬 本地FAQ问答引擎基准测试")
+    print("=" * 72)
+    print(f"问答对: {len(pairs)}，加载与建索引耗时 {load_ms:.1f}ms")
+
+    for label, queries in (
+        ("原问题", [(pair.question, pair) for pair in pairs]),
+        ("改写", [(variant, pair) for pair in pairs for variant in variants(pair.question)[1:]]),
+    ):
+        hits = correct = 0
+        for query, pair in queries:
+            match = engine.match(query)
+            if match is not None:
+                hits += 1
+                correct += match.pair is pair
+        print(f"{label:<6} {len(queries):>5} 个  命中率 {hits / len(queries):>6.1%}  "
+              f"命中正确率 {correct / hits if hits else 0:>6.1%}")
+
+    false_hits = [query for query in OUT_OF_DOMAIN if engine.match(query) is not None]
+    print(f"库外问题 {len(OUT_OF_DOMAIN):>3} 个  误命中率 {len(false_hits) / len(OUT_OF_DOMAIN):>6.1%}"
+          + (f"  {false_hits}" if false_hits else ""))
+    instructed = [f"{pair.question}{suffix}" for pair in pairs for suffix in INSTRUCTION_SUFFIXES]
+    false_hits = [query for query in instructed if engine.match(query) is not None]
+    print(f"附加要求 {len(instructed):>3} 个  误命中率 {len(false_hits) / len(instructed):>6.1%}")
+
+    queries = [pair.question for pair in pairs] + OUT_OF_DOMAIN
+    timings = []
+    for _ in range(args.repeat):
+        for query in queries:
+            started = time.perf_counter()
+            engine.match(query)
+            timings.append(time.perf_counter() - started)
+    timings.sort()
+    print(f"单次匹配: 平均 {sum(timings) / len(timings) * 1000:.3f}ms  "
+          f"p50 {timings[len(timings) // 2] * 1000:.3f}ms  p99 {timings[int(len(timings) * 0.99)] * 1000:.3f}ms")
+    print("=" * 72)
+
+
+if __name__ == "__main__":
+    main()
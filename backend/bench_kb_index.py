@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+知识库预建索引（mmap）多worker基准测试
+
+启动多个进程模拟多个uvicorn worker，每个进程加载知识库索引后跑完一遍查询集，
+统计加载耗时和加载前后内存的增长（/proc/self/smaps_rollup）：
+    RSS   进程驻留内存，共享页在每个进程中都计一次
+    PSS   共享页按共享进程数均摊，各worker的PSS之和即这些进程实际占用的物理内存
+    私有  只属于该进程的内存
+mapped为以mmap方式打开kb_index build建好的索引，build为各进程自己解析语料、建索引（对照）。
+所有worker加载完、查询完后在屏障处一起测量，保证共享页确实被同时映射。
+
+用法: python kb_index.py build && python bench_kb_index.py --workers 1,2,4
+"""
+
+import argparse
+import multiprocessing
+import statistics
+import time
+
+from faq_engine import load_qa_pairs
+
+
+def memory_kb():
+    """(RSS, PSS, 私有) 单位KB"""
+    values = {}
+    with open('/proc/self/smaps_rollup') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) >= 2 and parts[1].isdigit():
+                values[parts[0].rstrip(':')] = int(parts[1])
+    return values['Rss'], values['Pss'], values.get('Private_Clean', 0) + values.get('Private_Dirty', 0)
+
+
+def worker(mode: str, barrier, results):
+    from kb_search import knowledge_base
+    queries = [pair.question for pair in load_qa_pairs(knowledge_base.directory)]
+    if mode == 'mapped':
+        key = knowledge_base.corpus_hash()
+    barrier.wait()
+    before = memory_kb()
+
+    started = time.perf_counter()
+    if mode == 'mapped':
+        from kb_index import open_index
+        index = open_index(knowledge_base.index_dir, key)
+        if index is None:
+            raise SystemExit("没有与当前语料匹配的预建索引，请先执行 python kb_index.py build")
+    else:
+        index = knowledge_base.build()
+    load_seconds = time.perf_counter() - started
+    for query in queries:
+        index.search(query, 10)
+
+    barrier.wait()
+    after = memory_kb()
+    results.put((load_seconds, [a - b for a, b in zip(after, before)]))
+    barrier.wait()
+
+
+def run(mode: str, workers: int):
+    context = multiprocessing.get_context('spawn')
+    barrier = context.Barrier(workers)
+    results = context.Queue()
+    processes = [context.Process(target=worker, args=(mode, barrier, results)) for _ in range(workers)]
+    for process in processes:
+        process.start()
+    outcomes = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+
+    loads = [outcome[0] * 1000 for outcome in outcomes]
+    rss, pss, private = ([outcome[1][i] / 1024 for outcome in outcomes] for i in range(3))
+    print(f"{mode:>7} {workers:>6} {statistics.mean(loads):>10.1f} {statistics.mean(rss):>12.1f} "
+          f"{statistics.mean(private):>11.1f} {sum(pss):>13.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="知识库预建索引（mmap）多worker基准测试")
+    parser.add_argument("--workers", default="1,2,4", help="逗号分隔的worker数")
+    parser.add_argument("--modes", default="mapped,build", help="逗号分隔：mapped / build")
+    args = parser.parse_args()
+
+    print("🔬 知识库预建索引多worker基准测试")
+    print("内存为加载索引并跑完查询集后相对加载前的增长（MB）")
+    print("=" * 72)
+    print(f"{'方式':>7} {'worker':>6} {'加载ms':>10} {'每worker RSS':>12} {'每worker私有':>11} {'全部worker PSS':>13}")
+    for mode in args.modes.split(','):
+        for workers in (int(value) for value in args.workers.split(',')):
+            run(mode, workers)
+    print("=" * 72)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+知识库BM25检索基准测试
+
+以knowledge_base的全部段落（问答Markdown + PDF正文，PDF经kb_ingest抽取并缓存）为基础语料，
+按目标字符数扩充语料（从真实段落中随机抽取句子重新组合成新段落，词项分布与真实语料接近），
+测量随语料增长的建索引耗时、索引规模、单条查询的延迟分布和批量查询的吞吐。
+查询集为知识库中整理好的问题加上一批库外问题。现有语料约55万字，默认测到400万字。
+
+用法: python bench_kb_search.py --sizes 0,1000000,2000000,4000000 --top-k 10 [--no-pdfs]
+"""
+
+import argparse
+import os
+import random
+import re
+import time
+
+from faq_engine import DEFAULT_KB_DIR, load_qa_pairs
+from kb_ingest import DEFAULT_CACHE_DIR, PDFIngestor, resolve_path
+from kb_search import PASSAGE_CHARS, BM25Index, Passage, load_passages
+
+OUT_OF_DOMAIN = [
+    "你好", "今天天气怎么样", "讲个笑话", "珠穆朗玛峰有多高", "火山为什么会喷发", "月球是怎么形成的",
+    "长江有多长", "恐龙是怎么灭绝的", "台风和飓风有什么区别", "海水为什么是咸的", "如何预测地震"
+]
+
+
+def grow_corpus(passages, target_chars: int, seed: int = 0):
+    """在真实段落之外补充合成段落，使语料总字符数达到target_chars"""
+    corpus = list(passages)
+    total = sum(len(passage.text) for passage in corpus)
+    if total >= target_chars:
+        return corpus
+    sentences = [s for passage in passages for s in re.split(r'(?<=[。！？；])', passage.text) if s.strip()]
+    titles = [passage.title for passage in passages]
+    rng = random.Random(seed)
+    number = 0
+    while total < target_chars:
+        text = ''
+        while len(text) < PASSAGE_CHARS * 0.8:
+            text += rng.choice(sentences)
+        corpus.append(Passage(f"synthetic#{number}", "synthetic", rng.choice(titles), text))
+        total += len(text)
+        number += 1
+    return corpus
+
+
+def percentile(values, fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="知识库BM25检索基准测试")
+    parser.add_argument("--dir", default=DEFAULT_KB_DIR, help="知识库目录")
+    parser.add_argument("--cache-dir", default=resolve_path(os.getenv('KB_CACHE_DIR', DEFAULT_CACHE_DIR)), help="PDF抽取缓存目录")
+    parser.add_argument("--no-pdfs", action="store_true", help="只用问答Markdown作为基础语料")
+    parser.add_argument("--sizes", default="0,1000000,2000000,4000000",
+                        help="逗号分隔的语料目标字符数（0表示只用真实语料）")
+    parser.add_argument("--top-k", type=int, default=10, help="每次查询返回的段落数")
+    parser.add_argument("--repeat", type=int, default=5, help="测延迟时查询集重复的次数")
+    args = parser.parse_args()
+
+    documents = [] if args.no_pdfs else PDFIngestor(args.dir, args.cache_dir).ingest().documents
+    base = load_passages(args.dir, documents=documents)
+    queries = [pair.question for pair in load_qa_pairs(args.dir)] + OUT_OF_DOMAIN
+
+    print("🔬 知识库BM25检索基准测试")
+    print(f"基础语料 {len(base)} 个段落，查询集 {len(queries)} 条，top-k={args.top_k}")
+    print("=" * 96)
+    print(f"{'字符数':>10} {'段落':>7} {'词项':>8} {'非零元':>10} {'建索引ms':>9} "
+          f"{'查询平均ms':>10} {'p50':>7} {'p99':>7} {'批量条/秒':>10}")
+    for size in (int(value) for value in args.sizes.split(',')):
+        corpus = grow_corpus(base, size)
+        chars = sum(len(passage.text) for passage in corpus)
+        index = BM25Index(corpus)
+
+        timings = []
+        for _ in range(args.repeat):
+            for query in queries:
+                started = time.perf_counter()
+                index.search(query, args.top_k)
+                timings.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        for _ in range(args.repeat):
+            index.search_batch(queries, args.top_k)
+        batch_rate = len(queries) * args.repeat / (time.perf_counter() - started)
+
+        print(f"{chars:>10,} {len(corpus):>7,} {len(index.vocabulary):>8,} {index.matrix.nnz:>10,} "
+              f"{index.build_seconds * 1000:>9.1f} {sum(timings) / len(timings) * 1000:>10.3f} "
+              f"{percentile(timings, 0.5) * 1000:>7.3f} {percentile(timings, 0.99) * 1000:>7.3f} "
+              f"{batch_rate:>10,.0f}")
+    print("=" * 96)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+知识库增量更新基准测试
+
+以knowledge_base的全部段落（问答Markdown + PDF正文，PDF经kb_ingest抽取并缓存）为语料：
+    单文件  依次把每个文件当作“被修改”（删去它的段落、重新加入），比较BM25Index.updated与
+            用全部段落重新建索引的耗时，并核对两者对查询集的得分一致
+    并发    后台线程不停地做增量更新并替换索引，同时在主线程连续查询，
+            比较查询延迟与没有更新时的差别（更新期间查询不会被暂停，只受CPU争用影响）
+
+用法: python bench_kb_update.py --repeat 5 --seconds 3 [--no-pdfs]
+"""
+
+import argparse
+import os
+import statistics
+import threading
+import time
+
+from faq_engine import DEFAULT_KB_DIR, load_qa_pairs
+from kb_ingest import DEFAULT_CACHE_DIR, PDFIngestor, resolve_path
+from kb_search import BM25Index, load_passages
+
+
+def percentile(values, fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def timed(function, repeat: int) -> float:
+    """function执行repeat次的耗时中位数（毫秒）"""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+def query_latencies(holder, queries, seconds: float):
+    """seconds秒内连续查询当前索引，返回各次查询耗时"""
+    timings = []
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        for query in queries:
+            started = time.perf_counter()
+            holder[0].search(query, 10)
+            timings.append(time.perf_counter() - started)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="知识库增量更新基准测试")
+    parser.add_argument("--dir", default=DEFAULT_KB_DIR, help="知识库目录")
+    parser.add_argument("--cache-dir", default=resolve_path(os.getenv('KB_CACHE_DIR', DEFAULT_CACHE_DIR)), help="PDF抽取缓存目录")
+    parser.add_argument("--no-pdfs", action="store_true", help="只用问答Markdown作为语料")
+    parser.add_argument("--repeat", type=int, default=5, help="每项耗时测量的次数（取中位数）")
+    parser.add_argument("--seconds", type=float, default=3.0, help="并发测试的时长")
+    args = parser.parse_args()
+
+    documents = [] if args.no_pdfs else PDFIngestor(args.dir, args.cache_dir).ingest().documents
+    passages = load_passages(args.dir, documents=documents)
+    queries = [pair.question for pair in load_qa_pairs(args.dir)]
+    index = BM25Index(passages)
+    by_source = {}
+    for passage in passages:
+        by_source.setdefault(passage.source, []).append(passage)
+
+    print("🔬 知识库增量更新基准测试")
+    print(f"语料 {len(passages)} 个段落，{len(index.vocabulary)} 个词项，查询集 {len(queries)} 条")
+    print("=" * 88)
+    full_ms = timed(lambda: BM25Index(passages), args.repeat)
+    print(f"全部重建: {full_ms:.1f}ms")
+    print(f"{'变化的文件':<36} {'段落':>6} {'增量ms':>8} {'加速':>6} {'得分一致':>8}")
+    for source, source_passages in by_source.items():
+        update_ms = timed(lambda: index.updated([source], source_passages), args.repeat)
+        updated = index.updated([source], source_passages)
+        same = all([round(score, 4) for score, _ in updated.search(query, 10)]
+                   == [round(score, 4) for score, _ in index.search(query, 10)] for query in queries)
+        print(f"{source[:34]:<36} {len(source_passages):>6} {update_ms:>8.1f} {full_ms / update_ms:>5.1f}x "
+              f"{'是' if same else '否':>8}")
+
+    print("-" * 88)
+    holder = [index]
+    idle = query_latencies(holder, queries, args.seconds)
+    stop = threading.Event()
+    swaps = [0]
+
+    def updater():
+        source, source_passages = next(iter(by_source.items()))
+        while not stop.is_set():
+            holder[0] = holder[0].updated([source], source_passages)
+            swaps[0] += 1
+
+    thread = threading.Thread(target=updater)
+    thread.start()
+    busy = query_latencies(holder, queries, args.seconds)
+    stop.set()
+    thread.join()
+    print(f"{'查询延迟ms':<16} {'次数':>7} {'p50':>7} {'p99':>7} {'最大':>7}")
+    for label, timings in (("无更新", idle), (f"更新中（替换{swaps[0]}次）", busy)):
+        print(f"{label:<16} {len(timings):>7} {percentile(timings, 0.5) * 1000:>7.3f} "
+              f"{percentile(timings, 0.99) * 1000:>7.3f} {max(timings) * 1000:>7.3f}")
+    print("=" * 88)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+SSE解析微基准测试
+
+生成数MB的合成千帆流式响应，按随机大小的网络分块喂给解析器，
+对比旧的逐行解码 + 字符串拼接实现与字节级增量解析器的吞吐量。
+
+用法: python bench_sse_parser.py --size-mb 4 --piece-chars 8
+"""
+
+import argparse
+import asyncio
+import codecs
+import json
+import random
+import time
+from typing import Iterator, List
+
+from sse_parser import AnswerAssembler, SSEParser, aiter_json
+
+PIECE_ALPHABET = "地球板块构造火山地震海洋大气气候冰川岩石矿物沉积风化侵蚀abcdefXYZ0123456789，。"
+
+
+def build_stream(size_mb: float, piece_chars: int, seed: int = 42) -> bytes:
+    """构造近似千帆格式的SSE字节流"""
+    rng = random.Random(seed)
+    target = int(size_mb * 1024 * 1024)
+    frames: List[bytes] = []
+    total = 0
+    index = 0
+    while total < target:
+        piece = ''.join(rng.choice(PIECE_ALPHABET) for _ in range(piece_chars))
+        frame = {
+            "request_id": "bench-request",
+            "conversation_id": "bench-conversation",
+            "message_id": "bench-message",
+            "answer": piece,
+            "is_completion": False,
+            "index": index
+        }
+        encoded = f"data: {json.dumps(frame, ensure_ascii=False)}\n\n".encode("utf-8")
+        if index % 50 == 0:
+            encoded = b": keep-alive\n" + encoded
+        frames.append(encoded)
+        total += len(encoded)
+        index += 1
+
+    final = {"request_id": "bench-request", "answer": "", "is_completion": True}
+    frames.append(f"data: {json.dumps(final)}\n\ndata: [DONE]\n\n".encode("utf-8"))
+    return b''.join(frames)
+
+
+def split_chunks(stream: bytes, min_size: int, max_size: int, seed: int = 7) -> List[bytes]:
+    """模拟网络读取的随机分块（会切断UTF-8字符和行边界）"""
+    rng = random.Random(seed)
+    chunks = []
+    pos = 0
+    while pos < len(stream):
+        size = rng.randint(min_size, max_size)
+        chunks.append(stream[pos:pos + size])
+        pos += size
+    return chunks
+
+
+def iter_lines_decoded(chunks: List[bytes]) -> Iterator[str]:
+    """等价于 requests 的 iter_lines(decode_unicode=True)"""
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    pending = None
+    for chunk in chunks:
+        text = decoder.decode(chunk)
+        if pending is not None:
+            text = pending + text
+        lines = text.splitlines()
+        if lines and text and lines[-1] and lines[-1][-1] == text[-1]:
+            pending = lines.pop()
+        else:
+            pending = None
+        yield from lines
+    if pending is not None:
+        yield pending
+
+
+def legacy_parse(chunks: List[bytes]) -> str:
+    """原 _handle_stream_response 的解析方式"""
+    full_answer = ""
+    final_result = {}
+    for line in iter_lines_decoded(chunks):
+        if not line or line.startswith(':'):
+            continue
+        if line.startswith('data: '):
+            data_content = line[6:].strip()
+            if not data_content or data_content == '[DONE]':
+                continue
+            chunk_data = json.loads(data_content)
+            if 'answer' in chunk_data:
+                full_answer += chunk_data['answer']
+            if chunk_data.get('is_completion', False):
+                final_result = chunk_data
+                final_result['answer'] = full_answer
+                break
+            final_result.update(chunk_data)
+    return final_result.get('answer', full_answer)
+
+
+async def _iter_chunks(chunks: List[bytes]):
+    for chunk in chunks:
+        yield chunk
+
+
+async def _assemble(chunks: List[bytes]) -> str:
+    answer = AnswerAssembler()
+    async for chunk_data in aiter_json(_iter_chunks(chunks)):
+        answer.append(chunk_data.get('answer', ''))
+        if chunk_data.get('is_completion', False):
+            break
+    return answer.getvalue()
+
+
+def incremental_parse(chunks: List[bytes]) -> str:
+    """字节级增量解析 + 分块内批量JSON解码 + 线性答案拼接（与QianfanClient相同的路径）"""
+    return asyncio.run(_assemble(chunks))
+
+
+def parse_only(chunks: List[bytes]) -> int:
+    """仅切分事件，不做JSON解析"""
+    parser = SSEParser()
+    count = 0
+    for chunk in chunks:
+        count += len(parser.feed(chunk))
+    return count + len(parser.flush())
+
+
+def measure(func, chunks: List[bytes], repeat: int) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(chunks)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SSE解析微基准测试")
+    parser.add_argument("--size-mb", type=float, nargs="+", default=[1, 4, 16], help="合成流大小（MB）")
+    parser.add_argument("--piece-chars", type=int, default=8, help="每个分块answer的字符数")
+    parser.add_argument("--min-chunk", type=int, default=512, help="最小网络分块字节数")
+    parser.add_argument("--max-chunk", type=int, default=16384, help="最大网络分块字节数")
+    parser.add_argument("--repeat", type=int, default=3, help="每项重复次数（取最优）")
+    args = parser.parse_args()
+
+    print("🔬 SSE解析微基准测试")
+    print("=" * 72)
+    print(f"{'大小':>8} {'事件数':>9} {'旧实现':>12} {'增量解析':>12} {'仅切分':>12} {'加速比':>8}")
+
+    for size_mb in args.size_mb:
+        stream = build_stream(size_mb, args.piece_chars)
+        chunks = split_chunks(stream, args.min_chunk, args.max_chunk)
+
+        legacy_answer = legacy_parse(chunks)
+        new_answer = incremental_parse(chunks)
+        assert legacy_answer == new_answer, "两种实现的答案不一致"
+        events = parse_only(chunks)
+
+        legacy = measure(legacy_parse, chunks, args.repeat)
+        incremental = measure(incremental_parse, chunks, args.repeat)
+        split = measure(parse_only, chunks, args.repeat)
+        mb = len(stream) / (1024 * 1024)
+
+        print(f"{mb:>6.1f}MB {events:>9} {mb / legacy:>8.1f}MB/s {mb / incremental:>8.1f}MB/s "
+              f"{mb / split:>8.1f}MB/s {legacy / incremental:>7.2f}x")
+
+    print("=" * 72)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,26 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from pydantic import BaseModel, ValidationError
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, AsyncIterator, List
+from contextlib import asynccontextmanager
+import asyncio
 import os
+import json
+import math
 import logging
 import traceback
-from qianfan_client import QianfanClient, create_qianfan_client
+from qianfan_client import QianfanClient
+from client_registry import client_registry
+from conversation_pool import conversation_pool
+from answer_cache import answer_cache, normalize_query, shareable_answer
+from answer_warmup import answer_warmer, warm_match
+from singleflight import upstream_flight
+from admission import admission_controller, AdmissionRejected, AdmissionTicket
+from conversation_store import conversation_store
+from faq_engine import faq_engine, FAQMatch
+from sse_parser import AnswerAssembler
+from utils import make_etag, etag_matches
+from resilience import CircuitOpenError, get_circuit_breaker, breaker_states, any_breaker_open
 
 # 创建路由器
 router = APIRouter(prefix="/api/chat", tags=["智能体对话"])
@@ -16,9 +32,7 @@ logger = logging.getLogger(__name__)
 # 从环境变量读取配置，如果没有则使用默认值（仅用于开发测试）
 QIANFAN_TOKEN = os.getenv('QIANFAN_TOKEN', '')
 DEFAULT_APP_ID = os.getenv('QIANFAN_APP_ID', '')
-
-# 简单的对话存储（生产环境应使用数据库）
-conversation_storage = {}
+QIANFAN_BASE_URL = os.getenv('QIANFAN_API_BASE_URL', 'https://qianfan.baidubce.com')
 
 # Pydantic模型
 class ConversationRequest(BaseModel):
@@ -47,6 +61,7 @@ class QuickChatRequest(BaseModel):
     message: str
     stream: bool = False
     token: Optional[str] = None
+    use_cache: bool = True  # 为False时跳过答案缓存，强制请求上游
 
 class QuickChatResponse(BaseModel):
     success: bool
@@ -87,7 +102,7 @@ class AgentChatResponse(BaseModel):
 
 # 依赖函数：获取千帆客户端
 def get_qianfan_client(token: Optional[str] = None) -> QianfanClient:
-    """获取千帆客户端实例"""
+    """获取千帆客户端实例（从注册表复用长期存活的客户端）"""
     auth_token = token or QIANFAN_TOKEN
     
     # 检查配置
@@ -97,16 +112,139 @@ def get_qianfan_client(token: Optional[str] = None) -> QianfanClient:
             detail="AI服务未配置。请创建.env文件并配置QIANFAN_TOKEN环境变量。"
         )
     
+    # 服务端配置的令牌常驻注册表，请求级覆盖的令牌参与LRU淘汰
+    pinned = auth_token == QIANFAN_TOKEN
+    
     # 确保token格式正确
     if not auth_token.startswith('Bearer '):
         auth_token = f'Bearer {auth_token}'
     
-    return create_qianfan_client(auth_token)
+    return client_registry.get(auth_token, QIANFAN_BASE_URL, pinned=pinned)
+
+def upstream_unavailable(error: CircuitOpenError) -> HTTPException:
+    """上游熔断时快速返回503，并通过Retry-After告知客户端何时重试"""
+    logger.warning(f"上游熔断，快速拒绝请求: {error}")
+    return HTTPException(
+        status_code=503,
+        detail=str(error),
+        headers={"Retry-After": str(max(1, math.ceil(error.retry_after)))}
+    )
+
+async def admit_upstream(token: str, app_id: str) -> AdmissionTicket:
+    """获取上游并发名额；队列已满返回429，排队超时返回503，均带Retry-After"""
+    try:
+        return await admission_controller.acquire(token, app_id)
+    except AdmissionRejected as e:
+        logger.warning(f"准入拒绝: {e}")
+        raise HTTPException(
+            status_code=e.status_code,
+            detail=str(e),
+            headers={"Retry-After": str(max(1, math.ceil(e.retry_after)))}
+        )
+
+@asynccontextmanager
+async def upstream_slot(token: str, app_id: str):
+    """在async with块内占用一个上游并发名额"""
+    ticket = await admit_upstream(token, app_id)
+    try:
+        yield ticket
+    finally:
+        ticket.release()
+
+async def release_when_done(events: AsyncIterator[str], ticket: AdmissionTicket) -> AsyncIterator[str]:
+    """流结束（含客户端断开）时归还上游并发名额"""
+    try:
+        async for event in events:
+            yield event
+    finally:
+        ticket.release()
+
+async def new_conversation(client: QianfanClient, app_id: str, token: Optional[str] = None,
+                           record: bool = True) -> Dict[str, Any]:
+    """
+    创建新对话：使用服务端令牌时优先从预创建池取用，池为空时同步创建
+
+    Args:
+        record: 是否记入对话存储（快速对话的一次性对话不记录）
+    """
+    result = None
+    if (token or QIANFAN_TOKEN) == QIANFAN_TOKEN:
+        result = conversation_pool.acquire(app_id)
+    if result is None:
+        result = await client.create_conversation(app_id)
+    
+    conversation_id = result.get('conversation_id')
+    if record and conversation_id:
+        await conversation_store.call('put', conversation_id, app_id)
+    return result
+
+async def start_conversation_pool():
+    """应用启动时开始为默认应用预创建对话"""
+    if QIANFAN_TOKEN and DEFAULT_APP_ID:
+        app_ids = [DEFAULT_APP_ID] + [
+            app_id.strip() for app_id in os.getenv('CONVERSATION_POOL_APP_IDS', '').split(',') if app_id.strip()
+        ]
+        await conversation_pool.start(get_qianfan_client, app_ids)
+
+async def is_new_conversation(conversation_id: Optional[str]) -> bool:
+    """没有conversation_id，或本服务记录的对话还没有任何消息（上游对话里也没有上下文）"""
+    if not conversation_id:
+        return True
+    page = await conversation_store.call('history', conversation_id, 0, 1)
+    return page is not None and page['total'] == 0
+
+async def match_faq(app_id: str, message: str, conversation_id: Optional[str] = None) -> Optional[FAQMatch]:
+    """
+    本地FAQ只用于默认智能体应用（知识库内容与其一致）
+
+    FAQ未命中时再查预热过的地标aiPrompt答案（answer_warmup），命中时method为warmup。
+    只在新对话或无状态的快速对话中使用：已有上下文的对话在本地作答后上游缺少这一轮，
+    后续追问的上下文与本地历史不一致；本地没有记录或记录不完整的对话同样转发上游。
+    """
+    if app_id != DEFAULT_APP_ID or not await is_new_conversation(conversation_id):
+        return None
+    return faq_engine.match(message) or warm_match(app_id, message)
+
+def faq_message_result(match: FAQMatch, conversation_id: Optional[str] = None) -> Dict[str, Any]:
+    """本地FAQ答案，格式与上游消息结果一致，faq字段为命中的问题和相似度"""
+    return {
+        "answer": match.answer,
+        "conversation_id": conversation_id,
+        "message_id": None,
+        "is_completion": True,
+        "faq": match.to_dict()
+    }
+
+async def answer_with_faq(client: QianfanClient, app_id: str, token: str, conversation_id: Optional[str],
+                          message: str, match: FAQMatch) -> str:
+    """
+    用本地FAQ答案回复并记录本轮对话，返回使用的conversation_id
+
+    没有conversation_id时仍需要一个上游对话供后续消息使用，优先从预创建池取用，不产生上游调用
+    """
+    if not conversation_id:
+        try:
+            async with upstream_slot(token, app_id):
+                result = await new_conversation(client, app_id, token)
+        except CircuitOpenError as e:
+            raise upstream_unavailable(e)
+        conversation_id = result.get('conversation_id')
+        if not conversation_id:
+            raise HTTPException(status_code=500, detail="创建对话失败，请检查AI服务配置")
+    
+    logger.info(f"FAQ命中（{match.score:.3f}）: {match.pair.question}")
+    if await conversation_store.call('append_turn', conversation_id, message, match.answer):
+        # 本轮没有发往上游，标记本地历史比上游对话多出的轮数
+        record = await conversation_store.call('peek', conversation_id)
+        local_turns = record.metadata.get('local_turns', 0) if record is not None else 0
+        await conversation_store.call('update', conversation_id, {'local_turns': local_turns + 1})
+    return conversation_id
 
 # 前端兼容接口 - 直接处理chat.js的调用
 @router.post("", response_model=FrontendChatResponse)
 async def frontend_chat(request: FrontendChatRequest):
     """前端聊天接口 - 兼容现有chat.js的调用方式"""
+    ticket = None
     try:
         logger.info(f"收到前端聊天请求: message='{request.message}', conversation_id={request.conversation_id}")
         
@@ -144,11 +282,20 @@ async def frontend_chat(request: FrontendChatRequest):
         
         app_id = DEFAULT_APP_ID
         
+        # 命中整理好的问答时本地作答，不请求上游
+        faq = await match_faq(app_id, request.message, request.conversation_id)
+        if faq is not None:
+            conversation_id = await answer_with_faq(client, app_id, QIANFAN_TOKEN, request.conversation_id,
+                                                    request.message, faq)
+            return FrontendChatResponse(conversation_id=conversation_id, response=faq.answer)
+        
+        ticket = await admit_upstream(QIANFAN_TOKEN, app_id)
+        
         # 如果没有conversation_id，创建新对话
         if not request.conversation_id:
             logger.info("创建新对话")
             try:
-                conversation_result = client.create_conversation(app_id)
+                conversation_result = await new_conversation(client, app_id)
                 conversation_id = conversation_result.get('conversation_id')
                 
                 if not conversation_id:
@@ -158,15 +305,12 @@ async def frontend_chat(request: FrontendChatRequest):
                         detail="创建对话失败，请检查AI服务配置"
                     )
                 
-                # 存储对话信息
-                conversation_storage[conversation_id] = {
-                    "app_id": app_id,
-                    "created_at": "now"
-                }
                 logger.info(f"新对话创建成功: {conversation_id}")
                 
             except HTTPException:
                 raise
+            except CircuitOpenError as e:
+                raise upstream_unavailable(e)
             except Exception as e:
                 logger.error(f"创建对话异常: {e}")
                 logger.error(f"异常详情: {traceback.format_exc()}")
@@ -181,9 +325,11 @@ async def frontend_chat(request: FrontendChatRequest):
         # 发送消息
         try:
             logger.info(f"发送消息到对话: {conversation_id}")
-            message_result = client.send_message(app_id, conversation_id, request.message, stream=False)
+            message_result = await client.send_message(app_id, conversation_id, request.message, stream=False)
             logger.info(f"消息发送成功，响应长度: {len(str(message_result))}")
             
+        except CircuitOpenError as e:
+            raise upstream_unavailable(e)
         except Exception as e:
             logger.error(f"发送消息失败: {e}")
             logger.error(f"异常详情: {traceback.format_exc()}")
@@ -201,6 +347,9 @@ async def frontend_chat(request: FrontendChatRequest):
             logger.error(f"提取回复文本失败: {e}")
             response_text = "抱歉，处理AI回复时出现错误。"
         
+        await conversation_store.call('append_turn', conversation_id, request.message, response_text,
+                                      message_result.get('message_id'))
+        
         return FrontendChatResponse(
             conversation_id=conversation_id,
             response=response_text
@@ -222,6 +371,9 @@ async def frontend_chat(request: FrontendChatRequest):
             status_code=500, 
             detail=f"聊天服务暂时不可用: {str(e)}"
         )
+    finally:
+        if ticket is not None:
+            ticket.release()
 
 def extract_response_text(api_response: Dict[str, Any]) -> str:
     """从千帆API响应中提取文本回复"""
@@ -268,7 +420,8 @@ async def create_conversation(request: ConversationRequest):
         
         # 创建客户端并发起请求
         client = get_qianfan_client(token)
-        result = client.create_conversation(app_id)
+        async with upstream_slot(token, app_id):
+            result = await new_conversation(client, app_id, token)
         
         return ConversationResponse(
             success=True,
@@ -277,6 +430,8 @@ async def create_conversation(request: ConversationRequest):
         
     except HTTPException:
         raise
+    except CircuitOpenError as e:
+        raise upstream_unavailable(e)
     except Exception as e:
         logger.error(f"创建对话失败: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -299,9 +454,20 @@ async def send_message(request: MessageRequest):
         if not request.message:
             raise HTTPException(status_code=400, detail="缺少消息内容")
         
+        # 命中整理好的问答时本地作答，不请求上游
+        faq = await match_faq(app_id, request.message, request.conversation_id)
+        if faq is not None:
+            client = get_qianfan_client(token)
+            await answer_with_faq(client, app_id, token, request.conversation_id, request.message, faq)
+            return MessageResponse(success=True, data=faq_message_result(faq, request.conversation_id))
+        
         # 创建客户端并发送消息
         client = get_qianfan_client(token)
-        result = client.send_message(app_id, request.conversation_id, request.message, request.stream)
+        async with upstream_slot(token, app_id):
+            result = await client.send_message(app_id, request.conversation_id, request.message, request.stream)
+        
+        await conversation_store.call('append_turn', request.conversation_id, request.message,
+                                      result.get('answer') or '', result.get('message_id'))
         
         return MessageResponse(
             success=True,
@@ -310,40 +476,138 @@ async def send_message(request: MessageRequest):
         
     except HTTPException:
         raise
+    except CircuitOpenError as e:
+        raise upstream_unavailable(e)
     except Exception as e:
         logger.error(f"发送消息失败: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+HISTORY_PAGE_LIMIT = 200
+
+def parse_upstream_history(result: Dict[str, Any]) -> Optional[List[Dict[str, Any]]]:
+    """把上游历史接口的返回转换为本地消息格式，无法识别时返回None"""
+    items = result.get('messages')
+    if items is None and isinstance(result.get('data'), list):
+        items = result['data']
+    if not isinstance(items, list):
+        return None
+    
+    messages = []
+    for item in items:
+        if not isinstance(item, dict) or 'role' not in item:
+            return None
+        content = item.get('content', '')
+        if isinstance(content, list):
+            # 千帆的content为分块列表，文本在outputs.text中
+            content = ''.join(
+                part.get('outputs', {}).get('text', '') for part in content
+                if isinstance(part, dict) and isinstance(part.get('outputs'), dict)
+            )
+        elif not isinstance(content, str):
+            content = str(content)
+        messages.append({
+            'role': item['role'],
+            'content': content,
+            'created_at': item.get('created_at') if isinstance(item.get('created_at'), (int, float)) else None,
+            'message_id': item.get('message_id')
+        })
+    return messages
+
+def history_response(conversation_id: str, page: Dict[str, Any], source: str,
+                     if_none_match: Optional[str]) -> Response:
+    """
+    返回一页历史并附带强ETag；客户端已有相同内容时返回304
+    
+    ETag只由决定响应体的字段计算（消息按序号、时间和ID标识），不需要先序列化整页内容。
+    """
+    etag = make_etag(
+        conversation_id, source, page['total'], page['next_cursor'], page['has_more'], page['reset'],
+        [(message['seq'], message['created_at'], message['message_id']) for message in page['messages']]
+    )
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    
+    body = MessageResponse(success=True, data={"conversation_id": conversation_id, "source": source, **page})
+    return JSONResponse(content=body.model_dump(), headers=headers)
+
 @router.get("/history/{conversation_id}", response_model=MessageResponse)
 async def get_conversation_history(
     conversation_id: str,
+    http_request: Request,
     app_id: Optional[str] = None,
-    token: Optional[str] = None
+    token: Optional[str] = None,
+    cursor: int = 0,
+    limit: int = 50,
+    since: Optional[str] = None
 ):
-    """获取对话历史"""
+    """
+    获取对话历史
+    
+    优先从本地记录返回，按cursor分页（返回序号大于cursor的消息，下一页使用next_cursor）；
+    since为上次收到的最后一条消息ID（或序号），只返回其后的新消息，找不到时reset为true并从头返回。
+    响应带强ETag，轮询时携带If-None-Match，内容未变化返回304。
+    本地没有该对话时请求上游并回填本地记录。
+    """
     try:
         # 获取参数
         app_id = app_id or DEFAULT_APP_ID
         token = token or QIANFAN_TOKEN
+        limit = max(1, min(limit, HISTORY_PAGE_LIMIT))
+        if_none_match = http_request.headers.get('if-none-match')
         
         if not token:
             raise HTTPException(status_code=400, detail="缺少授权令牌")
         
-        # 创建客户端并获取历史
+        page = await conversation_store.call('history', conversation_id, cursor, limit, since)
+        if page is not None:
+            return history_response(conversation_id, page, "local", if_none_match)
+        
+        # 本地未命中：创建客户端并获取历史
         client = get_qianfan_client(token)
-        result = client.get_conversation_history(app_id, conversation_id)
+        async with upstream_slot(token, app_id):
+            result = await client.get_conversation_history(app_id, conversation_id)
         
-        return MessageResponse(
-            success=True,
-            data=result
-        )
+        messages = parse_upstream_history(result)
+        if messages is None:
+            logger.warning(f"无法识别上游历史格式，直接透传: {list(result.keys())}")
+            return MessageResponse(
+                success=True,
+                data=result
+            )
+        
+        await conversation_store.call('replace_history', conversation_id, app_id, messages)
+        page = await conversation_store.call('history', conversation_id, cursor, limit, since)
+        return history_response(conversation_id, page, "upstream", if_none_match)
         
     except HTTPException:
         raise
+    except CircuitOpenError as e:
+        raise upstream_unavailable(e)
     except Exception as e:
         logger.error(f"获取对话历史失败: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+async def run_quick_chat(client: QianfanClient, app_id: str, token: str,
+                         message: str, stream: bool) -> Dict[str, Any]:
+    """快速对话的上游部分：创建对话并发送消息，成功的答案写入缓存"""
+    async with upstream_slot(token, app_id):
+        conversation_result = await new_conversation(client, app_id, token, record=False)
+        conversation_id = conversation_result.get('conversation_id')
+        
+        if not conversation_id:
+            raise HTTPException(status_code=500, detail="创建对话失败")
+        
+        message_result = await client.send_message(app_id, conversation_id, message, stream)
+    
+    data = {
+        'conversation': conversation_result,
+        'message_response': message_result
+    }
+    if message_result.get('answer') and not message_result.get('error'):
+        answer_cache.put(app_id, message, shareable_answer(data))
+    return data
+
 @router.post("/quick-chat", response_model=QuickChatResponse)
 async def quick_chat(request: QuickChatRequest):
     """快速对话（自动创建对话并发送消息）"""
@@ -359,29 +623,36 @@ async def quick_chat(request: QuickChatRequest):
         if not request.message:
             raise HTTPException(status_code=400, detail="缺少消息内容")
         
+        # 无状态问答先查本地FAQ和缓存，命中时不消耗上游配额
+        if request.use_cache:
+            faq = await match_faq(app_id, request.message)
+            if faq is not None:
+                return QuickChatResponse(success=True, data={
+                    'conversation': {}, 'message_response': faq_message_result(faq), 'cached': False
+                })
+            cached = answer_cache.get(app_id, request.message)
+            if cached is not None:
+                return QuickChatResponse(success=True, data={**cached, 'cached': True})
+        
         # 创建客户端
         client = get_qianfan_client(token)
         
-        # 首先创建对话
-        conversation_result = client.create_conversation(app_id)
-        conversation_id = conversation_result.get('conversation_id')
-        
-        if not conversation_id:
-            raise HTTPException(status_code=500, detail="创建对话失败")
-        
-        # 发送消息
-        message_result = client.send_message(app_id, conversation_id, request.message, request.stream)
+        # 相同问题的并发请求合并为一次上游调用
+        flight_key = ("quick-chat", token, app_id, normalize_query(request.message), request.stream)
+        data = await upstream_flight.do(
+            flight_key,
+            lambda: run_quick_chat(client, app_id, token, request.message, request.stream)
+        )
         
         return QuickChatResponse(
             success=True,
-            data={
-                'conversation': conversation_result,
-                'message_response': message_result
-            }
+            data={**data, 'cached': False}
         )
         
     except HTTPException:
         raise
+    except CircuitOpenError as e:
+        raise upstream_unavailable(e)
     except Exception as e:
         logger.error(f"快速对话失败: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -393,7 +664,8 @@ async def test_connection():
         "qianfan_token_configured": bool(QIANFAN_TOKEN),
         "qianfan_app_id_configured": bool(DEFAULT_APP_ID),
         "qianfan_token_length": len(QIANFAN_TOKEN) if QIANFAN_TOKEN else 0,
-        "app_id": DEFAULT_APP_ID if DEFAULT_APP_ID else "未配置"
+        "app_id": DEFAULT_APP_ID if DEFAULT_APP_ID else "未配置",
+        "upstream_degraded": any_breaker_open()
     }
     
     logger.info(f"API测试请求，配置状态: {config_status}")
@@ -407,11 +679,31 @@ async def test_connection():
             "POST /api/chat/message - 发送消息", 
             "GET /api/chat/history/{conversation_id} - 获取对话历史",
             "POST /api/chat/quick-chat - 快速对话",
-            "POST /api/chat/agent-chat - 智能体对话接口（推荐）"
+            "POST /api/chat/agent-chat - 智能体对话接口（推荐）",
+            "POST /api/chat/stream - 前端流式聊天接口（SSE）",
+            "POST /api/chat/agent-chat/stream - 智能体流式对话接口（SSE）",
+            "POST /api/chat/quick-chat/stream - 快速流式对话接口（SSE）",
+            "GET /api/chat/stats - 运行状态统计"
         ],
         config_status=config_status
     ) 
 
+@router.get("/stats")
+async def get_stats():
+    """运行状态统计（客户端连接池、熔断器等）"""
+    return {
+        "success": True,
+        "client_registry": client_registry.stats(),
+        "conversation_pool": conversation_pool.stats(),
+        "answer_cache": answer_cache.stats(),
+        "answer_warmup": answer_warmer.stats(),
+        "faq": faq_engine.stats(),
+        "singleflight": upstream_flight.stats(),
+        "admission": admission_controller.stats(),
+        "conversation_store": conversation_store.stats(),
+        "circuit_breakers": breaker_states()
+    }
+
 # 在最后添加新的智能体对话接口
 @router.post("/agent-chat", response_model=AgentChatResponse)
 async def agent_chat(request: AgentChatRequest):
@@ -420,6 +712,7 @@ async def agent_chat(request: AgentChatRequest):
     1. 如果没有conversation_id，先创建新对话
     2. 使用conversation_id发送消息获取回复
     """
+    ticket = None
     try:
         logger.info(f"智能体对话请求: message='{request.message}', conversation_id={request.conversation_id}")
         
@@ -461,11 +754,19 @@ async def agent_chat(request: AgentChatRequest):
         
         conversation_id = request.conversation_id
         
+        # 命中整理好的问答时本地作答，不请求上游
+        faq = await match_faq(app_id, request.message, request.conversation_id)
+        if faq is not None:
+            conversation_id = await answer_with_faq(client, app_id, token, conversation_id, request.message, faq)
+            return AgentChatResponse(success=True, conversation_id=conversation_id, response=faq.answer)
+        
+        ticket = await admit_upstream(token, app_id)
+        
         # 步骤1：如果没有conversation_id，创建新对话
         if not conversation_id:
             logger.info("步骤1: 创建新对话")
             try:
-                conversation_result = client.create_conversation(app_id)
+                conversation_result = await new_conversation(client, app_id, token)
                 conversation_id = conversation_result.get('conversation_id')
                 
                 if not conversation_id:
@@ -479,6 +780,8 @@ async def agent_chat(request: AgentChatRequest):
                 
             except HTTPException:
                 raise
+            except CircuitOpenError as e:
+                raise upstream_unavailable(e)
             except Exception as e:
                 logger.error(f"创建对话异常: {e}")
                 logger.error(f"异常详情: {traceback.format_exc()}")
@@ -492,10 +795,12 @@ async def agent_chat(request: AgentChatRequest):
         # 步骤2：使用conversation_id发送消息
         try:
             logger.info(f"步骤2: 发送消息到对话 {conversation_id}")
-            message_result = client.send_message(app_id, conversation_id, request.message, request.stream)
+            message_result = await client.send_message(app_id, conversation_id, request.message, request.stream)
             
             logger.info(f"消息发送成功，响应: {type(message_result)}")
             
+        except CircuitOpenError as e:
+            raise upstream_unavailable(e)
         except Exception as e:
             logger.error(f"发送消息失败: {e}")
             logger.error(f"异常详情: {traceback.format_exc()}")
@@ -513,6 +818,9 @@ async def agent_chat(request: AgentChatRequest):
             logger.error(f"提取回复文本失败: {e}")
             response_text = "抱歉，处理AI回复时出现错误。"
         
+        await conversation_store.call('append_turn', conversation_id, request.message, response_text,
+                                      message_result.get('message_id'))
+        
         # 返回结果
         return AgentChatResponse(
             success=True,
@@ -537,7 +845,247 @@ async def agent_chat(request: AgentChatRequest):
         raise HTTPException(
             status_code=500, 
             detail=f"智能体对话服务暂时不可用: {str(e)}"
-        ) 
+        )
+    finally:
+        if ticket is not None:
+            ticket.release()
+
+# 流式对话接口 - Server-Sent Events
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "Connection": "keep-alive",
+    "X-Accel-Buffering": "no"  # 禁止nginx等反向代理缓冲
+}
+
+def format_sse(data: Any, event: Optional[str] = None) -> str:
+    """格式化为一条SSE消息"""
+    payload = data if isinstance(data, str) else json.dumps(data, ensure_ascii=False)
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {payload}\n\n"
+
+async def stream_chat_events(client: QianfanClient, app_id: str, conversation_id: str,
+                             message: str) -> AsyncIterator[str]:
+    """转发上游流式响应，每收到一个分块立即推送给前端；完整结束后记录本轮对话"""
+    yield format_sse({"conversation_id": conversation_id}, event="conversation")
+    
+    answer = AnswerAssembler()
+    message_id = None
+    completed = False
+    try:
+        async for chunk in client.send_message_stream(app_id, conversation_id, message):
+            if chunk.get('error'):
+                yield format_sse(chunk, event="error")
+                break
+            answer.append(chunk.get('answer'))
+            message_id = chunk.get('message_id') or message_id
+            completed = bool(chunk.get('is_completion'))
+            yield format_sse(chunk)
+    except Exception as e:
+        logger.error(f"流式对话异常: {e}")
+        logger.error(f"异常详情: {traceback.format_exc()}")
+        yield format_sse({"error": str(e), "is_completion": True}, event="error")
+    finally:
+        # 中途出错或客户端断开时上游可能已记录部分内容，下次读取历史以上游为准；
+        # 客户端断开时本任务已被取消，记录操作放在独立任务中完成
+        if completed:
+            recording = conversation_store.call('append_turn', conversation_id, message, answer.getvalue(),
+                                                message_id)
+        else:
+            recording = conversation_store.call('mark_history_stale', conversation_id)
+        await asyncio.shield(recording)
+    
+    yield format_sse("[DONE]")
+
+async def prepare_stream_conversation(client: QianfanClient, app_id: str,
+                                      conversation_id: Optional[str], token: Optional[str] = None) -> str:
+    """流式接口开始推送前确定conversation_id，创建失败时直接返回HTTP错误"""
+    # 上游熔断时在返回流之前快速失败，避免推送一个注定出错的流
+    try:
+        get_circuit_breaker(client.base_url, "runs").raise_if_open()
+    except CircuitOpenError as e:
+        raise upstream_unavailable(e)
+    
+    if conversation_id:
+        logger.info(f"使用现有对话: {conversation_id}")
+        return conversation_id
+    
+    try:
+        conversation_result = await new_conversation(client, app_id, token)
+    except CircuitOpenError as e:
+        raise upstream_unavailable(e)
+    except Exception as e:
+        logger.error(f"创建对话异常: {e}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"创建对话时发生错误: {str(e)}"
+        )
+    
+    conversation_id = conversation_result.get('conversation_id')
+    if not conversation_id:
+        logger.error(f"创建对话失败，返回结果: {conversation_result}")
+        raise HTTPException(
+            status_code=500,
+            detail="创建对话失败，请检查AI服务配置"
+        )
+    
+    logger.info(f"新对话创建成功: {conversation_id}")
+    return conversation_id
+
+@router.post("/stream")
+async def frontend_chat_stream(request: FrontendChatRequest):
+    """前端流式聊天接口 - 与POST /api/chat参数一致，以text/event-stream逐块返回"""
+    if not request.message or not request.message.strip():
+        raise HTTPException(status_code=400, detail="消息内容不能为空")
+    
+    if not DEFAULT_APP_ID:
+        raise HTTPException(
+            status_code=500,
+            detail="AI服务未配置。请创建.env文件并配置QIANFAN_APP_ID环境变量。"
+        )
+    
+    client = get_qianfan_client()
+    app_id = DEFAULT_APP_ID
+    faq = await match_faq(app_id, request.message, request.conversation_id)
+    if faq is not None:
+        conversation_id = await answer_with_faq(client, app_id, QIANFAN_TOKEN, request.conversation_id,
+                                                request.message, faq)
+        return StreamingResponse(faq_stream_events(faq, conversation_id), media_type="text/event-stream",
+                                 headers=SSE_HEADERS)
+    
+    ticket = await admit_upstream(QIANFAN_TOKEN, app_id)
+    try:
+        conversation_id = await prepare_stream_conversation(client, app_id, request.conversation_id)
+    except BaseException:
+        ticket.release()
+        raise
+    
+    return StreamingResponse(
+        release_when_done(stream_chat_events(client, app_id, conversation_id, request.message), ticket),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS
+    )
+
+@router.post("/agent-chat/stream")
+async def agent_chat_stream(request: AgentChatRequest):
+    """智能体流式对话接口 - 与POST /api/chat/agent-chat参数一致，以text/event-stream逐块返回"""
+    if not request.message or not request.message.strip():
+        raise HTTPException(status_code=400, detail="消息内容不能为空")
+    
+    app_id = request.app_id or DEFAULT_APP_ID
+    token = request.token or QIANFAN_TOKEN
+    
+    if not token:
+        raise HTTPException(
+            status_code=400,
+            detail="缺少授权令牌。请配置QIANFAN_TOKEN环境变量。"
+        )
+    
+    if not app_id:
+        raise HTTPException(
+            status_code=400,
+            detail="缺少应用ID。请配置QIANFAN_APP_ID环境变量。"
+        )
+    
+    client = get_qianfan_client(token)
+    faq = await match_faq(app_id, request.message, request.conversation_id)
+    if faq is not None:
+        conversation_id = await answer_with_faq(client, app_id, token, request.conversation_id,
+                                                request.message, faq)
+        return StreamingResponse(faq_stream_events(faq, conversation_id), media_type="text/event-stream",
+                                 headers=SSE_HEADERS)
+    
+    ticket = await admit_upstream(token, app_id)
+    try:
+        conversation_id = await prepare_stream_conversation(client, app_id, request.conversation_id, token)
+    except BaseException:
+        ticket.release()
+        raise
+    
+    return StreamingResponse(
+        release_when_done(stream_chat_events(client, app_id, conversation_id, request.message), ticket),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS
+    )
+
+async def quick_chat_stream_events(client: QianfanClient, app_id: str, token: str,
+                                   message: str) -> AsyncIterator[str]:
+    """快速流式对话：创建对话后转发上游流，创建失败时以error事件结束"""
+    try:
+        conversation_result = await new_conversation(client, app_id, token, record=False)
+        conversation_id = conversation_result.get('conversation_id')
+        if not conversation_id:
+            raise ValueError("创建对话失败，请检查AI服务配置")
+    except Exception as e:
+        logger.error(f"创建对话异常: {e}")
+        yield format_sse({"error": str(e), "is_completion": True}, event="error")
+        yield format_sse("[DONE]")
+        return
+    
+    async for event in stream_chat_events(client, app_id, conversation_id, message):
+        yield event
+
+async def faq_stream_events(match: FAQMatch, conversation_id: Optional[str] = None) -> AsyncIterator[str]:
+    """以一个完整分块返回本地FAQ答案"""
+    yield format_sse({"conversation_id": conversation_id}, event="conversation")
+    yield format_sse(faq_message_result(match, conversation_id))
+    yield format_sse("[DONE]")
+
+async def cached_stream_events(cached: Dict[str, Any]) -> AsyncIterator[str]:
+    """以一个完整分块回放缓存的答案"""
+    conversation = cached.get('conversation') or {}
+    yield format_sse({"conversation_id": conversation.get('conversation_id')}, event="conversation")
+    yield format_sse({**cached['message_response'], "is_completion": True, "cached": True})
+    yield format_sse("[DONE]")
+
+@router.post("/quick-chat/stream")
+async def quick_chat_stream(request: QuickChatRequest):
+    """快速流式对话接口 - 无状态，相同问题的并发请求共享同一个上游流"""
+    app_id = request.app_id or DEFAULT_APP_ID
+    token = request.token or QIANFAN_TOKEN
+    
+    if not token:
+        raise HTTPException(status_code=400, detail="缺少授权令牌")
+    
+    if not request.message or not request.message.strip():
+        raise HTTPException(status_code=400, detail="缺少消息内容")
+    
+    if request.use_cache:
+        faq = await match_faq(app_id, request.message)
+        if faq is not None:
+            return StreamingResponse(faq_stream_events(faq), media_type="text/event-stream", headers=SSE_HEADERS)
+        cached = answer_cache.get(app_id, request.message)
+        if cached is not None:
+            return StreamingResponse(
+                cached_stream_events(cached),
+                media_type="text/event-stream",
+                headers=SSE_HEADERS
+            )
+    
+    client = get_qianfan_client(token)
+    try:
+        get_circuit_breaker(client.base_url, "runs").raise_if_open()
+    except CircuitOpenError as e:
+        raise upstream_unavailable(e)
+    
+    flight_key = ("quick-chat-stream", token, app_id, normalize_query(request.message))
+    # 只有发起上游流的请求占用并发名额，加入已有流的请求不占用
+    ticket = None
+    if not upstream_flight.in_flight(flight_key):
+        ticket = await admit_upstream(token, app_id)
+        if upstream_flight.in_flight(flight_key):
+            # 排队期间相同的流已经启动，直接加入
+            ticket.release()
+            ticket = None
+    
+    def start_stream() -> AsyncIterator[str]:
+        events = quick_chat_stream_events(client, app_id, token, request.message)
+        return release_when_done(events, ticket) if ticket else events
+    
+    return StreamingResponse(
+        upstream_flight.stream(flight_key, start_stream),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS
+    )
 
 # 提取响应文本的辅助函数
 def extract_response_text(message_result):
@@ -554,4 +1102,4 @@ def extract_response_text(message_result):
         if "text" in message_result["result"]:
             return message_result["result"]["text"]
             
-    return "未能提取到响应内容" 
\ No newline at end of file
+    return "未能提取到响应内容" 
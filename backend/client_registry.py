@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+千帆客户端注册表 - 按 (授权令牌, 基础URL) 复用长期存活的客户端及其连接池
+"""
+
+import asyncio
+import logging
+import os
+from collections import OrderedDict
+from typing import Dict, Any, Tuple
+
+from qianfan_client import QianfanClient, create_session
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BASE_URL = "https://qianfan.baidubce.com"
+
+# 被淘汰客户端的关闭宽限期，需长于上游最长超时（流式请求120秒），避免中断进行中的请求
+EVICTION_GRACE_SECONDS = 150
+
+
+class QianfanClientRegistry:
+    """客户端注册表 - 有界LRU，每个客户端持有独立的连接池"""
+
+    def __init__(self, max_clients: int = 32, eviction_grace: float = EVICTION_GRACE_SECONDS):
+        self.max_clients = max_clients
+        self.eviction_grace = eviction_grace
+        self._clients: "OrderedDict[Tuple[str, str], QianfanClient]" = OrderedDict()
+        self._pinned = set()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, authorization_token: str, base_url: str = DEFAULT_BASE_URL,
+            pinned: bool = False) -> QianfanClient:
+        """
+        获取客户端，不存在时创建
+
+        Args:
+            authorization_token: 完整的Authorization头（Bearer token）
+            base_url: API基础URL
+            pinned: 是否常驻（不参与淘汰），用于服务端配置的默认令牌
+        """
+        key = (authorization_token, base_url)
+        if pinned:
+            # 先以请求级令牌创建、后被配置为默认令牌的客户端也要常驻
+            self._pinned.add(key)
+        client = self._clients.get(key)
+        if client is not None and not client.closed:
+            self.hits += 1
+            self._clients.move_to_end(key)
+            return client
+
+        self.misses += 1
+        client = QianfanClient(authorization_token, base_url, session=create_session())
+        self._clients[key] = client
+        self._evict_overflow()
+        return client
+
+    def _evict_overflow(self):
+        """淘汰最久未使用的非常驻客户端"""
+        while len(self._clients) > self.max_clients:
+            victim = next((key for key in self._clients if key not in self._pinned), None)
+            if victim is None:
+                return
+            client = self._clients.pop(victim)
+            self.evictions += 1
+            self._schedule_close(client)
+
+    def _schedule_close(self, client: QianfanClient):
+        """宽限期后关闭客户端连接池"""
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        loop.call_later(self.eviction_grace, lambda: loop.create_task(client.close()))
+
+    async def close_all(self):
+        """关闭所有客户端（应用关闭时调用）"""
+        clients = list(self._clients.values())
+        self._clients.clear()
+        self._pinned.clear()
+        for client in clients:
+            await client.close()
+
+    def stats(self) -> Dict[str, Any]:
+        """连接池命中统计"""
+        total = self.hits + self.misses
+        return {
+            "size": len(self._clients),
+            "max_size": self.max_clients,
+            "pinned": len(self._pinned),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0
+        }
+
+
+# 全局实例
+client_registry = QianfanClientRegistry(
+    max_clients=int(os.getenv('QIANFAN_CLIENT_REGISTRY_SIZE', 32))
+)
@@ -0,0 +1,513 @@
+#!/usr/bin/env python3
+"""
+对话持久化 - 本地SQLite（WAL模式）
+
+写入由专门的后台任务批量执行：各请求只把写操作追加到待写队列，
+写入任务每隔一个很短的窗口把积攒的操作放进同一个事务提交（group commit），
+提交在线程中进行，不阻塞事件循环。读取走独立的只读连接，WAL模式下与写入互不阻塞；
+读取对话时重放尚未提交的写操作，ConversationStore.preload在线程中读取，请求处理中不在事件循环上访问数据库。
+
+SQLiteConversationState是多worker共享模式（CONVERSATION_BACKEND=sqlite）使用的同步版本：
+每个操作立即在短事务中提交，同一主机上的其他进程随即可见，消息序号在写事务内分配。
+"""
+
+import asyncio
+import itertools
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS conversations (
+    conversation_id TEXT PRIMARY KEY,
+    app_id TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    last_used REAL NOT NULL,
+    metadata TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_conversations_last_used ON conversations (last_used);
+CREATE TABLE IF NOT EXISTS messages (
+    conversation_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    message_id TEXT,
+    PRIMARY KEY (conversation_id, seq)
+) WITHOUT ROWID;
+"""
+
+SQL_UPSERT_CONVERSATION = (
+    "INSERT INTO conversations (conversation_id, app_id, created_at, last_used, metadata) VALUES (?, ?, ?, ?, ?) "
+    "ON CONFLICT(conversation_id) DO UPDATE SET app_id = excluded.app_id, created_at = excluded.created_at, "
+    "last_used = excluded.last_used, metadata = excluded.metadata"
+)
+SQL_UPDATE_METADATA = "UPDATE conversations SET metadata = ?, last_used = ? WHERE conversation_id = ?"
+SQL_TOUCH = "UPDATE conversations SET last_used = ? WHERE conversation_id = ? AND last_used < ?"
+SQL_DELETE_CONVERSATION = "DELETE FROM conversations WHERE conversation_id = ?"
+SQL_DELETE_MESSAGES = "DELETE FROM messages WHERE conversation_id = ?"
+SQL_APPEND_MESSAGE = (
+    "INSERT OR REPLACE INTO messages (conversation_id, seq, role, content, created_at, message_id) "
+    "VALUES (?, ?, ?, ?, ?, ?)"
+)
+SQL_PURGE_CONVERSATIONS = "DELETE FROM conversations WHERE last_used < ?"
+# 按最后使用时间索引找到过期的对话，再按主键前缀删除其消息，耗时与过期的消息数成正比
+SQL_PURGE_MESSAGES = (
+    "DELETE FROM messages WHERE conversation_id IN (SELECT conversation_id FROM conversations WHERE last_used < ?)"
+)
+SQL_SELECT_CONVERSATION = (
+    "SELECT app_id, created_at, last_used, metadata FROM conversations WHERE conversation_id = ?"
+)
+SQL_SELECT_MESSAGES = (
+    "SELECT seq, role, content, created_at, message_id FROM messages "
+    "WHERE conversation_id = ? AND seq > ? ORDER BY seq LIMIT ?"
+)
+
+
+def _encode_metadata(metadata: Optional[Dict[str, Any]]) -> Optional[str]:
+    return json.dumps(metadata, ensure_ascii=False, default=str) if metadata else None
+
+
+def _decode_metadata(text: Optional[str]) -> Dict[str, Any]:
+    return json.loads(text) if text else {}
+
+
+def _message_dicts(rows: List[tuple]) -> List[Dict[str, Any]]:
+    return [
+        {"seq": row[0], "role": row[1], "content": row[2], "created_at": row[3], "message_id": row[4]}
+        for row in rows
+    ]
+
+
+def connect(path: str) -> sqlite3.Connection:
+    """打开数据库连接（自动提交模式，事务显式开启）"""
+    conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    # WAL模式下NORMAL只在检查点时fsync，掉电最多丢失最近的事务，进程崩溃不丢数据
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA busy_timeout=5000")
+    return conn
+
+
+class SQLiteConversationBackend:
+    """SQLite对话持久化后端"""
+
+    def __init__(self, path: str, flush_interval: float = 0.02, max_batch: int = 5000):
+        """
+        Args:
+            path: 数据库文件路径
+            flush_interval: 组提交窗口（秒），窗口内到达的写操作合并到一个事务
+            max_batch: 单个事务的最大操作数
+        """
+        self.path = path
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+        self._writer = connect(path)
+        self._writer.executescript(SCHEMA)
+        self._reader = connect(path)
+        self._reader_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+
+        self._pending: List[Tuple[str, tuple]] = []
+        self._touches: Dict[str, float] = {}
+        # 正在线程中提交的批次；读取对话时与待写队列一起重放，读到尚未提交的写入
+        self._inflight: Tuple[List[Tuple[str, tuple]], Dict[str, float]] = ([], {})
+        self._queue_lock = threading.Lock()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+        self.ops_written = 0
+        self.batches = 0
+        self.max_batch_seen = 0
+        self.write_seconds = 0.0
+
+    # ---- 写入（入队） ----
+
+    def _enqueue(self, sql: str, params: tuple):
+        self._pending.append((sql, params))
+        self._notify()
+
+    def _notify(self):
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def upsert_conversation(self, conversation_id: str, app_id: str, created_at: float, last_used: float,
+                            metadata: Optional[Dict[str, Any]] = None):
+        self._touches.pop(conversation_id, None)
+        self._enqueue(SQL_UPSERT_CONVERSATION,
+                      (conversation_id, app_id, created_at, last_used, _encode_metadata(metadata)))
+
+    def update_metadata(self, conversation_id: str, metadata: Dict[str, Any], last_used: float):
+        self._enqueue(SQL_UPDATE_METADATA, (_encode_metadata(metadata), last_used, conversation_id))
+
+    def touch(self, conversation_id: str, last_used: float):
+        """更新最后使用时间；同一批次内对同一对话的多次更新只写最后一次"""
+        self._touches[conversation_id] = last_used
+        self._notify()
+
+    def delete_conversation(self, conversation_id: str):
+        self._touches.pop(conversation_id, None)
+        self._enqueue(SQL_DELETE_CONVERSATION, (conversation_id,))
+        self._enqueue(SQL_DELETE_MESSAGES, (conversation_id,))
+
+    def append_message(self, conversation_id: str, seq: int, role: str, content: str, created_at: float,
+                       message_id: Optional[str] = None):
+        """追加一条消息，seq为对话内从1开始的序号"""
+        self._enqueue(SQL_APPEND_MESSAGE, (conversation_id, seq, role, content, created_at, message_id))
+
+    def replace_messages(self, conversation_id: str, messages: List[Dict[str, Any]]):
+        """用上游回填的完整历史替换本地消息"""
+        self._enqueue(SQL_DELETE_MESSAGES, (conversation_id,))
+        for message in messages:
+            self.append_message(conversation_id, message['seq'], message['role'], message['content'],
+                                message['created_at'], message.get('message_id'))
+
+    def purge_expired(self, cutoff: float):
+        """删除最后使用时间早于cutoff的对话及其消息（先删消息，此时对话行仍在）"""
+        self._enqueue(SQL_PURGE_MESSAGES, (cutoff,))
+        self._enqueue(SQL_PURGE_CONVERSATIONS, (cutoff,))
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending) + len(self._touches)
+
+    # ---- 写入（提交） ----
+
+    def _take_batch(self) -> Tuple[List[Tuple[str, tuple]], Dict[str, float]]:
+        with self._queue_lock:
+            if len(self._pending) > self.max_batch:
+                batch = self._pending[:self.max_batch]
+                self._pending = self._pending[self.max_batch:]
+                touches = {}
+            else:
+                batch, self._pending = self._pending, []
+                room = self.max_batch - len(batch)
+                if len(self._touches) <= room:
+                    touches, self._touches = self._touches, {}
+                else:
+                    touches = {cid: self._touches.pop(cid) for cid in list(itertools.islice(self._touches, room))}
+            self._inflight = (batch, touches)
+        return batch, touches
+
+    def _write_batch(self, batch: List[Tuple[str, tuple]], touches: Dict[str, float]):
+        """在一个事务中执行一批写操作；连续的同类语句合并为executemany"""
+        if not batch and not touches:
+            return
+        started = time.perf_counter()
+        with self._write_lock:
+            conn = self._writer
+            conn.execute("BEGIN")
+            try:
+                for sql, group in itertools.groupby(batch, key=lambda op: op[0]):
+                    conn.executemany(sql, [params for _, params in group])
+                if touches:
+                    # 放在最后执行：同一批次中先插入后使用的对话也能正确更新
+                    conn.executemany(SQL_TOUCH, [(ts, cid, ts) for cid, ts in touches.items()])
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        size = len(batch) + len(touches)
+        self.ops_written += size
+        self.batches += 1
+        self.max_batch_seen = max(self.max_batch_seen, size)
+        self.write_seconds += time.perf_counter() - started
+
+    async def _writer_loop(self):
+        while True:
+            await self._wakeup.wait()
+            # 组提交窗口：等一小段时间让并发请求的写操作进入同一事务
+            await asyncio.sleep(self.flush_interval)
+            self._wakeup.clear()
+            while self._pending or self._touches:
+                batch, touches = self._take_batch()
+                try:
+                    await asyncio.to_thread(self._write_batch, batch, touches)
+                except sqlite3.Error as e:
+                    logger.error(f"对话持久化写入失败，丢弃 {len(batch) + len(touches)} 个操作: {e}")
+                finally:
+                    self._inflight = ([], {})
+
+    async def start(self):
+        """启动后台写入任务"""
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            if self.pending:
+                self._wakeup.set()
+            self._task = asyncio.create_task(self._writer_loop())
+
+    async def stop(self):
+        """停止写入任务并写完剩余操作"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            self._wakeup = None
+        self.flush()
+
+    def flush(self):
+        """同步写完所有待写操作（关闭时或脚本中使用）"""
+        while self._pending or self._touches:
+            try:
+                self._write_batch(*self._take_batch())
+            finally:
+                self._inflight = ([], {})
+
+    async def wait_idle(self):
+        """等待当前已入队的操作全部提交（包括已从队列取出、尚未开始写入的批次）"""
+        while self.pending or self._inflight[0] or self._inflight[1]:
+            await asyncio.sleep(self.flush_interval)
+
+    async def drain(self):
+        """读取前等待已入队的操作提交：写入任务运行时等待它写完，否则（脚本中）直接同步写入"""
+        if self._task is None:
+            self.flush()
+        else:
+            await self.wait_idle()
+
+    def close(self):
+        self.flush()
+        self._writer.close()
+        self._reader.close()
+
+    # ---- 读取 ----
+
+    def _query(self, sql: str, params: tuple) -> List[tuple]:
+        with self._reader_lock:
+            return self._reader.execute(sql, params).fetchall()
+
+    def _queued(self, conversation_id: str) -> Tuple[List[Tuple[str, tuple]], float]:
+        """尚未提交的写操作（正在提交的批次在前）和该对话排队中的最后使用时间，可在线程中调用"""
+        with self._queue_lock:
+            batch, touches = self._inflight
+            touched = max(touches.get(conversation_id, 0.0), self._touches.get(conversation_id, 0.0))
+            return batch + self._pending, touched
+
+    def load_conversation(self, conversation_id: str) -> Optional[Dict[str, Any]]:
+        """
+        读取单个对话，时间为epoch秒
+
+        在已提交的行上按顺序重放尚未提交的插入、元数据更新和删除，读到的是最新状态。
+        取队列和读库期间持有写锁，不会有批次在两者之间提交（已提交的批次重放一次结果不变）。
+        """
+        with self._write_lock:
+            queued, touched = self._queued(conversation_id)
+            rows = self._query(SQL_SELECT_CONVERSATION, (conversation_id,))
+        row = list(rows[0]) if rows else None
+        for sql, params in queued:
+            if sql is SQL_UPSERT_CONVERSATION and params[0] == conversation_id:
+                row = list(params[1:])
+            elif sql is SQL_UPDATE_METADATA and params[2] == conversation_id and row is not None:
+                row[3], row[2] = params[0], params[1]
+            elif sql is SQL_DELETE_CONVERSATION and params[0] == conversation_id:
+                row = None
+            elif sql is SQL_PURGE_CONVERSATIONS and row is not None and row[2] < params[0]:
+                row = None
+        if row is None:
+            return None
+        app_id, created_at, last_used, metadata = row
+        return {
+            "app_id": app_id,
+            "created_at": created_at,
+            "last_used": max(last_used, touched),
+            "metadata": _decode_metadata(metadata)
+        }
+
+    def load_messages(self, conversation_id: str, after_seq: int = 0, limit: int = -1) -> List[Dict[str, Any]]:
+        """按序号读取对话消息（seq大于after_seq），limit为-1时不限条数"""
+        return _message_dicts(self._query(SQL_SELECT_MESSAGES, (conversation_id, after_seq, limit)))
+
+    def load_messages_many(self, conversation_ids: List[str]) -> Dict[str, List[Dict[str, Any]]]:
+        """一次查询读取多个对话的全部消息 {对话ID: 消息列表}，没有消息的对话为空列表"""
+        result: Dict[str, List[Dict[str, Any]]] = {conversation_id: [] for conversation_id in conversation_ids}
+        # 分块查询，不超过SQLite的参数个数上限
+        for start in range(0, len(conversation_ids), 500):
+            chunk = conversation_ids[start:start + 500]
+            rows = self._query(
+                "SELECT conversation_id, seq, role, content, created_at, message_id FROM messages "
+                f"WHERE conversation_id IN ({','.join('?' * len(chunk))}) ORDER BY conversation_id, seq",
+                tuple(chunk)
+            )
+            for conversation_id, group in itertools.groupby(rows, key=lambda row: row[0]):
+                result[conversation_id] = _message_dicts([row[1:] for row in group])
+        return result
+
+    def count_conversations(self) -> int:
+        return self._query("SELECT COUNT(*) FROM conversations", ())[0][0]
+
+    def count_messages(self) -> int:
+        return self._query("SELECT COUNT(*) FROM messages", ())[0][0]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "path": self.path,
+            "pending": self.pending,
+            "ops_written": self.ops_written,
+            "batches": self.batches,
+            "avg_batch": round(self.ops_written / self.batches, 1) if self.batches else 0.0,
+            "max_batch": self.max_batch_seen,
+            "write_seconds": round(self.write_seconds, 3)
+        }
+
+
+class SQLiteConversationState:
+    """
+    多进程共享的对话状态（同一主机的多个worker共用一个SQLite文件）
+
+    与SQLiteConversationBackend共用表结构，但不排队：每个操作同步提交，
+    需要读后写的操作（追加消息、合并元数据）在BEGIN IMMEDIATE事务中完成，
+    多个进程并发时由SQLite的写锁保证原子性。数据库放在/dev/shm下即为共享内存存储。
+    """
+
+    errors = (sqlite3.Error,)
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = connect(path)
+        self._conn.executescript(SCHEMA)
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def _transaction(self):
+        with self._lock:
+            conn = self._conn
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+    def _execute(self, sql: str, params: tuple) -> sqlite3.Cursor:
+        with self._lock:
+            return self._conn.execute(sql, params)
+
+    def upsert_conversation(self, conversation_id: str, app_id: str, now: float,
+                            metadata: Optional[Dict[str, Any]] = None):
+        self._execute(SQL_UPSERT_CONVERSATION, (conversation_id, app_id, now, now, _encode_metadata(metadata)))
+
+    def load_conversation(self, conversation_id: str, cutoff: float,
+                          touch: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """读取最后使用时间晚于cutoff的对话；给出touch时同时把最后使用时间更新为touch"""
+        if touch is not None:
+            self._execute(SQL_TOUCH + " AND last_used > ?", (touch, conversation_id, touch, cutoff))
+        with self._lock:
+            row = self._conn.execute(SQL_SELECT_CONVERSATION, (conversation_id,)).fetchone()
+        if row is None or row[2] <= cutoff:
+            return None
+        return {"app_id": row[0], "created_at": row[1], "last_used": row[2], "metadata": _decode_metadata(row[3])}
+
+    def merge_metadata(self, conversation_id: str, metadata: Dict[str, Any], now: float, cutoff: float) -> bool:
+        with self._transaction() as conn:
+            row = conn.execute("SELECT metadata FROM conversations WHERE conversation_id = ? AND last_used > ?",
+                               (conversation_id, cutoff)).fetchone()
+            if row is None:
+                return False
+            merged = _decode_metadata(row[0])
+            merged.update(metadata)
+            conn.execute("UPDATE conversations SET metadata = ?, last_used = max(last_used, ?) "
+                         "WHERE conversation_id = ?", (_encode_metadata(merged), now, conversation_id))
+        return True
+
+    def append_messages(self, conversation_id: str, messages: List[Tuple[str, str, Optional[str]]],
+                        now: float, cutoff: float) -> bool:
+        """在对话末尾追加(role, content, message_id)，序号接着已有的最大序号；对话不存在时返回False"""
+        with self._transaction() as conn:
+            row = conn.execute("SELECT 1 FROM conversations WHERE conversation_id = ? AND last_used > ?",
+                               (conversation_id, cutoff)).fetchone()
+            if row is None:
+                return False
+            seq = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM messages WHERE conversation_id = ?",
+                               (conversation_id,)).fetchone()[0]
+            conn.executemany(SQL_APPEND_MESSAGE, [
+                (conversation_id, seq + offset, role, content, now, message_id)
+                for offset, (role, content, message_id) in enumerate(messages, start=1)
+            ])
+            conn.execute(SQL_TOUCH, (now, conversation_id, now))
+        return True
+
+    def load_messages(self, conversation_id: str) -> List[Dict[str, Any]]:
+        with self._lock:
+            return _message_dicts(self._conn.execute(SQL_SELECT_MESSAGES, (conversation_id, 0, -1)).fetchall())
+
+    def replace_messages(self, conversation_id: str, app_id: str, messages: List[Dict[str, Any]],
+                         now: float, cutoff: float):
+        """用上游回填的完整历史替换消息并清除history_stale，对话不存在或已过期时一并创建"""
+        with self._transaction() as conn:
+            row = conn.execute("SELECT metadata FROM conversations WHERE conversation_id = ? AND last_used > ?",
+                               (conversation_id, cutoff)).fetchone()
+            if row is None:
+                conn.execute(SQL_UPSERT_CONVERSATION, (conversation_id, app_id, now, now, None))
+            else:
+                metadata = _decode_metadata(row[0])
+                if metadata.pop('history_stale', None):
+                    conn.execute("UPDATE conversations SET metadata = ? WHERE conversation_id = ?",
+                                 (_encode_metadata(metadata), conversation_id))
+            conn.execute(SQL_DELETE_MESSAGES, (conversation_id,))
+            conn.executemany(SQL_APPEND_MESSAGE, [
+                (conversation_id, message['seq'], message['role'], message['content'],
+                 message['created_at'], message.get('message_id'))
+                for message in messages
+            ])
+
+    def delete_conversation(self, conversation_id: str) -> bool:
+        with self._transaction() as conn:
+            deleted = conn.execute(SQL_DELETE_CONVERSATION, (conversation_id,)).rowcount
+            conn.execute(SQL_DELETE_MESSAGES, (conversation_id,))
+        return deleted > 0
+
+    def list_recent(self, limit: int, before: Optional[Tuple[float, str]],
+                    cutoff: float) -> List[Tuple[str, Dict[str, Any]]]:
+        """按(最后使用时间, 对话ID)倒序列出未过期的对话，before为键集分页游标"""
+        sql = "SELECT conversation_id, app_id, created_at, last_used, metadata FROM conversations WHERE last_used > ?"
+        params: tuple = (cutoff,)
+        if before is not None:
+            sql += " AND (last_used < ? OR (last_used = ? AND conversation_id < ?))"
+            params += (before[0], before[0], before[1])
+        sql += " ORDER BY last_used DESC, conversation_id DESC LIMIT ?"
+        with self._lock:
+            rows = self._conn.execute(sql, params + (limit,)).fetchall()
+        return [
+            (row[0], {"app_id": row[1], "created_at": row[2], "last_used": row[3],
+                      "metadata": _decode_metadata(row[4])})
+            for row in rows
+        ]
+
+    def count_live(self, cutoff: float) -> int:
+        return self._execute("SELECT COUNT(*) FROM conversations WHERE last_used > ?", (cutoff,)).fetchone()[0]
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            conversations = self._conn.execute("SELECT COUNT(*) FROM conversations").fetchone()[0]
+            messages = self._conn.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+        return {"conversations": conversations, "messages": messages}
+
+    def purge_expired(self, cutoff: float, max_items: int = 1000) -> int:
+        """删除最多max_items个最后使用时间不晚于cutoff的对话及其消息，返回删除的对话数"""
+        with self._transaction() as conn:
+            ids = [(row[0],) for row in conn.execute(
+                "SELECT conversation_id FROM conversations WHERE last_used <= ? LIMIT ?", (cutoff, max_items))]
+            conn.executemany(SQL_DELETE_CONVERSATION, ids)
+            conn.executemany(SQL_DELETE_MESSAGES, ids)
+        return len(ids)
+
+    def close(self):
+        self._conn.close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"type": "sqlite", "path": self.path}
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+预创建对话池 - 后台为每个app_id维护一批新鲜的conversation_id，
+新会话直接取用，省去首条消息前的一次上游往返
+"""
+
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Iterable, Optional, Tuple
+
+from qianfan_client import QianfanClient
+
+logger = logging.getLogger(__name__)
+
+# 千帆对话有效期为7天
+CONVERSATION_LIFETIME_SECONDS = 7 * 24 * 3600
+
+
+class ConversationPool:
+    """对话池 - 低于低水位时后台补充到目标大小，过期的预创建对话直接丢弃"""
+
+    def __init__(self, target_size: int = 8, low_watermark: int = 2, max_age: float = 24 * 3600,
+                 refill_interval: float = 30.0, refill_concurrency: int = 2):
+        """
+        Args:
+            target_size: 每个app_id的目标池大小（高水位）
+            low_watermark: 池中数量不高于该值时触发补充
+            max_age: 预创建对话在池中的最长存放时间，保证取出后仍有足够的剩余有效期
+            refill_interval: 后台巡检间隔（秒）
+            refill_concurrency: 补充时的最大并发创建数
+        """
+        self.client_factory: Optional[Callable[[], QianfanClient]] = None
+        self.target_size = target_size
+        self.low_watermark = min(low_watermark, target_size)
+        self.max_age = min(max_age, CONVERSATION_LIFETIME_SECONDS)
+        self.refill_interval = refill_interval
+        self.refill_concurrency = max(1, refill_concurrency)
+        self._pools: Dict[str, Deque[Tuple[float, Dict[str, Any]]]] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self.hits = 0
+        self.misses = 0
+        self.created = 0
+        self.expired = 0
+        self.refill_errors = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.target_size > 0
+
+    def register(self, app_id: str):
+        """登记需要预创建对话的app_id"""
+        if self.enabled and app_id and app_id not in self._pools:
+            self._pools[app_id] = deque()
+            self._notify()
+
+    def acquire(self, app_id: str) -> Optional[Dict[str, Any]]:
+        """
+        取出一个预创建的对话
+
+        Returns:
+            创建对话接口的原始结果（含conversation_id）；池为空或未登记时返回None
+        """
+        pool = self._pools.get(app_id)
+        if pool is None:
+            return None
+
+        self._drop_expired(pool)
+        result = pool.popleft()[1] if pool else None
+        if result is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+
+        if len(pool) <= self.low_watermark:
+            self._notify()
+        return result
+
+    async def start(self, client_factory: Callable[[], QianfanClient], app_ids: Iterable[str] = ()):
+        """
+        启动后台补充任务
+
+        Args:
+            client_factory: 返回用于预创建对话的客户端（服务端配置的令牌）
+            app_ids: 需要预创建对话的应用ID
+        """
+        if not self.enabled or self._task is not None:
+            return
+        self.client_factory = client_factory
+        for app_id in app_ids:
+            self.register(app_id)
+        self._wakeup = asyncio.Event()
+        self._wakeup.set()
+        self._task = asyncio.create_task(self._run())
+        logger.info(f"对话池已启动，目标大小: {self.target_size}，低水位: {self.low_watermark}")
+
+    async def stop(self):
+        """停止后台补充任务"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        self._wakeup = None
+
+    def _notify(self):
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def _drop_expired(self, pool: Deque[Tuple[float, Dict[str, Any]]]):
+        cutoff = time.time() - self.max_age
+        while pool and pool[0][0] < cutoff:
+            pool.popleft()
+            self.expired += 1
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.refill_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+            for app_id, pool in list(self._pools.items()):
+                self._drop_expired(pool)
+                if len(pool) <= self.low_watermark:
+                    await self._refill(app_id, pool)
+
+    async def _refill(self, app_id: str, pool: Deque[Tuple[float, Dict[str, Any]]]):
+        """补充到目标大小；任一批次失败则等下一次巡检再试，避免在上游故障时反复请求"""
+        try:
+            client = self.client_factory()
+        except Exception as e:
+            logger.warning(f"对话池无法获取客户端: {e}")
+            return
+
+        while len(pool) < self.target_size:
+            batch = min(self.refill_concurrency, self.target_size - len(pool))
+            results = await asyncio.gather(
+                *(client.create_conversation(app_id) for _ in range(batch)),
+                return_exceptions=True
+            )
+            failed = False
+            for result in results:
+                if isinstance(result, BaseException) or not result.get('conversation_id'):
+                    failed = True
+                    continue
+                pool.append((time.time(), result))
+                self.created += 1
+
+            if failed:
+                self.refill_errors += 1
+                logger.warning(f"对话池补充失败，app_id: {app_id}，当前数量: {len(pool)}")
+                return
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "target_size": self.target_size,
+            "low_watermark": self.low_watermark,
+            "available": {app_id: len(pool) for app_id, pool in self._pools.items()},
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+            "created": self.created,
+            "expired": self.expired,
+            "refill_errors": self.refill_errors
+        }
+
+
+# 全局实例（CONVERSATION_POOL_SIZE=0 时禁用）
+conversation_pool = ConversationPool(
+    target_size=int(os.getenv('CONVERSATION_POOL_SIZE', 8)),
+    low_watermark=int(os.getenv('CONVERSATION_POOL_LOW_WATERMARK', 2)),
+    max_age=float(os.getenv('CONVERSATION_POOL_MAX_AGE', 24 * 3600)),
+    refill_interval=float(os.getenv('CONVERSATION_POOL_REFILL_INTERVAL', 30)),
+    refill_concurrency=int(os.getenv('CONVERSATION_POOL_REFILL_CONCURRENCY', 2))
+)
@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+"""
+对话共享状态 - Redis兼容服务（Redis、Valkey、KeyDB等）
+
+多副本部署（CONVERSATION_BACKEND=redis）时所有worker共用同一份对话状态。键布局（prefix默认terra:）：
+    {prefix}conv:{id}       哈希，app_id / created_at / last_used
+    {prefix}meta:{id}       哈希，元数据，每个字段的值为JSON
+    {prefix}messages:{id}   列表，每条消息一个JSON，序号即列表下标+1
+    {prefix}recency         有序集合，分值为最后使用时间，用于按最近使用列出和过期清理
+    {prefix}message_count   消息总数计数器
+
+需要先检查对话是否存在再写入的操作用Lua脚本在服务端原子执行，每个操作一次往返。
+对话键另设原生过期时间（有效期再加一天）作为兜底，正常由过期清理从recency中删除。
+使用同步客户端，请求处理中由SharedConversationStore.call放到线程中调用，慢请求最多占用一个线程到socket_timeout。
+清理脚本按前缀拼接键名，不支持Redis集群模式。
+"""
+
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    import redis
+except ImportError:  # 可选依赖，仅CONVERSATION_BACKEND=redis时需要
+    redis = None
+
+# 原生过期时间在对话有效期之外额外保留的秒数
+EXPIRE_MARGIN_SECONDS = 24 * 3600
+
+# 每个对话脚本的参数约定：
+#   KEYS = conv, meta, messages, recency, message_count
+#   ARGV = cutoff, now（可为空）, 原生过期秒数, 对话ID, 其余为各脚本自己的参数
+_PRELUDE = """
+local last_used = redis.call('HGET', KEYS[1], 'last_used')
+local live = last_used and tonumber(last_used) > tonumber(ARGV[1])
+local function touch()
+    if tonumber(ARGV[2]) > tonumber(last_used) then
+        last_used = ARGV[2]
+        redis.call('HSET', KEYS[1], 'last_used', ARGV[2])
+        redis.call('ZADD', KEYS[4], ARGV[2], ARGV[4])
+    end
+    for i = 1, 3 do redis.call('EXPIRE', KEYS[i], ARGV[3]) end
+end
+"""
+
+LOAD_SCRIPT = _PRELUDE + """
+if not live then return false end
+if ARGV[2] ~= '' then touch() end
+local fields = redis.call('HMGET', KEYS[1], 'app_id', 'created_at')
+return {fields[1], fields[2], last_used, redis.call('HGETALL', KEYS[2])}
+"""
+
+MERGE_METADATA_SCRIPT = _PRELUDE + """
+if not live then return 0 end
+for i = 5, #ARGV, 2 do redis.call('HSET', KEYS[2], ARGV[i], ARGV[i + 1]) end
+touch()
+return 1
+"""
+
+APPEND_SCRIPT = _PRELUDE + """
+if not live then return 0 end
+for i = 5, #ARGV do redis.call('RPUSH', KEYS[3], ARGV[i]) end
+redis.call('INCRBY', KEYS[5], #ARGV - 4)
+touch()
+return 1
+"""
+
+# ARGV[5]为app_id，之后为全部消息
+REPLACE_SCRIPT = _PRELUDE + """
+if live then
+    redis.call('HDEL', KEYS[2], 'history_stale')
+else
+    redis.call('DEL', KEYS[2])
+    redis.call('HSET', KEYS[1], 'app_id', ARGV[5], 'created_at', ARGV[2], 'last_used', ARGV[2])
+    redis.call('ZADD', KEYS[4], ARGV[2], ARGV[4])
+end
+redis.call('DECRBY', KEYS[5], redis.call('LLEN', KEYS[3]))
+redis.call('DEL', KEYS[3])
+for i = 6, #ARGV do redis.call('RPUSH', KEYS[3], ARGV[i]) end
+redis.call('INCRBY', KEYS[5], #ARGV - 5)
+for i = 1, 3 do redis.call('EXPIRE', KEYS[i], ARGV[3]) end
+return 1
+"""
+
+DELETE_SCRIPT = """
+local existed = redis.call('EXISTS', KEYS[1])
+redis.call('DECRBY', KEYS[5], redis.call('LLEN', KEYS[3]))
+redis.call('DEL', KEYS[1], KEYS[2], KEYS[3])
+redis.call('ZREM', KEYS[4], ARGV[4])
+return existed
+"""
+
+# KEYS = recency, message_count；ARGV = cutoff, 最多条数, 键前缀
+PURGE_SCRIPT = """
+local ids = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2])
+for _, id in ipairs(ids) do
+    local messages = ARGV[3] .. 'messages:' .. id
+    redis.call('DECRBY', KEYS[2], redis.call('LLEN', messages))
+    redis.call('DEL', ARGV[3] .. 'conv:' .. id, ARGV[3] .. 'meta:' .. id, messages)
+    redis.call('ZREM', KEYS[1], id)
+end
+return #ids
+"""
+
+
+def _encode_message(role: str, content: str, created_at: float, message_id: Optional[str]) -> str:
+    return json.dumps({"role": role, "content": content, "created_at": created_at, "message_id": message_id},
+                      ensure_ascii=False)
+
+
+def _decode_metadata(pairs) -> Dict[str, Any]:
+    # 脚本返回的HGETALL是扁平列表，客户端直接调用时是字典
+    items = pairs.items() if isinstance(pairs, dict) else zip(pairs[::2], pairs[1::2])
+    return {key: json.loads(value) for key, value in items}
+
+
+class RedisConversationState:
+    """Redis兼容服务上的共享对话状态"""
+
+    def __init__(self, url: str = "redis://127.0.0.1:6379/0", prefix: str = "terra:",
+                 ttl: float = 7 * 24 * 3600, socket_timeout: float = 1.0):
+        """
+        Args:
+            url: 服务地址，如 redis://127.0.0.1:6379/0 或 unix:///run/redis.sock
+            prefix: 键前缀，多个应用共用一个实例时区分
+            ttl: 对话有效期（秒），用于设置键的原生过期时间
+            socket_timeout: 单次操作超时（秒）
+        """
+        if redis is None:
+            raise RuntimeError("CONVERSATION_BACKEND=redis 需要安装redis包: pip install redis")
+        self.url = url
+        self.prefix = prefix
+        self.expire_seconds = int(ttl + EXPIRE_MARGIN_SECONDS)
+        self.client = redis.Redis.from_url(url, decode_responses=True, socket_timeout=socket_timeout,
+                                           socket_connect_timeout=socket_timeout)
+        self.errors = (redis.RedisError,)
+        self._recency = f"{prefix}recency"
+        self._message_count = f"{prefix}message_count"
+        self._load = self.client.register_script(LOAD_SCRIPT)
+        self._merge_metadata = self.client.register_script(MERGE_METADATA_SCRIPT)
+        self._append = self.client.register_script(APPEND_SCRIPT)
+        self._replace = self.client.register_script(REPLACE_SCRIPT)
+        self._delete = self.client.register_script(DELETE_SCRIPT)
+        self._purge = self.client.register_script(PURGE_SCRIPT)
+
+    def _keys(self, conversation_id: str) -> List[str]:
+        prefix = self.prefix
+        return [f"{prefix}conv:{conversation_id}", f"{prefix}meta:{conversation_id}",
+                f"{prefix}messages:{conversation_id}", self._recency, self._message_count]
+
+    def _args(self, conversation_id: str, cutoff: float, now: Optional[float], *extra) -> List[Any]:
+        return [repr(cutoff), '' if now is None else repr(now), self.expire_seconds, conversation_id, *extra]
+
+    def upsert_conversation(self, conversation_id: str, app_id: str, now: float,
+                            metadata: Optional[Dict[str, Any]] = None):
+        conv, meta, messages, recency, _ = self._keys(conversation_id)
+        pipe = self.client.pipeline(transaction=True)
+        pipe.hset(conv, mapping={"app_id": app_id, "created_at": repr(now), "last_used": repr(now)})
+        pipe.delete(meta)
+        if metadata:
+            pipe.hset(meta, mapping={key: json.dumps(value, ensure_ascii=False, default=str)
+                                     for key, value in metadata.items()})
+        pipe.zadd(recency, {conversation_id: now})
+        for key in (conv, meta, messages):
+            pipe.expire(key, self.expire_seconds)
+        pipe.execute()
+
+    def load_conversation(self, conversation_id: str, cutoff: float,
+                          touch: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """读取最后使用时间晚于cutoff的对话；给出touch时同时把最后使用时间更新为touch"""
+        result = self._load(keys=self._keys(conversation_id), args=self._args(conversation_id, cutoff, touch))
+        if result is None:
+            return None
+        app_id, created_at, last_used, metadata = result
+        return {"app_id": app_id, "created_at": float(created_at), "last_used": float(last_used),
+                "metadata": _decode_metadata(metadata)}
+
+    def merge_metadata(self, conversation_id: str, metadata: Dict[str, Any], now: float, cutoff: float) -> bool:
+        pairs = []
+        for key, value in metadata.items():
+            pairs += [key, json.dumps(value, ensure_ascii=False, default=str)]
+        return bool(self._merge_metadata(keys=self._keys(conversation_id),
+                                         args=self._args(conversation_id, cutoff, now, *pairs)))
+
+    def append_messages(self, conversation_id: str, messages: List[Tuple[str, str, Optional[str]]],
+                        now: float, cutoff: float) -> bool:
+        """在对话末尾追加(role, content, message_id)；对话不存在时返回False"""
+        encoded = [_encode_message(role, content, now, message_id) for role, content, message_id in messages]
+        return bool(self._append(keys=self._keys(conversation_id),
+                                 args=self._args(conversation_id, cutoff, now, *encoded)))
+
+    def load_messages(self, conversation_id: str) -> List[Dict[str, Any]]:
+        items = self.client.lrange(f"{self.prefix}messages:{conversation_id}", 0, -1)
+        messages = []
+        for seq, item in enumerate(items, start=1):
+            message = json.loads(item)
+            message['seq'] = seq
+            messages.append(message)
+        return messages
+
+    def replace_messages(self, conversation_id: str, app_id: str, messages: List[Dict[str, Any]],
+                         now: float, cutoff: float):
+        """用上游回填的完整历史替换消息并清除history_stale，对话不存在或已过期时一并创建"""
+        encoded = [
+            _encode_message(message['role'], message['content'], message['created_at'], message.get('message_id'))
+            for message in messages
+        ]
+        self._replace(keys=self._keys(conversation_id),
+                      args=self._args(conversation_id, cutoff, now, app_id, *encoded))
+
+    def delete_conversation(self, conversation_id: str) -> bool:
+        return bool(self._delete(keys=self._keys(conversation_id),
+                                 args=self._args(conversation_id, 0.0, None)))
+
+    def list_recent(self, limit: int, before: Optional[Tuple[float, str]],
+                    cutoff: float) -> List[Tuple[str, Dict[str, Any]]]:
+        """按(最后使用时间, 对话ID)倒序列出未过期的对话，before为键集分页游标"""
+        maximum = '+inf' if before is None else repr(before[0])
+        minimum = f"({cutoff!r}"
+        entries = []
+        offset = 0
+        while len(entries) < limit:
+            count = limit - len(entries)
+            page = self.client.zrevrangebyscore(self._recency, maximum, minimum, start=offset, num=count,
+                                                withscores=True)
+            offset += len(page)
+            # 与游标分值相同的条目按ID倒序排在前面，跳过不在游标之后的
+            entries += [(conversation_id, score) for conversation_id, score in page
+                        if before is None or (score, conversation_id) < before]
+            if len(page) < count:
+                break
+
+        pipe = self.client.pipeline(transaction=False)
+        for conversation_id, _ in entries:
+            pipe.hmget(f"{self.prefix}conv:{conversation_id}", "app_id", "created_at")
+            pipe.hgetall(f"{self.prefix}meta:{conversation_id}")
+        results = pipe.execute()
+        rows = []
+        for index, (conversation_id, last_used) in enumerate(entries):
+            (app_id, created_at), metadata = results[2 * index], results[2 * index + 1]
+            if app_id is None:
+                continue  # 列出期间被删除
+            rows.append((conversation_id, {"app_id": app_id, "created_at": float(created_at),
+                                           "last_used": last_used, "metadata": _decode_metadata(metadata)}))
+        return rows
+
+    def count_live(self, cutoff: float) -> int:
+        return self.client.zcount(self._recency, f"({cutoff!r}", '+inf')
+
+    def counts(self) -> Dict[str, int]:
+        pipe = self.client.pipeline(transaction=False)
+        pipe.zcard(self._recency)
+        pipe.get(self._message_count)
+        conversations, messages = pipe.execute()
+        return {"conversations": conversations, "messages": int(messages or 0)}
+
+    def purge_expired(self, cutoff: float, max_items: int = 1000) -> int:
+        """删除最多max_items个最后使用时间不晚于cutoff的对话，返回删除的对话数"""
+        return self._purge(keys=[self._recency, self._message_count], args=[repr(cutoff), max_items, self.prefix])
+
+    def close(self):
+        self.client.close()
+
+    def stats(self) -> Dict[str, Any]:
+        kwargs = self.client.connection_pool.connection_kwargs
+        return {
+            "type": "redis",
+            "server": kwargs.get('path') or f"{kwargs.get('host')}:{kwargs.get('port')}/{kwargs.get('db', 0)}",
+            "prefix": self.prefix
+        }
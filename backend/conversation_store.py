@@ -0,0 +1,862 @@
+#!/usr/bin/env python3
+"""
+对话存储 - 有界的内存对话索引
+
+每条对话是一个__slots__记录，时间用epoch浮点数保存，元数据字典在第一次写入时才分配。
+另维护一个按最后使用时间有序的最近使用索引：每次使用在末尾追加一条，旧条目留作失效条目延迟清理。
+按条目数和估算内存双重上限从索引头部淘汰最久未使用的对话；后台asyncio任务从索引头部弹出到期条目，
+不在请求路径上全量扫描；按最近使用倒序列出对话和键集分页都从索引尾部二分定位，耗时与返回条数成正比。
+配置了持久化后端时，内存部分作为读穿透缓存：写操作同时交给后端批量落盘，
+缓存未命中时从后端读取，被淘汰的对话仍保留在后端。
+
+每个对话同时记录经过本服务的消息（用户问题与回答），历史接口直接从本地返回；
+记录的messages为None表示消息尚未从后端加载，为空元组表示没有消息。
+
+以多个worker或多副本运行时，进程内缓存在各进程间不一致，改用SharedConversationStore：
+不缓存，每个操作直接读写共享状态（同主机用SQLite文件，多副本用Redis兼容服务），由CONVERSATION_BACKEND选择。
+请求处理中统一通过await store.call(方法名, ...)调用：进程内存储直接执行，共享存储在线程中执行。
+"""
+
+import asyncio
+import bisect
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from conversation_db import SQLiteConversationBackend, SQLiteConversationState
+
+logger = logging.getLogger(__name__)
+
+# 千帆对话有效期为7天（自最后一次使用起算）
+DEFAULT_TTL_SECONDS = 7 * 24 * 3600
+# 单条记录的固定内存开销估算（记录对象、两个时间戳、字典槽位、索引条目及其失效副本），
+# 按bench_conversation_memory.py实测约270字节；ID字符串与元数据按长度另计
+RECORD_OVERHEAD_BYTES = 300
+# 单条消息字典的固定开销估算，内容字符串按sys.getsizeof另计
+MESSAGE_OVERHEAD_BYTES = 400
+
+_NO_MESSAGES = ()
+
+# 第一个参数为对话ID的操作，ConversationStore.call执行前先从持久化后端载入该对话
+CONVERSATION_METHODS = frozenset({
+    'get', 'peek', 'update', 'append_turn', 'history', 'replace_history', 'turn_summary', 'mark_history_stale'
+})
+
+
+def _in_event_loop() -> bool:
+    """当前线程是否正在运行事件循环（请求处理中）"""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+class ConversationRecord:
+    """单个对话的紧凑记录"""
+
+    __slots__ = ('app_id', 'created_at', 'last_used', 'size', '_metadata', 'messages')
+
+    def __init__(self, app_id: str, created_at: float, last_used: float,
+                 metadata: Optional[Dict[str, Any]] = None, messages=None):
+        self.app_id = app_id
+        self.created_at = created_at
+        self.last_used = last_used
+        self.size = 0
+        self._metadata = metadata or None
+        self.messages = messages
+
+    @property
+    def metadata(self) -> Dict[str, Any]:
+        """元数据字典，首次访问时分配"""
+        if self._metadata is None:
+            self._metadata = {}
+        return self._metadata
+
+    @property
+    def has_metadata(self) -> bool:
+        return bool(self._metadata)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """转换为原先的字典格式（时间为datetime）"""
+        return {
+            'app_id': self.app_id,
+            'created_at': datetime.fromtimestamp(self.created_at),
+            'last_used': datetime.fromtimestamp(self.last_used),
+            'metadata': dict(self._metadata) if self._metadata else {}
+        }
+
+
+def _metadata_size(metadata: Optional[Dict[str, Any]]) -> int:
+    if not metadata:
+        return 0
+    return len(json.dumps(metadata, ensure_ascii=False, default=str).encode('utf-8'))
+
+
+def _record_size(conversation_id: str, record: ConversationRecord) -> int:
+    size = RECORD_OVERHEAD_BYTES + len(conversation_id) + len(record.app_id) + _metadata_size(record._metadata)
+    for message in record.messages or ():
+        size += MESSAGE_OVERHEAD_BYTES + sys.getsizeof(message['content'])
+    return size
+
+
+def _resolve_since(messages: List[Dict[str, Any]], since: str) -> Optional[int]:
+    """把since游标解析为序号：先按消息ID从新到旧查找，再按序号解释"""
+    for message in reversed(messages):
+        if message['message_id'] == since:
+            return message['seq']
+    if since.isdigit() and int(since) <= len(messages):
+        return int(since)
+    return None
+
+
+def _history_page(messages: List[Dict[str, Any]], after: int, limit: int,
+                  since: Optional[str]) -> Dict[str, Any]:
+    """从完整消息列表中取一页历史"""
+    reset = False
+    if since:
+        resolved = _resolve_since(messages, since)
+        reset = resolved is None
+        after = resolved or 0
+    # 序号从1开始连续递增，游标即列表下标
+    start = max(0, after)
+    page = messages[start:start + limit]
+    has_more = start + limit < len(messages)
+    return {
+        "messages": page,
+        "next_cursor": page[-1]['seq'] if page and has_more else None,
+        "has_more": has_more,
+        "total": len(messages),
+        "reset": reset
+    }
+
+
+def _turn_summary(messages: List[Dict[str, Any]]) -> Dict[str, Any]:
+    user_message = bot_response = ''
+    for message in reversed(messages):
+        if message['role'] == 'user':
+            user_message = message['content']
+            break
+        if not bot_response:
+            bot_response = message['content']
+    return {"user_message": user_message, "bot_response": bot_response, "message_count": len(messages)}
+
+
+class ConversationStore:
+    """对话存储 - 紧凑记录 + 最近使用索引"""
+
+    def __init__(self, max_entries: int = 1_000_000, max_bytes: int = 1024 * 1024 * 1024,
+                 ttl: float = DEFAULT_TTL_SECONDS, sweep_interval: float = 60.0,
+                 backend: Optional[SQLiteConversationBackend] = None):
+        """
+        Args:
+            max_entries: 内存中最大对话数
+            max_bytes: 内存估算上限
+            ttl: 自最后一次使用起的有效期（秒）
+            sweep_interval: 后台清理间隔（秒）
+            backend: 持久化后端，为None时仅保存在内存
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.sweep_interval = sweep_interval
+        self._records: Dict[str, ConversationRecord] = {}
+        # 最近使用索引：按(最后使用时间, 对话ID)升序，_index_start之前的部分已被清理
+        self._index: List[Tuple[float, str]] = []
+        self._index_start = 0
+        self.total_bytes = 0
+        self.message_count = 0  # 内存中已加载的消息数
+        self.evictions = 0
+        self.expirations = 0
+        self.backend = backend
+        self.backend_hits = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def __contains__(self, conversation_id: str) -> bool:
+        return conversation_id in self._records
+
+    # ---- 读写 ----
+
+    def put(self, conversation_id: str, app_id: str, metadata: Optional[Dict[str, Any]] = None):
+        """存储对话（已存在时覆盖）"""
+        now = time.time()
+        self._insert(conversation_id, ConversationRecord(app_id, now, now, metadata, _NO_MESSAGES))
+        if self.backend is not None:
+            self.backend.upsert_conversation(conversation_id, app_id, now, now, metadata)
+
+    def _insert(self, conversation_id: str, record: ConversationRecord):
+        """只写入内存缓存"""
+        previous = self._records.get(conversation_id)
+        if previous is not None:
+            self._remove(conversation_id)
+
+        record.size = _record_size(conversation_id, record)
+        self._records[conversation_id] = record
+        self.total_bytes += record.size
+        if previous is None or previous.last_used != record.last_used:
+            self._append_index(record.last_used, conversation_id)
+        self._evict_overflow(protect=conversation_id)
+
+    def _load(self, conversation_id: str) -> Optional[ConversationRecord]:
+        """
+        缓存未命中时从持久化后端读取未过期的对话并放入缓存（脚本中的同步路径）
+
+        在事件循环中不读库，视为未命中：请求处理中由call/preload先在线程中载入。
+        """
+        if self.backend is None or _in_event_loop():
+            return None
+        return self._adopt(conversation_id, self.backend.load_conversation(conversation_id))
+
+    def _adopt(self, conversation_id: str, row: Optional[Dict[str, Any]]) -> Optional[ConversationRecord]:
+        if row is None or row['last_used'] + self.ttl <= time.time():
+            return None
+        self.backend_hits += 1
+        record = ConversationRecord(row['app_id'], row['created_at'], row['last_used'], row['metadata'])
+        self._insert(conversation_id, record)
+        return record
+
+    def get(self, conversation_id: str) -> Optional[ConversationRecord]:
+        """获取对话并刷新最后使用时间；已过期的对话视为不存在"""
+        record = self._records.get(conversation_id)
+        if record is None:
+            record = self._load(conversation_id)
+            if record is None:
+                return None
+        if record.last_used + self.ttl <= time.time():
+            self._remove(conversation_id)
+            self.expirations += 1
+            return None
+        self._touch(conversation_id, record)
+        return record
+
+    def peek(self, conversation_id: str) -> Optional[ConversationRecord]:
+        """获取对话但不刷新使用时间和最近使用位置"""
+        return self._records.get(conversation_id)
+
+    def update(self, conversation_id: str, metadata: Dict[str, Any]) -> bool:
+        """合并更新元数据"""
+        record = self._records.get(conversation_id) or self._load(conversation_id)
+        if record is None:
+            return False
+        record.metadata.update(metadata)
+        if self.backend is not None:
+            self.backend.update_metadata(conversation_id, record._metadata, time.time())
+        self._resize(conversation_id, record)
+        self._touch(conversation_id, record)
+        self._evict_overflow(protect=conversation_id)
+        return True
+
+    # ---- 消息记录 ----
+
+    def _live(self, conversation_id: str) -> Optional[ConversationRecord]:
+        """获取未过期的对话（必要时从后端加载），不刷新使用时间"""
+        record = self._records.get(conversation_id) or self._load(conversation_id)
+        if record is None or record.last_used + self.ttl <= time.time():
+            return None
+        return record
+
+    def _messages(self, conversation_id: str, record: ConversationRecord) -> Optional[List[Dict[str, Any]]]:
+        """
+        返回对话的消息列表，首次访问时从后端加载（脚本中的同步路径）
+
+        在事件循环中不读库，消息尚未载入时返回None（请求处理中已由call/preload载入）。
+        """
+        if record.messages is None:
+            if _in_event_loop():
+                return None
+            if self.backend is not None and self.backend.pending:
+                # 读之前先写完排队中的操作，保证能读到刚追加的消息
+                self.backend.flush()
+            self._set_messages(conversation_id, record,
+                               self.backend.load_messages(conversation_id) if self.backend is not None else [])
+        elif record.messages is _NO_MESSAGES:
+            record.messages = []
+        return record.messages
+
+    def _set_messages(self, conversation_id: str, record: ConversationRecord, messages: List[Dict[str, Any]]):
+        record.messages = messages
+        self.message_count += len(messages)
+        self._resize(conversation_id, record)
+
+    async def preload(self, conversation_id: Optional[str], messages: bool = True):
+        """
+        把对话及其消息从持久化后端载入内存，之后的同步操作只访问内存
+
+        请求处理中在读写对话之前调用：先等待写入任务提交排队的操作，再在线程中读库，不阻塞事件循环。
+        """
+        if self.backend is None or not conversation_id:
+            return
+        record = self._records.get(conversation_id)
+        if record is None:
+            row = await asyncio.to_thread(self.backend.load_conversation, conversation_id)
+            # 等待期间可能已被其他请求载入
+            record = self._records.get(conversation_id) or self._adopt(conversation_id, row)
+        if record is None or not messages or record.messages is not None:
+            return
+        await self.backend.drain()
+        loaded = await asyncio.to_thread(self.backend.load_messages, conversation_id)
+        if record.messages is None and self._records.get(conversation_id) is record:
+            self._set_messages(conversation_id, record, loaded)
+
+    async def preload_many(self, conversation_ids: List[str]):
+        """
+        载入多个内存中对话尚未加载的消息（对话列表附带最后一轮问答时使用）
+
+        只等待一次写入任务，在线程中用一次查询读取全部，不逐个preload。
+        """
+        if self.backend is None:
+            return
+        records = {conversation_id: self._records.get(conversation_id) for conversation_id in conversation_ids}
+        missing = [conversation_id for conversation_id, record in records.items()
+                   if record is not None and record.messages is None]
+        if not missing:
+            return
+        await self.backend.drain()
+        loaded = await asyncio.to_thread(self.backend.load_messages_many, missing)
+        for conversation_id in missing:
+            record = records[conversation_id]
+            if record.messages is None and self._records.get(conversation_id) is record:
+                self._set_messages(conversation_id, record, loaded[conversation_id])
+
+    async def call(self, method: str, *args):
+        """
+        请求处理中调用存储操作
+
+        以对话ID为参数的操作先preload（已在内存中时不等待），之后只访问内存，
+        写入由后台任务落盘，直接在事件循环中执行。
+        """
+        if method in CONVERSATION_METHODS:
+            await self.preload(args[0])
+        return getattr(self, method)(*args)
+
+    def _resize(self, conversation_id: str, record: ConversationRecord):
+        size = _record_size(conversation_id, record)
+        self.total_bytes += size - record.size
+        record.size = size
+
+    def append_turn(self, conversation_id: str, query: str, answer: str,
+                    message_id: Optional[str] = None) -> bool:
+        """记录一轮对话（用户问题和回答）；对话未被本服务记录时忽略并返回False"""
+        record = self._live(conversation_id)
+        if record is None:
+            return False
+        messages = self._messages(conversation_id, record)
+        if messages is None:
+            # 无法确定序号，改为下次读取历史时从上游回填
+            self.update(conversation_id, {'history_stale': True})
+            return False
+        now = time.time()
+        for role, content, mid in (('user', query, None), ('assistant', answer, message_id)):
+            message = {
+                'seq': messages[-1]['seq'] + 1 if messages else 1,
+                'role': role,
+                'content': content,
+                'created_at': now,
+                'message_id': mid
+            }
+            messages.append(message)
+            self.message_count += 1
+            if self.backend is not None:
+                self.backend.append_message(conversation_id, message['seq'], role, content, now, mid)
+        self._resize(conversation_id, record)
+        self._touch(conversation_id, record)
+        self._evict_overflow(protect=conversation_id)
+        return True
+
+    def history(self, conversation_id: str, after: int = 0, limit: int = 50,
+                since: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """
+        从本地记录分页读取对话历史
+
+        Args:
+            after: 游标，返回序号大于after的消息
+            limit: 单页最多条数
+            since: 增量同步游标（消息ID或序号），给出时只返回其后的消息，优先于after
+
+        Returns:
+            {"messages", "next_cursor", "has_more", "total", "reset"}；
+            对话不在本地或本地记录不完整时返回None。since找不到时reset为True并从头返回。
+        """
+        record = self._live(conversation_id)
+        if record is None or (record._metadata and record._metadata.get('history_stale')):
+            return None
+        messages = self._messages(conversation_id, record)
+        return None if messages is None else _history_page(messages, after, limit, since)
+
+    def replace_history(self, conversation_id: str, app_id: str, messages: List[Dict[str, Any]]):
+        """用上游回填的完整历史替换本地记录，对话不存在时一并创建"""
+        record = self._live(conversation_id)
+        if record is None:
+            self.put(conversation_id, app_id)
+            record = self._records.get(conversation_id)
+            if record is None:
+                return
+        now = time.time()
+        self.message_count -= len(record.messages or ())
+        record.messages = [
+            {
+                'seq': index,
+                'role': message['role'],
+                'content': message['content'],
+                'created_at': message.get('created_at') or now,
+                'message_id': message.get('message_id')
+            }
+            for index, message in enumerate(messages, start=1)
+        ]
+        self.message_count += len(record.messages)
+        if record._metadata and record._metadata.pop('history_stale', None) and self.backend is not None:
+            self.backend.update_metadata(conversation_id, record._metadata, now)
+        if self.backend is not None:
+            self.backend.replace_messages(conversation_id, record.messages)
+        self._resize(conversation_id, record)
+        self._evict_overflow(protect=conversation_id)
+
+    def turn_summary(self, conversation_id: str) -> Dict[str, Any]:
+        """对话的最后一轮问答和消息数（用于对话列表）"""
+        record = self._records.get(conversation_id)
+        return _turn_summary((self._messages(conversation_id, record) if record is not None else None) or [])
+
+    def turn_summaries(self, conversation_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """多个对话的turn_summary（消息先由preload_many一次载入）"""
+        return {conversation_id: self.turn_summary(conversation_id) for conversation_id in conversation_ids}
+
+    def counts(self) -> Dict[str, int]:
+        """对话数和消息数；有持久化后端时以后端为准（包含已被淘汰的对话）"""
+        if self.backend is not None:
+            return {"conversations": self.backend.count_conversations(), "messages": self.backend.count_messages()}
+        return {"conversations": len(self._records), "messages": self.message_count}
+
+    def mark_history_stale(self, conversation_id: str):
+        """本地记录可能缺少消息（如流式回答中断），下次读取历史时从上游回填"""
+        if self._live(conversation_id) is not None:
+            self.update(conversation_id, {'history_stale': True})
+
+    def delete(self, conversation_id: str) -> bool:
+        if self.backend is not None:
+            self.backend.delete_conversation(conversation_id)
+        if conversation_id not in self._records:
+            return False
+        self._remove(conversation_id)
+        return True
+
+    def list(self, limit: int = 50,
+             before: Optional[Tuple[float, str]] = None) -> List[Tuple[str, ConversationRecord]]:
+        """
+        按最后使用时间倒序列出未过期的对话
+
+        Args:
+            limit: 最多返回条数
+            before: 键集分页游标，即上一页最后一条的recency_key，只返回排在它之后的对话
+        """
+        index = self._index
+        records = self._records
+        position = len(index) if before is None else bisect.bisect_left(index, before, lo=self._index_start)
+        cutoff = time.time() - self.ttl
+        result = []
+        while position > self._index_start and len(result) < limit:
+            position -= 1
+            last_used, conversation_id = index[position]
+            if last_used <= cutoff:
+                break  # 更早的条目都已过期
+            record = records.get(conversation_id)
+            if record is not None and record.last_used == last_used:
+                result.append((conversation_id, record))
+        return result
+
+    def recency_key(self, conversation_id: str) -> Optional[Tuple[float, str]]:
+        """对话在最近使用索引中的排序键，用作list的分页游标"""
+        record = self._records.get(conversation_id)
+        return None if record is None else (record.last_used, conversation_id)
+
+    def _append_index(self, last_used: float, conversation_id: str):
+        index = self._index
+        entry = (last_used, conversation_id)
+        if len(index) == self._index_start or entry >= index[-1]:
+            index.append(entry)
+        else:
+            # 从后端加载的旧对话或系统时钟回拨时才需要插入到中间
+            bisect.insort(index, entry, lo=self._index_start)
+
+    def _touch(self, conversation_id: str, record: ConversationRecord):
+        # 追加新的索引条目，旧条目在最后使用时间变化后自动失效
+        now = time.time()
+        if now != record.last_used:
+            record.last_used = now
+            self._append_index(now, conversation_id)
+            self._compact_index()
+        if self.backend is not None:
+            self.backend.touch(conversation_id, now)
+
+    def _remove(self, conversation_id: str):
+        record = self._records.pop(conversation_id)
+        self.message_count -= len(record.messages or ())
+        self.total_bytes -= record.size
+
+    def _evict_overflow(self, protect: Optional[str] = None):
+        """
+        从索引头部淘汰最久未使用的对话直到满足条目数和内存上限
+
+        Args:
+            protect: 刚写入的对话；它本身最旧时（如从后端加载的旧对话）停止淘汰，避免写入即被淘汰
+        """
+        records = self._records
+        index = self._index
+        position = self._index_start
+        while records and (len(records) > self.max_entries or self.total_bytes > self.max_bytes):
+            if position >= len(index):
+                break
+            last_used, conversation_id = index[position]
+            record = records.get(conversation_id)
+            if record is None or record.last_used != last_used:
+                position += 1
+                continue
+            if conversation_id == protect:
+                break
+            position += 1
+            self._remove(conversation_id)
+            self.evictions += 1
+        self._index_start = position
+        self._compact_index()
+
+    def _compact_index(self):
+        """失效条目（含已清理的头部）超过有效条目的1/4时，按原顺序过滤重建，仍保持有序"""
+        live = len(self._records)
+        if len(self._index) > live + live // 4 + 1024:
+            records = self._records
+            self._index = [
+                entry for entry in self._index[self._index_start:]
+                if entry[1] in records and records[entry[1]].last_used == entry[0]
+            ]
+            self._index_start = 0
+
+    # ---- 过期清理 ----
+
+    def sweep_expired(self, now: Optional[float] = None, max_items: Optional[int] = None) -> int:
+        """
+        从索引头部弹出所有已到期的条目，返回清理的对话数
+
+        Args:
+            now: 当前时间戳（默认time.time()）
+            max_items: 单次最多处理的索引条目数，避免长时间占用事件循环
+        """
+        cutoff = (time.time() if now is None else now) - self.ttl
+        index = self._index
+        records = self._records
+        position = self._index_start
+        removed = 0
+        processed = 0
+        while position < len(index) and index[position][0] <= cutoff:
+            if max_items is not None and processed >= max_items:
+                break
+            processed += 1
+            last_used, conversation_id = index[position]
+            position += 1
+            record = records.get(conversation_id)
+            if record is None or record.last_used != last_used:
+                continue  # 已被删除、淘汰或期间被使用过
+            self._remove(conversation_id)
+            removed += 1
+
+        self._index_start = position
+        self.expirations += removed
+        self._compact_index()
+        return removed
+
+    def _next_deadline(self) -> Optional[float]:
+        if self._index_start >= len(self._index):
+            return None
+        return self._index[self._index_start][0] + self.ttl
+
+    async def _sweep_loop(self):
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            if self.backend is not None:
+                self.backend.purge_expired(time.time() - self.ttl)
+            total = 0
+            while True:
+                removed = self.sweep_expired(max_items=2000)
+                total += removed
+                next_deadline = self._next_deadline()
+                if next_deadline is None or next_deadline > time.time():
+                    break
+                await asyncio.sleep(0)
+            if total:
+                logger.info(f"清理了 {total} 个过期对话")
+
+    async def start(self):
+        """启动后台过期清理任务（及持久化写入任务）"""
+        if self.backend is not None:
+            await self.backend.start()
+        if self._task is None:
+            self._task = asyncio.create_task(self._sweep_loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self.backend is not None:
+            await self.backend.stop()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._records),
+            "max_entries": self.max_entries,
+            "estimated_bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+            "ttl": self.ttl,
+            "recency_index_size": len(self._index) - self._index_start,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "backend_hits": self.backend_hits,
+            "backend": self.backend.stats() if self.backend is not None else None
+        }
+
+
+class SharedConversationStore:
+    """
+    多worker共享的对话存储，接口与ConversationStore相同
+
+    不在进程内缓存对话，每个操作直接读写共享状态（SQLiteConversationState或RedisConversationState），
+    任一worker写入后其他worker立即可见。共享状态出错时记录日志：写操作返回False，读操作视为对话不存在，
+    与上游交互的主流程不受影响（历史接口会退回上游）。
+    同步操作可能等待其他worker持有的SQLite写锁（最长busy_timeout）或Redis网络往返，
+    请求处理中经call放到线程中执行，不阻塞事件循环。
+    """
+
+    def __init__(self, state, ttl: float = DEFAULT_TTL_SECONDS, sweep_interval: float = 60.0):
+        """
+        Args:
+            state: 共享状态后端
+            ttl: 自最后一次使用起的有效期（秒）
+            sweep_interval: 后台清理间隔（秒），多个worker都会执行，清理操作是幂等的
+        """
+        self.state = state
+        self.ttl = ttl
+        self.sweep_interval = sweep_interval
+        self.operations = 0
+        self.errors = 0
+        self.op_seconds = 0.0
+        self.expirations = 0
+        self._stats_lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    def _call(self, method: str, *args, default=None):
+        """调用共享状态，统计耗时；出错时返回default"""
+        started = time.perf_counter()
+        failed = False
+        try:
+            return getattr(self.state, method)(*args)
+        except self.state.errors as e:
+            failed = True
+            logger.error(f"共享对话状态操作 {method} 失败: {e}")
+            return default
+        finally:
+            # 各操作在线程池中并发执行
+            with self._stats_lock:
+                self.operations += 1
+                if failed:
+                    self.errors += 1
+                self.op_seconds += time.perf_counter() - started
+
+    async def call(self, method: str, *args):
+        """请求处理中调用存储操作，在线程中执行"""
+        return await asyncio.to_thread(getattr(self, method), *args)
+
+    @staticmethod
+    def _record(row: Dict[str, Any]) -> ConversationRecord:
+        return ConversationRecord(row['app_id'], row['created_at'], row['last_used'], row['metadata'])
+
+    def __len__(self) -> int:
+        return self._call('count_live', time.time() - self.ttl, default=0)
+
+    def __contains__(self, conversation_id: str) -> bool:
+        return self.peek(conversation_id) is not None
+
+    def put(self, conversation_id: str, app_id: str, metadata: Optional[Dict[str, Any]] = None):
+        self._call('upsert_conversation', conversation_id, app_id, time.time(), metadata)
+
+    def get(self, conversation_id: str) -> Optional[ConversationRecord]:
+        now = time.time()
+        row = self._call('load_conversation', conversation_id, now - self.ttl, now)
+        return None if row is None else self._record(row)
+
+    def peek(self, conversation_id: str) -> Optional[ConversationRecord]:
+        row = self._call('load_conversation', conversation_id, time.time() - self.ttl)
+        return None if row is None else self._record(row)
+
+    async def preload(self, conversation_id: Optional[str], messages: bool = True):
+        """共享存储没有进程内缓存，请求处理中的操作经call在线程中访问共享状态，无需预先载入"""
+
+    async def preload_many(self, conversation_ids: List[str]):
+        """同preload，无需预先载入"""
+
+    def update(self, conversation_id: str, metadata: Dict[str, Any]) -> bool:
+        now = time.time()
+        return self._call('merge_metadata', conversation_id, metadata, now, now - self.ttl, default=False)
+
+    def append_turn(self, conversation_id: str, query: str, answer: str,
+                    message_id: Optional[str] = None) -> bool:
+        now = time.time()
+        return self._call('append_messages', conversation_id,
+                          [('user', query, None), ('assistant', answer, message_id)],
+                          now, now - self.ttl, default=False)
+
+    def history(self, conversation_id: str, after: int = 0, limit: int = 50,
+                since: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        record = self.peek(conversation_id)
+        if record is None or record.metadata.get('history_stale'):
+            return None
+        messages = self._call('load_messages', conversation_id)
+        if messages is None:
+            return None
+        return _history_page(messages, after, limit, since)
+
+    def replace_history(self, conversation_id: str, app_id: str, messages: List[Dict[str, Any]]):
+        now = time.time()
+        self._call('replace_messages', conversation_id, app_id, [
+            {
+                'seq': index,
+                'role': message['role'],
+                'content': message['content'],
+                'created_at': message.get('created_at') or now,
+                'message_id': message.get('message_id')
+            }
+            for index, message in enumerate(messages, start=1)
+        ], now, now - self.ttl)
+
+    def turn_summary(self, conversation_id: str) -> Dict[str, Any]:
+        return _turn_summary(self._call('load_messages', conversation_id, default=[]))
+
+    def turn_summaries(self, conversation_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """多个对话的turn_summary，经call在同一个线程任务中依次读取"""
+        return {conversation_id: self.turn_summary(conversation_id) for conversation_id in conversation_ids}
+
+    def counts(self) -> Dict[str, int]:
+        return self._call('counts', default={"conversations": 0, "messages": 0})
+
+    def mark_history_stale(self, conversation_id: str):
+        self.update(conversation_id, {'history_stale': True})
+
+    def delete(self, conversation_id: str) -> bool:
+        return self._call('delete_conversation', conversation_id, default=False)
+
+    def list(self, limit: int = 50,
+             before: Optional[Tuple[float, str]] = None) -> List[Tuple[str, ConversationRecord]]:
+        rows = self._call('list_recent', limit, before, time.time() - self.ttl, default=[])
+        return [(conversation_id, self._record(row)) for conversation_id, row in rows]
+
+    def recency_key(self, conversation_id: str) -> Optional[Tuple[float, str]]:
+        record = self.peek(conversation_id)
+        return None if record is None else (record.last_used, conversation_id)
+
+    def sweep_expired(self, now: Optional[float] = None, max_items: int = 1000) -> int:
+        cutoff = (time.time() if now is None else now) - self.ttl
+        removed = self._call('purge_expired', cutoff, max_items, default=0)
+        self.expirations += removed
+        return removed
+
+    async def _sweep_loop(self):
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            total = 0
+            while True:
+                removed = await self.call('sweep_expired', None, 1000)
+                total += removed
+                if removed < 1000:
+                    break
+            if total:
+                logger.info(f"清理了 {total} 个过期对话")
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._sweep_loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self.state.close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "ttl": self.ttl,
+            "operations": self.operations,
+            "errors": self.errors,
+            "avg_op_ms": round(self.op_seconds / self.operations * 1000, 3) if self.operations else 0.0,
+            "expirations": self.expirations,
+            "backend": self.state.stats()
+        }
+
+
+def _db_path() -> str:
+    """CONVERSATION_DB_PATH，相对路径基于backend目录；设为空字符串时返回空"""
+    path = os.getenv('CONVERSATION_DB_PATH', os.path.join('data', 'conversations.db'))
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), path) if path else ''
+
+
+def create_backend() -> Optional[SQLiteConversationBackend]:
+    """按CONVERSATION_DB_PATH创建持久化后端，设为空字符串时仅使用内存"""
+    path = _db_path()
+    if not path:
+        return None
+    return SQLiteConversationBackend(
+        path,
+        flush_interval=float(os.getenv('CONVERSATION_DB_FLUSH_INTERVAL', 0.02))
+    )
+
+
+def create_conversation_store():
+    """
+    按CONVERSATION_BACKEND创建对话存储
+
+        local   进程内存储（默认），可选SQLite持久化；只适合单worker
+        sqlite  同一主机多worker共享CONVERSATION_DB_PATH指向的SQLite文件
+        redis   多副本共享CONVERSATION_REDIS_URL指向的Redis兼容服务
+    """
+    kind = os.getenv('CONVERSATION_BACKEND', 'local').strip().lower()
+    ttl = float(os.getenv('CONVERSATION_STORE_TTL', DEFAULT_TTL_SECONDS))
+    sweep_interval = float(os.getenv('CONVERSATION_STORE_SWEEP_INTERVAL', 60))
+    if kind == 'local':
+        return ConversationStore(
+            max_entries=int(os.getenv('CONVERSATION_STORE_MAX_ENTRIES', 1_000_000)),
+            max_bytes=int(os.getenv('CONVERSATION_STORE_MAX_BYTES', 1024 * 1024 * 1024)),
+            ttl=ttl,
+            sweep_interval=sweep_interval,
+            backend=create_backend()
+        )
+    if kind == 'sqlite':
+        path = _db_path()
+        if not path:
+            raise ValueError("CONVERSATION_BACKEND=sqlite 需要设置CONVERSATION_DB_PATH")
+        state = SQLiteConversationState(path)
+    elif kind == 'redis':
+        from conversation_redis import RedisConversationState
+        state = RedisConversationState(
+            os.getenv('CONVERSATION_REDIS_URL', 'redis://127.0.0.1:6379/0'),
+            prefix=os.getenv('CONVERSATION_REDIS_PREFIX', 'terra:'),
+            ttl=ttl,
+            socket_timeout=float(os.getenv('CONVERSATION_REDIS_TIMEOUT', 1.0))
+        )
+    else:
+        raise ValueError(f"未知的CONVERSATION_BACKEND: {kind}（可选 local / sqlite / redis）")
+    return SharedConversationStore(state, ttl=ttl, sweep_interval=sweep_interval)
+
+
+# 全局实例
+conversation_store = create_conversation_store()
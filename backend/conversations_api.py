@@ -0,0 +1,45 @@
+from fastapi import APIRouter, HTTPException
+import asyncio
+from typing import Optional
+import os
+import logging
+from utils import conversation_manager
+
+# 创建路由器
+router = APIRouter(prefix="/api/conversations", tags=["对话管理"])
+
+logger = logging.getLogger(__name__)
+
+MAX_PAGE_SIZE = 100
+
+@router.get("")
+async def list_conversations(limit: int = 20, cursor: Optional[str] = None):
+    """
+    按最后使用时间倒序列出对话（管理页面使用）
+
+    键集分页：has_more为true时把next_cursor作为下一页的cursor，
+    翻页期间新产生或被使用的对话不会导致重复或遗漏。
+    """
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    try:
+        page = await conversation_manager.list_page(limit, cursor, with_turns=True)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return {"success": True, **page}
+
+@router.get("/stats")
+async def conversation_stats():
+    """对话统计（管理页面使用）"""
+    # 有持久化后端时按数据库计数，共享存储的对话数同样要查询共享状态，都在线程中执行
+    store = conversation_manager.store
+    counts = await asyncio.to_thread(store.counts)
+    cached = await asyncio.to_thread(len, store)
+    ai_configured = bool(os.getenv('QIANFAN_TOKEN') and os.getenv('QIANFAN_APP_ID'))
+    return {
+        "success": True,
+        "total_messages": counts["messages"],
+        "unique_conversations": counts["conversations"],
+        "cached_conversations": cached,
+        "ai_mode": "agent" if ai_configured else "local"
+    }
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+近似最近邻检索 - 哈希TF-IDF向量 + IVF
+
+向量在本地计算，不依赖外部模型服务：
+    HashedTfidf  词项键（整数，见faq_engine.term_keys）乘法哈希到dim个桶（另取一位作正负号，抵消碰撞偏差），
+                 按 (1 + log tf) * idf 加权后做L2归一化，余弦相似度即向量内积
+    IVFIndex     球面k-means把向量分成约sqrt(n)个簇，按簇连续存放；查询先与各簇心比较，
+                 只在最近的nprobe个簇内精确计算内积排序
+文档向量存为CSR稀疏矩阵，查询向量只有几十个非零桶。
+换一种说法的问题与原问题的余弦相似度通常只有0.2~0.5，这个区间内随机投影LSH（SimHash）的签名
+很少相同，要达到同样的召回几乎要扫描全部向量，因此选用IVF（对比数据见bench_faq_ann）。
+"""
+
+import math
+import time
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+import numpy as np
+import scipy.sparse as sp
+
+# 64位乘法哈希常数（黄金分割）
+_HASH_MULTIPLIER = np.uint64(0x9E3779B97F4A7C15)
+
+
+class HashedTfidf:
+    """词项键 → 哈希桶上的TF-IDF向量"""
+
+    def __init__(self, dim_bits: int = 14):
+        self.dim_bits = dim_bits
+        self.dim = 1 << dim_bits
+        self.idf = np.ones(self.dim, dtype=np.float32)
+
+    def buckets(self, keys: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """词项键对应的桶号和正负号"""
+        hashed = keys.astype(np.uint64) * _HASH_MULTIPLIER
+        buckets = (hashed >> np.uint64(64 - self.dim_bits)).astype(np.int64)
+        signs = np.where((hashed >> np.uint64(63 - self.dim_bits)) & np.uint64(1), -1.0, 1.0).astype(np.float32)
+        return buckets, signs
+
+    def _counts(self, keys: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """每个桶的带符号词频"""
+        buckets, signs = self.buckets(keys)
+        unique, inverse = np.unique(buckets, return_inverse=True)
+        return unique, np.bincount(inverse.ravel(), weights=signs, minlength=len(unique)).astype(np.float32)
+
+    def fit(self, documents: Sequence[np.ndarray]) -> 'HashedTfidf':
+        """按文档频率计算每个桶的idf"""
+        df = np.zeros(self.dim, dtype=np.float64)
+        for keys in documents:
+            df[np.unique(self.buckets(keys)[0])] += 1
+        self.idf = np.log((len(documents) + 1) / (df + 0.5)).astype(np.float32)
+        return self
+
+    def transform(self, keys: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """单个文本的稀疏向量 (桶号, 权重)，已L2归一化"""
+        buckets, counts = self._counts(keys)
+        weights = np.sign(counts) * (1 + np.log(np.maximum(np.abs(counts), 1))) * self.idf[buckets]
+        nonzero = counts != 0
+        buckets, weights = buckets[nonzero], weights[nonzero]
+        norm = float(np.linalg.norm(weights))
+        return buckets, (weights / norm if norm else weights).astype(np.float32)
+
+    def transform_many(self, documents: Sequence[np.ndarray]) -> sp.csr_matrix:
+        """多个文本的向量组成的CSR矩阵（每行已L2归一化）"""
+        rows, columns, values = [], [], []
+        for row, keys in enumerate(documents):
+            buckets, weights = self.transform(keys)
+            rows.append(np.full(len(buckets), row, dtype=np.int64))
+            columns.append(buckets)
+            values.append(weights)
+        if not documents:
+            return sp.csr_matrix((0, self.dim), dtype=np.float32)
+        return sp.csr_matrix((np.concatenate(values), (np.concatenate(rows), np.concatenate(columns))),
+                             shape=(len(documents), self.dim), dtype=np.float32)
+
+
+def combine(vectors: Sequence[sp.csr_matrix], weights: Sequence[float]) -> sp.csr_matrix:
+    """多组行向量加权相加后逐行重新归一化"""
+    total = sum(vector * weight for vector, weight in zip(vectors, weights)).tocsr()
+    norms = np.sqrt(np.asarray(total.multiply(total).sum(axis=1)).ravel())
+    norms[norms == 0] = 1.0
+    return sp.csr_matrix(sp.diags(1 / norms) @ total, dtype=np.float32)
+
+
+class IVFIndex:
+    """倒排文件索引（IVF）：球面k-means把向量分成若干簇，查询只在最近的nprobe个簇内精确计算"""
+
+    def __init__(self, vectors: sp.csr_matrix, lists: Optional[int] = None, nprobe: int = 3,
+                 iterations: int = 15, seed: int = 0):
+        """
+        Args:
+            vectors: 行向量已L2归一化的CSR矩阵
+            lists: 簇数，默认为向量数的平方根
+            nprobe: 查询时探查的簇数，越多召回越高、计算越多
+            iterations: k-means迭代次数
+            seed: 初始簇心的随机种子，相同参数和种子建出的索引相同
+        """
+        started = time.perf_counter()
+        count = vectors.shape[0]
+        self.dim = vectors.shape[1]
+        self.lists = max(1, min(count, lists or int(round(math.sqrt(count)))))
+        self.nprobe = min(nprobe, self.lists)
+
+        rng = np.random.default_rng(seed)
+        centroids = vectors[rng.choice(count, self.lists, replace=False)].toarray() if count else \
+            np.zeros((1, self.dim), dtype=np.float32)
+        assignment = np.zeros(count, dtype=np.int64)
+        for _ in range(iterations if count else 0):
+            assignment = np.asarray(vectors @ centroids.T).argmax(axis=1)
+            members = sp.csr_matrix((np.ones(count, dtype=np.float32), (assignment, np.arange(count))),
+                                    shape=(self.lists, count))
+            sums = (members @ vectors).toarray()
+            norms = np.linalg.norm(sums, axis=1)
+            # 空簇保留原簇心
+            filled = norms > 0
+            centroids[filled] = sums[filled] / norms[filled, None]
+        self.centroids = centroids.astype(np.float32)
+
+        # 按簇重排，每个簇是连续的一段行；rows把重排后的行号映射回原行号
+        self.rows = np.argsort(assignment, kind='stable')
+        self.vectors = vectors[self.rows].tocsr()
+        self.starts = np.searchsorted(assignment[self.rows], np.arange(self.lists + 1))
+        self._list_vectors = [self.vectors[self.starts[i]:self.starts[i + 1]] for i in range(self.lists)]
+        self.build_seconds = time.perf_counter() - started
+
+    def __len__(self) -> int:
+        return self.vectors.shape[0]
+
+    def _rank(self, rows: np.ndarray, scores: np.ndarray, top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        if len(rows) > top_k:
+            keep = np.argpartition(-scores, top_k - 1)[:top_k]
+            rows, scores = rows[keep], scores[keep]
+        order = np.argsort(-scores, kind='stable')
+        return self.rows[rows[order]], scores[order]
+
+    def search(self, buckets: np.ndarray, weights: np.ndarray, top_k: int = 5) -> Tuple[np.ndarray, np.ndarray]:
+        """近似最近邻：返回 (文档行号, 余弦相似度)，相似度降序"""
+        if not len(self):
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        probes = np.argpartition(-(self.centroids[:, buckets] @ weights), self.nprobe - 1)[:self.nprobe]
+        query = np.zeros(self.dim, dtype=np.float32)
+        query[buckets] = weights
+        # 每个簇在重排后的矩阵中是连续的一段行，各簇的向量分别与查询向量相乘
+        rows = np.concatenate([np.arange(self.starts[probe], self.starts[probe + 1]) for probe in probes])
+        scores = np.concatenate([self._list_vectors[probe] @ query for probe in probes])
+        return self._rank(rows, scores, top_k)
+
+    def brute_force(self, buckets: np.ndarray, weights: np.ndarray,
+                    top_k: int = 5) -> Tuple[np.ndarray, np.ndarray]:
+        """精确最近邻（与全部向量计算内积），作为基准"""
+        query = np.zeros(self.dim, dtype=np.float32)
+        query[buckets] = weights
+        scores = np.asarray(self.vectors @ query).ravel()
+        return self._rank(np.arange(len(scores)), scores, top_k)
+
+    def stats(self) -> Dict[str, Any]:
+        sizes = np.diff(self.starts)
+        return {
+            "vectors": len(self),
+            "lists": self.lists,
+            "nprobe": self.nprobe,
+            "avg_list": round(float(sizes.mean()), 2) if len(sizes) else None,
+            "max_list": int(sizes.max()) if len(sizes) else None,
+            "build_ms": round(self.build_seconds * 1000, 1)
+        }
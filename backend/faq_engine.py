@@ -0,0 +1,516 @@
+#!/usr/bin/env python3
+"""
+本地FAQ问答引擎 - 基于knowledge_base中整理好的问答对
+
+启动时解析knowledge_base下的问答Markdown，支持两种写法：
+    **问：……**            Q: ……
+    答：……                A: ……（可跨多行，到下一个问题、标题或"标签:"行为止）
+中文没有空格分词，问题文本按字符n-gram（一元 + 二元）切分，建倒排索引并按TF-IDF加权，用余弦相似度打分。
+复合问题（"什么是温室效应？为什么会发生全球变暖？"）的每个子问题也单独索引，指向同一个答案。
+用户问题与某个整理好的问题足够相似（不低于阈值，且与第二名的问答对拉开差距）时直接返回整理好的答案，
+不请求上游。相似度只看重合程度：问题后面附加的要求（"……？用一句话"）使相似度只略微下降，
+因此还要求用户问题去掉疑问词后，整理好的问题中没有的字符不超过问题长度的一定比例。
+
+换了说法的问题（"阿尔卑斯山怎么来的" 与 "阿尔卑斯造山带是如何形成的？"）字面重合很少，
+字面匹配未命中时再做一次语义匹配：去掉疑问词和虚词后，问题与答案开头的n-gram共同构成哈希TF-IDF向量，
+在IVF索引（faq_ann）上找最近邻，相似度达到语义阈值（通常远低于字面阈值）且拉开差距时命中。
+语义匹配默认关闭（FAQ_SEMANTIC_ENABLED）：换说法的问题与库外的相近问题相似度区间重叠，
+默认阈值按bench_faq_ann的标注集校准为库外问题零误命中，只能接住一部分换说法的问题。
+"""
+
+import glob
+import logging
+import math
+import os
+import re
+import time
+import unicodedata
+from collections import Counter, defaultdict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from faq_ann import HashedTfidf, IVFIndex, combine
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_KB_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'knowledge_base')
+
+_QUESTION_BOLD = re.compile(r'^\*\*问[：:]\s*(.+?)\s*\*\*\s*$')
+_ANSWER_PLAIN = re.compile(r'^答[：:]\s*(.*)$')
+_QUESTION_QA = re.compile(r'^Q[：:]\s*(.+?)\s*$')
+_ANSWER_QA = re.compile(r'^A[：:]\s*(.*)$')
+_TAGS = re.compile(r'^标签[：:]\s*(.*)$')
+_HEADING = re.compile(r'^(#{1,6})\s+(.+?)\s*$')
+# 行内出现的标题（文件拼接残留），视为答案结束
+_INLINE_HEADING = re.compile(r'\S#{1,6} \S')
+_NON_WORD = re.compile(r'[\W_]+')
+_SUB_QUESTION = re.compile(r'[？?；;]')
+# 语义匹配前去掉的疑问词和虚词（在不同说法之间差别最大，却不表达问的是什么）
+_QUESTION_WORDS = re.compile(
+    r'什么是|是什么|为什么|为何|怎么样|怎么|怎样|如何|哪些|什么|有没有|会不会|是否|能不能|多少|'
+    r'它们|它|我们|这么|那么|如此|这样|一下|[吗呢吧啊的了着是有会能在来又还都就对与和及中上下里其之个些几]'
+)
+
+NGRAM_SIZES = (1, 2)
+# 二元组的键为 (前一个码点 + 1) * BIGRAM_BASE + 后一个码点，与一元组（即码点本身）不会重叠
+BIGRAM_BASE = 0x110000
+# 子问题短于该长度（规范化后的字符数）时不单独索引
+MIN_ALIAS_CHARS = 4
+
+
+class QAPair:
+    """一个整理好的问答对"""
+
+    __slots__ = ('question', 'answer', 'source', 'section', 'tags')
+
+    def __init__(self, question: str, answer: str, source: str, section: str = '', tags: Tuple[str, ...] = ()):
+        self.question = question
+        self.answer = answer
+        self.source = source
+        self.section = section
+        self.tags = tags
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "question": self.question,
+            "answer": self.answer,
+            "source": self.source,
+            "section": self.section,
+            "tags": list(self.tags)
+        }
+
+
+def parse_qa_markdown(text: str, source: str) -> List[QAPair]:
+    """从Markdown文本中解析问答对；第一个问题之前的内容忽略"""
+    pairs: List[QAPair] = []
+    section = ''
+    question: Optional[str] = None
+    answer_lines: List[str] = []
+    tags: Tuple[str, ...] = ()
+    in_answer = False
+
+    def finish():
+        nonlocal question, answer_lines, tags, in_answer
+        answer = '\n'.join(answer_lines).strip()
+        if question and answer:
+            pairs.append(QAPair(question, answer, source, section, tags))
+        question, answer_lines, tags, in_answer = None, [], (), False
+
+    for raw in text.splitlines():
+        line = raw.rstrip()
+        stripped = line.strip()
+
+        heading = _HEADING.match(stripped)
+        match = _QUESTION_BOLD.match(stripped) or _QUESTION_QA.match(stripped)
+        if heading or match:
+            finish()
+            if heading:
+                section = heading.group(2)
+            else:
+                question = match.group(1)
+            continue
+        if question is None:
+            continue
+
+        if not in_answer:
+            match = _ANSWER_PLAIN.match(stripped) or _ANSWER_QA.match(stripped)
+            if match:
+                in_answer = True
+                answer_lines.append(match.group(1))
+            continue
+
+        match = _TAGS.match(stripped)
+        if match:
+            tags = tuple(tag.strip() for tag in re.split(r'[,，、]', match.group(1)) if tag.strip())
+            finish()
+            continue
+        if _INLINE_HEADING.search(stripped):
+            finish()
+            continue
+        answer_lines.append(line)
+
+    finish()
+    return pairs
+
+
+def _pair_key(pair: QAPair) -> Tuple[str, str, str, Tuple[str, ...]]:
+    return pair.question, pair.answer, pair.section, pair.tags
+
+
+def load_qa_pairs(directory: str = DEFAULT_KB_DIR) -> List[QAPair]:
+    """读取目录下所有Markdown文件中的问答对"""
+    pairs: List[QAPair] = []
+    for path in sorted(glob.glob(os.path.join(directory, '*.md'))):
+        with open(path, encoding='utf-8') as f:
+            pairs.extend(parse_qa_markdown(f.read(), os.path.basename(path)))
+    return pairs
+
+
+def normalize_text(text: str) -> str:
+    """全角转半角、统一小写、去掉空白和标点"""
+    return _NON_WORD.sub('', unicodedata.normalize('NFKC', text).lower())
+
+
+def char_ngrams(text: str, sizes: Tuple[int, ...] = NGRAM_SIZES) -> Dict[str, int]:
+    """规范化后的字符n-gram及其出现次数"""
+    normalized = normalize_text(text)
+    counts: Dict[str, int] = defaultdict(int)
+    for size in sizes:
+        for start in range(len(normalized) - size + 1):
+            counts[normalized[start:start + size]] += 1
+    return counts
+
+
+def term_keys(texts: Sequence[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    计算所有文本的一元/二元词项键（与char_ngrams相同的n-gram，编码为整数，整体向量化计算）
+
+    Returns:
+        (keys, rows)：每个词项出现一次对应一个键，rows为其所在文本的下标
+    """
+    normalized = [normalize_text(text) for text in texts]
+    lengths = np.fromiter((len(text) for text in normalized), dtype=np.int64, count=len(normalized))
+    codepoints = np.frombuffer(''.join(normalized).encode('utf-32-le'), dtype=np.uint32).astype(np.int64)
+    rows = np.repeat(np.arange(len(normalized), dtype=np.int64), lengths)
+    # 二元组不跨越文本边界
+    same = rows[:-1] == rows[1:]
+    bigrams = (codepoints[:-1][same] + 1) * BIGRAM_BASE + codepoints[1:][same]
+    return np.concatenate([codepoints, bigrams]), np.concatenate([rows, rows[:-1][same]])
+
+
+def split_term_keys(texts: Sequence[str]) -> List[np.ndarray]:
+    """每个文本各自的词项键"""
+    keys, rows = term_keys(texts)
+    order = np.argsort(rows, kind='stable')
+    return np.split(keys[order], np.searchsorted(rows[order], np.arange(1, len(texts))))
+
+
+def strip_question_words(text: str) -> str:
+    return _QUESTION_WORDS.sub(' ', text)
+
+
+def extra_chars(query: str, question: str) -> int:
+    """query去掉疑问词后，question中没有的字符数（按出现次数计）"""
+    missing = Counter(normalize_text(strip_question_words(query))) - Counter(normalize_text(question))
+    return sum(missing.values())
+
+
+def question_aliases(question: str) -> List[str]:
+    """问题本身及其中的各个子问题"""
+    aliases = [question]
+    parts = [part for part in _SUB_QUESTION.split(question) if len(normalize_text(part)) >= MIN_ALIAS_CHARS]
+    if len(parts) > 1:
+        aliases.extend(parts)
+    return aliases
+
+
+class FAQIndex:
+    """问题文本的TF-IDF倒排索引"""
+
+    def __init__(self, pairs: List[QAPair]):
+        self.pairs = pairs
+        # 每个索引文档是一个问题或子问题，指向所属的问答对
+        self.doc_pairs: List[int] = []
+        doc_grams: List[Dict[str, int]] = []
+        for pair_index, pair in enumerate(pairs):
+            for alias in question_aliases(pair.question):
+                grams = char_ngrams(alias)
+                if grams:
+                    self.doc_pairs.append(pair_index)
+                    doc_grams.append(grams)
+
+        document_frequency: Dict[str, int] = defaultdict(int)
+        for grams in doc_grams:
+            for gram in grams:
+                document_frequency[gram] += 1
+        total = len(doc_grams)
+        self.idf = {gram: math.log((total + 1) / (df + 0.5)) for gram, df in document_frequency.items()}
+
+        self.postings: Dict[str, List[Tuple[int, float]]] = defaultdict(list)
+        self.doc_norms: List[float] = []
+        for doc, grams in enumerate(doc_grams):
+            norm = 0.0
+            for gram, count in grams.items():
+                weight = (1 + math.log(count)) * self.idf[gram]
+                self.postings[gram].append((doc, weight))
+                norm += weight * weight
+            self.doc_norms.append(math.sqrt(norm) or 1.0)
+
+    def __len__(self) -> int:
+        return len(self.pairs)
+
+    def search(self, query: str, top_k: int = 5) -> List[Tuple[float, QAPair]]:
+        """返回与query最相似的top_k个问答对（余弦相似度降序，同一问答对只保留最高分）"""
+        scores: Dict[int, float] = defaultdict(float)
+        query_norm = 0.0
+        for gram, count in char_ngrams(query).items():
+            idf = self.idf.get(gram)
+            if idf is None:
+                # 索引中没有的n-gram只计入查询向量长度
+                idf = math.log(len(self.doc_norms) + 1)
+                query_norm += ((1 + math.log(count)) * idf) ** 2
+                continue
+            weight = (1 + math.log(count)) * idf
+            query_norm += weight * weight
+            for doc, doc_weight in self.postings[gram]:
+                scores[doc] += weight * doc_weight
+        if not scores:
+            return []
+
+        query_norm = math.sqrt(query_norm)
+        best: Dict[int, float] = {}
+        for doc, dot in scores.items():
+            score = dot / (query_norm * self.doc_norms[doc])
+            pair_index = self.doc_pairs[doc]
+            if score > best.get(pair_index, 0.0):
+                best[pair_index] = score
+        ranked = sorted(best.items(), key=lambda item: item[1], reverse=True)[:top_k]
+        return [(score, self.pairs[pair_index]) for pair_index, score in ranked]
+
+
+class FAQVectorIndex:
+    """问答对的语义向量（问题 + 答案开头的哈希TF-IDF）及其IVF索引"""
+
+    def __init__(self, pairs: List[QAPair], answer_weight: float = 1.0, answer_chars: int = 300,
+                 dim_bits: int = 14, lists: Optional[int] = None, nprobe: int = 3):
+        """
+        Args:
+            pairs: 问答对
+            answer_weight: 答案开头相对问题的权重
+            answer_chars: 参与向量的答案开头字符数
+            dim_bits: 哈希桶数为2的dim_bits次方
+            lists, nprobe: IVF的簇数和查询时探查的簇数，见faq_ann.IVFIndex
+        """
+        self.pairs = pairs
+        questions, answers, doc_pairs = [], [], []
+        for pair_index, pair in enumerate(pairs):
+            for alias in question_aliases(pair.question):
+                questions.append(strip_question_words(alias))
+                answers.append(pair.answer[:answer_chars])
+                doc_pairs.append(pair_index)
+        self.doc_pairs = np.array(doc_pairs, dtype=np.int64)
+
+        question_keys = split_term_keys(questions)
+        answer_keys = split_term_keys(answers)
+        self.vectorizer = HashedTfidf(dim_bits).fit(question_keys + answer_keys)
+        vectors = combine([self.vectorizer.transform_many(question_keys),
+                           self.vectorizer.transform_many(answer_keys)], [1.0, answer_weight])
+        self.ann = IVFIndex(vectors, lists=lists, nprobe=nprobe)
+
+    def __len__(self) -> int:
+        return len(self.pairs)
+
+    def vector(self, query: str) -> Tuple[np.ndarray, np.ndarray]:
+        return self.vectorizer.transform(term_keys([strip_question_words(query)])[0])
+
+    def search(self, query: str, top_k: int = 5, exact: bool = False) -> List[Tuple[float, QAPair]]:
+        """
+        返回与query语义最接近的top_k个问答对（余弦相似度降序，同一问答对只保留最高分）
+
+        Args:
+            exact: 为True时与全部向量计算相似度（基准），否则查IVF索引
+        """
+        buckets, weights = self.vector(query)
+        if not len(buckets) or not len(self.pairs):
+            return []
+        search = self.ann.brute_force if exact else self.ann.search
+        # 同一问答对可能有多个子问题向量，多取一些再去重
+        rows, scores = search(buckets, weights, top_k * 3)
+        best: Dict[int, float] = {}
+        for row, score in zip(rows, scores):
+            pair_index = int(self.doc_pairs[row])
+            if score > 0 and pair_index not in best:
+                best[pair_index] = float(score)
+        return [(score, self.pairs[pair_index]) for pair_index, score in list(best.items())[:top_k]]
+
+
+class FAQMatch:
+    """一次命中的结果"""
+
+    __slots__ = ('pair', 'score', 'method')
+
+    def __init__(self, pair: QAPair, score: float, method: str = 'lexical'):
+        """method: lexical（字面匹配）、semantic（语义匹配）或 warmup（预热的答案，见answer_warmup）"""
+        self.pair = pair
+        self.score = score
+        self.method = method
+
+    @property
+    def answer(self) -> str:
+        return self.pair.answer
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"question": self.pair.question, "score": round(self.score, 4), "source": self.pair.source,
+                "method": self.method}
+
+
+class FAQEngine:
+    """FAQ快速应答 - 用户问题命中整理好的问题时在本地作答"""
+
+    def __init__(self, directory: str = DEFAULT_KB_DIR, threshold: float = 0.8, margin: float = 0.05,
+                 enabled: bool = True, semantic: bool = False, semantic_threshold: float = 0.33,
+                 semantic_margin: float = 0.2, max_extra: float = 0.1):
+        """
+        Args:
+            directory: 问答Markdown所在目录
+            threshold: 命中所需的最低相似度（0-1）
+            margin: 第一名需要领先第二名问答对的相似度，避免在相近的问题之间随意选择
+            enabled: 为False时match始终返回None
+            semantic: 字面匹配未命中时是否再做语义匹配
+            semantic_threshold, semantic_margin: 语义匹配的阈值和差距（语义向量的相似度整体偏低）
+            max_extra: 字面匹配时用户问题多出的字符数上限，为问题长度的比例（至少允许1个字符，
+                       如"啥是"与"什么是"）；多出的内容往往是整理好的答案满足不了的要求
+        """
+        self.directory = directory
+        self.threshold = threshold
+        self.margin = margin
+        self.enabled = enabled
+        self.semantic = semantic
+        self.semantic_threshold = semantic_threshold
+        self.semantic_margin = semantic_margin
+        self.max_extra = max_extra
+        # 字面索引和语义索引作为一个元组整体替换，查询中途替换时不会混用新旧索引
+        self._indexes: Tuple[FAQIndex, Optional[FAQVectorIndex]] = (FAQIndex([]), None)
+        self.loaded_at: Optional[float] = None
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        if enabled:
+            self.reload()
+
+    def reload(self) -> int:
+        """重新读取问答文件并替换索引，返回问答对数量"""
+        started = time.perf_counter()
+        try:
+            pairs = load_qa_pairs(self.directory)
+        except OSError as e:
+            logger.error(f"读取FAQ知识库失败: {e}")
+            return len(self.index)
+        self._swap(pairs)
+        logger.info(f"FAQ知识库加载完成: {len(pairs)} 个问答对，耗时 {(time.perf_counter() - started) * 1000:.1f}ms")
+        return len(pairs)
+
+    def _swap(self, pairs: List[QAPair]):
+        """用pairs建好新索引后整体替换，替换前开始的查询继续使用旧索引"""
+        self._indexes = (FAQIndex(pairs), FAQVectorIndex(pairs) if self.semantic else None)
+        self.loaded_at = time.time()
+
+    def update_sources(self, sources: Sequence[str]) -> Tuple[int, int]:
+        """
+        目录下某些问答文件新增、修改或删除后，只重新解析这些文件，其余问答对原样保留
+
+        问答对顺序与reload相同（按文件名），结果与重新读取全部文件一致。
+
+        Returns:
+            (新增的问答对数, 删除的问答对数)，内容未变的问答对不计
+        """
+        if not self.enabled or not sources:
+            return 0, 0
+        started = time.perf_counter()
+        by_source: Dict[str, List[QAPair]] = defaultdict(list)
+        for pair in self.index.pairs:
+            by_source[pair.source].append(pair)
+        added = removed = 0
+        for source in sources:
+            old = {_pair_key(pair) for pair in by_source.pop(source, [])}
+            path = os.path.join(self.directory, source)
+            if os.path.isfile(path):
+                with open(path, encoding='utf-8') as f:
+                    by_source[source] = parse_qa_markdown(f.read(), source)
+            new = {_pair_key(pair) for pair in by_source.get(source, [])}
+            added += len(new - old)
+            removed += len(old - new)
+        if added or removed:
+            self._swap([pair for source in sorted(by_source) for pair in by_source[source]])
+            logger.info(f"FAQ知识库增量更新: {', '.join(sources)}，新增 {added} 个、删除 {removed} 个问答对，"
+                        f"耗时 {(time.perf_counter() - started) * 1000:.1f}ms")
+        return added, removed
+
+    @property
+    def index(self) -> FAQIndex:
+        return self._indexes[0]
+
+    @property
+    def vector_index(self) -> Optional[FAQVectorIndex]:
+        return self._indexes[1]
+
+    def search(self, query: str, top_k: int = 5) -> List[Tuple[float, QAPair]]:
+        return self.index.search(query, top_k)
+
+    def lookup(self, query: str, semantic: bool = True) -> Optional[FAQMatch]:
+        """
+        与match相同的匹配，但不计入命中统计（用于预先计算，如landmark_facts）
+
+        Args:
+            semantic: 为False时只做字面匹配
+        """
+        if not self.enabled or not query or not query.strip():
+            return None
+        index, vector_index = self._indexes
+        match = self._best(index.search(query, top_k=2), self.threshold, self.margin, 'lexical')
+        if match is not None and not self._covers(query, match.pair):
+            # 字面上就是这个问题，但附加了其他要求，换说法也不应命中，交给上游
+            return None
+        if match is None and semantic and vector_index is not None:
+            match = self._best(vector_index.search(query, top_k=2), self.semantic_threshold,
+                               self.semantic_margin, 'semantic')
+        return match
+
+    def match(self, query: str) -> Optional[FAQMatch]:
+        """问题命中时返回FAQMatch，否则返回None"""
+        if not self.enabled or not query or not query.strip():
+            return None
+        match = self.lookup(query)
+        if match is None:
+            self.misses += 1
+        elif match.method == 'semantic':
+            self.semantic_hits += 1
+        else:
+            self.hits += 1
+        return match
+
+    def _covers(self, query: str, pair: QAPair) -> bool:
+        """用户问题没有超出整理好的问题（或其某个子问题）的内容"""
+        return any(extra_chars(query, alias) <= max(1, self.max_extra * len(normalize_text(alias)))
+                   for alias in question_aliases(pair.question))
+
+    @staticmethod
+    def _best(results: List[Tuple[float, QAPair]], threshold: float, margin: float,
+              method: str) -> Optional[FAQMatch]:
+        """第一名不低于阈值且领先第二名至少margin时命中"""
+        if results and results[0][0] >= threshold and (len(results) < 2 or results[0][0] - results[1][0] >= margin):
+            return FAQMatch(results[0][1], results[0][0], method)
+        return None
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.semantic_hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "pairs": len(self.index),
+            "threshold": self.threshold,
+            "margin": self.margin,
+            "max_extra": self.max_extra,
+            "semantic": self.semantic,
+            "semantic_threshold": self.semantic_threshold,
+            "semantic_margin": self.semantic_margin,
+            "hits": self.hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "hit_ratio": round((self.hits + self.semantic_hits) / total, 4) if total else 0.0,
+            "ann": self.vector_index.ann.stats() if self.vector_index is not None else None,
+            "loaded_at": self.loaded_at
+        }
+
+
+# 全局实例
+faq_engine = FAQEngine(
+    directory=os.getenv('FAQ_KB_DIR', DEFAULT_KB_DIR),
+    threshold=float(os.getenv('FAQ_MATCH_THRESHOLD', 0.8)),
+    margin=float(os.getenv('FAQ_MATCH_MARGIN', 0.05)),
+    enabled=os.getenv('FAQ_ENABLED', 'true').lower() not in ('0', 'false', 'no'),
+    semantic=os.getenv('FAQ_SEMANTIC_ENABLED', 'false').lower() in ('1', 'true', 'yes'),
+    semantic_threshold=float(os.getenv('FAQ_SEMANTIC_THRESHOLD', 0.33)),
+    semantic_margin=float(os.getenv('FAQ_SEMANTIC_MARGIN', 0.2)),
+    max_extra=float(os.getenv('FAQ_MATCH_MAX_EXTRA', 0.1))
+)
@@ -0,0 +1,43 @@
+from fastapi import APIRouter, HTTPException
+import asyncio
+import time
+import logging
+from kb_search import knowledge_base
+from kb_watch import kb_watcher
+
+# 创建路由器
+router = APIRouter(prefix="/api/kb", tags=["知识库检索"])
+
+logger = logging.getLogger(__name__)
+
+MAX_TOP_K = 50
+
+@router.get("/search")
+async def search_knowledge_base(q: str, k: int = 5):
+    """
+    BM25检索知识库段落
+
+    返回得分最高的k个段落（得分降序），每个段落带出处文件和所属问题/标题。
+    """
+    if not q.strip():
+        raise HTTPException(status_code=400, detail="查询内容不能为空")
+    k = max(1, min(k, MAX_TOP_K))
+
+    if knowledge_base.index is None:
+        # 首次查询时建索引，放到线程中避免阻塞事件循环
+        await asyncio.to_thread(knowledge_base.load)
+    started = time.perf_counter()
+    results = knowledge_base.search(q, k)
+    took_ms = (time.perf_counter() - started) * 1000
+
+    return {
+        "success": True,
+        "query": q,
+        "took_ms": round(took_ms, 3),
+        "results": [{**passage.to_dict(), "score": round(score, 4)} for score, passage in results]
+    }
+
+@router.get("/stats")
+async def knowledge_base_stats():
+    """知识库索引统计（含热更新的监视状态）"""
+    return {"success": True, **knowledge_base.stats(), "watcher": kb_watcher.stats()}
@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+"""
+知识库预建索引 - 建一次存到磁盘，各worker以mmap方式打开
+
+每个worker在启动时各自解析Markdown和PDF、建BM25索引，既慢又让每个进程各持有一份索引。
+这里把kb_search建好的索引存为一个目录 index-<语料哈希>/：
+    meta.json                       格式版本、语料哈希、BM25参数、规模、来源文件名列表
+    vocabulary.npy                  有序的词项键
+    indptr.npy indices.npy data.npy 段落×词项权重矩阵（CSC）
+    term_counts.npy                 与权重矩阵非零元一一对应的词频（知识库热更新时由它重新计算权重）
+    text.bin / text_offsets.npy     所有段落正文（UTF-8拼接）及各段的字节偏移
+    titles.bin / title_offsets.npy  去重后的标题及字节偏移
+    title_ids.npy source_ids.npy numbers.npy pages.npy offsets.npy
+                                    每个段落的标题、来源、来源内序号、起始页码和页内偏移（无则为-1）
+数组用np.load(mmap_mode='r')、正文用mmap打开，不复制到进程内存，多个worker共享操作系统的页缓存，
+打开只需读meta.json，查询只触及用到的列和返回的段落。
+语料哈希覆盖知识库每个文件的内容哈希和建索引参数，文件或参数变化后worker找不到对应目录，
+回退为进程内建索引（并记录警告），直到重新执行build。
+
+用法: python kb_index.py build [--force]     建索引（语料未变化时跳过）
+      python kb_index.py info                查看当前语料对应的索引
+"""
+
+import argparse
+import glob
+import hashlib
+import json
+import logging
+import mmap
+import os
+import shutil
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import scipy.sparse as sp
+
+from kb_ingest import file_sha256
+from kb_search import DEFAULT_INDEX_DIR, BM25Index, Passage, knowledge_base
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 2
+# build后保留的索引版本数（正在使用旧版本的worker映射的文件在删除后仍然有效）
+KEEP_VERSIONS = 2
+
+_ARRAYS = ('vocabulary', 'indptr', 'indices', 'data', 'term_counts', 'text_offsets', 'title_offsets',
+           'title_ids', 'source_ids', 'numbers', 'pages', 'offsets')
+
+
+def corpus_hash(directory: str, include_pdfs: bool, passage_chars: int, k1: float, b: float) -> str:
+    """知识库文件内容和建索引参数的哈希"""
+    digest = hashlib.sha256(f"{FORMAT_VERSION}|{include_pdfs}|{passage_chars}|{k1}|{b}".encode())
+    patterns = ('*.md', '*.pdf') if include_pdfs else ('*.md',)
+    paths = sorted(path for pattern in patterns for path in glob.glob(os.path.join(directory, pattern)))
+    for path in paths:
+        digest.update(f"|{os.path.basename(path)}:{file_sha256(path)}".encode())
+    return digest.hexdigest()[:16]
+
+
+def index_path(index_dir: str, key: str) -> str:
+    return os.path.join(index_dir, f"index-{key}")
+
+
+def _blob(strings: List[str]):
+    """字符串列表拼接为UTF-8字节串，返回(字节串, 各字符串的起始偏移，末尾多一项总长度)"""
+    encoded = [string.encode('utf-8') for string in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(item) for item in encoded], out=offsets[1:])
+    return b''.join(encoded), offsets
+
+
+def save_index(index: BM25Index, path: str, key: str, passage_chars: int) -> Dict[str, Any]:
+    """把内存中建好的索引写入path（先写临时目录再改名，worker不会打开写了一半的索引）"""
+    passages = index.passages
+    sources = sorted({passage.source for passage in passages})
+    source_numbers = {source: number for number, source in enumerate(sources)}
+    titles: Dict[str, int] = {}
+    title_ids = np.array([titles.setdefault(passage.title, len(titles)) for passage in passages], dtype=np.int32)
+    numbers = np.array([int(passage.id.rsplit('#', 1)[1]) for passage in passages], dtype=np.int32)
+    text, text_offsets = _blob([passage.text for passage in passages])
+    title_text, title_offsets = _blob(list(titles))
+    matrix = index.matrix
+    arrays = {
+        'vocabulary': index.vocabulary,
+        'indptr': matrix.indptr,
+        'indices': matrix.indices,
+        'data': matrix.data,
+        'term_counts': index.term_counts,
+        'text_offsets': text_offsets,
+        'title_offsets': title_offsets,
+        'title_ids': title_ids,
+        'source_ids': np.array([source_numbers[passage.source] for passage in passages], dtype=np.int32),
+        'numbers': numbers,
+        'pages': np.array([-1 if passage.page is None else passage.page for passage in passages], dtype=np.int32),
+        'offsets': np.array([-1 if passage.offset is None else passage.offset for passage in passages],
+                            dtype=np.int32)
+    }
+    meta = {
+        "format": FORMAT_VERSION,
+        "corpus_hash": key,
+        "passages": len(passages),
+        "terms": len(index.vocabulary),
+        "nonzeros": int(matrix.nnz),
+        "k1": index.k1,
+        "b": index.b,
+        "avg_length": index.avg_length,
+        "passage_chars": passage_chars,
+        "sources": sources,
+        "build_seconds": index.build_seconds,
+        "built_at": time.time()
+    }
+
+    temp = f"{path}.tmp{os.getpid()}"
+    shutil.rmtree(temp, ignore_errors=True)
+    os.makedirs(temp)
+    for name, array in arrays.items():
+        np.save(os.path.join(temp, f"{name}.npy"), np.ascontiguousarray(array))
+    with open(os.path.join(temp, 'text.bin'), 'wb') as f:
+        f.write(text)
+    with open(os.path.join(temp, 'titles.bin'), 'wb') as f:
+        f.write(title_text)
+    with open(os.path.join(temp, 'meta.json'), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+    # meta.json最后写入，打开时以它为准
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    os.rename(temp, path)
+    return meta
+
+
+def _map_file(path: str):
+    """只读映射整个文件；空文件无法映射，返回空字节串"""
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return b''
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class MappedBM25Index(BM25Index):
+    """以mmap方式打开的预建索引，查询逻辑与BM25Index相同，段落按需从映射的正文中解码"""
+
+    def __init__(self, path: str):
+        started = time.perf_counter()
+        with open(os.path.join(path, 'meta.json'), encoding='utf-8') as f:
+            self.meta = json.load(f)
+        if self.meta.get('format') != FORMAT_VERSION:
+            raise ValueError(f"索引格式版本不匹配: {self.meta.get('format')}")
+        self.path = path
+        self.k1 = self.meta['k1']
+        self.b = self.meta['b']
+        self.avg_length = self.meta['avg_length']
+        self.build_seconds = self.meta['build_seconds']
+        self.sources = self.meta['sources']
+
+        arrays = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode='r') for name in _ARRAYS}
+        self.vocabulary = arrays['vocabulary']
+        self.term_counts = arrays['term_counts']
+        self.matrix = sp.csc_matrix((arrays['data'], arrays['indices'], arrays['indptr']),
+                                    shape=(self.meta['passages'], self.meta['terms']), copy=False)
+        self.text_offsets = arrays['text_offsets']
+        self.title_offsets = arrays['title_offsets']
+        self.title_ids = arrays['title_ids']
+        self.source_ids = arrays['source_ids']
+        self.numbers = arrays['numbers']
+        self.pages = arrays['pages']
+        self.offsets = arrays['offsets']
+        self.text = _map_file(os.path.join(path, 'text.bin'))
+        self.titles = _map_file(os.path.join(path, 'titles.bin'))
+        self.passages = None
+        self.open_seconds = time.perf_counter() - started
+
+    def passage(self, row: int) -> Passage:
+        source = self.sources[self.source_ids[row]]
+        title = int(self.title_ids[row])
+        page = int(self.pages[row])
+        offset = int(self.offsets[row])
+        return Passage(
+            f"{source}#{self.numbers[row]}",
+            source,
+            self.titles[self.title_offsets[title]:self.title_offsets[title + 1]].decode('utf-8'),
+            self.text[self.text_offsets[row]:self.text_offsets[row + 1]].decode('utf-8'),
+            None if page < 0 else page,
+            None if offset < 0 else offset
+        )
+
+    def row_sources(self) -> List[str]:
+        return [self.sources[source_id] for source_id in self.source_ids]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **super().stats(),
+            "path": self.path,
+            "corpus_hash": self.meta['corpus_hash'],
+            "open_ms": round(self.open_seconds * 1000, 3)
+        }
+
+
+def open_index(index_dir: str, key: str) -> Optional[MappedBM25Index]:
+    """打开语料哈希为key的预建索引，不存在或损坏时返回None"""
+    path = index_path(index_dir, key)
+    if not os.path.isfile(os.path.join(path, 'meta.json')):
+        return None
+    try:
+        index = MappedBM25Index(path)
+    except (OSError, ValueError, KeyError) as e:
+        logger.error(f"打开预建索引失败 {path}: {e}")
+        return None
+    logger.info(f"已映射预建索引 {path}: {len(index)} 个段落，耗时 {index.open_seconds * 1000:.1f}ms")
+    return index
+
+
+def prune(index_dir: str, keep: int = KEEP_VERSIONS):
+    """只保留最近的keep个索引版本"""
+    versions = sorted(glob.glob(os.path.join(index_dir, 'index-*')), key=os.path.getmtime, reverse=True)
+    for path in versions[keep:]:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="知识库预建索引")
+    parser.add_argument("command", choices=("build", "info"), help="build: 建索引；info: 查看当前语料对应的索引")
+    parser.add_argument("--out", default=knowledge_base.index_dir or DEFAULT_INDEX_DIR, help="索引目录")
+    parser.add_argument("--force", action="store_true", help="语料未变化时也重新建索引")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    started = time.perf_counter()
+    key = knowledge_base.corpus_hash()
+    path = index_path(args.out, key)
+    hash_ms = (time.perf_counter() - started) * 1000
+
+    if args.command == 'info':
+        index = open_index(args.out, key)
+        print(json.dumps({"corpus_hash": key, "hash_ms": round(hash_ms, 1), "path": path,
+                          "index": index.stats() if index is not None else None}, ensure_ascii=False, indent=2))
+        return
+
+    if os.path.isfile(os.path.join(path, 'meta.json')) and not args.force:
+        print(f"语料未变化，索引已存在: {path}")
+        return
+    index = knowledge_base.build()
+    os.makedirs(args.out, exist_ok=True)
+    meta = save_index(index, path, key, knowledge_base.passage_chars)
+    prune(args.out)
+    size = sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+    print(f"索引已写入 {path}: {meta['passages']} 个段落，{meta['terms']} 个词项，{meta['nonzeros']} 个非零元，"
+          f"{size / 1024 / 1024:.1f}MB，总耗时 {time.perf_counter() - started:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+"""
+知识库PDF增量抽取 - 进程池按页抽取正文，按内容哈希缓存
+
+knowledge_base下的PDF教材按页抽取文字（pypdf），清理掉排版造成的硬换行后缓存在
+KB_CACHE_DIR下（每个文件一份 pages-<sha256>.json），manifest.json记录每个文件的
+大小、修改时间、内容哈希、页数和抽取耗时：
+    大小和修改时间都没变      直接读缓存，不计算哈希
+    变了但内容哈希没变        （如touch、复制）读缓存，只更新manifest
+    新文件或内容变化          重新抽取
+    已删除的文件              从manifest中移除并删除缓存
+需要抽取的文件按页切分成若干任务（每个任务PAGES_PER_TASK页）交给进程池并行处理，
+一本大书不会拖住其他任务。添加一本书后重建语料只需抽取这一本。
+
+用法: python kb_ingest.py --dir ../knowledge_base --workers 4 [--force]
+"""
+
+import argparse
+import glob
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Collection, Dict, List, Optional, Tuple
+
+try:
+    import pypdf
+except ImportError:
+    pypdf = None
+
+logger = logging.getLogger(__name__)
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_KB_DIR = os.path.join(os.path.dirname(BACKEND_DIR), 'knowledge_base')
+DEFAULT_CACHE_DIR = os.path.join(BACKEND_DIR, 'data', 'kb_cache')
+MANIFEST_NAME = 'manifest.json'
+MANIFEST_VERSION = 1
+# 每个抽取任务的页数
+PAGES_PER_TASK = 32
+
+_CJK = r'\u3000-\u303f\u3400-\u9fff\uff00-\uffef'
+# 两侧都是中文字符或中文标点的换行是排版造成的硬换行
+_CJK_WRAP = re.compile(rf'(?<=[{_CJK}])\s*\n\s*(?=[{_CJK}])')
+_WHITESPACE = re.compile(r'\s+')
+
+
+class PDFDocument:
+    """一个PDF文件抽取出的各页正文"""
+
+    __slots__ = ('source', 'sha256', 'pages')
+
+    def __init__(self, source: str, sha256: str, pages: List[str]):
+        self.source = source
+        self.sha256 = sha256
+        self.pages = pages
+
+    @property
+    def title(self) -> str:
+        return os.path.splitext(self.source)[0]
+
+    @property
+    def chars(self) -> int:
+        return sum(len(page) for page in self.pages)
+
+
+def resolve_path(path: str) -> str:
+    """配置中的相对路径基于backend目录（与启动时的工作目录无关），空字符串保持为空"""
+    return os.path.join(BACKEND_DIR, path) if path else path
+
+
+def clean_page(text: str) -> str:
+    """去掉中文之间的硬换行，其余空白合并为一个空格"""
+    return _WHITESPACE.sub(' ', _CJK_WRAP.sub('', text)).strip()
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def count_pages(path: str) -> int:
+    return len(pypdf.PdfReader(path).pages)
+
+
+def extract_pages(path: str, start: int, end: int) -> List[str]:
+    """抽取第start到end-1页（从0开始）的正文，在进程池中执行"""
+    reader = pypdf.PdfReader(path)
+    pages = []
+    for number in range(start, end):
+        try:
+            pages.append(clean_page(reader.pages[number].extract_text() or ''))
+        except Exception as e:
+            # 个别页面解析失败时留空，不影响其余页面
+            logger.warning(f"抽取 {os.path.basename(path)} 第{number + 1}页失败: {e}")
+            pages.append('')
+    return pages
+
+
+def _write_json(path: str, data: Any):
+    """先写临时文件再改名，读者不会看到写了一半的文件"""
+    temp = f"{path}.tmp{os.getpid()}"
+    with open(temp, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(temp, path)
+
+
+class IngestReport:
+    """一次抽取的结果统计"""
+
+    __slots__ = ('documents', 'reused', 'extracted', 'removed', 'pages_extracted', 'seconds')
+
+    def __init__(self):
+        self.documents: List[PDFDocument] = []
+        self.reused: List[str] = []
+        self.extracted: List[str] = []
+        self.removed: List[str] = []
+        self.pages_extracted = 0
+        self.seconds = 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "documents": len(self.documents),
+            "pages": sum(len(document.pages) for document in self.documents),
+            "chars": sum(document.chars for document in self.documents),
+            "reused": self.reused,
+            "extracted": self.extracted,
+            "removed": self.removed,
+            "pages_extracted": self.pages_extracted,
+            "seconds": round(self.seconds, 3)
+        }
+
+
+class PDFIngestor:
+    """knowledge_base下PDF的增量抽取"""
+
+    def __init__(self, directory: str = DEFAULT_KB_DIR, cache_dir: str = DEFAULT_CACHE_DIR,
+                 workers: Optional[int] = None):
+        """
+        Args:
+            directory: PDF所在目录
+            cache_dir: 抽取结果和manifest所在目录
+            workers: 抽取进程数，默认为CPU核数；为1时在当前进程中抽取
+        """
+        self.directory = directory
+        self.cache_dir = cache_dir
+        self.workers = workers or os.cpu_count() or 1
+
+    @property
+    def manifest_path(self) -> str:
+        return os.path.join(self.cache_dir, MANIFEST_NAME)
+
+    def _pages_path(self, sha256: str) -> str:
+        return os.path.join(self.cache_dir, f"pages-{sha256}.json")
+
+    def load_manifest(self) -> Dict[str, Dict[str, Any]]:
+        try:
+            with open(self.manifest_path, encoding='utf-8') as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if manifest.get('version') != MANIFEST_VERSION:
+            return {}
+        return manifest.get('files', {})
+
+    def _load_pages(self, sha256: str) -> Optional[List[str]]:
+        try:
+            with open(self._pages_path(sha256), encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _extract(self, paths: List[str]) -> Dict[str, List[str]]:
+        """抽取各文件的全部页面，页数多时拆成多个任务并行"""
+        tasks: List[Tuple[str, int, int]] = []
+        for path in paths:
+            try:
+                total = count_pages(path)
+            except Exception as e:
+                logger.error(f"无法读取PDF {os.path.basename(path)}: {e}")
+                total = 0
+            tasks.extend((path, start, min(start + PAGES_PER_TASK, total))
+                         for start in range(0, total, PAGES_PER_TASK))
+
+        results: Dict[str, List[str]] = {path: [] for path in paths}
+        workers = min(self.workers, len(tasks))
+        if workers <= 1:
+            for path, start, end in tasks:
+                results[path].extend(extract_pages(path, start, end))
+            return results
+        # spawn：应用启动时在线程中调用，fork带线程的进程不安全
+        with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+            futures = [pool.submit(extract_pages, path, start, end) for path, start, end in tasks]
+            # 任务按文件、页码顺序提交，按提交顺序取结果即可拼回原页序
+            for (path, _, _), future in zip(tasks, futures):
+                results[path].extend(future.result())
+        return results
+
+    def ingest(self, force: bool = False, sources: Optional[Collection[str]] = None) -> IngestReport:
+        """
+        抽取目录下全部PDF，只处理新增或内容变化的文件
+
+        Args:
+            force: 为True时忽略缓存全部重新抽取
+            sources: 只返回这些文件的正文（知识库热更新时），其余大小和修改时间未变的文件
+                     保留manifest记录、不读缓存；为None时返回全部文件
+        """
+        if pypdf is None:
+            raise RuntimeError("PDF抽取需要安装pypdf: pip install pypdf")
+        started = time.perf_counter()
+        report = IngestReport()
+        os.makedirs(self.cache_dir, exist_ok=True)
+        previous = {} if force else self.load_manifest()
+        manifest: Dict[str, Dict[str, Any]] = {}
+        cached: Dict[str, List[str]] = {}
+        pending: Dict[str, str] = {}
+
+        for path in sorted(glob.glob(os.path.join(self.directory, '*.pdf'))):
+            source = os.path.basename(path)
+            stat = os.stat(path)
+            entry = previous.get(source)
+            unchanged = entry and entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns
+            if unchanged and sources is not None and source not in sources:
+                manifest[source] = entry
+                continue
+            if unchanged:
+                sha256 = entry['sha256']
+            else:
+                sha256 = file_sha256(path)
+            pages = None if force else self._load_pages(sha256)
+            if pages is not None:
+                cached[source] = pages
+                report.reused.append(source)
+                manifest[source] = {**(entry or {}), "sha256": sha256, "size": stat.st_size,
+                                    "mtime_ns": stat.st_mtime_ns, "pages": len(pages),
+                                    "chars": sum(len(page) for page in pages)}
+            else:
+                pending[source] = sha256
+                manifest[source] = {"sha256": sha256, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+        if pending:
+            extract_started = time.perf_counter()
+            extracted = self._extract([os.path.join(self.directory, source) for source in pending])
+            seconds = time.perf_counter() - extract_started
+            for source, sha256 in pending.items():
+                pages = extracted[os.path.join(self.directory, source)]
+                _write_json(self._pages_path(sha256), pages)
+                cached[source] = pages
+                report.extracted.append(source)
+                report.pages_extracted += len(pages)
+                manifest[source].update({
+                    "pages": len(pages),
+                    "chars": sum(len(page) for page in pages),
+                    "extract_seconds": round(seconds, 3),
+                    "ingested_at": time.time()
+                })
+
+        # 清理已删除或内容已变化的文件的缓存
+        report.removed = sorted(set(previous) - set(manifest))
+        live = {entry['sha256'] for entry in manifest.values()}
+        for entry in previous.values():
+            if entry['sha256'] not in live:
+                try:
+                    os.remove(self._pages_path(entry['sha256']))
+                except OSError:
+                    pass
+        _write_json(self.manifest_path, {"version": MANIFEST_VERSION, "files": manifest})
+
+        report.documents = [PDFDocument(source, manifest[source]['sha256'], cached[source])
+                            for source in manifest if source in cached]
+        report.seconds = time.perf_counter() - started
+        logger.info(f"PDF抽取完成: {len(report.documents)} 个文件，复用 {len(report.reused)} 个，"
+                    f"抽取 {len(report.extracted)} 个（{report.pages_extracted} 页），耗时 {report.seconds:.2f}s")
+        return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="知识库PDF增量抽取")
+    parser.add_argument("--dir", default=DEFAULT_KB_DIR, help="PDF所在目录")
+    parser.add_argument("--cache-dir", default=resolve_path(os.getenv('KB_CACHE_DIR', DEFAULT_CACHE_DIR)), help="缓存目录")
+    parser.add_argument("--workers", type=int, default=None, help="抽取进程数（默认CPU核数）")
+    parser.add_argument("--force", action="store_true", help="忽略缓存全部重新抽取")
+    args = parser.parse_args()
+
+    report = PDFIngestor(args.dir, args.cache_dir, args.workers).ingest(force=args.force)
+    print(json.dumps(report.to_dict(), ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
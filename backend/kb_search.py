@@ -0,0 +1,433 @@
+#!/usr/bin/env python3
+"""
+知识库检索 - 基于SciPy稀疏矩阵的向量化BM25
+
+知识库文档切分为段落（passage）：问答Markdown按答案切分，PDF教材由kb_ingest增量抽取后
+按句子切分（记录起始页码和页内偏移）。词项与faq_engine一致为字符一元组和二元组。
+建索引和查询都不逐个词项做Python循环：
+    建索引  全部段落的一元/二元词项键由faq_engine.term_keys按码点数组整体计算，
+            np.unique得到词表（有序的键数组）和列号，构造段落×词项的词频稀疏矩阵，
+            再按BM25公式对所有非零元一次算出权重，存为CSC矩阵（按词项取列）
+    查询    查询的词项键在词表上二分查找得到列号，取出这些列与查询词频相乘得到所有段落的得分，
+            argpartition取top-k；批量查询合成一个查询×词项矩阵，一次稀疏矩阵乘法完成
+    增量    保留与权重矩阵同结构的词频，某些文件变化时删去这些来源的段落、只对新段落计算词项，
+            合并词表后由词频重新算出权重（idf和平均长度随语料变化），得到新索引后整体替换
+索引可以由kb_index预先建好存到磁盘，各worker以mmap方式打开（见kb_index）。
+"""
+
+import logging
+import os
+import re
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import scipy.sparse as sp
+
+from faq_engine import DEFAULT_KB_DIR, QAPair, load_qa_pairs, parse_qa_markdown, term_keys
+from kb_ingest import BACKEND_DIR, DEFAULT_CACHE_DIR, IngestReport, PDFDocument, PDFIngestor, pypdf, resolve_path
+
+logger = logging.getLogger(__name__)
+
+# 段落的最大字符数
+PASSAGE_CHARS = 400
+# 预建索引目录
+DEFAULT_INDEX_DIR = os.path.join(BACKEND_DIR, 'data', 'kb_index')
+
+_PARAGRAPH = re.compile(r'\n\s*\n')
+_SENTENCE_END = re.compile(r'(?<=[。！？!?；;])')
+_SENTENCE = re.compile(r'[^。！？!?；;]+[。！？!?；;]*')
+
+
+class Passage:
+    """检索的基本单位：一段文本及其出处（PDF段落另有起始页码和页内字符偏移）"""
+
+    __slots__ = ('id', 'source', 'title', 'text', 'page', 'offset')
+
+    def __init__(self, id: str, source: str, title: str, text: str,
+                 page: Optional[int] = None, offset: Optional[int] = None):
+        self.id = id
+        self.source = source
+        self.title = title
+        self.text = text
+        self.page = page
+        self.offset = offset
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"id": self.id, "source": self.source, "title": self.title, "text": self.text,
+                "page": self.page, "offset": self.offset}
+
+
+def split_passages(text: str, max_chars: int = PASSAGE_CHARS) -> List[str]:
+    """按段落切分文本，相邻的短段落合并，超长的段落按句子再切分，每段不超过max_chars"""
+    pieces: List[str] = []
+    for paragraph in _PARAGRAPH.split(text):
+        paragraph = paragraph.strip()
+        if len(paragraph) <= max_chars:
+            if paragraph:
+                pieces.append(paragraph)
+            continue
+        for sentence in _SENTENCE_END.split(paragraph):
+            while len(sentence) > max_chars:
+                pieces.append(sentence[:max_chars])
+                sentence = sentence[max_chars:]
+            if sentence.strip():
+                pieces.append(sentence.strip())
+
+    chunks: List[str] = []
+    current = ''
+    for piece in pieces:
+        if current and len(current) + len(piece) + 1 > max_chars:
+            chunks.append(current)
+            current = piece
+        else:
+            current = f"{current}\n{piece}" if current else piece
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def markdown_passages(pairs: List[QAPair], max_chars: int = PASSAGE_CHARS) -> List[Passage]:
+    """问答对的每个答案切分为段落，标题为对应的问题"""
+    passages: List[Passage] = []
+    counters: Dict[str, int] = {}
+    for pair in pairs:
+        for chunk in split_passages(pair.answer, max_chars):
+            number = counters.get(pair.source, 0)
+            counters[pair.source] = number + 1
+            passages.append(Passage(f"{pair.source}#{number}", pair.source, pair.question, chunk))
+    return passages
+
+
+def load_markdown_passages(directory: str = DEFAULT_KB_DIR, max_chars: int = PASSAGE_CHARS) -> List[Passage]:
+    """目录下全部问答Markdown的段落"""
+    return markdown_passages(load_qa_pairs(directory), max_chars)
+
+
+def chunk_pages(pages: List[str], max_chars: int = PASSAGE_CHARS) -> List[Tuple[int, int, str]]:
+    """
+    把各页正文按句子切分为不超过max_chars的段落，段落可以跨页
+
+    Returns:
+        [(起始页码（从1开始）, 页内字符偏移, 段落文本)]
+    """
+    text = ''.join(pages)
+    page_starts = np.cumsum([0] + [len(page) for page in pages[:-1]])
+    spans: List[Tuple[int, int]] = []
+    for match in _SENTENCE.finditer(text):
+        start, end = match.span()
+        while end - start > max_chars:
+            spans.append((start, start + max_chars))
+            start += max_chars
+        spans.append((start, end))
+
+    chunks: List[Tuple[int, int, str]] = []
+    chunk_start = chunk_end = None
+    for start, end in spans + [(None, None)]:
+        if chunk_start is not None and (start is None or end - chunk_start > max_chars):
+            chunk = text[chunk_start:chunk_end]
+            stripped = chunk.lstrip()
+            if stripped.strip():
+                position = chunk_start + len(chunk) - len(stripped)
+                page = int(np.searchsorted(page_starts, position, side='right')) - 1
+                chunks.append((page + 1, position - int(page_starts[page]), stripped.rstrip()))
+            chunk_start = None
+        if start is None:
+            break
+        if chunk_start is None:
+            chunk_start = start
+        chunk_end = end
+    return chunks
+
+
+def load_pdf_passages(documents: List[PDFDocument], max_chars: int = PASSAGE_CHARS) -> List[Passage]:
+    """PDF正文的段落，标题为书名"""
+    passages: List[Passage] = []
+    for document in documents:
+        for number, (page, offset, chunk) in enumerate(chunk_pages(document.pages, max_chars)):
+            passages.append(Passage(f"{document.source}#{number}", document.source, document.title,
+                                    chunk, page, offset))
+    return passages
+
+
+def load_passages(directory: str = DEFAULT_KB_DIR, max_chars: int = PASSAGE_CHARS,
+                  documents: Optional[List[PDFDocument]] = None) -> List[Passage]:
+    """知识库目录下的全部段落：问答Markdown，以及documents（已抽取的PDF正文）"""
+    return load_markdown_passages(directory, max_chars) + load_pdf_passages(documents or [], max_chars)
+
+
+class BM25Index:
+    """段落×词项的BM25权重矩阵"""
+
+    def __init__(self, passages: List[Passage], k1: float = 1.2, b: float = 0.75):
+        started = time.perf_counter()
+        keys, rows = term_keys(self._documents(passages))
+        # 词表为有序的键数组，查询时二分查找
+        vocabulary, columns = np.unique(keys, return_inverse=True)
+        tf = sp.csr_matrix((np.ones(len(keys), dtype=np.float32), (rows, columns.ravel())),
+                           shape=(len(passages), len(vocabulary)))
+        self._weigh(passages, vocabulary, tf, k1, b)
+        self.build_seconds = time.perf_counter() - started
+
+    @staticmethod
+    def _documents(passages: List[Passage]) -> List[str]:
+        return [f"{passage.title}\n{passage.text}" for passage in passages]
+
+    def _weigh(self, passages: List[Passage], vocabulary: np.ndarray, tf: sp.csr_matrix, k1: float, b: float):
+        """由段落×词项的词频矩阵算出BM25权重矩阵"""
+        self.passages = passages
+        self.vocabulary = vocabulary
+        self.k1 = k1
+        self.b = b
+        tf = tf.tocsc()
+        shape = tf.shape
+
+        lengths = np.asarray(tf.sum(axis=1)).ravel()
+        self.avg_length = float(lengths.mean()) if shape[0] else 0.0
+        df = np.diff(tf.indptr)
+        self.idf = np.log1p((shape[0] - df + 0.5) / (df + 0.5)).astype(np.float32)
+
+        # 对所有非零元一次算出 idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * dl / avgdl))
+        nonzero_columns = np.repeat(np.arange(shape[1]), df)
+        norms = (k1 * (1 - b + b * lengths / (self.avg_length or 1.0))).astype(np.float32)
+        weights = self.idf[nonzero_columns] * tf.data * (k1 + 1) / (tf.data + norms[tf.indices])
+        # 词频与权重矩阵共用indices/indptr，增量更新时由它重新计算权重
+        self.term_counts = tf.data
+        self.matrix = sp.csc_matrix((weights, tf.indices, tf.indptr), shape=shape)
+
+    def row_sources(self) -> List[str]:
+        """每个段落的来源文件名"""
+        return [passage.source for passage in self.passages]
+
+    def updated(self, sources: Sequence[str], passages: List[Passage]) -> 'BM25Index':
+        """
+        删除来源为sources的全部段落、加入passages，返回新索引（自身不变，正在使用它的查询不受影响）
+
+        只对新段落计算词项；保留的段落沿用原有词频，与用全部段落重新建索引的得分相同（段落顺序不同）。
+        """
+        started = time.perf_counter()
+        removed = set(sources)
+        keep = np.flatnonzero([source not in removed for source in self.row_sources()])
+        tf = sp.csc_matrix((self.term_counts, self.matrix.indices, self.matrix.indptr),
+                           shape=self.matrix.shape).tocsr()[keep]
+
+        keys, rows = term_keys(self._documents(passages))
+        vocabulary = np.asarray(self.vocabulary)
+        new_terms = np.unique(keys)[self._columns(np.unique(keys)) < 0]
+        if len(new_terms):
+            # 只有新词项需要排序合并；原词表是新词表的子集，原列号按有序位置映射
+            vocabulary = np.sort(np.concatenate([vocabulary, new_terms]), kind='stable')
+            tf = sp.csr_matrix((tf.data, np.searchsorted(vocabulary, self.vocabulary)[tf.indices], tf.indptr),
+                               shape=(len(keep), len(vocabulary)))
+        added = sp.csr_matrix((np.ones(len(keys), dtype=np.float32), (rows, np.searchsorted(vocabulary, keys))),
+                              shape=(len(passages), len(vocabulary)))
+        tf = sp.vstack([tf, added], format='csr')
+
+        # 去掉已不在任何段落中出现的词项
+        used = np.bincount(tf.indices, minlength=len(vocabulary)) > 0
+        if not used.all():
+            columns = np.cumsum(used) - 1
+            tf = sp.csr_matrix((tf.data, columns[tf.indices], tf.indptr), shape=(tf.shape[0], int(used.sum())))
+            vocabulary = vocabulary[used]
+
+        index = BM25Index.__new__(BM25Index)
+        index._weigh([self.passage(int(row)) for row in keep] + passages, vocabulary, tf, self.k1, self.b)
+        index.build_seconds = time.perf_counter() - started
+        return index
+
+    def __len__(self) -> int:
+        return self.matrix.shape[0]
+
+    def passage(self, row: int) -> Passage:
+        return self.passages[row]
+
+    def _columns(self, keys: np.ndarray) -> np.ndarray:
+        """词项键对应的列号，词表中没有的键为-1"""
+        if not len(self.vocabulary):
+            return np.full(len(keys), -1, dtype=np.int64)
+        positions = np.searchsorted(self.vocabulary, keys)
+        positions[positions >= len(self.vocabulary)] = 0
+        return np.where(self.vocabulary[positions] == keys, positions, -1)
+
+    def _top(self, scores: np.ndarray, top_k: int) -> List[Tuple[float, Passage]]:
+        candidates = np.flatnonzero(scores > 0)
+        if len(candidates) > top_k:
+            candidates = candidates[np.argpartition(-scores[candidates], top_k - 1)[:top_k]]
+        ranked = candidates[np.argsort(-scores[candidates], kind='stable')]
+        return [(float(scores[row]), self.passage(int(row))) for row in ranked]
+
+    def search(self, query: str, top_k: int = 10) -> List[Tuple[float, Passage]]:
+        """返回得分最高的top_k个段落（得分降序，不含得分为0的段落）"""
+        keys, _ = term_keys([query])
+        columns, counts = np.unique(self._columns(keys), return_counts=True)
+        found = columns >= 0
+        if not found.any():
+            return []
+        scores = self.matrix[:, columns[found]] @ counts[found].astype(np.float32)
+        return self._top(np.asarray(scores).ravel(), top_k)
+
+    def search_batch(self, queries: Sequence[str], top_k: int = 10) -> List[List[Tuple[float, Passage]]]:
+        """批量查询：所有查询组成一个查询×词项矩阵，与权重矩阵相乘一次得到全部得分"""
+        keys, rows = term_keys(queries)
+        columns = self._columns(keys)
+        found = columns >= 0
+        query_matrix = sp.csr_matrix(
+            (np.ones(int(found.sum()), dtype=np.float32), (rows[found], columns[found])),
+            shape=(len(queries), len(self.vocabulary))
+        )
+        scores = (query_matrix @ self.matrix.T).toarray()
+        return [self._top(row, top_k) for row in scores]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "passages": len(self),
+            "terms": len(self.vocabulary),
+            "nonzeros": int(self.matrix.nnz),
+            "avg_length": round(self.avg_length, 1),
+            "k1": self.k1,
+            "b": self.b,
+            "build_ms": round(self.build_seconds * 1000, 1)
+        }
+
+
+class KnowledgeBase:
+    """知识库检索入口，首次查询时（或应用启动时）建立索引"""
+
+    def __init__(self, directory: str = DEFAULT_KB_DIR, k1: float = 1.2, b: float = 0.75,
+                 passage_chars: int = PASSAGE_CHARS, include_pdfs: bool = True,
+                 cache_dir: str = DEFAULT_CACHE_DIR, ingest_workers: Optional[int] = None,
+                 index_dir: Optional[str] = None):
+        """
+        Args:
+            directory: 知识库目录
+            k1, b: BM25参数
+            passage_chars: 段落的最大字符数
+            include_pdfs: 是否索引PDF正文（需要pypdf）
+            cache_dir: PDF抽取缓存目录
+            ingest_workers: PDF抽取进程数，默认为CPU核数
+            index_dir: 预建索引目录（kb_index build），为空时总是在进程内建索引
+        """
+        self.directory = directory
+        self.k1 = k1
+        self.b = b
+        self.passage_chars = passage_chars
+        self.include_pdfs = include_pdfs
+        self.ingestor = PDFIngestor(directory, cache_dir, ingest_workers)
+        self.index_dir = index_dir
+        self.index: Optional[BM25Index] = None
+        self.loaded_at: Optional[float] = None
+        self.last_ingest: Optional[IngestReport] = None
+        self.queries = 0
+
+    def _pdf_documents(self, sources: Optional[Sequence[str]] = None) -> List[PDFDocument]:
+        """
+        增量抽取PDF正文；未安装pypdf或抽取失败时只索引Markdown
+
+        Args:
+            sources: 只返回这些文件（其余未变化的文件不读缓存），为None时返回全部
+        """
+        if not self.include_pdfs:
+            return []
+        if pypdf is None:
+            logger.warning("未安装pypdf，知识库检索不包含PDF正文")
+            return []
+        try:
+            self.last_ingest = self.ingestor.ingest(sources=sources)
+        except (OSError, RuntimeError) as e:
+            # RuntimeError包括进程池异常退出（BrokenProcessPool）
+            logger.error(f"PDF抽取失败: {e}")
+            return []
+        return self.last_ingest.documents
+
+    def corpus_hash(self) -> str:
+        """当前语料（知识库文件内容）和索引参数的哈希，预建索引以此区分版本"""
+        # kb_index依赖本模块，在这里导入
+        from kb_index import corpus_hash
+        return corpus_hash(self.directory, self.include_pdfs, self.passage_chars, self.k1, self.b)
+
+    def build(self) -> BM25Index:
+        """读取知识库（PDF只抽取新增或变化的文件）并在内存中建索引"""
+        passages = load_passages(self.directory, self.passage_chars, self._pdf_documents())
+        return BM25Index(passages, self.k1, self.b)
+
+    def _source_passages(self, sources: Sequence[str]) -> List[Passage]:
+        """重新解析知识库目录下的这些文件（已删除的文件没有段落）"""
+        passages: List[Passage] = []
+        for source in sources:
+            path = os.path.join(self.directory, source)
+            if source.endswith('.md') and os.path.isfile(path):
+                with open(path, encoding='utf-8') as f:
+                    passages.extend(markdown_passages(parse_qa_markdown(f.read(), source), self.passage_chars))
+        pdfs = [source for source in sources if source.endswith('.pdf')]
+        if pdfs:
+            documents = [document for document in self._pdf_documents(pdfs) if document.source in pdfs]
+            passages.extend(load_pdf_passages(documents, self.passage_chars))
+        return passages
+
+    def update(self, sources: Sequence[str]) -> Optional[BM25Index]:
+        """
+        知识库中某些文件新增、修改或删除后，只重新解析这些文件，把增量应用到当前索引后整体替换
+
+        替换之前开始的查询继续使用旧索引；索引尚未加载时不处理（加载时会读取最新的文件）。
+        以mmap打开的预建索引更新后成为进程内的索引，知识库变化后应重新执行kb_index build。
+        """
+        index = self.index
+        if index is None or not sources:
+            return index
+        passages = self._source_passages(sources)
+        updated = index.updated(sources, passages)
+        self.index = updated
+        self.loaded_at = time.time()
+        logger.info(f"知识库索引增量更新: {', '.join(sources)}，{len(index)} → {len(updated)} 个段落，"
+                    f"耗时 {updated.build_seconds * 1000:.0f}ms")
+        return updated
+
+    def load(self) -> BM25Index:
+        """
+        加载索引，完成后整体替换
+
+        index_dir下有与当前语料哈希一致的预建索引时以mmap方式打开（毫秒级，多个worker共享物理内存），
+        否则在进程内建索引。
+        """
+        index = None
+        if self.index_dir:
+            from kb_index import open_index
+            key = self.corpus_hash()
+            index = open_index(self.index_dir, key)
+            if index is None:
+                logger.warning(f"没有与当前语料匹配的预建索引（{key}），在进程内建索引；"
+                               f"可执行 python kb_index.py build 预先建好")
+        if index is None:
+            index = self.build()
+            logger.info(f"知识库索引建立完成: {len(index)} 个段落，{len(index.vocabulary)} 个词项，"
+                        f"耗时 {index.build_seconds * 1000:.0f}ms")
+        self.index = index
+        self.loaded_at = time.time()
+        return index
+
+    def search(self, query: str, top_k: int = 10) -> List[Tuple[float, Passage]]:
+        index = self.index or self.load()
+        self.queries += 1
+        return index.search(query, top_k)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "directory": self.directory,
+            "loaded_at": self.loaded_at,
+            "queries": self.queries,
+            "ingest": self.last_ingest.to_dict() if self.last_ingest is not None else None,
+            "index": self.index.stats() if self.index is not None else None
+        }
+
+
+# 全局实例
+knowledge_base = KnowledgeBase(
+    directory=os.getenv('KB_DIR', DEFAULT_KB_DIR),
+    k1=float(os.getenv('KB_BM25_K1', 1.2)),
+    b=float(os.getenv('KB_BM25_B', 0.75)),
+    passage_chars=int(os.getenv('KB_PASSAGE_CHARS', PASSAGE_CHARS)),
+    include_pdfs=os.getenv('KB_INCLUDE_PDFS', 'true').lower() not in ('0', 'false', 'no'),
+    cache_dir=resolve_path(os.getenv('KB_CACHE_DIR', DEFAULT_CACHE_DIR)),
+    ingest_workers=int(os.getenv('KB_INGEST_WORKERS', 0)) or None,
+    index_dir=resolve_path(os.getenv('KB_INDEX_DIR', DEFAULT_INDEX_DIR))
+)
@@ -0,0 +1,357 @@
+#!/usr/bin/env python3
+"""
+知识库热更新 - 监视knowledge_base目录，文件变化后增量更新FAQ和检索索引
+
+编辑earth_science_qa.md或放入一本新的PDF后不需要重启服务，也不需要重建全部索引：
+    监视    Linux上用inotify（通过ctypes调用libc，不需要额外依赖）接收目录中文件的写入关闭、
+            移入移出和删除事件；其他平台、inotify不可用或目录被移走时改为定时比较文件的大小和修改时间
+    防抖    编辑器保存一个文件往往产生多个事件，最后一个事件之后安静KB_WATCH_DEBOUNCE秒再处理，
+            同一批变化的文件一起处理；大小和修改时间都没变的文件忽略
+    更新    只重新解析变化的文件：FAQ替换这些文件的问答对（faq_engine.update_sources），
+            检索索引删去这些文件的段落、加入新段落（kb_search.KnowledgeBase.update），
+            新索引在线程中建好后整体替换，替换前开始的查询继续使用旧索引，不会被暂停；
+            问答文件变化后重新关联地标知识卡片（landmark_facts）
+    重试    一批文件更新失败时逐个文件重新应用，只有应用成功的文件记入快照；
+            失败的文件保留原有索引，KB_WATCH_INTERVAL秒后重试
+每个worker进程各自监视、各自更新自己的索引。
+"""
+
+import asyncio
+import ctypes
+import ctypes.util
+import logging
+import os
+import struct
+import sys
+import time
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from faq_engine import FAQEngine, faq_engine
+from kb_search import KnowledgeBase, knowledge_base
+from landmark_facts import LandmarkFacts, landmark_facts
+
+logger = logging.getLogger(__name__)
+
+# 监视的文件类型
+WATCHED_SUFFIXES = ('.md', '.pdf')
+
+# inotify事件（linux/inotify.h）
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_FROM = 0x00000040
+_IN_MOVED_TO = 0x00000080
+_IN_DELETE = 0x00000200
+_IN_DELETE_SELF = 0x00000400
+_IN_MOVE_SELF = 0x00000800
+_IN_Q_OVERFLOW = 0x00004000
+_IN_IGNORED = 0x00008000
+_IN_NONBLOCK = os.O_NONBLOCK
+_IN_CLOEXEC = 0o2000000
+_WATCH_MASK = _IN_CLOSE_WRITE | _IN_MOVED_FROM | _IN_MOVED_TO | _IN_DELETE | _IN_DELETE_SELF | _IN_MOVE_SELF
+# struct inotify_event { int wd; uint32_t mask, cookie, len; char name[]; }
+_EVENT = struct.Struct('iIII')
+
+_libc = None
+if sys.platform.startswith('linux'):
+    try:
+        _libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        _libc.inotify_init1
+    except (OSError, AttributeError):
+        _libc = None
+
+
+def watched(name: str) -> bool:
+    return name.endswith(WATCHED_SUFFIXES) and not name.startswith('.')
+
+
+def scan(directory: str) -> Dict[str, Tuple[int, int]]:
+    """目录下被监视的文件及其 (大小, 修改时间)"""
+    files: Dict[str, Tuple[int, int]] = {}
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        return files
+    for name in names:
+        if not watched(name):
+            continue
+        try:
+            stat = os.stat(os.path.join(directory, name))
+        except OSError:
+            continue
+        files[name] = (stat.st_size, stat.st_mtime_ns)
+    return files
+
+
+class Inotify:
+    """一个目录的inotify监视（非阻塞文件描述符，可交给事件循环的add_reader）"""
+
+    def __init__(self, directory: str):
+        if _libc is None:
+            raise OSError("当前平台不支持inotify")
+        self.fd = _libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1失败")
+        if _libc.inotify_add_watch(self.fd, os.fsencode(directory), _WATCH_MASK) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, f"无法监视目录 {directory}")
+
+    def read(self) -> Tuple[Set[str], bool, bool]:
+        """
+        读出当前积压的事件
+
+        Returns:
+            (涉及的文件名, 是否需要全目录比较（事件队列溢出）, 监视是否已失效（目录被删除或移走）)
+        """
+        names: Set[str] = set()
+        overflow = lost = False
+        while True:
+            try:
+                data = os.read(self.fd, 65536)
+            except BlockingIOError:
+                break
+            if not data:
+                break
+            position = 0
+            while position + _EVENT.size <= len(data):
+                _, mask, _, length = _EVENT.unpack_from(data, position)
+                name = data[position + _EVENT.size:position + _EVENT.size + length].rstrip(b'\0')
+                position += _EVENT.size + length
+                if mask & _IN_Q_OVERFLOW:
+                    overflow = True
+                if mask & (_IN_DELETE_SELF | _IN_MOVE_SELF | _IN_IGNORED):
+                    lost = True
+                if name:
+                    name = os.fsdecode(name)
+                    if watched(name):
+                        names.add(name)
+        return names, overflow, lost
+
+    def close(self):
+        try:
+            os.close(self.fd)
+        except OSError:
+            pass
+
+
+class KnowledgeBaseWatcher:
+    """监视知识库目录，把变化的文件增量应用到FAQ和检索索引"""
+
+    def __init__(self, kb: KnowledgeBase, faq: Optional[FAQEngine] = None, mode: str = 'auto',
+                 interval: float = 2.0, debounce: float = 0.5, enabled: bool = True,
+                 landmarks: Optional[LandmarkFacts] = None):
+        """
+        Args:
+            kb: 检索知识库，监视其目录
+            faq: FAQ引擎，目录与kb相同时一并更新
+            mode: auto（优先inotify，不可用时轮询）/ inotify / poll
+            interval: 轮询间隔，也是更新失败的文件的重试间隔（秒）
+            debounce: 最后一个事件之后等待多久再处理（秒）
+            enabled: 为False时start不做任何事
+            landmarks: 地标知识卡片，问答文件变化后重新关联
+        """
+        self.kb = kb
+        if faq is not None and os.path.abspath(faq.directory) != os.path.abspath(kb.directory):
+            faq = None
+        self.faq = faq
+        if landmarks is not None and os.path.abspath(landmarks.kb_dir) != os.path.abspath(kb.directory):
+            landmarks = None
+        self.landmarks = landmarks
+        self.directory = kb.directory
+        self.mode = mode
+        self.interval = interval
+        self.debounce = debounce
+        self.enabled = enabled
+        self.backend: Optional[str] = None
+        self.snapshot: Dict[str, Tuple[int, int]] = {}
+        self._inotify: Optional[Inotify] = None
+        self._pending: Set[str] = set()
+        self._failed: Set[str] = set()
+        self._rescan = False
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._poll_task: Optional[asyncio.Task] = None
+        self.events = 0
+        self.updates = 0
+        self.errors = 0
+        self.last_update: Optional[Dict[str, Any]] = None
+
+    async def start(self):
+        """开始监视（在知识库索引加载之后调用，此后的变化都会被应用）"""
+        if not self.enabled or self._task is not None:
+            return
+        self._wake = asyncio.Event()
+        self.snapshot = await asyncio.to_thread(scan, self.directory)
+        if self.mode in ('auto', 'inotify'):
+            try:
+                self._inotify = Inotify(self.directory)
+                asyncio.get_running_loop().add_reader(self._inotify.fd, self._on_inotify)
+                self.backend = 'inotify'
+            except OSError as e:
+                if self._inotify is not None:
+                    self._inotify.close()
+                    self._inotify = None
+                log = logger.warning if self.mode == 'inotify' else logger.info
+                log(f"inotify不可用（{e}），改为每 {self.interval:g} 秒轮询知识库目录")
+        if self._inotify is None:
+            self._start_polling()
+        self._task = asyncio.create_task(self._run())
+        logger.info(f"开始监视知识库目录 {self.directory}（{self.backend}），{len(self.snapshot)} 个文件")
+
+    def _start_polling(self):
+        self.backend = 'poll'
+        self._poll_task = asyncio.create_task(self._poll_loop())
+
+    async def stop(self):
+        if self._inotify is not None:
+            asyncio.get_running_loop().remove_reader(self._inotify.fd)
+            self._inotify.close()
+            self._inotify = None
+        for task in (self._poll_task, self._task):
+            if task is not None:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._poll_task = self._task = None
+
+    def _on_inotify(self):
+        names, overflow, lost = self._inotify.read()
+        self.events += len(names)
+        self._pending |= names
+        self._rescan |= overflow or lost
+        if lost:
+            logger.warning(f"知识库目录 {self.directory} 的inotify监视已失效，改为轮询")
+            asyncio.get_running_loop().remove_reader(self._inotify.fd)
+            self._inotify.close()
+            self._inotify = None
+            self._start_polling()
+        if names or overflow or lost:
+            self._wake.set()
+
+    async def _poll_loop(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            current = await asyncio.to_thread(scan, self.directory)
+            changed = {name for name in set(current) | set(self.snapshot)
+                       if current.get(name) != self.snapshot.get(name)} - self._pending
+            if changed:
+                self.events += len(changed)
+                self._pending |= changed
+                self._wake.set()
+
+    async def _run(self):
+        while True:
+            await self._wake.wait()
+            # 防抖：直到debounce秒内没有新事件
+            while True:
+                self._wake.clear()
+                try:
+                    await asyncio.wait_for(self._wake.wait(), self.debounce)
+                except asyncio.TimeoutError:
+                    break
+            names, rescan = self._pending, self._rescan
+            self._pending, self._rescan = set(), False
+            await asyncio.to_thread(self.apply, names, rescan)
+            if self._failed:
+                asyncio.get_running_loop().call_later(self.interval, self._retry, self._failed)
+
+    def _retry(self, names: Set[str]):
+        self._pending |= names
+        self._wake.set()
+
+    def _update(self, changed: List[str]) -> Dict[str, Any]:
+        """把变化的文件应用到FAQ、检索索引和地标知识卡片"""
+        result: Dict[str, Any] = {}
+        markdown = [name for name in changed if name.endswith('.md')]
+        if self.faq is not None and markdown:
+            added, removed = self.faq.update_sources(markdown)
+            result["faq"] = {"added": added, "removed": removed}
+        pdfs = [name for name in changed if name.endswith('.pdf')] if self.kb.include_pdfs else []
+        index = self.kb.update(markdown + pdfs)
+        result["passages"] = len(index) if index is not None else None
+        if self.landmarks is not None and markdown:
+            result["landmarks"] = self.landmarks.load()
+        return result
+
+    def apply(self, names: Set[str], rescan: bool = False) -> Set[str]:
+        """
+        处理一批文件变化，返回实际变化（新增、修改或删除）并已应用的文件名
+
+        只有应用成功的文件记入快照；失败的文件记入_failed，由_run稍后重试（文件再次变化时也会重试）
+
+        Args:
+            names: 可能变化的文件名
+            rescan: 为True时与上次记录比较目录下的全部文件
+        """
+        current = scan(self.directory)
+        if rescan:
+            names = names | set(current) | set(self.snapshot)
+        changed = sorted(name for name in names if current.get(name) != self.snapshot.get(name))
+        self._failed = set()
+        if not changed:
+            return set()
+
+        started = time.perf_counter()
+        result: Dict[str, Any] = {"files": changed, "at": time.time()}
+        failed: Dict[str, str] = {}
+        try:
+            result.update(self._update(changed))
+        except Exception as e:
+            if len(changed) == 1:
+                failed[changed[0]] = str(e)
+            else:
+                # 逐个文件重新应用，找出失败的文件，其余文件照常生效
+                for name in changed:
+                    try:
+                        result.update(self._update([name]))
+                    except Exception as e:
+                        failed[name] = str(e)
+
+        # 快照整体替换（轮询任务在事件循环中读取）
+        snapshot = dict(self.snapshot)
+        for name in changed:
+            if name in failed:
+                continue
+            if name in current:
+                snapshot[name] = current[name]
+            else:
+                snapshot.pop(name, None)
+        self.snapshot = snapshot
+
+        if failed:
+            # 失败的文件保留原有索引，稍后重试
+            self.errors += 1
+            self._failed = set(failed)
+            result["error"] = "; ".join(f"{name}: {error}" for name, error in failed.items())
+            logger.error(f"知识库热更新失败，{self.interval:g} 秒后重试: {result['error']}")
+        else:
+            self.updates += 1
+        result["seconds"] = round(time.perf_counter() - started, 3)
+        self.last_update = result
+        return set(changed) - set(failed)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "backend": self.backend,
+            "directory": self.directory,
+            "files": len(self.snapshot),
+            "events": self.events,
+            "updates": self.updates,
+            "errors": self.errors,
+            "retrying": sorted(self._failed),
+            "last_update": self.last_update
+        }
+
+
+# 全局实例
+kb_watcher = KnowledgeBaseWatcher(
+    knowledge_base,
+    faq_engine,
+    mode=os.getenv('KB_WATCH_MODE', 'auto'),
+    interval=float(os.getenv('KB_WATCH_INTERVAL', 2.0)),
+    debounce=float(os.getenv('KB_WATCH_DEBOUNCE', 0.5)),
+    enabled=os.getenv('KB_WATCH_ENABLED', 'true').lower() not in ('0', 'false', 'no'),
+    landmarks=landmark_facts
+)
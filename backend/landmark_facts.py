@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+"""
+地标知识卡片 - 把地球上的地标与知识库中整理好的问答关联起来，预先算好供接口直接返回
+
+前端frontend/script.js的landmarkData定义了地球上的地标（名称、类型、简介、点击时发给AI的aiPrompt），
+geological_landmarks_qa.md等问答文件中有这些地标整理好的问答，但名称并不完全一致
+（"阿拉伯构造板块" / "阿拉伯板块是如何……"）。build把每个地标关联到问答：
+    名称    问题覆盖了地标名称（或别名）一半以上的相邻两字，且在所有地标中覆盖最多；
+            问题中完整出现地标名称时总是关联（"科罗拉多高原如何形成了大峡谷？"同时属于两个地标），
+            但一个名称包含另一个时最长的名称优先（"地中海俯冲区……"不属于地中海）；问题只出现较短的名称时，
+            按问答所在章节与地标类型判断（地质构造地标一节中的"为什么地中海地区地震……"属于地中海俯冲区）
+    提示    地标的aiPrompt字面命中FAQ（与对话接口本地FAQ快速应答的字面匹配相同）的问答；
+            语义匹配只判断是否同一个问题，不用于关联
+结果写入LANDMARK_FACTS_PATH（JSON），记录前端脚本和问答文件内容的哈希。服务启动时读入，
+每个地标的响应体和ETag预先生成，接口直接返回字节串；文件不存在或与当前内容不一致时在进程内重新关联
+（并记录警告）。知识库热更新（kb_watch）修改问答文件后同样重新关联。
+
+用法: python landmark_facts.py build          预先关联并写入文件
+      python landmark_facts.py show 冰岛裂谷   查看某个地标的关联结果
+"""
+
+import argparse
+import glob
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from faq_engine import DEFAULT_KB_DIR, FAQEngine, QAPair, _pair_key, faq_engine, load_qa_pairs, normalize_text
+from kb_ingest import BACKEND_DIR, _write_json, resolve_path
+from utils import make_etag
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 2
+DEFAULT_SCRIPT_PATH = os.path.join(os.path.dirname(BACKEND_DIR), 'frontend', 'script.js')
+DEFAULT_FACTS_PATH = os.path.join(BACKEND_DIR, 'data', 'landmark_facts.json')
+# 名称关联所需的最低覆盖率（地标名称的相邻两字在问题中出现的比例）
+MIN_NAME_COVERAGE = 0.5
+# 问答中使用的另一个名称
+LANDMARK_ALIASES = {
+    "玻利维亚盐沼": ("乌尤尼盐沼",),
+    "乌鲁鲁": ("艾尔斯岩",),
+}
+# 问答章节对应的地标类型，用于区分名称互相包含的地标
+SECTION_TYPES = {
+    "地质构造地标": "geology",
+    "海洋地标": "ocean",
+    "气象地标": "meteorology",
+}
+
+_LANDMARK_ARRAY = re.compile(r'const\s+landmarkData\s*=\s*\[(.*?)\];', re.S)
+_OBJECT = re.compile(r'\{([^{}]*)\}')
+_FIELD = re.compile(r'(\w+)\s*:\s*("(?:[^"\\]|\\.)*"|-?\d+(?:\.\d+)?)')
+
+
+class Landmark:
+    """地球上的一个地标（与landmarkData中的字段对应）"""
+
+    __slots__ = ('name', 'type', 'lat', 'lng', 'description', 'ai_prompt', 'priority')
+
+    def __init__(self, name: str, type: str, lat: float, lng: float, description: str = '',
+                 ai_prompt: str = '', priority: Optional[int] = None):
+        self.name = name
+        self.type = type
+        self.lat = lat
+        self.lng = lng
+        self.description = description
+        self.ai_prompt = ai_prompt
+        self.priority = priority
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"name": self.name, "type": self.type, "lat": self.lat, "lng": self.lng,
+                "description": self.description, "ai_prompt": self.ai_prompt, "priority": self.priority}
+
+
+def parse_landmarks(script: str) -> List[Landmark]:
+    """从前端脚本中解析landmarkData"""
+    match = _LANDMARK_ARRAY.search(script)
+    if match is None:
+        raise ValueError("前端脚本中没有找到landmarkData")
+    landmarks = []
+    for body in _OBJECT.findall(match.group(1)):
+        fields = {key: json.loads(value) for key, value in _FIELD.findall(body)}
+        if 'name' not in fields:
+            continue
+        landmarks.append(Landmark(fields['name'], fields.get('type', ''), fields.get('lat', 0.0),
+                                  fields.get('lng', 0.0), fields.get('description', ''),
+                                  fields.get('aiPrompt', ''), fields.get('priority')))
+    return landmarks
+
+
+def name_grams(name: str) -> Set[str]:
+    """名称的相邻两字（一个字的名称为其本身）"""
+    text = normalize_text(name)
+    return {text[i:i + 2] for i in range(len(text) - 1)} or {text}
+
+
+def link_landmarks(landmarks: List[Landmark], pairs: List[QAPair],
+                   engine: Optional[FAQEngine] = None) -> Dict[str, List[Tuple[QAPair, str, float]]]:
+    """
+    把地标关联到问答对
+
+    Returns:
+        {地标名称: [(问答对, 关联方式name/prompt, 得分)]}，名称关联按问答文件中的顺序排在前面
+    """
+    variants = {landmark.name: [name_grams(name) for name in (landmark.name, *LANDMARK_ALIASES.get(landmark.name, ()))]
+                for landmark in landmarks}
+    types = {landmark.name: landmark.type for landmark in landmarks}
+    # 名称包含某个地标名称的其他地标（地中海 → 地中海俯冲区）
+    longer = {name: [other for other in variants if other != name and name in other] for name in variants}
+    links: Dict[str, List[Tuple[QAPair, str, float]]] = {landmark.name: [] for landmark in landmarks}
+    for pair in pairs:
+        question = normalize_text(pair.question)
+        # 每个地标的 (覆盖率, 覆盖的两字数)，取名称和别名中最高的
+        scores = {name: max((sum(gram in question for gram in grams) / len(grams),
+                             sum(gram in question for gram in grams)) for grams in grams_list)
+                  for name, grams_list in variants.items()}
+        full = [name for name, (coverage, _) in scores.items() if coverage >= 1.0]
+        if full:
+            linked = []
+            for name in full:
+                if any(other in full for other in longer[name]):
+                    continue  # 更长的名称完整出现
+                section_type = SECTION_TYPES.get(pair.section)
+                owners = [other for other in longer[name] if types[other] == section_type]
+                if types[name] != section_type and len(owners) == 1:
+                    name = owners[0]
+                linked.append(name)
+        else:
+            best = max(scores, key=scores.get) if scores else None
+            linked = [best] if best is not None and scores[best][0] >= MIN_NAME_COVERAGE else []
+        for name in linked:
+            links[name].append((pair, 'name', round(scores[name][0], 4)))
+
+    if engine is not None:
+        for landmark in landmarks:
+            match = engine.lookup(landmark.ai_prompt, semantic=False)
+            linked = {_pair_key(pair) for pair, _, _ in links[landmark.name]}
+            if match is not None and _pair_key(match.pair) not in linked:
+                links[landmark.name].append((match.pair, 'prompt', round(match.score, 4)))
+    return links
+
+
+def source_hash(script_path: str, kb_dir: str) -> str:
+    """前端脚本和问答文件内容的哈希"""
+    digest = hashlib.sha256(f"{FORMAT_VERSION}".encode())
+    for path in [script_path] + sorted(glob.glob(os.path.join(kb_dir, '*.md'))):
+        with open(path, 'rb') as f:
+            digest.update(f"|{os.path.basename(path)}|".encode() + hashlib.sha256(f.read()).digest())
+    return digest.hexdigest()[:16]
+
+
+def build(script_path: str = DEFAULT_SCRIPT_PATH, kb_dir: str = DEFAULT_KB_DIR,
+          engine: Optional[FAQEngine] = None) -> Dict[str, Any]:
+    """关联全部地标，返回可写入JSON的结果"""
+    started = time.perf_counter()
+    key = source_hash(script_path, kb_dir)
+    with open(script_path, encoding='utf-8') as f:
+        landmarks = parse_landmarks(f.read())
+    links = link_landmarks(landmarks, load_qa_pairs(kb_dir), engine)
+    sheets = {}
+    for landmark in landmarks:
+        sheets[landmark.name] = {
+            "landmark": landmark.to_dict(),
+            "facts": [{**pair.to_dict(), "link": link, "score": score} for pair, link, score in links[landmark.name]]
+        }
+    return {
+        "format": FORMAT_VERSION,
+        "source_hash": key,
+        "built_at": time.time(),
+        "build_seconds": round(time.perf_counter() - started, 3),
+        "landmarks": sheets
+    }
+
+
+class LandmarkFacts:
+    """地标知识卡片：每个地标的响应体和ETag预先生成"""
+
+    def __init__(self, path: str = DEFAULT_FACTS_PATH, script_path: str = DEFAULT_SCRIPT_PATH,
+                 kb_dir: str = DEFAULT_KB_DIR, engine: Optional[FAQEngine] = None, max_age: int = 86400):
+        """
+        Args:
+            path: build写入的文件
+            script_path: 定义landmarkData的前端脚本
+            kb_dir: 问答Markdown所在目录
+            engine: 用于aiPrompt关联的FAQ引擎，为None时只做名称关联
+            max_age: 响应的Cache-Control max-age（秒）；内容变化后ETag随之变化
+        """
+        self.path = path
+        self.max_age = max_age
+        self.script_path = script_path
+        self.kb_dir = kb_dir
+        self.engine = engine
+        self.version: Optional[str] = None
+        self.loaded_at: Optional[float] = None
+        self.prebuilt = False
+        # {名称: (响应体, ETag)}，与列表的 (响应体, ETag) 作为一个元组整体替换
+        self._responses: Tuple[Dict[str, Tuple[bytes, str]], Optional[Tuple[bytes, str]]] = ({}, None)
+
+    def _read(self, key: str) -> Optional[Dict[str, Any]]:
+        """读取与当前内容一致的预建结果"""
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                document = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if document.get('format') != FORMAT_VERSION or document.get('source_hash') != key:
+            return None
+        return document
+
+    def load(self) -> int:
+        """读入预建结果（不一致时在进程内重新关联）并生成响应，返回地标数"""
+        try:
+            key = source_hash(self.script_path, self.kb_dir)
+            document = self._read(key)
+            self.prebuilt = document is not None
+            if document is None:
+                logger.warning(f"没有与当前内容匹配的地标知识卡片（{self.path}），在进程内关联；"
+                               f"可执行 python landmark_facts.py build 预先生成")
+                document = build(self.script_path, self.kb_dir, self.engine)
+        except (OSError, ValueError) as e:
+            logger.error(f"加载地标知识卡片失败: {e}")
+            return len(self)
+
+        responses = {}
+        summary = []
+        for name, sheet in document['landmarks'].items():
+            body = json.dumps({"success": True, "version": document['source_hash'], **sheet},
+                              ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+            responses[name] = (body, make_etag(body))
+            summary.append({**sheet['landmark'], "facts": len(sheet['facts'])})
+        body = json.dumps({"success": True, "version": document['source_hash'], "landmarks": summary},
+                          ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        self._responses = (responses, (body, make_etag(body)))
+        self.version = document['source_hash']
+        self.loaded_at = time.time()
+        logger.info(f"地标知识卡片加载完成: {len(responses)} 个地标，"
+                    f"{sum(1 for item in summary if item['facts'])} 个有关联的问答")
+        return len(responses)
+
+    def __len__(self) -> int:
+        return len(self._responses[0])
+
+    def get(self, name: str) -> Optional[Tuple[bytes, str]]:
+        """地标的 (响应体, ETag)，未知地标返回None"""
+        return self._responses[0].get(name)
+
+    def listing(self) -> Optional[Tuple[bytes, str]]:
+        """全部地标及关联问答数的 (响应体, ETag)"""
+        return self._responses[1]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "landmarks": len(self),
+            "version": self.version,
+            "prebuilt": self.prebuilt,
+            "max_age": self.max_age,
+            "path": self.path,
+            "loaded_at": self.loaded_at
+        }
+
+
+# 全局实例
+landmark_facts = LandmarkFacts(
+    path=resolve_path(os.getenv('LANDMARK_FACTS_PATH', DEFAULT_FACTS_PATH)),
+    script_path=resolve_path(os.getenv('LANDMARK_SCRIPT_PATH', DEFAULT_SCRIPT_PATH)),
+    kb_dir=os.getenv('FAQ_KB_DIR', DEFAULT_KB_DIR),
+    engine=faq_engine,
+    max_age=int(os.getenv('LANDMARK_FACTS_MAX_AGE', 86400))
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="地标知识卡片")
+    parser.add_argument("command", choices=("build", "show"), help="build: 关联并写入文件；show: 查看一个地标")
+    parser.add_argument("name", nargs="?", help="show的地标名称")
+    parser.add_argument("--out", default=landmark_facts.path, help="输出文件")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    document = build(landmark_facts.script_path, landmark_facts.kb_dir, landmark_facts.engine)
+    if args.command == 'show':
+        sheet = document['landmarks'].get(args.name or '')
+        if sheet is None:
+            raise SystemExit(f"未知的地标: {args.name}")
+        print(json.dumps(sheet, ensure_ascii=False, indent=2))
+        return
+
+    os.makedirs(os.path.dirname(args.out) or '.', exist_ok=True)
+    _write_json(args.out, document)
+    sheets = document['landmarks']
+    linked = [name for name, sheet in sheets.items() if sheet['facts']]
+    print(f"地标知识卡片已写入 {args.out}: {len(sheets)} 个地标，{len(linked)} 个关联到 "
+          f"{sum(len(sheets[name]['facts']) for name in linked)} 个问答，耗时 {document['build_seconds']:.2f}s")
+    print(f"没有关联问答的地标: {', '.join(name for name in sheets if name not in linked)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+from fastapi import APIRouter, HTTPException, Request, Response
+import asyncio
+import logging
+from typing import Tuple
+from landmark_facts import landmark_facts
+from utils import etag_matches
+
+# 创建路由器
+router = APIRouter(prefix="/api/landmarks", tags=["地标知识卡片"])
+
+logger = logging.getLogger(__name__)
+
+def cached_response(body_etag: Tuple[bytes, str], if_none_match) -> Response:
+    """返回预先生成的响应体；客户端已有相同内容时返回304"""
+    body, etag = body_etag
+    headers = {"ETag": etag, "Cache-Control": f"public, max-age={landmark_facts.max_age}"}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+async def ensure_loaded():
+    if not len(landmark_facts):
+        # 启动时未加载（或加载失败）时在线程中加载，避免阻塞事件循环
+        await asyncio.to_thread(landmark_facts.load)
+
+@router.get("")
+async def list_landmarks(request: Request):
+    """全部地标及各自关联的问答数"""
+    await ensure_loaded()
+    listing = landmark_facts.listing()
+    if listing is None:
+        raise HTTPException(status_code=503, detail="地标知识卡片不可用")
+    return cached_response(listing, request.headers.get('if-none-match'))
+
+@router.get("/{name}/facts")
+async def landmark_facts_sheet(name: str, request: Request):
+    """
+    地标的知识卡片
+
+    返回地标信息和关联的问答（预先关联、预先序列化），带强ETag和长期缓存头；
+    知识库内容变化后ETag随之变化。没有关联问答的地标facts为空列表。
+    """
+    await ensure_loaded()
+    sheet = landmark_facts.get(name)
+    if sheet is None:
+        raise HTTPException(status_code=404, detail=f"未知的地标: {name}")
+    return cached_response(sheet, request.headers.get('if-none-match'))
@@ -2,7 +2,21 @@ from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
 import os
-from chat_api import router as chat_router
+import asyncio
+from chat_api import router as chat_router, start_conversation_pool
+from conversations_api import router as conversations_router
+from kb_api import router as kb_router
+from landmarks_api import router as landmarks_router
+from conversation_pool import conversation_pool
+from conversation_store import conversation_store
+from kb_search import knowledge_base
+from kb_watch import kb_watcher
+from landmark_facts import landmark_facts
+from answer_cache import answer_cache
+from answer_warmup import answer_warmer
+from qianfan_client import close_shared_session
+from client_registry import client_registry
+from resilience import breaker_states, any_breaker_open
 
 # 加载环境变量
 load_dotenv()
@@ -11,6 +25,12 @@ app = FastAPI(title="AI聊天助手", description="基于百度千帆API的聊
 
 # 包含智能体对话路由
 app.include_router(chat_router)
+# 对话管理路由（管理页面使用）
+app.include_router(conversations_router)
+# 知识库检索路由
+app.include_router(kb_router)
+# 地标知识卡片路由
+app.include_router(landmarks_router)
 
 # 配置CORS
 app.add_middleware(
@@ -21,14 +41,40 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.on_event("startup")
+async def startup_event():
+    """启动对话预创建池和对话存储的过期清理任务，建立知识库检索索引、加载地标知识卡片，开始监视知识库目录、定期载入和预热答案"""
+    await start_conversation_pool()
+    await conversation_store.start()
+    await asyncio.to_thread(knowledge_base.load)
+    await asyncio.to_thread(landmark_facts.load)
+    await kb_watcher.start()
+    await answer_cache.start()
+    await answer_warmer.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """停止后台任务，关闭千帆客户端连接池"""
+    await conversation_pool.stop()
+    await conversation_store.stop()
+    await kb_watcher.stop()
+    await answer_warmer.stop()
+    await answer_cache.stop()
+    await client_registry.close_all()
+    await close_shared_session()
+
 @app.get("/")
 async def root():
     return {"message": "AI聊天助手后端服务正在运行", "status": "ok"}
 
 @app.get("/health")
 async def health_check():
-    """健康检查接口"""
-    return {"status": "healthy", "service": "ai-chat-backend"}
+    """健康检查接口（上游熔断时标记为degraded，附带各接口熔断器状态）"""
+    return {
+        "status": "degraded" if any_breaker_open() else "healthy",
+        "service": "ai-chat-backend",
+        "upstream": breaker_states()
+    }
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+"""
+本地千帆模拟服务 - 在不访问 qianfan.baidubce.com 的情况下压测后端
+
+模拟以下接口：
+    POST /v2/app/conversation                         创建对话
+    POST /v2/app/conversation/runs                    发送消息（JSON或SSE流式）
+    GET  /v2/app/conversation/{conversation_id}/messages  对话历史
+    GET  /mock/stats                                  模拟服务自身的请求统计
+
+延迟分布写法：
+    const:0.2            固定0.2秒
+    uniform:0.1,0.5      0.1~0.5秒均匀分布
+    normal:0.3,0.05      正态分布（均值, 标准差），截断为非负
+    lognormal:-1.5,0.5   对数正态分布（mu, sigma），模拟长尾
+    exp:0.2              指数分布（均值）
+
+用法:
+    python mock_qianfan_server.py --port 8900 --runs-latency lognormal:-1.2,0.6 --answer-chars 200-800
+    QIANFAN_API_BASE_URL=http://127.0.0.1:8900 python main.py
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+from aiohttp import web
+
+ANSWER_ALPHABET = "地球板块构造火山地震海洋大气气候冰川岩石矿物沉积风化侵蚀河流湖泊山脉平原，。"
+
+
+class LatencyDistribution:
+    """按规格字符串采样的延迟分布（秒）"""
+
+    KINDS = ('const', 'uniform', 'normal', 'lognormal', 'exp')
+
+    def __init__(self, kind: str, params: Tuple[float, ...]):
+        if kind not in self.KINDS:
+            raise ValueError(f"未知的延迟分布: {kind}，可选: {', '.join(self.KINDS)}")
+        self.kind = kind
+        self.params = params
+
+    @classmethod
+    def parse(cls, spec: str) -> "LatencyDistribution":
+        kind, _, args = spec.partition(':')
+        params = tuple(float(value) for value in args.split(',') if value) if args else (0.0,)
+        return cls(kind.strip(), params)
+
+    def sample(self, rng: random.Random) -> float:
+        p = self.params
+        if self.kind == 'const':
+            value = p[0]
+        elif self.kind == 'uniform':
+            value = rng.uniform(p[0], p[1])
+        elif self.kind == 'normal':
+            value = rng.gauss(p[0], p[1])
+        elif self.kind == 'lognormal':
+            value = rng.lognormvariate(p[0], p[1])
+        else:
+            value = rng.expovariate(1.0 / p[0]) if p[0] > 0 else 0.0
+        return max(0.0, value)
+
+    def __repr__(self):
+        return f"{self.kind}:{','.join(f'{v:g}' for v in self.params)}"
+
+
+def parse_range(spec: str) -> Tuple[int, int]:
+    """解析 "300" 或 "200-800" 形式的整数区间"""
+    low, _, high = spec.partition('-')
+    return int(low), int(high or low)
+
+
+class MockConfig:
+    """模拟服务配置"""
+
+    def __init__(self, conversation_latency: str = "const:0.05", runs_latency: str = "const:0.3",
+                 first_chunk_latency: str = "const:0.2", chunk_interval: str = "const:0.02",
+                 history_latency: str = "const:0.05", answer_chars: str = "200-600",
+                 chunk_chars: str = "8-24", error_rate: float = 0.0, seed: Optional[int] = None):
+        self.conversation_latency = LatencyDistribution.parse(conversation_latency)
+        self.runs_latency = LatencyDistribution.parse(runs_latency)
+        self.first_chunk_latency = LatencyDistribution.parse(first_chunk_latency)
+        self.chunk_interval = LatencyDistribution.parse(chunk_interval)
+        self.history_latency = LatencyDistribution.parse(history_latency)
+        self.answer_chars = parse_range(answer_chars)
+        self.chunk_chars = parse_range(chunk_chars)
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "conversation_latency": repr(self.conversation_latency),
+            "runs_latency": repr(self.runs_latency),
+            "first_chunk_latency": repr(self.first_chunk_latency),
+            "chunk_interval": repr(self.chunk_interval),
+            "history_latency": repr(self.history_latency),
+            "answer_chars": self.answer_chars,
+            "chunk_chars": self.chunk_chars,
+            "error_rate": self.error_rate
+        }
+
+
+class MockQianfanServer:
+    """模拟服务状态：对话及其消息保存在内存中，供历史接口返回"""
+
+    def __init__(self, config: MockConfig):
+        self.config = config
+        self.conversations: Dict[str, Dict[str, Any]] = {}
+        self.requests = Counter()
+        self.errors = Counter()
+        self.started_at = time.time()
+
+    # ---- 工具方法 ----
+
+    def _error(self, status: int, code: str, message: str) -> web.Response:
+        return web.json_response({"request_id": str(uuid.uuid4()), "code": code, "message": message},
+                                 status=status)
+
+    def _check(self, request: web.Request, name: str) -> Optional[web.Response]:
+        """统计请求、校验授权头、按配置注入5xx故障"""
+        self.requests[name] += 1
+        if not request.headers.get('Authorization', '').startswith('Bearer '):
+            self.errors[name] += 1
+            return self._error(401, "InvalidAuthorization", "缺少或错误的Authorization头")
+        if self.config.error_rate and self.config.rng.random() < self.config.error_rate:
+            self.errors[name] += 1
+            return self._error(503, "ServiceUnavailable", "模拟的上游故障")
+        return None
+
+    def _make_answer(self, query: str) -> str:
+        low, high = self.config.answer_chars
+        length = self.config.rng.randint(low, high)
+        prefix = f"关于「{query[:20]}」："
+        body = ''.join(self.config.rng.choice(ANSWER_ALPHABET) for _ in range(max(0, length - len(prefix))))
+        return (prefix + body)[:length]
+
+    def _split_answer(self, answer: str) -> List[str]:
+        low, high = self.config.chunk_chars
+        pieces = []
+        pos = 0
+        while pos < len(answer):
+            size = max(1, self.config.rng.randint(low, high))
+            pieces.append(answer[pos:pos + size])
+            pos += size
+        return pieces
+
+    def _frame(self, request_id: str, conversation_id: str, message_id: str, answer: str,
+               is_completion: bool) -> Dict[str, Any]:
+        return {
+            "request_id": request_id,
+            "date": time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            "answer": answer,
+            "conversation_id": conversation_id,
+            "message_id": message_id,
+            "is_completion": is_completion,
+            "content": []
+        }
+
+    async def _sleep(self, distribution: LatencyDistribution):
+        delay = distribution.sample(self.config.rng)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    # ---- 接口 ----
+
+    async def create_conversation(self, request: web.Request) -> web.Response:
+        rejected = self._check(request, "conversation")
+        if rejected is not None:
+            return rejected
+
+        payload = await request.json()
+        if not payload.get('app_id'):
+            self.errors["conversation"] += 1
+            return self._error(400, "InvalidParameter", "缺少app_id")
+
+        await self._sleep(self.config.conversation_latency)
+        conversation_id = str(uuid.uuid4())
+        self.conversations[conversation_id] = {
+            "app_id": payload['app_id'],
+            "created_at": time.time(),
+            "messages": []
+        }
+        return web.json_response({"request_id": str(uuid.uuid4()), "conversation_id": conversation_id})
+
+    async def runs(self, request: web.Request) -> web.StreamResponse:
+        rejected = self._check(request, "runs")
+        if rejected is not None:
+            return rejected
+
+        payload = await request.json()
+        conversation_id = payload.get('conversation_id')
+        conversation = self.conversations.get(conversation_id)
+        if conversation is None:
+            self.errors["runs"] += 1
+            return self._error(400, "InvalidConversation", "对话不存在或已过期")
+
+        query = payload.get('query', '')
+        request_id = str(uuid.uuid4())
+        message_id = str(uuid.uuid4())
+        answer = self._make_answer(query)
+        conversation["messages"].append({"role": "user", "content": query, "created_at": time.time()})
+
+        if not payload.get('stream'):
+            await self._sleep(self.config.runs_latency)
+            conversation["messages"].append({"role": "assistant", "content": answer, "created_at": time.time()})
+            return web.json_response(self._frame(request_id, conversation_id, message_id, answer, True))
+
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream", "Cache-Control": "no-cache"})
+        await response.prepare(request)
+        await self._sleep(self.config.first_chunk_latency)
+        for index, piece in enumerate(self._split_answer(answer)):
+            if index:
+                await self._sleep(self.config.chunk_interval)
+            frame = self._frame(request_id, conversation_id, message_id, piece, False)
+            await response.write(f"data: {json.dumps(frame, ensure_ascii=False)}\n\n".encode('utf-8'))
+
+        final = self._frame(request_id, conversation_id, message_id, "", True)
+        await response.write(f"data: {json.dumps(final, ensure_ascii=False)}\n\n".encode('utf-8'))
+        conversation["messages"].append({"role": "assistant", "content": answer, "created_at": time.time()})
+        await response.write_eof()
+        return response
+
+    async def history(self, request: web.Request) -> web.Response:
+        rejected = self._check(request, "history")
+        if rejected is not None:
+            return rejected
+
+        conversation_id = request.match_info['conversation_id']
+        conversation = self.conversations.get(conversation_id)
+        if conversation is None:
+            self.errors["history"] += 1
+            return self._error(400, "InvalidConversation", "对话不存在或已过期")
+
+        await self._sleep(self.config.history_latency)
+        return web.json_response({
+            "request_id": str(uuid.uuid4()),
+            "conversation_id": conversation_id,
+            "messages": conversation["messages"]
+        })
+
+    async def stats(self, request: web.Request) -> web.Response:
+        return web.json_response({
+            "uptime": round(time.time() - self.started_at, 1),
+            "conversations": len(self.conversations),
+            "requests": dict(self.requests),
+            "errors": dict(self.errors),
+            "config": self.config.describe()
+        })
+
+
+def create_app(config: Optional[MockConfig] = None) -> web.Application:
+    """创建模拟服务应用（也可在测试脚本中直接嵌入）"""
+    server = MockQianfanServer(config or MockConfig())
+    app = web.Application()
+    app['mock_server'] = server
+    app.router.add_post('/v2/app/conversation', server.create_conversation)
+    app.router.add_post('/v2/app/conversation/runs', server.runs)
+    app.router.add_get('/v2/app/conversation/{conversation_id}/messages', server.history)
+    app.router.add_get('/mock/stats', server.stats)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地千帆模拟服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--conversation-latency", default="const:0.05", help="创建对话延迟分布")
+    parser.add_argument("--runs-latency", default="const:0.3", help="非流式消息延迟分布")
+    parser.add_argument("--first-chunk-latency", default="const:0.2", help="流式首个分块延迟分布")
+    parser.add_argument("--chunk-interval", default="const:0.02", help="流式分块间隔分布")
+    parser.add_argument("--history-latency", default="const:0.05", help="历史接口延迟分布")
+    parser.add_argument("--answer-chars", default="200-600", help="答案长度（字符），如 300 或 200-600")
+    parser.add_argument("--chunk-chars", default="8-24", help="每个流式分块的字符数，如 16 或 8-24")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="随机返回503的比例（0~1）")
+    parser.add_argument("--seed", type=int, default=None, help="随机种子")
+    args = parser.parse_args()
+
+    config = MockConfig(
+        conversation_latency=args.conversation_latency,
+        runs_latency=args.runs_latency,
+        first_chunk_latency=args.first_chunk_latency,
+        chunk_interval=args.chunk_interval,
+        history_latency=args.history_latency,
+        answer_chars=args.answer_chars,
+        chunk_chars=args.chunk_chars,
+        error_rate=args.error_rate,
+        seed=args.seed
+    )
+
+    print(f"🧪 千帆模拟服务: http://{args.host}:{args.port}")
+    print(f"   配置: {config.describe()}")
+    print(f"   后端使用: QIANFAN_API_BASE_URL=http://{args.host}:{args.port}")
+    web.run_app(create_app(config), host=args.host, port=args.port, print=None)
+
+
+if __name__ == "__main__":
+    main()
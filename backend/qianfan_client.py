@@ -1,19 +1,67 @@
-import requests
+import aiohttp
+import asyncio
 import json
 import logging
-from typing import Optional, Dict, Any, Iterator
+import os
+from typing import Optional, Dict, Any, AsyncIterator, Awaitable, Callable
 import re
+from sse_parser import AnswerAssembler, aiter_json
+from resilience import (
+    CircuitOpenError, RetryPolicy, call_with_resilience, default_retry_policy,
+    get_circuit_breaker, is_upstream_failure
+)
+
+# 连接池配置 - 复用keep-alive连接、DNS缓存和TLS会话
+POOL_LIMIT = int(os.getenv('QIANFAN_POOL_LIMIT', 400))
+POOL_LIMIT_PER_HOST = int(os.getenv('QIANFAN_POOL_LIMIT_PER_HOST', 200))
+KEEPALIVE_TIMEOUT = float(os.getenv('QIANFAN_KEEPALIVE_TIMEOUT', 60))
+DNS_CACHE_TTL = int(os.getenv('QIANFAN_DNS_CACHE_TTL', 300))
+
+_shared_session: Optional[aiohttp.ClientSession] = None
+
+
+def create_session(limit: int = POOL_LIMIT, limit_per_host: int = POOL_LIMIT_PER_HOST) -> aiohttp.ClientSession:
+    """创建带连接池的aiohttp会话（必须在事件循环中调用）"""
+    connector = aiohttp.TCPConnector(
+        limit=limit,
+        limit_per_host=limit_per_host,
+        keepalive_timeout=KEEPALIVE_TIMEOUT,
+        ttl_dns_cache=DNS_CACHE_TTL,
+        enable_cleanup_closed=True
+    )
+    return aiohttp.ClientSession(connector=connector, raise_for_status=False)
+
+
+def get_shared_session() -> aiohttp.ClientSession:
+    """获取进程级共享会话，首次调用时创建"""
+    global _shared_session
+    if _shared_session is None or _shared_session.closed:
+        _shared_session = create_session()
+    return _shared_session
+
+
+async def close_shared_session():
+    """关闭共享会话（应用关闭时调用）"""
+    global _shared_session
+    if _shared_session is not None and not _shared_session.closed:
+        await _shared_session.close()
+    _shared_session = None
+
 
 class QianfanClient:
-    """百度千帆API客户端"""
-    
-    def __init__(self, authorization_token: str, base_url: str = "https://qianfan.baidubce.com"):
+    """百度千帆API客户端（基于aiohttp的异步实现）"""
+
+    def __init__(self, authorization_token: str, base_url: str = "https://qianfan.baidubce.com",
+                 session: Optional[aiohttp.ClientSession] = None,
+                 retry_policy: Optional[RetryPolicy] = None):
         """
         初始化千帆客户端
-        
+
         Args:
             authorization_token: 授权令牌（Bearer token）
             base_url: API基础URL
+            session: 可选的aiohttp会话，不传则使用进程级共享会话
+            retry_policy: 重试策略，不传则使用全局默认策略
         """
         self.authorization_token = authorization_token
         self.base_url = base_url
@@ -21,166 +69,178 @@ class QianfanClient:
             'Content-Type': 'application/json',
             'Authorization': authorization_token  # 直接使用完整的 Authorization header
         }
-        
-        # 配置日志
-        logging.basicConfig(level=logging.INFO)
+        self._session = session
+        self.retry_policy = retry_policy or default_retry_policy
         self.logger = logging.getLogger(__name__)
-    
-    def create_conversation(self, app_id: str) -> Dict[str, Any]:
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        """当前使用的aiohttp会话"""
+        if self._session is not None and not self._session.closed:
+            return self._session
+        return get_shared_session()
+
+    @property
+    def closed(self) -> bool:
+        """客户端自有会话是否已关闭"""
+        return self._session is not None and self._session.closed
+
+    async def close(self):
+        """关闭客户端自有的会话（共享会话由close_shared_session统一关闭）"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+    async def _raise_for_status(self, response: aiohttp.ClientResponse):
+        """检查响应状态，失败时记录错误详情并抛出异常"""
+        if response.status < 400:
+            return
+
+        body = await response.text()
+        try:
+            self.logger.error(f"错误详情: {json.loads(body)}")
+        except ValueError:
+            self.logger.error(f"响应内容: {body}")
+        response.raise_for_status()
+
+    async def _call_upstream(self, endpoint: str, operation: Callable[[], Awaitable[Any]],
+                             idempotent: bool) -> Any:
+        """经过该接口的熔断器和重试策略执行上游调用"""
+        breaker = get_circuit_breaker(self.base_url, endpoint)
+        return await call_with_resilience(operation, breaker, self.retry_policy, idempotent)
+
+    async def create_conversation(self, app_id: str) -> Dict[str, Any]:
         """
         创建新的对话
-        
+
         Args:
             app_id: 应用ID
-            
+
         Returns:
             包含conversation_id和request_id的字典
-            
+
         Raises:
-            requests.RequestException: 请求失败时抛出异常
+            aiohttp.ClientError: 请求失败时抛出异常
+            CircuitOpenError: 上游熔断中时快速失败
         """
         url = f"{self.base_url}/v2/app/conversation"
-        
+
         payload = {
             "app_id": app_id
         }
-        
+
+        async def attempt():
+            async with self.session.post(
+                url,
+                headers=self.headers,
+                data=json.dumps(payload, ensure_ascii=False).encode("utf-8"),
+                timeout=aiohttp.ClientTimeout(total=30)
+            ) as response:
+                await self._raise_for_status(response)
+                return await response.json(content_type=None)
+
         try:
             self.logger.info(f"创建对话，app_id: {app_id}")
-            
-            response = requests.post(
-                url, 
-                headers=self.headers, 
-                data=json.dumps(payload, ensure_ascii=False).encode("utf-8"),
-                timeout=30
-            )
-            
-            response.raise_for_status()
-            result = response.json()
-            
+
+            # 创建对话可安全重试（多创建的空对话不影响结果）
+            result = await self._call_upstream("conversation", attempt, idempotent=True)
+
             self.logger.info(f"对话创建成功，conversation_id: {result.get('conversation_id')}")
             return result
-            
-        except requests.exceptions.RequestException as e:
-            self.logger.error(f"创建对话失败: {e}")
-            if hasattr(e, 'response') and e.response is not None:
-                try:
-                    error_detail = e.response.json()
-                    self.logger.error(f"错误详情: {error_detail}")
-                except:
-                    self.logger.error(f"响应内容: {e.response.text}")
+
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            self.logger.error(f"创建对话失败: {e!r}")
             raise
-    
-    def send_message(self, app_id: str, conversation_id: str, message: str, 
-                    stream: bool = False) -> Dict[str, Any]:
+
+    async def send_message(self, app_id: str, conversation_id: str, message: str,
+                           stream: bool = False) -> Dict[str, Any]:
         """
         发送消息到对话
-        
+
         Args:
             app_id: 应用ID
             conversation_id: 对话ID
             message: 消息内容
             stream: 是否流式返回
-            
+
         Returns:
             API响应结果
         """
         url = f"{self.base_url}/v2/app/conversation/runs"
-        
+
         payload = {
             "app_id": app_id,
             "conversation_id": conversation_id,
             "query": message,
             "stream": stream
         }
-        
-        try:
-            self.logger.info(f"发送消息，conversation_id: {conversation_id}, stream: {stream}")
-            
-            response = requests.post(
+
+        async def attempt():
+            async with self.session.post(
                 url,
                 headers=self.headers,
                 data=json.dumps(payload, ensure_ascii=False).encode("utf-8"),
-                timeout=60 if not stream else 120,
-                stream=stream  # 启用流式接收
-            )
-            
-            response.raise_for_status()
-            
-            if stream:
-                return self._handle_stream_response(response)
-            else:
-                result = response.json()
-                self.logger.info("消息发送成功")
-                return result
-                
-        except requests.exceptions.RequestException as e:
-            self.logger.error(f"发送消息失败: {e}")
-            if hasattr(e, 'response') and e.response is not None:
-                try:
-                    error_detail = e.response.json()
-                    self.logger.error(f"错误详情: {error_detail}")
-                except:
-                    self.logger.error(f"响应内容: {e.response.text}")
+                timeout=aiohttp.ClientTimeout(total=60 if not stream else 120)
+            ) as response:
+                await self._raise_for_status(response)
+
+                if stream:
+                    return await self._handle_stream_response(response)
+
+                return await response.json(content_type=None)
+
+        try:
+            self.logger.info(f"发送消息，conversation_id: {conversation_id}, stream: {stream}")
+
+            # 发送消息非幂等，只在确定上游未处理时重试
+            result = await self._call_upstream("runs", attempt, idempotent=False)
+            self.logger.info("消息发送成功")
+            return result
+
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            self.logger.error(f"发送消息失败: {e!r}")
             raise
-    
-    def _handle_stream_response(self, response) -> Dict[str, Any]:
+
+    async def _handle_stream_response(self, response: aiohttp.ClientResponse) -> Dict[str, Any]:
         """处理流式响应 - 解析Server-Sent Events格式"""
-        full_answer = ""
+        answer = AnswerAssembler()
         final_result = {}
-        
+
         try:
-            # 按行处理流式响应
-            for line in response.iter_lines(decode_unicode=True):
-                if not line or line.startswith(':'):
-                    continue
-                    
-                # 解析SSE格式的数据
-                if line.startswith('data: '):
-                    data_content = line[6:].strip()  # 移除 'data: ' 前缀
-                    
-                    # 跳过空数据行和结束标记
-                    if not data_content or data_content == '[DONE]':
-                        continue
-                    
-                    try:
-                        # 解析JSON数据
-                        chunk_data = json.loads(data_content)
-                        
-                        # 累积答案文本
-                        if 'answer' in chunk_data:
-                            full_answer += chunk_data['answer']
-                        
-                        # 保存最后一个完整的响应作为最终结果
-                        if chunk_data.get('is_completion', False):
-                            final_result = chunk_data
-                            final_result['answer'] = full_answer
-                            break
-                        else:
-                            # 更新最终结果但不停止（继续累积答案）
-                            final_result.update(chunk_data)
-                            
-                    except json.JSONDecodeError as e:
-                        self.logger.warning(f"无法解析JSON数据: {data_content}, 错误: {e}")
-                        continue
-            
-            # 如果有累积的答案，更新到最终结果
-            if full_answer and 'answer' not in final_result:
-                final_result['answer'] = full_answer
-            
+            # 直接在原始字节分块上增量解析SSE事件，同一分块内的数据帧批量解码
+            async for chunk_data in aiter_json(response.content.iter_any(), self._log_bad_frame):
+                # 累积答案文本
+                if 'answer' in chunk_data:
+                    answer.append(chunk_data['answer'])
+
+                # 保存最后一个完整的响应作为最终结果
+                if chunk_data.get('is_completion', False):
+                    final_result = chunk_data
+                    final_result['answer'] = answer.getvalue()
+                    break
+                else:
+                    # 更新最终结果但不停止（继续累积答案）
+                    final_result.update(chunk_data)
+
+            # 未收到完成标记时，用累积的答案覆盖最后一个分块的增量answer
+            if answer and not final_result.get('is_completion', False):
+                final_result['answer'] = answer.getvalue()
+
             # 如果没有获得任何有效响应，返回默认结构
             if not final_result:
                 final_result = {
-                    'answer': full_answer or "抱歉，没有收到有效的响应。",
+                    'answer': answer.getvalue() or "抱歉，没有收到有效的响应。",
                     'is_completion': True,
                     'request_id': 'stream-unknown',
                     'conversation_id': 'unknown',
                     'message_id': 'unknown'
                 }
-            
+
             self.logger.info(f"流式响应处理完成，最终答案长度: {len(final_result.get('answer', ''))}")
             return final_result
-            
+
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            # 中途断流交给call_with_resilience计入熔断（与send_message_stream一致），不能当作成功返回
+            raise
         except Exception as e:
             self.logger.error(f"处理流式响应失败: {e}")
             return {
@@ -188,105 +248,112 @@ class QianfanClient:
                 'is_completion': True,
                 'error': str(e)
             }
-    
-    def send_message_stream(self, app_id: str, conversation_id: str, message: str) -> Iterator[Dict[str, Any]]:
+
+    def _log_bad_frame(self, payload: bytes, error: Exception):
+        """记录无法解析的流式数据帧"""
+        self.logger.warning(f"无法解析流式JSON数据: {payload[:200]!r}, 错误: {error}")
+
+    async def send_message_stream(self, app_id: str, conversation_id: str,
+                                  message: str) -> AsyncIterator[Dict[str, Any]]:
         """
-        发送消息并返回流式响应迭代器
-        
+        发送消息并返回流式响应异步迭代器
+
         Args:
             app_id: 应用ID
             conversation_id: 对话ID
             message: 消息内容
-            
+
         Yields:
             每个流式响应块的字典
         """
         url = f"{self.base_url}/v2/app/conversation/runs"
-        
+
         payload = {
             "app_id": app_id,
             "conversation_id": conversation_id,
             "query": message,
             "stream": True
         }
-        
-        try:
-            self.logger.info(f"发送流式消息，conversation_id: {conversation_id}")
-            
-            response = requests.post(
+
+        async def open_stream():
+            response = await self.session.post(
                 url,
                 headers=self.headers,
                 data=json.dumps(payload, ensure_ascii=False).encode("utf-8"),
-                timeout=120,
-                stream=True
+                timeout=aiohttp.ClientTimeout(total=120)
             )
-            
-            response.raise_for_status()
-            
-            # 逐行处理流式响应
-            for line in response.iter_lines(decode_unicode=True):
-                if not line or line.startswith(':'):
-                    continue
-                    
-                if line.startswith('data: '):
-                    data_content = line[6:].strip()
-                    
-                    if not data_content or data_content == '[DONE]':
+            try:
+                await self._raise_for_status(response)
+            except BaseException:
+                response.release()
+                raise
+            return response
+
+        try:
+            self.logger.info(f"发送流式消息，conversation_id: {conversation_id}")
+
+            # 只在拿到响应头之前重试，开始推送后不再重试
+            response = await self._call_upstream("runs", open_stream, idempotent=False)
+            try:
+                # 每收到一个网络分块就解析出其中完整的事件
+                async for chunk_data in aiter_json(response.content.iter_any(), self._log_bad_frame):
+                    yield chunk_data
+
+                    # 如果响应完成，退出循环
+                    if chunk_data.get('is_completion', False):
                         break
-                    
-                    try:
-                        chunk_data = json.loads(data_content)
-                        yield chunk_data
-                        
-                        # 如果响应完成，退出循环
-                        if chunk_data.get('is_completion', False):
-                            break
-                            
-                    except json.JSONDecodeError as e:
-                        self.logger.warning(f"无法解析流式JSON数据: {data_content}")
-                        continue
-                        
-        except requests.exceptions.RequestException as e:
-            self.logger.error(f"发送流式消息失败: {e}")
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                # 推送中途断流同样反映上游健康状况
+                if is_upstream_failure(e):
+                    get_circuit_breaker(self.base_url, "runs").record_failure()
+                raise
+            finally:
+                response.release()
+
+        except (aiohttp.ClientError, asyncio.TimeoutError, CircuitOpenError) as e:
+            self.logger.error(f"发送流式消息失败: {e!r}")
             yield {
                 'answer': "抱歉，网络连接出现问题。",
                 'is_completion': True,
                 'error': str(e)
             }
-    
-    def get_conversation_history(self, app_id: str, conversation_id: str) -> Dict[str, Any]:
+
+    async def get_conversation_history(self, app_id: str, conversation_id: str) -> Dict[str, Any]:
         """
         获取对话历史
-        
+
         Args:
             app_id: 应用ID
             conversation_id: 对话ID
-            
+
         Returns:
             对话历史数据
         """
         # 注意：这个接口可能需要根据实际API文档调整
         url = f"{self.base_url}/v2/app/conversation/{conversation_id}/messages"
-        
+
         params = {"app_id": app_id}
-        
-        try:
-            response = requests.get(
+
+        async def attempt():
+            async with self.session.get(
                 url,
                 headers=self.headers,
                 params=params,
-                timeout=30
-            )
-            
-            response.raise_for_status()
-            return response.json()
-            
-        except requests.exceptions.RequestException as e:
-            self.logger.error(f"获取对话历史失败: {e}")
+                timeout=aiohttp.ClientTimeout(total=30)
+            ) as response:
+                await self._raise_for_status(response)
+                return await response.json(content_type=None)
+
+        try:
+            return await self._call_upstream("history", attempt, idempotent=True)
+
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            self.logger.error(f"获取对话历史失败: {e!r}")
             raise
 
 
 # 便捷函数
-def create_qianfan_client(authorization_token: str) -> QianfanClient:
+def create_qianfan_client(authorization_token: str,
+                          base_url: str = "https://qianfan.baidubce.com") -> QianfanClient:
     """创建千帆客户端实例"""
-    return QianfanClient(authorization_token) 
\ No newline at end of file
+    return QianfanClient(authorization_token, base_url)
@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""
+上游调用容错：带抖动的指数退避重试 + 按接口划分的熔断器
+"""
+
+import asyncio
+import logging
+import math
+import os
+import random
+import time
+from typing import Any, Awaitable, Callable, Dict, Tuple, TypeVar
+
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+# 非幂等请求（发送消息）只在确定上游未处理时重试
+NON_IDEMPOTENT_RETRY_STATUSES = {429, 503}
+# 幂等请求（创建对话、查询历史）还会重试其他暂时性错误
+IDEMPOTENT_RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(Exception):
+    """熔断器处于打开状态，请求被快速拒绝"""
+
+    def __init__(self, name: str, retry_after: float):
+        self.name = name
+        self.retry_after = retry_after
+        super().__init__(f"上游接口 {name} 暂时不可用（熔断中），请 {math.ceil(retry_after)} 秒后重试")
+
+
+class RetryPolicy:
+    """重试策略 - 指数退避 + 全抖动（full jitter）"""
+
+    def __init__(self, max_attempts: int = 3, base_delay: float = 0.5, max_delay: float = 8.0):
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def backoff(self, attempt: int) -> float:
+        """第attempt次失败后的等待时间（attempt从1开始）"""
+        ceiling = min(self.max_delay, self.base_delay * (2 ** (attempt - 1)))
+        return random.uniform(0, ceiling)
+
+
+class CircuitBreaker:
+    """
+    熔断器
+
+    closed: 正常放行，连续失败达到阈值后打开
+    open: 快速失败，冷却时间结束后进入半开
+    half_open: 放行有限个探测请求，成功则关闭，失败则重新打开
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_threshold: int = 5, recovery_timeout: float = 30.0,
+                 half_open_max_calls: int = 1):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.half_open_calls = 0
+        self.total_failures = 0
+        self.total_successes = 0
+        self.rejected = 0
+
+    def retry_after(self) -> float:
+        """距离允许探测还需等待的秒数"""
+        if self.state != self.OPEN:
+            return 0.0
+        return max(0.0, self.opened_at + self.recovery_timeout - time.monotonic())
+
+    def raise_if_open(self):
+        """仅检查状态，不占用半开探测名额"""
+        if self.state == self.OPEN and self.retry_after() > 0:
+            self.rejected += 1
+            raise CircuitOpenError(self.name, self.retry_after())
+
+    def before_call(self):
+        """请求前调用，不允许放行时抛出CircuitOpenError"""
+        if self.state == self.OPEN:
+            if self.retry_after() > 0:
+                self.rejected += 1
+                raise CircuitOpenError(self.name, self.retry_after())
+            self.state = self.HALF_OPEN
+            self.half_open_calls = 0
+            logger.info(f"熔断器 {self.name} 进入半开状态")
+
+        if self.state == self.HALF_OPEN:
+            if self.half_open_calls >= self.half_open_max_calls:
+                self.rejected += 1
+                raise CircuitOpenError(self.name, self.recovery_timeout)
+            self.half_open_calls += 1
+
+    def record_success(self):
+        self.total_successes += 1
+        self.consecutive_failures = 0
+        if self.state != self.CLOSED:
+            logger.info(f"熔断器 {self.name} 恢复关闭状态")
+        self.state = self.CLOSED
+        self.half_open_calls = 0
+
+    def record_failure(self):
+        self.total_failures += 1
+        self.consecutive_failures += 1
+        if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                logger.warning(f"熔断器 {self.name} 打开，连续失败 {self.consecutive_failures} 次")
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+            self.half_open_calls = 0
+
+    def release_probe(self):
+        """半开探测请求既未成功也未计为失败（如客户端错误）时归还名额"""
+        if self.state == self.HALF_OPEN and self.half_open_calls > 0:
+            self.half_open_calls -= 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "retry_after": round(self.retry_after(), 1),
+            "total_failures": self.total_failures,
+            "total_successes": self.total_successes,
+            "rejected": self.rejected
+        }
+
+
+def is_upstream_failure(error: BaseException) -> bool:
+    """是否反映上游健康问题（计入熔断）；4xx等客户端错误不计入"""
+    if isinstance(error, aiohttp.ClientResponseError):
+        return error.status >= 500
+    return isinstance(error, (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError, asyncio.TimeoutError))
+
+
+def is_retryable(error: BaseException, idempotent: bool) -> bool:
+    """判断错误是否可以重试"""
+    if isinstance(error, aiohttp.ClientResponseError):
+        statuses = IDEMPOTENT_RETRY_STATUSES if idempotent else NON_IDEMPOTENT_RETRY_STATUSES
+        return error.status in statuses
+    if not idempotent:
+        # 连接未建立时请求必然没有到达上游
+        return isinstance(error, aiohttp.ClientConnectorError)
+    return isinstance(error, (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError, asyncio.TimeoutError))
+
+
+async def call_with_resilience(operation: Callable[[], Awaitable[T]], breaker: CircuitBreaker,
+                               policy: RetryPolicy, idempotent: bool) -> T:
+    """
+    经过熔断器和重试策略执行一次上游调用
+
+    Args:
+        operation: 无参协程工厂，每次尝试重新调用
+        breaker: 该接口的熔断器
+        policy: 重试策略
+        idempotent: 是否幂等，决定哪些错误可以重试
+    """
+    attempt = 0
+    while True:
+        attempt += 1
+        breaker.before_call()
+        try:
+            result = await operation()
+        except asyncio.CancelledError:
+            breaker.release_probe()
+            raise
+        except Exception as e:
+            if is_upstream_failure(e):
+                breaker.record_failure()
+            else:
+                breaker.release_probe()
+
+            if attempt >= policy.max_attempts or not is_retryable(e, idempotent):
+                raise
+            delay = policy.backoff(attempt)
+            logger.warning(f"上游调用 {breaker.name} 第 {attempt} 次失败: {e!r}，{delay:.2f}s 后重试")
+            await asyncio.sleep(delay)
+        else:
+            breaker.record_success()
+            return result
+
+
+_breakers: Dict[Tuple[str, str], CircuitBreaker] = {}
+
+BREAKER_FAILURE_THRESHOLD = int(os.getenv('QIANFAN_BREAKER_FAILURES', 5))
+BREAKER_RECOVERY_TIMEOUT = float(os.getenv('QIANFAN_BREAKER_RECOVERY', 30))
+
+
+def get_circuit_breaker(base_url: str, endpoint: str) -> CircuitBreaker:
+    """获取（base_url, 接口）对应的熔断器；同一上游的所有客户端共享"""
+    key = (base_url, endpoint)
+    breaker = _breakers.get(key)
+    if breaker is None:
+        breaker = CircuitBreaker(
+            endpoint,
+            failure_threshold=BREAKER_FAILURE_THRESHOLD,
+            recovery_timeout=BREAKER_RECOVERY_TIMEOUT
+        )
+        _breakers[key] = breaker
+    return breaker
+
+
+def breaker_states() -> Dict[str, Dict[str, Any]]:
+    """所有熔断器状态，供健康检查接口使用"""
+    return {f"{base_url} {endpoint}": breaker.snapshot() for (base_url, endpoint), breaker in _breakers.items()}
+
+
+def any_breaker_open() -> bool:
+    return any(breaker.state != CircuitBreaker.CLOSED for breaker in _breakers.values())
+
+
+# 全局默认重试策略
+default_retry_policy = RetryPolicy(
+    max_attempts=int(os.getenv('QIANFAN_RETRY_ATTEMPTS', 3)),
+    base_delay=float(os.getenv('QIANFAN_RETRY_BASE_DELAY', 0.5)),
+    max_delay=float(os.getenv('QIANFAN_RETRY_MAX_DELAY', 8))
+)
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+单飞（single-flight）请求合并 - 相同键的并发无状态调用只向上游发起一次，
+其余调用者等待同一个结果；流式调用由一个后台任务拉取上游流并扇出给所有订阅者
+"""
+
+import asyncio
+import logging
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Hashable, List, Optional, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+
+class _Broadcast:
+    """一次上游流的广播缓冲 - 已收到的分块全部保留，晚加入的订阅者从头回放"""
+
+    def __init__(self):
+        self.items: List[Any] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self._changed = asyncio.Event()
+
+    async def pump(self, source: AsyncIterator[Any]):
+        try:
+            async for item in source:
+                self.items.append(item)
+                self._notify()
+        except Exception as e:
+            self.error = e
+        finally:
+            self.done = True
+            self._notify()
+
+    def _notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def subscribe(self) -> AsyncIterator[Any]:
+        index = 0
+        while True:
+            while index < len(self.items):
+                yield self.items[index]
+                index += 1
+            if self.done:
+                if self.error is not None:
+                    raise self.error
+                return
+            await self._changed.wait()
+
+
+class SingleFlight:
+    """请求合并器 - 同一时刻每个键最多一个上游调用在进行"""
+
+    def __init__(self, name: str = "upstream"):
+        self.name = name
+        self._calls: Dict[Hashable, asyncio.Task] = {}
+        self._streams: Dict[Hashable, _Broadcast] = {}
+        self.calls = 0
+        self.coalesced_calls = 0
+        self.streams = 0
+        self.coalesced_streams = 0
+
+    def in_flight(self, key: Hashable) -> bool:
+        """该键是否已有进行中的调用或流"""
+        return key in self._calls or key in self._streams
+
+    async def do(self, key: Hashable, operation: Callable[[], Awaitable[T]]) -> T:
+        """
+        执行或加入一次调用
+
+        上游调用在独立任务中运行，任一调用者断开（取消）都不会影响其他等待者。
+        """
+        task = self._calls.get(key)
+        if task is not None:
+            self.coalesced_calls += 1
+            return await asyncio.shield(task)
+
+        self.calls += 1
+        task = asyncio.ensure_future(operation())
+        self._calls[key] = task
+        task.add_done_callback(lambda _: self._calls.pop(key, None))
+        return await asyncio.shield(task)
+
+    def stream(self, key: Hashable, factory: Callable[[], AsyncIterator[T]]) -> AsyncIterator[T]:
+        """
+        订阅或发起一次流式调用，返回订阅迭代器
+
+        登记在调用时同步完成：第一个调用者立即启动后台任务拉取上游流，
+        之后的调用者共享同一份分块（含已推送部分）；订阅者断开不会中断上游流。
+        """
+        broadcast = self._streams.get(key)
+        if broadcast is not None:
+            self.coalesced_streams += 1
+        else:
+            self.streams += 1
+            broadcast = _Broadcast()
+            self._streams[key] = broadcast
+            task = asyncio.ensure_future(broadcast.pump(factory()))
+            task.add_done_callback(lambda _: self._release_stream(key, broadcast))
+        return self._subscribe(broadcast)
+
+    async def _subscribe(self, broadcast: _Broadcast) -> AsyncIterator[Any]:
+        broadcast.subscribers += 1
+        try:
+            async for item in broadcast.subscribe():
+                yield item
+        finally:
+            broadcast.subscribers -= 1
+
+    def _release_stream(self, key: Hashable, broadcast: _Broadcast):
+        if self._streams.get(key) is broadcast:
+            del self._streams[key]
+
+    def stats(self) -> Dict[str, Any]:
+        total_calls = self.calls + self.coalesced_calls
+        total_streams = self.streams + self.coalesced_streams
+        return {
+            "in_flight_calls": len(self._calls),
+            "in_flight_streams": len(self._streams),
+            "upstream_calls": self.calls,
+            "coalesced_calls": self.coalesced_calls,
+            "upstream_streams": self.streams,
+            "coalesced_streams": self.coalesced_streams,
+            "coalesced_ratio": round(
+                (self.coalesced_calls + self.coalesced_streams) / (total_calls + total_streams), 4
+            ) if total_calls + total_streams else 0.0
+        }
+
+
+# 全局实例（快速对话等无状态请求共用）
+upstream_flight = SingleFlight()
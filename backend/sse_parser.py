@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""
+增量式Server-Sent Events解析器
+
+直接在原始字节上按行切分，不做整行解码；支持多行data字段、
+event/id/retry字段、注释行以及 \\n、\\r\\n、\\r 三种换行符。
+"""
+
+import json
+from typing import Any, AsyncIterable, AsyncIterator, Callable, List, Optional, Tuple
+
+_CR = 0x0D
+_json_decode = json.JSONDecoder().decode
+_COLON = 0x3A
+
+
+class SSEEvent:
+    """一条完整的SSE事件"""
+
+    __slots__ = ('event', 'data', 'id', 'retry')
+
+    def __init__(self, event: str, data: bytes, id: Optional[str] = None, retry: Optional[int] = None):
+        self.event = event
+        self.data = data
+        self.id = id
+        self.retry = retry
+
+    @property
+    def text(self) -> str:
+        """UTF-8解码后的data字段"""
+        return self.data.decode('utf-8')
+
+    def json(self) -> Any:
+        """按JSON解析data字段（跳过json.loads的编码探测与参数分派）"""
+        return _json_decode(self.data.decode('utf-8'))
+
+    def __repr__(self):
+        return f"SSEEvent(event={self.event!r}, id={self.id!r}, data={self.data[:60]!r})"
+
+
+class SSEParser:
+    """
+    增量SSE解析器
+
+    每次收到网络分块调用 feed()，返回该分块中已完整的事件；
+    流结束时调用 flush() 取出缓冲区中尚未以空行结束的最后一个事件。
+    按行切分交给 bytes.split 在C层完成，不完整的行以分片列表暂存，
+    超长的单行跨越多个分块时也不会被反复扫描。
+    """
+
+    def __init__(self):
+        self._pending: List[bytes] = []
+        self._data_lines: List[bytes] = []
+        self._event: Optional[str] = None
+        self._retry: Optional[int] = None
+        self.last_event_id: Optional[str] = None
+
+    def feed(self, chunk: bytes) -> List[SSEEvent]:
+        """喂入一段原始字节，返回解析出的完整事件"""
+        if b'\n' not in chunk and b'\r' not in chunk:
+            if chunk:
+                self._pending.append(chunk)
+            return []
+
+        if self._pending:
+            self._pending.append(chunk)
+            chunk = b''.join(self._pending)
+            self._pending = []
+
+        held_cr = b''
+        if b'\r' in chunk:
+            # \r 位于分块末尾时无法判断是否为 \r\n，留到下一个分块
+            if chunk[-1] == _CR:
+                chunk = chunk[:-1]
+                held_cr = b'\r'
+            chunk = chunk.replace(b'\r\n', b'\n').replace(b'\r', b'\n')
+
+        lines = chunk.split(b'\n')
+        tail = lines.pop()
+        if tail or held_cr:
+            self._pending.append(tail + held_cr)
+
+        events: List[SSEEvent] = []
+        self._process_lines(lines, events)
+        return events
+
+    def flush(self) -> List[SSEEvent]:
+        """流结束：处理残留的最后一行，并派发未以空行结束的事件"""
+        events: List[SSEEvent] = []
+        if self._pending:
+            rest = b''.join(self._pending).replace(b'\r\n', b'\n').replace(b'\r', b'\n')
+            self._pending = []
+            self._process_lines(rest.split(b'\n'), events)
+        self._dispatch(events)
+        return events
+
+    def _process_lines(self, lines: List[bytes], events: List[SSEEvent]):
+        data_lines = self._data_lines
+        for line in lines:
+            if not line:
+                self._dispatch(events)
+                data_lines = self._data_lines
+            elif line[:5] == b'data:':
+                data_lines.append(line[6:] if line[5:6] == b' ' else line[5:])
+            elif line[0] != _COLON:  # 冒号开头为注释行（心跳）
+                self._process_field(line)
+
+    def _process_field(self, line: bytes):
+        field, sep, value = line.partition(b':')
+        if sep and value[:1] == b' ':
+            value = value[1:]
+
+        if field == b'event':
+            self._event = value.decode('utf-8')
+        elif field == b'id':
+            if b'\x00' not in value:
+                self.last_event_id = value.decode('utf-8')
+        elif field == b'retry':
+            if value.isdigit():
+                self._retry = int(value)
+        elif field == b'data':
+            self._data_lines.append(value)
+
+    def _dispatch(self, events: List[SSEEvent]):
+        data_lines = self._data_lines
+        if data_lines:
+            data = data_lines[0] if len(data_lines) == 1 else b'\n'.join(data_lines)
+            events.append(SSEEvent(self._event or 'message', data, self.last_event_id, self._retry))
+            self._data_lines = []
+        self._event = None
+        self._retry = None
+
+
+class AnswerAssembler:
+    """
+    流式答案拼接器
+
+    将各分块的answer片段追加到列表，最后一次性join，拼接总耗时与答案长度成线性关系。
+    """
+
+    __slots__ = ('_parts', 'length')
+
+    def __init__(self):
+        self._parts: List[str] = []
+        self.length = 0
+
+    def append(self, piece: str):
+        if piece:
+            self._parts.append(piece)
+            self.length += len(piece)
+
+    def getvalue(self) -> str:
+        parts = self._parts
+        if len(parts) > 1:
+            joined = ''.join(parts)
+            self._parts = [joined]
+            return joined
+        return parts[0] if parts else ''
+
+    def __bool__(self):
+        return self.length > 0
+
+
+def is_done_marker(event: SSEEvent) -> bool:
+    """是否为流结束标记 data: [DONE]"""
+    data = event.data
+    return data == b'[DONE]' or (len(data) < 16 and data.strip() == b'[DONE]')
+
+
+def decode_json_batch(payloads: List[bytes],
+                      on_error: Optional[Callable[[bytes, Exception], None]] = None) -> List[Any]:
+    """
+    批量解析JSON数据帧
+
+    同一网络分块内的多个帧拼成一个JSON数组一次解码，摊薄逐帧调用的开销；
+    其中有坏帧时退回逐帧解析，跳过坏帧并通过on_error回调报告。
+    """
+    if not payloads:
+        return []
+    if len(payloads) > 1:
+        try:
+            return _json_decode((b'[' + b','.join(payloads) + b']').decode('utf-8'))
+        except ValueError:
+            pass
+
+    results = []
+    for payload in payloads:
+        try:
+            results.append(_json_decode(payload.decode('utf-8')))
+        except ValueError as e:
+            if on_error is not None:
+                on_error(payload, e)
+    return results
+
+
+def _split_done(events: List[SSEEvent]) -> Tuple[List[bytes], bool]:
+    """取出结束标记之前的非空数据帧，并返回是否遇到了结束标记"""
+    payloads = []
+    for event in events:
+        if is_done_marker(event):
+            return payloads, True
+        if event.data:
+            payloads.append(event.data)
+    return payloads, False
+
+
+async def aiter_json(byte_chunks: AsyncIterable[bytes],
+                     on_error: Optional[Callable[[bytes, Exception], None]] = None) -> AsyncIterator[Any]:
+    """
+    从异步字节分块流（如aiohttp的response.content.iter_any()）中逐个产出JSON数据帧，
+    遇到 data: [DONE] 时结束
+    """
+    parser = SSEParser()
+    async for chunk in byte_chunks:
+        events = parser.feed(chunk)
+        if not events:
+            continue
+        payloads, done = _split_done(events)
+        for item in decode_json_batch(payloads, on_error):
+            yield item
+        if done:
+            return
+
+    payloads, _ = _split_done(parser.flush())
+    for item in decode_json_batch(payloads, on_error):
+        yield item
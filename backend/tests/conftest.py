@@ -0,0 +1,5 @@
+import os
+import sys
+
+# 后端模块按文件名直接导入（与在backend目录下运行服务时相同）
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
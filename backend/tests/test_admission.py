@@ -0,0 +1,61 @@
+import asyncio
+import time
+
+import pytest
+
+import admission
+from admission import AdmissionRejected, ConcurrencyLimiter
+
+
+def test_slot_is_handed_to_the_oldest_waiter():
+    async def scenario():
+        limiter = ConcurrencyLimiter("test", max_concurrency=1, max_queue=2)
+        await limiter.acquire(time.monotonic() + 1)
+        first = asyncio.create_task(limiter.acquire(time.monotonic() + 1))
+        await asyncio.sleep(0)
+        second = asyncio.create_task(limiter.acquire(time.monotonic() + 1))
+        await asyncio.sleep(0)
+        limiter.release()
+        await first
+        assert not second.done()
+        limiter.release()
+        await second
+        limiter.release()
+        return limiter
+
+    limiter = asyncio.run(scenario())
+    assert limiter.idle and limiter.admitted == 3
+
+
+def test_timeout_returns_slot_handed_over_at_the_same_time(monkeypatch):
+    limiter = ConcurrencyLimiter("test", max_concurrency=1, max_queue=1)
+
+    async def handoff_then_timeout(waiter, timeout):
+        # release()在超时触发的同一时刻把名额交给了等待者
+        limiter.release()
+        assert waiter.done()
+        raise asyncio.TimeoutError
+
+    async def scenario():
+        await limiter.acquire(time.monotonic() + 1)
+        monkeypatch.setattr(admission.asyncio, "wait_for", handoff_then_timeout)
+        with pytest.raises(AdmissionRejected) as rejected:
+            await limiter.acquire(time.monotonic() + 1)
+        assert rejected.value.status_code == 503
+
+    asyncio.run(scenario())
+    assert limiter.in_flight == 0 and limiter.queued == 0
+    assert limiter.rejected_timeout == 1
+
+
+def test_plain_timeout_leaves_the_queue():
+    async def scenario():
+        limiter = ConcurrencyLimiter("test", max_concurrency=1, max_queue=1)
+        await limiter.acquire(time.monotonic() + 1)
+        with pytest.raises(AdmissionRejected):
+            await limiter.acquire(time.monotonic() + 0.01)
+        limiter.release()
+        return limiter
+
+    limiter = asyncio.run(scenario())
+    assert limiter.idle
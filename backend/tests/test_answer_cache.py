@@ -0,0 +1,119 @@
+import asyncio
+
+import pytest
+
+import answer_warmup
+import chat_api
+import answer_cache
+from answer_cache import AnswerCache, AnswerStore, shareable_answer
+from conversation_store import ConversationStore
+
+PROMPT = "请介绍一下某个不在知识库里的地标"
+VALUE = {"conversation": {"conversation_id": "warm"}, "message_response": {"answer": "预热的答案"}}
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = AnswerStore(str(tmp_path / "answers.db"))
+    yield store
+    store.close()
+
+
+def test_reads_do_not_touch_the_database(store, monkeypatch):
+    store.put("app", PROMPT, VALUE)
+    cache = AnswerCache(store=store)
+
+    def fail(*args):
+        raise AssertionError("请求路径访问了数据库")
+
+    monkeypatch.setattr(store, "_execute", fail)
+    assert cache.get("app", PROMPT) is None  # 尚未载入
+    monkeypatch.undo()
+
+    assert asyncio.run(cache.load_store())
+    monkeypatch.setattr(store, "_execute", fail)
+    # 早先写入的预热答案带有对话ID，载入时去掉
+    assert cache.get("app", PROMPT + "？") == {"conversation": {}, "message_response": {"answer": "预热的答案"}}
+    assert cache.stats()["store_hits"] == 1
+
+
+def test_remember_makes_own_writes_visible(store):
+    cache = AnswerCache(store=store)
+    cache.remember("app", PROMPT, VALUE)
+    assert cache.stored("app", PROMPT) == VALUE
+
+
+def test_warmed_answer_only_for_first_turn(store, monkeypatch):
+    cache = AnswerCache(store=store)
+    cache.remember(chat_api.DEFAULT_APP_ID, PROMPT, VALUE)
+    monkeypatch.setattr(answer_warmup, "answer_cache", cache)
+    conversations = ConversationStore()
+    monkeypatch.setattr(chat_api, "conversation_store", conversations)
+
+    conversations.put("new", chat_api.DEFAULT_APP_ID)
+    match = asyncio.run(chat_api.match_faq(chat_api.DEFAULT_APP_ID, PROMPT, "new"))
+    assert match is not None and match.method == "warmup" and match.answer == "预热的答案"
+
+    conversations.append_turn("new", "上一个问题", "上一个回答")
+    assert asyncio.run(chat_api.match_faq(chat_api.DEFAULT_APP_ID, PROMPT, "new")) is None
+
+
+def test_hit_refreshes_recency_and_counts():
+    cache = AnswerCache(max_entries=2)
+    cache.put("app", "问题一", {"answer": 1})
+    cache.put("app", "问题二", {"answer": 2})
+    assert cache.get("app", " 问题一？") == {"answer": 1}
+    cache.put("app", "问题三", {"answer": 3})
+    assert cache.get("app", "问题二") is None
+    assert cache.get("app", "问题一") == {"answer": 1}
+    assert (cache.hits, cache.misses, cache.evictions) == (2, 1, 1)
+
+
+def test_entries_expire_after_ttl(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(answer_cache.time, "monotonic", lambda: now[0])
+    cache = AnswerCache(ttl=10)
+    cache.put("app", PROMPT, {"answer": 1})
+    now[0] = 109.9
+    assert cache.get("app", PROMPT) == {"answer": 1}
+    now[0] = 110.0
+    assert cache.get("app", PROMPT) is None
+    assert cache.expirations == 1 and cache.total_bytes == 0
+
+
+def test_byte_cap_evicts_least_recently_used():
+    value = {"answer": "答" * 100}  # 314字节
+    cache = AnswerCache(max_bytes=700)
+    for query in ("一", "二"):
+        cache.put("app", query, value)
+    cache.get("app", "一")
+    cache.put("app", "三", value)
+    assert cache.get("app", "二") is None
+    assert cache.get("app", "一") == value and cache.get("app", "三") == value
+    assert cache.total_bytes <= cache.max_bytes
+    cache.put("app", "四", {"answer": "答" * 300})  # 单个值超过上限时不缓存
+    assert cache.get("app", "四") is None and cache.get("app", "一") == value
+
+
+class StubClient:
+    def __init__(self):
+        self.conversations = 0
+
+    async def create_conversation(self, app_id):
+        self.conversations += 1
+        return {"conversation_id": f"conv-{self.conversations}"}
+
+    async def send_message(self, app_id, conversation_id, message, stream):
+        return {"answer": "答案", "conversation_id": conversation_id, "message_id": "m1", "request_id": "r1"}
+
+
+def test_quick_chat_caches_answer_without_conversation(monkeypatch):
+    cache = AnswerCache()
+    monkeypatch.setattr(chat_api, "answer_cache", cache)
+    data = asyncio.run(chat_api.run_quick_chat(StubClient(), "app", "token-a", PROMPT, False))
+    # 发起调用的请求仍拿到自己的对话
+    assert data["conversation"] == {"conversation_id": "conv-1"}
+    assert data["message_response"]["message_id"] == "m1"
+    # 其他调用方（可能使用其他令牌）只拿到答案
+    assert cache.get("app", PROMPT) == {"conversation": {}, "message_response": {"answer": "答案"}}
+    assert shareable_answer(data) == cache.get("app", PROMPT)
@@ -0,0 +1,40 @@
+import asyncio
+
+import pytest
+
+import chat_api
+from conversation_store import ConversationStore
+
+QUESTION = "什么是地震波？"
+
+
+@pytest.fixture
+def store(monkeypatch):
+    store = ConversationStore()
+    monkeypatch.setattr(chat_api, "conversation_store", store)
+    return store
+
+
+def test_faq_answers_stateless_and_new_conversations(store):
+    assert asyncio.run(chat_api.match_faq(chat_api.DEFAULT_APP_ID, QUESTION)) is not None
+    store.put("new", chat_api.DEFAULT_APP_ID)
+    assert asyncio.run(chat_api.match_faq(chat_api.DEFAULT_APP_ID, QUESTION, "new")) is not None
+
+
+def test_faq_forwards_conversations_with_upstream_context(store):
+    store.put("ongoing", chat_api.DEFAULT_APP_ID)
+    store.append_turn("ongoing", "板块构造是什么", "……")
+    assert asyncio.run(chat_api.match_faq(chat_api.DEFAULT_APP_ID, QUESTION, "ongoing")) is None
+    # 本地没有记录的对话无法确认上游是否有上下文
+    assert asyncio.run(chat_api.match_faq(chat_api.DEFAULT_APP_ID, QUESTION, "unknown")) is None
+
+
+def test_local_answer_is_marked_on_the_conversation(store):
+    store.put("new", chat_api.DEFAULT_APP_ID)
+    match = asyncio.run(chat_api.match_faq(chat_api.DEFAULT_APP_ID, QUESTION, "new"))
+    conversation_id = asyncio.run(chat_api.answer_with_faq(None, chat_api.DEFAULT_APP_ID, "", "new",
+                                                           QUESTION, match))
+    assert conversation_id == "new"
+    assert store.peek("new").metadata["local_turns"] == 1
+    assert store.history("new")["total"] == 2
+    assert asyncio.run(chat_api.match_faq(chat_api.DEFAULT_APP_ID, QUESTION, "new")) is None
@@ -0,0 +1,150 @@
+import asyncio
+import json
+
+import pytest
+
+import chat_api
+from conversation_store import ConversationStore
+
+MESSAGE = "请用三句话介绍一下你自己"
+
+
+class StubClient:
+    """上游流式接口，逐块返回answer"""
+
+    base_url = "http://stream.test"
+
+    def __init__(self, chunks, error=None):
+        self.chunks = chunks
+        self.error = error
+
+    async def create_conversation(self, app_id):
+        return {"conversation_id": "conv-1"}
+
+    async def send_message_stream(self, app_id, conversation_id, message):
+        for chunk in self.chunks:
+            yield chunk
+        if self.error is not None:
+            raise self.error
+
+
+CHUNKS = [
+    {"answer": "我是", "message_id": "m1"},
+    {"answer": "地学助手", "message_id": "m1"},
+    {"answer": "", "message_id": "m1", "is_completion": True},
+]
+
+
+@pytest.fixture
+def store(monkeypatch):
+    store = ConversationStore()
+    monkeypatch.setattr(chat_api, "conversation_store", store)
+    monkeypatch.setattr(chat_api, "DEFAULT_APP_ID", "app")
+    monkeypatch.setattr(chat_api, "QIANFAN_TOKEN", "token")
+    return store
+
+
+@pytest.fixture
+def tickets(monkeypatch):
+    admitted = []
+    admit = chat_api.admit_upstream
+
+    async def recording_admit(token, app_id):
+        ticket = await admit(token, app_id)
+        admitted.append(ticket)
+        return ticket
+
+    monkeypatch.setattr(chat_api, "admit_upstream", recording_admit)
+    return admitted
+
+
+def use_client(monkeypatch, client):
+    monkeypatch.setattr(chat_api, "get_qianfan_client", lambda token=None: client)
+
+
+def parse(frames):
+    """SSE帧拆成(event, data)"""
+    events = []
+    for frame in frames:
+        assert frame.endswith("\n\n")
+        event = None
+        for line in frame[:-2].split("\n"):
+            name, _, value = line.partition(": ")
+            if name == "event":
+                event = value
+            else:
+                assert name == "data"
+                data = value if value == "[DONE]" else json.loads(value)
+        events.append((event, data))
+    return events
+
+
+async def collect(response, limit=None):
+    frames = []
+    async for frame in response.body_iterator:
+        frames.append(frame)
+        if len(frames) == limit:
+            break
+    await response.body_iterator.aclose()
+    return frames
+
+
+@pytest.mark.parametrize("endpoint", ["frontend", "agent"])
+def test_stream_forwards_each_chunk_and_records_the_turn(store, tickets, monkeypatch, endpoint):
+    use_client(monkeypatch, StubClient(CHUNKS))
+    if endpoint == "frontend":
+        request = chat_api.FrontendChatRequest(message=MESSAGE)
+        handler = chat_api.frontend_chat_stream
+    else:
+        request = chat_api.AgentChatRequest(message=MESSAGE)
+        handler = chat_api.agent_chat_stream
+
+    async def scenario():
+        response = await handler(request)
+        assert response.media_type == "text/event-stream"
+        assert response.headers["x-accel-buffering"] == "no"
+        return await collect(response)
+
+    events = parse(asyncio.run(scenario()))
+    assert events == [("conversation", {"conversation_id": "conv-1"})] + [(None, chunk) for chunk in CHUNKS] \
+        + [(None, "[DONE]")]
+    history = store.history("conv-1")
+    assert [message["content"] for message in history["messages"]] == [MESSAGE, "我是地学助手"]
+    assert history["messages"][-1]["message_id"] == "m1"
+    assert [ticket.released for ticket in tickets] == [True]
+
+
+def test_upstream_error_marks_history_stale(store, tickets, monkeypatch):
+    use_client(monkeypatch, StubClient(CHUNKS[:1], error=ConnectionResetError("断流")))
+
+    async def scenario():
+        return await collect(await chat_api.frontend_chat_stream(chat_api.FrontendChatRequest(message=MESSAGE)))
+
+    events = parse(asyncio.run(scenario()))
+    assert events[-2] == ("error", {"error": "断流", "is_completion": True})
+    assert events[-1] == (None, "[DONE]")
+    # 上游可能已记录部分回答，本地不再提供历史，下次读取时从上游回填
+    assert store.peek("conv-1").metadata["history_stale"]
+    assert store.history("conv-1") is None
+    assert tickets[0].released
+
+
+def test_client_disconnect_marks_history_stale(store, tickets, monkeypatch):
+    use_client(monkeypatch, StubClient(CHUNKS))
+    store.put("c1", "app")
+    store.append_turn("c1", "上一个问题", "上一个回答", "m0")
+
+    async def scenario():
+        request = chat_api.FrontendChatRequest(message=MESSAGE, conversation_id="c1")
+        # 收到第一个分块后断开，未收到is_completion
+        return await collect(await chat_api.frontend_chat_stream(request), limit=2)
+
+    assert len(asyncio.run(scenario())) == 2
+    assert store.peek("c1").metadata["history_stale"]
+    assert store.history("c1") is None
+    assert tickets[0].released
+
+
+def test_format_sse():
+    assert chat_api.format_sse({"answer": "板块"}) == 'data: {"answer": "板块"}\n\n'
+    assert chat_api.format_sse("[DONE]", event="end") == "event: end\ndata: [DONE]\n\n"
@@ -0,0 +1,90 @@
+import asyncio
+
+from client_registry import QianfanClientRegistry
+
+BASE_URL = "http://registry.test"
+
+
+def run(scenario):
+    """在事件循环中运行，结束时关闭注册表中剩余的客户端"""
+    async def wrapper():
+        registry = QianfanClientRegistry(max_clients=2, eviction_grace=0.01)
+        try:
+            return await scenario(registry)
+        finally:
+            await registry.close_all()
+
+    return asyncio.run(wrapper())
+
+
+def test_hits_reuse_the_client_and_its_pool():
+    async def scenario(registry):
+        client = registry.get("Bearer a", BASE_URL)
+        assert registry.get("Bearer a", BASE_URL) is client
+        assert registry.get("Bearer a", "http://other.test") is not client
+        return registry.stats()
+
+    stats = run(scenario)
+    assert (stats["hits"], stats["misses"], stats["size"]) == (1, 2, 2)
+
+
+def test_least_recently_used_client_is_evicted():
+    async def scenario(registry):
+        a = registry.get("Bearer a", BASE_URL)
+        registry.get("Bearer b", BASE_URL)
+        registry.get("Bearer a", BASE_URL)  # a变为最近使用
+        registry.get("Bearer c", BASE_URL)
+        assert [token for token, _ in registry._clients] == ["Bearer a", "Bearer c"]
+        assert registry.get("Bearer a", BASE_URL) is a
+        return registry.evictions
+
+    assert run(scenario) == 1
+
+
+def test_pinned_clients_survive_eviction():
+    async def scenario(registry):
+        server = registry.get("Bearer server", BASE_URL, pinned=True)
+        for token in ("Bearer a", "Bearer b", "Bearer c"):
+            registry.get(token, BASE_URL)
+        assert registry.get("Bearer server", BASE_URL) is server
+        assert [token for token, _ in registry._clients] == ["Bearer c", "Bearer server"]
+
+    run(scenario)
+
+
+def test_pinning_an_existing_client():
+    async def scenario(registry):
+        client = registry.get("Bearer a", BASE_URL)
+        assert registry.get("Bearer a", BASE_URL, pinned=True) is client
+        registry.get("Bearer b", BASE_URL)
+        registry.get("Bearer c", BASE_URL)
+        assert registry.get("Bearer a", BASE_URL) is client
+        return registry.stats()
+
+    stats = run(scenario)
+    assert (stats["pinned"], stats["evictions"]) == (1, 1)
+
+
+def test_evicted_client_is_closed_after_grace_period():
+    async def scenario(registry):
+        evicted = registry.get("Bearer a", BASE_URL)
+        registry.get("Bearer b", BASE_URL)
+        registry.get("Bearer c", BASE_URL)
+        # 宽限期内进行中的请求仍可使用连接池
+        assert not evicted.closed
+        await asyncio.sleep(0.05)
+        assert evicted.closed
+        # 再次请求该令牌时创建新客户端
+        assert registry.get("Bearer a", BASE_URL) is not evicted
+
+    run(scenario)
+
+
+def test_close_all_closes_every_client():
+    async def scenario(registry):
+        clients = [registry.get("Bearer a", BASE_URL, pinned=True), registry.get("Bearer b", BASE_URL)]
+        await registry.close_all()
+        assert all(client.closed for client in clients)
+        assert registry.stats()["size"] == registry.stats()["pinned"] == 0
+
+    run(scenario)
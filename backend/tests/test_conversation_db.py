@@ -0,0 +1,86 @@
+import asyncio
+import time
+
+import pytest
+
+from conversation_db import SQLiteConversationBackend
+from conversation_store import ConversationStore
+
+
+@pytest.fixture
+def backend(tmp_path):
+    backend = SQLiteConversationBackend(str(tmp_path / "conversations.db"))
+    yield backend
+    backend.close()
+
+
+def test_load_conversation_sees_queued_writes(backend):
+    now = time.time()
+    backend.upsert_conversation("c1", "app", now, now, {"title": "旧"})
+    assert backend.pending
+    row = backend.load_conversation("c1")
+    assert row["app_id"] == "app" and row["metadata"] == {"title": "旧"}
+
+    backend.flush()
+    backend.update_metadata("c1", {"title": "新"}, now + 1)
+    assert backend.load_conversation("c1")["metadata"] == {"title": "新"}
+
+    backend.delete_conversation("c1")
+    assert backend.load_conversation("c1") is None
+    backend.upsert_conversation("c1", "app", now, now + 2)
+    assert backend.load_conversation("c1")["last_used"] == now + 2
+
+
+def test_preload_restores_evicted_conversation(backend):
+    async def scenario():
+        store = ConversationStore(max_entries=1, backend=backend)
+        await store.start()
+        try:
+            store.put("c1", "app")
+            store.append_turn("c1", "问题", "回答")
+            store.put("c2", "app")  # 淘汰c1，其写入可能仍在排队
+            assert "c1" not in store
+            await store.preload("c1")
+            assert "c1" in store
+            record = store.peek("c1")
+            assert record.messages is not None and len(record.messages) == 2
+        finally:
+            await store.stop()
+
+    asyncio.run(scenario())
+
+
+def test_event_loop_never_reads_the_database(backend, monkeypatch):
+    store = ConversationStore(max_entries=1, backend=backend)
+    store.put("c1", "app")
+    store.append_turn("c1", "问题", "回答")
+    store.put("c2", "app")  # 淘汰c1
+    backend.flush()
+
+    def fail(*args):
+        raise AssertionError("在事件循环中读库")
+
+    async def scenario():
+        monkeypatch.setattr(backend, "load_conversation", fail)
+        monkeypatch.setattr(backend, "load_messages", fail)
+        # 未经call/preload的同步操作视为未命中
+        assert store.get("c1") is None and store.history("c1") is None
+        assert not store.append_turn("c1", "问题", "回答")
+        monkeypatch.undo()
+        await store.call('mark_history_stale', "c1")
+        assert store.peek("c1").metadata == {"history_stale": True}
+
+    asyncio.run(scenario())
+
+
+def test_purge_deletes_only_expired_messages(backend):
+    now = time.time()
+    backend.upsert_conversation("old", "app", now - 100, now - 100)
+    backend.upsert_conversation("new", "app", now, now)
+    for conversation_id in ("old", "new"):
+        backend.append_message(conversation_id, 1, "user", "问题", now)
+    backend.purge_expired(now - 50)
+    backend.flush()
+    assert backend.load_conversation("old") is None and backend.load_messages("old") == []
+    assert len(backend.load_messages("new")) == 1
+    assert backend.count_messages() == 1
@@ -0,0 +1,114 @@
+import asyncio
+
+import pytest
+
+import chat_api
+import conversation_pool
+from conversation_pool import ConversationPool
+from conversation_store import ConversationStore
+
+
+class StubClient:
+    def __init__(self):
+        self.created = 0
+        self.fail = False
+
+    async def create_conversation(self, app_id):
+        if self.fail:
+            raise ConnectionError("上游不可用")
+        self.created += 1
+        number = self.created
+        await asyncio.sleep(0)
+        return {"conversation_id": f"{app_id}-{number}"}
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(conversation_pool.time, "time", lambda: now[0])
+    return now
+
+
+async def settle(pool, app_id, size):
+    """等后台任务把池补到size"""
+    for _ in range(100):
+        if pool.stats()["available"][app_id] == size:
+            return
+        await asyncio.sleep(0.001)
+    raise AssertionError(pool.stats())
+
+
+def test_refills_only_at_low_watermark():
+    client = StubClient()
+    pool = ConversationPool(target_size=4, low_watermark=1, refill_interval=3600)
+
+    async def scenario():
+        await pool.start(lambda: client, ["app"])
+        await settle(pool, "app", 4)
+        taken = [pool.acquire("app")["conversation_id"] for _ in range(2)]
+        await asyncio.sleep(0.01)
+        assert pool.stats()["available"]["app"] == 2  # 高于低水位，不补充
+        taken.append(pool.acquire("app")["conversation_id"])
+        await settle(pool, "app", 4)
+        await pool.stop()
+        return taken
+
+    assert asyncio.run(scenario()) == ["app-1", "app-2", "app-3"]
+    assert client.created == 7
+    assert (pool.hits, pool.misses) == (3, 0)
+
+
+def test_expired_conversations_are_discarded(clock):
+    pool = ConversationPool(target_size=2, low_watermark=0, max_age=60)
+    pool.register("app")
+    pool._pools["app"].extend([(clock[0], {"conversation_id": "old"}), (clock[0] + 30, {"conversation_id": "new"})])
+
+    clock[0] += 61
+    assert pool.acquire("app") == {"conversation_id": "new"}
+    clock[0] += 30
+    assert pool.acquire("app") is None
+    assert (pool.hits, pool.misses, pool.expired) == (1, 1, 1)
+
+
+def test_max_age_never_exceeds_conversation_lifetime():
+    pool = ConversationPool(max_age=30 * 24 * 3600)
+    assert pool.max_age == conversation_pool.CONVERSATION_LIFETIME_SECONDS
+
+
+def test_failed_refill_waits_for_next_round():
+    client = StubClient()
+    client.fail = True
+    pool = ConversationPool(target_size=4, low_watermark=1, refill_interval=3600)
+
+    async def scenario():
+        await pool.start(lambda: client, ["app"])
+        await asyncio.sleep(0.01)
+        await pool.stop()
+
+    asyncio.run(scenario())
+    assert pool.refill_errors == 1 and pool.acquire("app") is None
+
+
+def test_unregistered_app_is_not_pooled():
+    pool = ConversationPool()
+    assert pool.acquire("other") is None
+    assert pool.misses == 0
+    disabled = ConversationPool(target_size=0)
+    disabled.register("app")
+    assert disabled.acquire("app") is None
+
+
+def test_new_conversation_takes_from_pool_for_server_token(monkeypatch):
+    pool = ConversationPool(target_size=1)
+    pool.register("app")
+    pool._pools["app"].append((conversation_pool.time.time(), {"conversation_id": "pooled"}))
+    monkeypatch.setattr(chat_api, "conversation_pool", pool)
+    monkeypatch.setattr(chat_api, "conversation_store", ConversationStore())
+    monkeypatch.setattr(chat_api, "QIANFAN_TOKEN", "server")
+    client = StubClient()
+
+    # 请求级令牌不能使用服务端令牌创建的对话
+    assert asyncio.run(chat_api.new_conversation(client, "app", "other"))["conversation_id"] == "app-1"
+    assert asyncio.run(chat_api.new_conversation(client, "app"))["conversation_id"] == "pooled"
+    assert asyncio.run(chat_api.new_conversation(client, "app"))["conversation_id"] == "app-2"
+    assert chat_api.conversation_store.peek("pooled") is not None
@@ -0,0 +1,84 @@
+import asyncio
+import time
+
+import pytest
+
+import conversation_store
+from conversation_db import SQLiteConversationState, connect
+from conversation_store import SharedConversationStore
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "shared.db")
+
+
+@pytest.fixture
+def workers(path):
+    """两个worker各自打开同一个SQLite文件"""
+    stores = [SharedConversationStore(SQLiteConversationState(path)) for _ in range(2)]
+    yield stores
+    for store in stores:
+        store.state.close()
+
+
+def test_writes_are_visible_to_other_workers(workers):
+    a, b = workers
+    a.put("c1", "app")
+    assert b.append_turn("c1", "问题", "回答", "m1")
+    assert a.history("c1")["messages"][-1]["message_id"] == "m1"
+    assert b.update("c1", {"title": "地震"})
+    assert a.peek("c1").metadata == {"title": "地震"}
+    assert a.delete("c1")
+    assert b.get("c1") is None and not b.append_turn("c1", "问题", "回答")
+
+
+def test_list_cursor_with_equal_last_used(workers, monkeypatch):
+    a, b = workers
+    monkeypatch.setattr(conversation_store.time, "time", lambda: 1000.0)
+    for conversation_id in ("c1", "c2", "c3", "c4", "c5"):
+        a.put(conversation_id, "app")
+
+    seen = []
+    before = None
+    while True:
+        page = b.list(2, before=before)
+        if not page:
+            break
+        seen += [conversation_id for conversation_id, _ in page]
+        before = b.recency_key(page[-1][0])
+    assert seen == ["c5", "c4", "c3", "c2", "c1"]
+
+
+def test_state_errors_fall_back_to_defaults(workers):
+    a, _ = workers
+    a.put("c1", "app")
+    a.state.close()  # 之后每个操作都抛出sqlite3.ProgrammingError
+    assert a.get("c1") is None
+    assert a.history("c1") is None
+    assert not a.append_turn("c1", "问题", "回答")
+    assert not a.update("c1", {"title": "地震"})
+    assert a.list() == []
+    assert len(a) == 0
+    assert a.counts() == {"conversations": 0, "messages": 0}
+    assert a.errors == 7
+
+
+def test_call_does_not_block_the_event_loop(path, workers):
+    a, _ = workers
+    a.put("c1", "app")
+    other = connect(path)  # 另一个worker持有写锁
+
+    async def scenario():
+        other.execute("BEGIN IMMEDIATE")
+        # 释放写锁需要事件循环继续运行；在事件循环上等锁会一直等到busy_timeout并失败
+        asyncio.get_running_loop().call_later(0.2, other.execute, "COMMIT")
+        started = time.perf_counter()
+        assert await a.call('append_turn', "c1", "问题", "回答")
+        return time.perf_counter() - started
+
+    try:
+        assert asyncio.run(scenario()) < 2
+    finally:
+        other.close()
+    assert a.history("c1")["total"] == 2
@@ -0,0 +1,131 @@
+import asyncio
+import itertools
+
+import pytest
+
+import conversation_store
+from conversation_db import SQLiteConversationBackend, SQLiteConversationState
+from conversation_store import ConversationStore, SharedConversationStore
+from utils import ConversationManager
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """每次读取前进一秒的时钟，保证最后使用时间各不相同"""
+    ticks = itertools.count(1000)
+    now = {"value": 1000.0}
+
+    def time():
+        now["value"] = float(next(ticks))
+        return now["value"]
+
+    monkeypatch.setattr(conversation_store.time, "time", time)
+    return now
+
+
+def ids(store):
+    return [conversation_id for conversation_id, _ in store.list(limit=10)]
+
+
+def test_least_recently_used_is_evicted_first(clock):
+    store = ConversationStore(max_entries=3)
+    for conversation_id in "abc":
+        store.put(conversation_id, "app")
+    store.get("a")
+    store.append_turn("b", "问题", "回答")
+    store.put("d", "app")
+    assert "c" not in store
+    assert ids(store) == ["d", "b", "a"]
+    store.update("a", {"title": "地质"})
+    store.put("e", "app")
+    assert "b" not in store
+    assert ids(store) == ["e", "a", "d"]
+    assert store.evictions == 2
+
+
+def test_peek_does_not_refresh_recency(clock):
+    store = ConversationStore(max_entries=2)
+    store.put("a", "app")
+    store.put("b", "app")
+    store.peek("a")
+    store.put("c", "app")
+    assert ids(store) == ["c", "b"]
+
+
+def test_byte_limit_evicts_oldest(clock):
+    store = ConversationStore(max_bytes=7_000)  # 每个对话约3.3KB，只能容纳两个
+    for conversation_id in ("a", "b", "c"):
+        store.put(conversation_id, "app")
+        store.append_turn(conversation_id, "问题", "答" * 1000)
+    assert ids(store) == ["c", "b"]
+    assert store.total_bytes <= store.max_bytes
+
+
+def test_expired_conversations_are_swept_in_recency_order(clock):
+    store = ConversationStore(ttl=100)
+    for conversation_id in "abc":
+        store.put(conversation_id, "app")
+    store.get("a")
+    # b和c已过期，a在c之后被使用过
+    assert store.sweep_expired(now=store.peek("c").last_used + 100.5) == 2
+    assert ids(store) == ["a"]
+    assert store.expirations == 2
+
+
+@pytest.fixture(params=["local", "shared"])
+def manager(request, tmp_path):
+    if request.param == "local":
+        store = ConversationStore()
+    else:
+        store = SharedConversationStore(SQLiteConversationState(str(tmp_path / "shared.db")))
+    yield ConversationManager(store)
+    if request.param == "shared":
+        store.state.close()
+
+
+def test_keyset_paging_across_concurrent_touches(clock, manager):
+    store = manager.store
+    for conversation_id in "abcdef":
+        store.put(conversation_id, "app")
+
+    async def page(cursor):
+        result = await manager.list_page(2, cursor, with_turns=True)
+        return [item['conversation_id'] for item in result['conversations']], result['next_cursor']
+
+    async def scenario():
+        pages = []
+        ids, cursor = await page(None)
+        pages.append(ids)
+        # 翻页期间：已列出的对话被使用、产生新对话，都排到游标之前
+        store.append_turn("e", "问题", "回答")
+        store.put("g", "app")
+        while cursor:
+            ids, cursor = await page(cursor)
+            pages.append(ids)
+        return pages
+
+    assert asyncio.run(scenario()) == [["f", "e"], ["d", "c"], ["b", "a"]]
+
+
+def test_list_page_loads_missing_messages_in_one_query(tmp_path, monkeypatch):
+    path = str(tmp_path / "conversations.db")
+    writer = ConversationStore(backend=SQLiteConversationBackend(path))
+    for conversation_id in "abc":
+        writer.put(conversation_id, "app")
+        writer.append_turn(conversation_id, f"问题{conversation_id}", f"回答{conversation_id}")
+    writer.backend.close()
+
+    backend = SQLiteConversationBackend(path)
+    store = ConversationStore(backend=backend)
+    for conversation_id in "abc":
+        store.get(conversation_id)  # 脚本中同步载入对话，消息尚未载入
+    queries = []
+    load_many = backend.load_messages_many
+    monkeypatch.setattr(backend, "load_messages", lambda *args: pytest.fail("逐个读取消息"))
+    monkeypatch.setattr(backend, "load_messages_many", lambda ids: queries.append(ids) or load_many(ids))
+
+    page = asyncio.run(ConversationManager(store).list_page(10, with_turns=True))
+    assert len(queries) == 1 and sorted(queries[0]) == ["a", "b", "c"]
+    assert {item['conversation_id']: (item['user_message'], item['message_count'])
+            for item in page['conversations']} == {"a": ("问题a", 2), "b": ("问题b", 2), "c": ("问题c", 2)}
+    backend.close()
@@ -0,0 +1,60 @@
+import pytest
+
+from bench_faq_ann import OUT_OF_DOMAIN, PARAPHRASES
+from faq_engine import FAQEngine
+
+
+@pytest.fixture(scope="module")
+def semantic_engine():
+    return FAQEngine(semantic=True)
+
+
+def test_semantic_matching_is_off_by_default():
+    engine = FAQEngine()
+    assert engine.semantic is False
+    assert engine.vector_index is None
+    assert engine.match("石油怎么来的") is None
+
+
+def test_out_of_domain_questions_never_hit(semantic_engine):
+    false_hits = {query: match.pair.question for query in OUT_OF_DOMAIN
+                  if (match := semantic_engine.lookup(query)) is not None}
+    assert false_hits == {}
+
+
+def test_related_but_uncovered_question_does_not_borrow_an_answer(semantic_engine):
+    # 知识库只有“什么是地震波？”，不能用它回答地震成因
+    assert semantic_engine.lookup("地震是怎么产生的") is None
+
+
+def test_paraphrase_hits_are_always_the_labelled_answer(semantic_engine):
+    wrong = {query: match.pair.question for query, expected in PARAPHRASES
+             if (match := semantic_engine.lookup(query)) is not None and expected not in match.pair.question}
+    assert wrong == {}
+
+
+def test_paraphrase_from_request(semantic_engine):
+    # “板块为什么会动”与地幔对流问题的相似度低于安全阈值：可以不命中，但不能给出别的答案
+    match = semantic_engine.lookup("板块为什么会动")
+    assert match is None or "地幔对流" in match.pair.question
+    match = semantic_engine.lookup("石油怎么来的")
+    assert match is not None and match.method == "semantic" and "石油" in match.pair.question
+
+
+def test_instruction_suffix_is_not_answered_locally():
+    engine = FAQEngine()
+    question = "为什么地中海地区地震活动如此频繁？"
+    assert engine.lookup(question).pair.question == question
+    # 相似度仍在阈值以上（约0.82），但整理好的答案满足不了附加的要求
+    assert engine.index.search(question + "用一句话", top_k=1)[0][0] >= engine.threshold
+    assert engine.lookup(question + "用一句话") is None
+    assert engine.lookup("请问" + question + "详细说明") is None
+
+
+def test_question_word_rewrites_still_hit():
+    engine = FAQEngine()
+    # 换了疑问词只多出一两个字符，仍然命中
+    for query, expected in (("为何地中海地区地震活动如此频繁", "地中海"), ("啥是盖亚假说", "盖亚假说"),
+                            ("什么是地震波", "地震波")):
+        match = engine.lookup(query)
+        assert match is not None and expected in match.pair.question, query
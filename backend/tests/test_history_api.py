@@ -0,0 +1,120 @@
+import asyncio
+import json
+
+import pytest
+from starlette.requests import Request
+
+import chat_api
+from conversation_store import ConversationStore
+
+
+class StubClient:
+    """上游历史接口，返回千帆格式（content为分块列表）"""
+
+    def __init__(self, turns):
+        self.turns = turns
+        self.calls = 0
+
+    async def get_conversation_history(self, app_id, conversation_id):
+        self.calls += 1
+        messages = []
+        for index, (query, answer) in enumerate(self.turns, start=1):
+            messages.append({"role": "user", "content": query})
+            messages.append({"role": "assistant", "message_id": f"up-{index}",
+                             "content": [{"content_type": "text", "outputs": {"text": answer}}]})
+        return {"messages": messages}
+
+
+@pytest.fixture
+def store(monkeypatch):
+    store = ConversationStore()
+    monkeypatch.setattr(chat_api, "conversation_store", store)
+    return store
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    client = StubClient([("上游问题1", "上游回答1"), ("上游问题2", "上游回答2")])
+    monkeypatch.setattr(chat_api, "get_qianfan_client", lambda token=None: client)
+    return client
+
+
+def fetch(conversation_id, if_none_match=None, **params):
+    headers = [(b"if-none-match", if_none_match.encode())] if if_none_match else []
+    request = Request({"type": "http", "method": "GET", "headers": headers})
+    response = asyncio.run(chat_api.get_conversation_history(
+        conversation_id, request, app_id="app", token="token", cursor=params.get("cursor", 0),
+        limit=params.get("limit", 50), since=params.get("since")))
+    body = json.loads(response.body) if response.body else None
+    return response, body and body["data"]
+
+
+def contents(data):
+    return [message["content"] for message in data["messages"]]
+
+
+def record_turns(store, conversation_id, count):
+    store.put(conversation_id, "app")
+    for index in range(1, count + 1):
+        store.append_turn(conversation_id, f"问题{index}", f"回答{index}", f"m{index}")
+
+
+def test_cursor_paging_is_served_locally(store, upstream):
+    record_turns(store, "c1", 3)
+    _, first = fetch("c1", limit=4)
+    assert first["source"] == "local"
+    assert contents(first) == ["问题1", "回答1", "问题2", "回答2"]
+    assert (first["next_cursor"], first["has_more"], first["total"]) == (4, True, 6)
+    _, second = fetch("c1", cursor=first["next_cursor"], limit=4)
+    assert contents(second) == ["问题3", "回答3"]
+    assert (second["next_cursor"], second["has_more"]) == (None, False)
+    assert upstream.calls == 0
+
+
+def test_since_returns_only_newer_messages(store, upstream):
+    record_turns(store, "c1", 2)
+    _, data = fetch("c1", since="m1")
+    assert contents(data) == ["问题2", "回答2"] and not data["reset"]
+    _, data = fetch("c1", since="2")  # 也可以按序号
+    assert contents(data) == ["问题2", "回答2"]
+    _, data = fetch("c1", since="m2")
+    assert data["messages"] == [] and not data["reset"]
+    _, data = fetch("c1", since="未知的消息")
+    assert data["reset"] and data["total"] == 4 and contents(data)[0] == "问题1"
+
+
+def test_unknown_conversation_is_backfilled_from_upstream(store, upstream):
+    _, data = fetch("c2")
+    assert data["source"] == "upstream"
+    assert contents(data) == ["上游问题1", "上游回答1", "上游问题2", "上游回答2"]
+    _, data = fetch("c2", since="up-1")
+    assert data["source"] == "local" and contents(data) == ["上游问题2", "上游回答2"]
+    assert upstream.calls == 1
+
+
+def test_stale_history_is_replaced_from_upstream(store, upstream):
+    record_turns(store, "c1", 1)
+    store.mark_history_stale("c1")  # 流式回答中断，本地缺少上游已记录的内容
+    _, data = fetch("c1")
+    assert data["source"] == "upstream" and data["total"] == 4
+    assert "history_stale" not in store.peek("c1").metadata
+    _, data = fetch("c1")
+    assert data["source"] == "local" and upstream.calls == 1
+
+
+def test_etag_is_stable_and_revalidates(store, upstream):
+    record_turns(store, "c1", 1)
+    response, _ = fetch("c1")
+    etag = response.headers["etag"]
+    assert fetch("c1")[0].headers["etag"] == etag
+    assert fetch("c1", limit=1)[0].headers["etag"] != etag
+
+    for header in (etag, f"W/{etag}", f'"other", {etag}', "*"):
+        not_modified, body = fetch("c1", if_none_match=header)
+        assert not_modified.status_code == 304 and body is None
+        assert not_modified.headers["etag"] == etag
+
+    store.append_turn("c1", "问题2", "回答2", "m2")
+    changed, data = fetch("c1", if_none_match=etag)
+    assert changed.status_code == 200 and data["total"] == 4
+    assert changed.headers["etag"] != etag
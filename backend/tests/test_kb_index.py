@@ -0,0 +1,50 @@
+from kb_index import MappedBM25Index, index_path, open_index, save_index
+from kb_search import BM25Index, Passage
+
+PASSAGES = [
+    Passage("a.md#0", "a.md", "什么是板块？", "板块构造学说认为岩石圈分成若干板块"),
+    Passage("a.md#1", "a.md", "什么是板块？", "地震多发生在板块边界"),
+    Passage("b.md#0", "b.md", "火山", "火山喷发与岩浆活动有关"),
+    Passage("c.pdf#0", "c.pdf", "c", "地中海地区位于欧亚板块与非洲板块交界处", page=3, offset=0),
+    Passage("c.pdf#1", "c.pdf", "c", "季风气候的成因是海陆热力性质差异", page=3, offset=120),
+]
+QUERIES = ["板块边界地震", "火山岩浆", "地中海", "季风海陆", "冰川"]
+
+
+def results(index, query):
+    return [(round(score, 5), passage.to_dict()) for score, passage in index.search(query, top_k=3)]
+
+
+def ranked(rows):
+    return [[(round(score, 5), passage.id) for score, passage in row] for row in rows]
+
+
+def test_mapped_index_matches_in_memory_index(tmp_path):
+    index = BM25Index(PASSAGES)
+    save_index(index, index_path(str(tmp_path), "k1"), "k1", passage_chars=400)
+    mapped = open_index(str(tmp_path), "k1")
+    assert isinstance(mapped, MappedBM25Index)
+
+    for query in QUERIES:
+        assert results(mapped, query) == results(index, query)
+    assert ranked(mapped.search_batch(QUERIES, 3)) == ranked(index.search_batch(QUERIES, 3))
+    assert [mapped.passage(row).to_dict() for row in range(len(mapped))] == [p.to_dict() for p in PASSAGES]
+    assert mapped.row_sources() == index.row_sources()
+
+
+def test_mapped_index_can_be_updated(tmp_path):
+    index = BM25Index(PASSAGES)
+    save_index(index, index_path(str(tmp_path), "k1"), "k1", passage_chars=400)
+    added = [Passage("b.md#0", "b.md", "冰川", "冰川侵蚀形成U形谷")]
+    updated = open_index(str(tmp_path), "k1").updated(["b.md"], added)
+    expected = index.updated(["b.md"], added)
+    for query in QUERIES:
+        assert results(updated, query) == results(expected, query)
+
+
+def test_missing_or_corrupt_index_is_ignored(tmp_path):
+    assert open_index(str(tmp_path), "missing") is None
+    path = index_path(str(tmp_path), "k1")
+    save_index(BM25Index(PASSAGES), path, "k1", passage_chars=400)
+    (tmp_path / "index-k1" / "data.npy").unlink()
+    assert open_index(str(tmp_path), "k1") is None
@@ -0,0 +1,89 @@
+import os
+
+import pytest
+
+import kb_ingest
+from kb_ingest import PDFIngestor
+
+pytestmark = pytest.mark.skipif(kb_ingest.pypdf is None, reason="需要pypdf")
+
+
+def write_pdf(path, text):
+    """写一个只有一页、一行ASCII文字的最小PDF"""
+    stream = f"BT /F1 12 Tf 72 720 Td ({text}) Tj ET".encode()
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+        b"/Resources << /Font << /F1 4 0 R >> >> /Contents 5 0 R >>",
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+        b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream),
+    ]
+    data = b"%PDF-1.4\n"
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(data))
+        data += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref = len(data)
+    data += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    data += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    data += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    path.write_bytes(data)
+
+
+@pytest.fixture
+def ingestor(tmp_path):
+    directory = tmp_path / "kb"
+    directory.mkdir()
+    write_pdf(directory / "a.pdf", "Plate tectonics")
+    write_pdf(directory / "b.pdf", "Monsoon climate")
+    return PDFIngestor(str(directory), str(tmp_path / "cache"), workers=1)
+
+
+def pages(report):
+    return {document.source: document.pages for document in report.documents}
+
+
+def test_unchanged_and_touched_files_reuse_the_manifest(ingestor, monkeypatch):
+    first = ingestor.ingest()
+    assert first.extracted == ["a.pdf", "b.pdf"]
+    assert pages(first) == {"a.pdf": ["Plate tectonics"], "b.pdf": ["Monsoon climate"]}
+
+    def no_extract(paths):
+        raise AssertionError(f"不应重新抽取: {paths}")
+
+    monkeypatch.setattr(ingestor, "_extract", no_extract)
+    second = ingestor.ingest()
+    assert (second.reused, second.extracted) == (["a.pdf", "b.pdf"], [])
+    assert pages(second) == pages(first)
+
+    # 只改修改时间：重新计算哈希，内容相同时仍复用缓存，manifest记录新的修改时间
+    path = os.path.join(ingestor.directory, "a.pdf")
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    touched = ingestor.ingest()
+    assert touched.reused == ["a.pdf", "b.pdf"] and touched.extracted == []
+    assert ingestor.load_manifest()["a.pdf"]["mtime_ns"] == stat.st_mtime_ns + 10 ** 9
+
+
+def test_sources_limit_documents_but_keep_manifest(ingestor):
+    ingestor.ingest()
+    report = ingestor.ingest(sources={"b.pdf"})
+    assert list(pages(report)) == ["b.pdf"]
+    assert set(ingestor.load_manifest()) == {"a.pdf", "b.pdf"}
+
+
+def test_changed_and_deleted_files(ingestor, tmp_path):
+    ingestor.ingest()
+    manifest = ingestor.load_manifest()
+    write_pdf(tmp_path / "kb" / "a.pdf", "Glacial erosion")
+    os.remove(tmp_path / "kb" / "b.pdf")
+
+    report = ingestor.ingest()
+    assert (report.extracted, report.removed) == (["a.pdf"], ["b.pdf"])
+    assert pages(report) == {"a.pdf": ["Glacial erosion"]}
+    assert set(ingestor.load_manifest()) == {"a.pdf"}
+    # 旧内容和已删除文件的页面缓存都被清理
+    assert sorted(os.listdir(ingestor.cache_dir)) == sorted(
+        ["manifest.json", f"pages-{ingestor.load_manifest()['a.pdf']['sha256']}.json"])
+    assert manifest["a.pdf"]["sha256"] != ingestor.load_manifest()["a.pdf"]["sha256"]
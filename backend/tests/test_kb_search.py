@@ -0,0 +1,57 @@
+import pytest
+
+from kb_search import BM25Index, KnowledgeBase, Passage
+
+
+def passages(source, texts):
+    return [Passage(f"{source}#{number}", source, f"{source}标题", text) for number, text in enumerate(texts)]
+
+
+CORPUS = {
+    "a.md": ["板块构造学说认为岩石圈分成若干板块", "地震多发生在板块边界"],
+    "b.md": ["火山喷发与岩浆活动有关", "地中海地区位于欧亚板块与非洲板块交界处"],
+    "c.pdf": ["季风气候的成因是海陆热力性质差异", "寒武纪生命大爆发"],
+}
+QUERIES = ["板块边界地震", "火山岩浆", "地中海", "季风", "寒武纪冰川", "海陆"]
+
+
+def scores(index):
+    """每个查询下各段落的得分，与段落顺序无关"""
+    return {query: {passage.id: round(score, 5) for score, passage in index.search(query, top_k=100)}
+            for query in QUERIES}
+
+
+def rebuild(corpus):
+    return BM25Index([passage for source, texts in corpus.items() for passage in passages(source, texts)])
+
+
+@pytest.mark.parametrize("changes", [
+    {"b.md": ["火山喷发与岩浆活动有关", "冰川侵蚀形成U形谷"]},  # 修改，引入新词项
+    {"c.pdf": None},  # 删除，部分词项不再出现
+    {"d.md": ["冰川侵蚀形成U形谷"]},  # 新增
+    {"a.md": None, "d.md": ["板块边界地震频繁"]},
+])
+def test_updated_index_scores_match_full_rebuild(changes):
+    index = rebuild(CORPUS)
+    corpus = {**CORPUS, **changes}
+    corpus = {source: texts for source, texts in corpus.items() if texts is not None}
+    added = [passage for source, texts in changes.items() if texts for passage in passages(source, texts)]
+
+    updated = index.updated(list(changes), added)
+    expected = rebuild(corpus)
+    assert scores(updated) == scores(expected)
+    assert list(updated.vocabulary) == list(expected.vocabulary)
+    assert updated.avg_length == pytest.approx(expected.avg_length)
+    assert len(index) == 6  # 原索引不变
+
+
+def test_knowledge_base_update_rereads_changed_files(tmp_path):
+    (tmp_path / "a.md").write_text("**问：什么是板块？**\n答：岩石圈被分成许多块。\n", encoding="utf-8")
+    kb = KnowledgeBase(str(tmp_path), include_pdfs=False, index_dir=None)
+    kb.load()
+    (tmp_path / "a.md").write_text("**问：什么是冰川？**\n答：多年积雪形成的冰体。\n", encoding="utf-8")
+    (tmp_path / "b.md").write_text("**问：什么是地震？**\n答：地壳快速释放能量产生的振动。\n", encoding="utf-8")
+
+    kb.update(["a.md", "b.md"])
+    assert scores(kb.index) == scores(kb.build())
+    assert kb.search("板块") == []
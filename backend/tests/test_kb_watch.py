@@ -0,0 +1,54 @@
+import pytest
+
+from faq_engine import FAQEngine
+from kb_search import KnowledgeBase
+from kb_watch import KnowledgeBaseWatcher
+
+
+def write_qa(path, question, answer):
+    path.write_text(f"**问：{question}**\n答：{answer}\n", encoding="utf-8")
+
+
+@pytest.fixture
+def watcher(tmp_path, monkeypatch):
+    write_qa(tmp_path / "a.md", "什么是板块？", "岩石圈被分成许多块。")
+    write_qa(tmp_path / "b.md", "什么是地震？", "地壳快速释放能量产生的振动。")
+    kb = KnowledgeBase(str(tmp_path), include_pdfs=False, index_dir=None)
+    kb.load()
+    faq = FAQEngine(str(tmp_path))
+    watcher = KnowledgeBaseWatcher(kb, faq, mode="poll")
+    watcher.snapshot = {name: (0, 0) for name in ("a.md", "b.md")}  # 两个文件都视为已修改
+
+    broken = {"b.md"}
+    update = kb.update
+
+    def flaky_update(sources):
+        if broken & set(sources):
+            raise OSError("读取失败")
+        return update(sources)
+
+    monkeypatch.setattr(kb, "update", flaky_update)
+    watcher.broken = broken
+    return watcher
+
+
+def test_failed_file_is_kept_out_of_snapshot_and_retried(watcher):
+    assert watcher.apply({"a.md", "b.md"}) == {"a.md"}
+    assert watcher.snapshot["a.md"] != (0, 0)
+    assert watcher.snapshot["b.md"] == (0, 0)
+    assert watcher._failed == {"b.md"}
+    assert watcher.errors == 1 and "b.md" in watcher.last_update["error"]
+
+    watcher.broken.clear()
+    assert watcher.apply(watcher._failed) == {"b.md"}
+    assert watcher._failed == set()
+    assert watcher.snapshot["b.md"] != (0, 0)
+    assert watcher.faq.lookup("什么是地震？") is not None
+
+
+def test_unrelated_changes_are_not_absorbed(watcher):
+    watcher.broken.clear()
+    assert watcher.apply({"a.md"}) == {"a.md"}
+    # b.md不在本批次中，下次处理时仍能发现它的变化
+    assert watcher.snapshot["b.md"] == (0, 0)
+    assert watcher.apply({"b.md"}) == {"b.md"}
@@ -0,0 +1,40 @@
+import pytest
+
+from faq_engine import DEFAULT_KB_DIR, FAQEngine, load_qa_pairs
+from landmark_facts import DEFAULT_SCRIPT_PATH, link_landmarks, parse_landmarks
+
+
+@pytest.fixture(scope="module")
+def links():
+    with open(DEFAULT_SCRIPT_PATH, encoding="utf-8") as f:
+        landmarks = parse_landmarks(f.read())
+    # 开启语义匹配也不能影响关联结果
+    links = link_landmarks(landmarks, load_qa_pairs(DEFAULT_KB_DIR), FAQEngine(semantic=True))
+    return {name: [(pair.question, link) for pair, link, _ in linked] for name, linked in links.items()}
+
+
+def test_longest_landmark_name_wins(links):
+    assert links["地中海"] == [
+        ("地中海作为半封闭海域有什么海洋学特征？", "name"),
+        ("地中海如何影响北大西洋的深层环流？", "name"),
+    ]
+    assert links["地中海俯冲区"] == [
+        ("为什么地中海地区地震活动如此频繁？", "name"),
+        ("地中海俯冲区如何展示大陆碰撞过程？", "name"),
+    ]
+
+
+def test_question_naming_two_landmarks_belongs_to_both(links):
+    assert ("科罗拉多高原如何形成了大峡谷？", "name") in links["大峡谷"]
+    assert ("科罗拉多高原如何形成了大峡谷？", "name") in links["科罗拉多高原"]
+
+
+def test_names_and_aliases(links):
+    assert links["冰岛裂谷"] == [("冰岛裂谷有什么独特之处？", "name"), ("冰岛裂谷展现了哪些地质现象？", "name")]
+    assert links["玻利维亚盐沼"] == [("乌尤尼盐沼是如何形成的？", "name"),
+                                ("乌尤尼盐沼有什么独特景观和资源价值？", "name")]
+
+
+def test_prompt_links_are_lexical_only(links):
+    # “冰川如何塑造地形？”与侵蚀作用问题只是语义相近
+    assert links["瓦特纳冰川"] == []
@@ -0,0 +1,41 @@
+import asyncio
+
+import qianfan_client
+from qianfan_client import QianfanClient, close_shared_session, create_session, get_shared_session
+
+
+def test_shared_session_is_reused_until_closed():
+    async def scenario():
+        first = get_shared_session()
+        assert get_shared_session() is first
+        client = QianfanClient("Bearer a")
+        assert client.session is first and not client.closed
+
+        # 客户端不持有共享会话，关闭客户端不影响其他请求
+        await client.close()
+        assert not first.closed and client.session is first
+
+        await close_shared_session()
+        assert first.closed and qianfan_client._shared_session is None
+        # 关闭后（如测试或重启生命周期）再次使用时重新创建
+        second = get_shared_session()
+        assert second is not first and client.session is second
+        await close_shared_session()
+        await close_shared_session()  # 重复关闭无副作用
+
+    asyncio.run(scenario())
+
+
+def test_owned_session_is_closed_with_the_client():
+    async def scenario():
+        session = create_session(limit=4, limit_per_host=2)
+        client = QianfanClient("Bearer a", session=session)
+        assert client.session is session
+        assert (session.connector.limit, session.connector.limit_per_host) == (4, 2)
+        await client.close()
+        assert session.closed and client.closed
+        # 自有会话关闭后回退到共享会话，不会在已关闭的会话上发请求
+        assert client.session is get_shared_session()
+        await close_shared_session()
+
+    asyncio.run(scenario())
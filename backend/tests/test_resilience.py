@@ -0,0 +1,128 @@
+import asyncio
+
+import aiohttp
+import pytest
+
+import resilience
+from qianfan_client import QianfanClient
+from resilience import CircuitBreaker, CircuitOpenError, RetryPolicy, call_with_resilience
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(resilience.time, "monotonic", lambda: now[0])
+    return now
+
+
+def server_error(status=500):
+    return aiohttp.ClientResponseError(None, (), status=status)
+
+
+def test_backoff_stays_within_exponential_ceiling():
+    policy = RetryPolicy(max_attempts=5, base_delay=0.5, max_delay=3.0)
+    for attempt, ceiling in ((1, 0.5), (2, 1.0), (3, 2.0), (4, 3.0), (10, 3.0)):
+        delays = [policy.backoff(attempt) for _ in range(200)]
+        assert all(0 <= delay <= ceiling for delay in delays)
+        assert max(delays) > ceiling / 2  # 全抖动：在整个区间内取值
+    assert RetryPolicy(max_attempts=0).max_attempts == 1
+
+
+def test_breaker_opens_probes_and_closes(clock):
+    breaker = CircuitBreaker("runs", failure_threshold=2, recovery_timeout=30)
+    for _ in range(2):
+        breaker.before_call()
+        breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    clock[0] += 30
+    breaker.before_call()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()  # 只放行一个探测请求
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.snapshot()["rejected"] == 2
+
+
+def test_failed_probe_reopens(clock):
+    breaker = CircuitBreaker("runs", failure_threshold=1, recovery_timeout=30)
+    breaker.before_call()
+    breaker.record_failure()
+    clock[0] += 30
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN and breaker.retry_after() == 30
+
+
+def run(operation, idempotent):
+    """返回调用次数和最终异常"""
+    calls = []
+
+    async def attempt():
+        calls.append(1)
+        return await operation()
+
+    breaker = CircuitBreaker("test", failure_threshold=100)
+    try:
+        asyncio.run(call_with_resilience(attempt, breaker, RetryPolicy(3, base_delay=0), idempotent))
+    except Exception as e:
+        return len(calls), e
+    return len(calls), None
+
+
+@pytest.mark.parametrize("error", [
+    server_error(500),
+    server_error(502),
+    aiohttp.ServerDisconnectedError(),
+    asyncio.TimeoutError(),
+])
+def test_non_idempotent_runs_are_not_retried_after_reaching_upstream(error):
+    async def operation():
+        raise error
+
+    assert run(operation, idempotent=False) == (1, error)
+    assert run(operation, idempotent=True)[0] == 3
+
+
+@pytest.mark.parametrize("error", [server_error(429), server_error(503)])
+def test_non_idempotent_retries_when_upstream_did_not_process(error):
+    async def operation():
+        raise error
+
+    assert run(operation, idempotent=False) == (3, error)
+
+
+class FakeContent:
+    async def iter_any(self):
+        yield 'data: {"answer": "板块"}\n\n'.encode()
+        raise aiohttp.ClientPayloadError("断流")
+
+
+class FakeResponse:
+    status = 200
+    content = FakeContent()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+class FakeSession:
+    closed = False
+
+    def post(self, url, **kwargs):
+        return FakeResponse()
+
+
+def test_broken_non_stream_response_counts_as_failure():
+    base_url = "http://broken-stream.test"
+    client = QianfanClient("Bearer x", base_url, session=FakeSession())
+    with pytest.raises(aiohttp.ClientPayloadError):
+        asyncio.run(client.send_message("app", "c1", "问题", stream=True))
+    breaker = resilience.get_circuit_breaker(base_url, "runs")
+    assert (breaker.total_failures, breaker.total_successes) == (1, 0)
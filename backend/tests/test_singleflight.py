@@ -0,0 +1,106 @@
+import asyncio
+
+import pytest
+
+from singleflight import SingleFlight
+
+
+def test_followers_share_one_upstream_call():
+    flight = SingleFlight()
+    calls = []
+
+    async def operation():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return {"answer": "板块"}
+
+    async def scenario():
+        return await asyncio.gather(*(flight.do("key", operation) for _ in range(5)))
+
+    results = asyncio.run(scenario())
+    assert len(calls) == 1
+    assert all(result is results[0] for result in results)
+    assert flight.stats()["coalesced_calls"] == 4 and not flight.in_flight("key")
+
+
+def test_exception_reaches_every_waiter():
+    flight = SingleFlight()
+
+    async def operation():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("上游失败")
+
+    async def scenario():
+        results = await asyncio.gather(*(flight.do("key", operation) for _ in range(3)),
+                                       return_exceptions=True)
+        # 失败后键被释放，下一次调用重新请求上游
+        assert not flight.in_flight("key")
+        return results
+
+    results = asyncio.run(scenario())
+    assert [type(result) for result in results] == [RuntimeError] * 3
+
+
+@pytest.mark.parametrize("cancelled", [0, 1])  # 取消发起者或跟随者
+def test_cancelled_waiter_does_not_cancel_the_call(cancelled):
+    flight = SingleFlight()
+    finished = []
+
+    async def operation():
+        await asyncio.sleep(0.02)
+        finished.append(1)
+        return "答案"
+
+    async def scenario():
+        waiters = [asyncio.ensure_future(flight.do("key", operation)) for _ in range(2)]
+        await asyncio.sleep(0.005)
+        waiters[cancelled].cancel()
+        remaining = waiters[1 - cancelled]
+        assert await remaining == "答案"
+        with pytest.raises(asyncio.CancelledError):
+            await waiters[cancelled]
+
+    asyncio.run(scenario())
+    assert finished == [1]
+
+
+def test_late_stream_subscriber_replays_from_first_frame():
+    flight = SingleFlight()
+    started = []
+
+    async def source():
+        started.append(1)
+        for frame in ("帧1", "帧2", "帧3"):
+            yield frame
+            await asyncio.sleep(0.01)
+
+    async def scenario():
+        early = flight.stream("key", source)
+        received = [await early.__anext__()]
+        await asyncio.sleep(0.015)  # 上游已推送到第二帧
+        late = flight.stream("key", source)
+        late_frames = [frame async for frame in late]
+        received += [frame async for frame in early]
+        return received, late_frames
+
+    received, late_frames = asyncio.run(scenario())
+    assert received == late_frames == ["帧1", "帧2", "帧3"]
+    assert started == [1]
+    assert flight.stats()["coalesced_streams"] == 1 and not flight.in_flight("key")
+
+
+def test_stream_error_reaches_subscribers_after_buffered_frames():
+    flight = SingleFlight()
+
+    async def source():
+        yield "帧1"
+        raise RuntimeError("断流")
+
+    async def scenario():
+        frames = []
+        with pytest.raises(RuntimeError):
+            async for frame in flight.stream("key", source):
+                frames.append(frame)
+        return frames
+
+    assert asyncio.run(scenario()) == ["帧1"]
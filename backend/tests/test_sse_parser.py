@@ -0,0 +1,70 @@
+import asyncio
+
+import pytest
+
+from sse_parser import SSEParser, aiter_json
+
+STREAM = (
+    ": 心跳\r\n"
+    "event: message\r\n"
+    "id: 1\r\n"
+    'data: {"answer": "板块"}\r\n'
+    "\r\n"
+    'data: {"answer": "构造",\n'
+    'data:  "is_completion": false}\n'
+    "\n"
+    "retry: 3000\r"
+    'data: {"answer": "学说"}\r'
+    "\r"
+    "data: [DONE]\n"
+    "\n"
+).encode("utf-8")
+
+
+def parse(chunks):
+    parser = SSEParser()
+    events = [event for chunk in chunks for event in parser.feed(chunk)]
+    events += parser.flush()
+    return [(event.event, event.id, event.retry, event.data) for event in events]
+
+
+EXPECTED = parse([STREAM])
+
+
+def test_whole_stream():
+    assert EXPECTED == [
+        ("message", "1", None, '{"answer": "板块"}'.encode()),
+        ("message", "1", None, '{"answer": "构造",\n "is_completion": false}'.encode()),
+        ("message", "1", 3000, '{"answer": "学说"}'.encode()),
+        ("message", "1", None, b"[DONE]"),
+    ]
+
+
+@pytest.mark.parametrize("split", range(1, len(STREAM)))
+def test_frames_split_at_any_byte(split):
+    # 包括\r\n之间、多字节UTF-8字符中间的切分
+    assert parse([STREAM[:split], STREAM[split:]]) == EXPECTED
+
+
+def test_byte_by_byte():
+    assert parse([STREAM[i:i + 1] for i in range(len(STREAM))]) == EXPECTED
+
+
+def test_last_event_without_blank_line_is_flushed():
+    assert parse([b"data: a\n\ndata: b"]) == [("message", None, None, b"a"), ("message", None, None, b"b")]
+
+
+def test_aiter_json_stops_at_done():
+    async def chunks():
+        for i in range(0, len(STREAM), 7):
+            yield STREAM[i:i + 7]
+        yield b'data: {"answer": "after done"}\n\n'
+
+    async def collect():
+        return [item async for item in aiter_json(chunks())]
+
+    assert asyncio.run(collect()) == [
+        {"answer": "板块"},
+        {"answer": "构造", "is_completion": False},
+        {"answer": "学说"},
+    ]
@@ -5,87 +5,93 @@
 
 import os
 import json
-import time
+import hashlib
 import logging
-from datetime import datetime, timedelta
+from datetime import datetime
 from typing import Dict, Any, Optional, List
 from dotenv import load_dotenv
+from conversation_store import ConversationStore, conversation_store
 
 # 加载环境变量
 load_dotenv()
 
 class ConversationManager:
-    """对话管理器 - 简单的内存存储"""
+    """对话管理器 - 基于有界对话存储（按最后使用时间排序的索引淘汰和清理过期对话，失效条目延迟压缩）"""
     
-    def __init__(self):
-        self.conversations = {}
-        self.cleanup_interval = 3600  # 1小时清理一次
-        self.last_cleanup = time.time()
+    def __init__(self, store: Optional[ConversationStore] = None):
+        self.store = store if store is not None else conversation_store
     
     def store_conversation(self, conversation_id: str, app_id: str, metadata: Dict[str, Any] = None):
         """存储对话信息"""
-        self.conversations[conversation_id] = {
-            'app_id': app_id,
-            'created_at': datetime.now(),
-            'last_used': datetime.now(),
-            'metadata': metadata or {}
-        }
-        self._cleanup_expired()
+        self.store.put(conversation_id, app_id, metadata)
     
     def get_conversation(self, conversation_id: str) -> Optional[Dict[str, Any]]:
-        """获取对话信息"""
-        if conversation_id in self.conversations:
-            # 更新最后使用时间
-            self.conversations[conversation_id]['last_used'] = datetime.now()
-            return self.conversations[conversation_id]
-        return None
+        """获取对话信息（同时更新最后使用时间）"""
+        record = self.store.get(conversation_id)
+        return record.to_dict() if record is not None else None
     
     def update_conversation(self, conversation_id: str, metadata: Dict[str, Any]):
         """更新对话元数据"""
-        if conversation_id in self.conversations:
-            self.conversations[conversation_id]['metadata'].update(metadata)
-            self.conversations[conversation_id]['last_used'] = datetime.now()
+        self.store.update(conversation_id, metadata)
     
     def delete_conversation(self, conversation_id: str):
         """删除对话"""
-        if conversation_id in self.conversations:
-            del self.conversations[conversation_id]
+        self.store.delete(conversation_id)
     
-    def list_conversations(self, limit: int = 50) -> List[Dict[str, Any]]:
-        """列出对话"""
-        conversations = []
-        for conv_id, data in self.conversations.items():
-            conversations.append({
-                'conversation_id': conv_id,
-                'app_id': data['app_id'],
-                'created_at': data['created_at'].isoformat(),
-                'last_used': data['last_used'].isoformat(),
-                'metadata': data['metadata']
-            })
-        
-        # 按最后使用时间排序
-        conversations.sort(key=lambda x: x['last_used'], reverse=True)
-        return conversations[:limit]
+    async def list_conversations(self, limit: int = 50) -> List[Dict[str, Any]]:
+        """列出对话（按最后使用时间倒序）"""
+        return (await self.list_page(limit))['conversations']
     
-    def _cleanup_expired(self):
-        """清理过期的对话"""
-        now = time.time()
-        if now - self.last_cleanup < self.cleanup_interval:
-            return
-        
-        self.last_cleanup = now
-        cutoff_time = datetime.now() - timedelta(days=7)  # 7天过期
+    async def list_page(self, limit: int = 50, cursor: Optional[str] = None,
+                        with_turns: bool = False) -> Dict[str, Any]:
+        """
+        键集分页列出对话（按最后使用时间倒序），只处理本页的条目
         
-        expired_ids = []
-        for conv_id, data in self.conversations.items():
-            if data['last_used'] < cutoff_time:
-                expired_ids.append(conv_id)
+        Args:
+            cursor: 上一页返回的next_cursor
+            with_turns: 是否附带最后一轮问答（尚未载入的消息先在线程中从持久化后端读取）
+        """
+        before = self._decode_cursor(cursor)
+        # 多取一条判断是否还有下一页
+        entries = await self.store.call('list', limit + 1, before)
+        has_more = len(entries) > limit
+        entries = entries[:limit]
+        summaries = {}
+        if with_turns:
+            ids = [conv_id for conv_id, _ in entries]
+            # 整页一次载入、一次调用，不逐条往返
+            await self.store.preload_many(ids)
+            summaries = await self.store.call('turn_summaries', ids)
         
-        for conv_id in expired_ids:
-            del self.conversations[conv_id]
+        conversations = []
+        for conv_id, record in entries:
+            item = {
+                'conversation_id': conv_id,
+                'app_id': record.app_id,
+                'created_at': datetime.fromtimestamp(record.created_at).isoformat(),
+                'last_used': datetime.fromtimestamp(record.last_used).isoformat(),
+                'metadata': dict(record.metadata) if record.has_metadata else {}
+            }
+            if with_turns:
+                item['timestamp'] = item['last_used']
+                item.update(summaries[conv_id])
+            conversations.append(item)
         
-        if expired_ids:
-            logging.info(f"清理了 {len(expired_ids)} 个过期对话")
+        next_cursor = None
+        if has_more and entries:
+            conv_id, record = entries[-1]
+            next_cursor = f"{record.last_used!r}:{conv_id}"
+        return {'conversations': conversations, 'next_cursor': next_cursor, 'has_more': has_more}
+    
+    @staticmethod
+    def _decode_cursor(cursor: Optional[str]) -> Optional[tuple]:
+        if not cursor:
+            return None
+        last_used, _, conv_id = cursor.partition(':')
+        try:
+            return (float(last_used), conv_id)
+        except ValueError:
+            raise ValueError(f"无效的分页游标: {cursor}")
 
 class ResponseFormatter:
     """响应格式化器"""
@@ -261,14 +267,32 @@ class APIEndpointHelper:
             {
                 "path": "/api/chat/history/{conversation_id}",
                 "method": "GET",
-                "description": "获取对话历史",
-                "parameters": ["app_id", "token"]
+                "description": "获取对话历史（本地记录，按cursor分页，since增量同步，支持ETag/304）",
+                "parameters": ["app_id", "token", "cursor", "limit", "since"]
             },
             {
                 "path": "/api/chat/quick-chat",
                 "method": "POST",
                 "description": "快速对话（自动创建对话并发送消息）",
-                "parameters": ["app_id", "message", "stream", "token"]
+                "parameters": ["app_id", "message", "stream", "token", "use_cache"]
+            },
+            {
+                "path": "/api/chat/quick-chat/stream",
+                "method": "POST",
+                "description": "快速流式对话接口（SSE，相同问题的并发请求共享上游流）",
+                "parameters": ["app_id", "message", "token", "use_cache"]
+            },
+            {
+                "path": "/api/chat/stream",
+                "method": "POST",
+                "description": "前端流式聊天接口（SSE）",
+                "parameters": ["message", "conversation_id"]
+            },
+            {
+                "path": "/api/chat/agent-chat/stream",
+                "method": "POST",
+                "description": "智能体流式对话接口（SSE）",
+                "parameters": ["app_id", "message", "conversation_id", "token"]
             },
             {
                 "path": "/api/chat/test",
@@ -310,6 +334,20 @@ def safe_json_loads(text: str, default: Any = None) -> Any:
     except (json.JSONDecodeError, TypeError):
         return default
 
+def make_etag(*parts: Any) -> str:
+    """由决定响应内容的各部分计算强ETag（带引号）"""
+    digest = hashlib.blake2b(repr(parts).encode('utf-8'), digest_size=12).hexdigest()
+    return f'"{digest}"'
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """判断If-None-Match请求头是否匹配当前ETag（按RFC 9110使用弱比较）"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    candidates = [tag.strip() for tag in if_none_match.split(',')]
+    return any((tag[2:] if tag.startswith('W/') else tag) == etag for tag in candidates)
+
 def create_example_env_file():
     """创建示例.env文件"""
     content = """# 百度千帆API配置
@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+"""
+球球Terra压测脚本
+对 /api/chat/* 的每个接口施加并发负载，报告吞吐量和 p50/p95/p99 延迟（流式接口另报首字节时间）
+
+配合本地千帆模拟服务使用，不消耗真实配额：
+    python backend/mock_qianfan_server.py --port 8900
+    cd backend && QIANFAN_API_BASE_URL=http://127.0.0.1:8900 python main.py
+    python load_test.py --concurrency 32 --requests 500
+
+或由脚本自动启动模拟服务和后端：
+    python load_test.py --spawn --concurrency 32 --requests 500
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import math
+import os
+import subprocess
+import sys
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+import aiohttp
+
+from test_integration import TerraIntegrationTest, TEST_CONFIG, backend_dir
+
+LANDMARK_PROMPTS = [
+    "告诉我北京的历史和文化",
+    "上海是如何成为国际金融中心的？",
+    "维多利亚瀑布如何形成？",
+    "塞伦盖蒂大迁徙是什么？",
+    "什么是板块构造？",
+    "火山是如何形成的？"
+]
+
+ALL_ROUTES = [
+    "chat", "conversation", "message", "history", "quick-chat", "quick-chat-stream",
+    "agent-chat", "stream", "agent-chat-stream", "test", "stats"
+]
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """最近秩法分位数"""
+    if not sorted_values:
+        return 0.0
+    rank = min(len(sorted_values) - 1, max(0, math.ceil(q * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+
+class RouteResult:
+    """单个接口的压测结果"""
+
+    def __init__(self, name: str, method: str, path: str):
+        self.name = name
+        self.method = method
+        self.path = path
+        self.latencies: List[float] = []
+        self.first_bytes: List[float] = []
+        self.statuses = Counter()
+        self.failures = 0
+        self.elapsed = 0.0
+
+    def record(self, status: int, latency: float, first_byte: Optional[float], ok: bool):
+        self.statuses[status] += 1
+        self.latencies.append(latency)
+        if first_byte is not None:
+            self.first_bytes.append(first_byte)
+        if not ok:
+            self.failures += 1
+
+    def summary(self) -> Dict[str, Any]:
+        latencies = sorted(self.latencies)
+        first_bytes = sorted(self.first_bytes)
+        total = len(latencies)
+        result = {
+            "route": f"{self.method} {self.path}",
+            "requests": total,
+            "failures": self.failures,
+            "statuses": dict(self.statuses),
+            "throughput": round(total / self.elapsed, 2) if self.elapsed else 0.0,
+            "p50_ms": round(percentile(latencies, 0.50) * 1000, 1),
+            "p95_ms": round(percentile(latencies, 0.95) * 1000, 1),
+            "p99_ms": round(percentile(latencies, 0.99) * 1000, 1)
+        }
+        if first_bytes:
+            result["ttfb_p50_ms"] = round(percentile(first_bytes, 0.50) * 1000, 1)
+            result["ttfb_p95_ms"] = round(percentile(first_bytes, 0.95) * 1000, 1)
+        return result
+
+
+class TerraLoadTest(TerraIntegrationTest):
+    """在集成测试基础上的并发压测"""
+
+    def __init__(self, backend_url: str, concurrency: int = 16, requests_per_route: int = 200,
+                 hot_messages: int = 0):
+        """
+        Args:
+            backend_url: 后端地址
+            concurrency: 每个接口的并发请求数
+            requests_per_route: 每个接口的请求总数
+            hot_messages: 大于0时消息在这么多个固定问题中循环（模拟热门地标），否则每条消息都不同
+        """
+        super().__init__(backend_url)
+        self.concurrency = concurrency
+        self.requests_per_route = requests_per_route
+        self.hot_messages = hot_messages
+        self.conversation_ids: List[str] = []
+        self._counter = itertools.count()
+
+    async def setup(self):
+        """初始化压测会话（连接数与并发数一致）"""
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.concurrency * 2, limit_per_host=self.concurrency * 2),
+            timeout=aiohttp.ClientTimeout(total=180)
+        )
+        print("🚀 初始化压测环境...")
+
+    def next_message(self) -> str:
+        index = next(self._counter)
+        if self.hot_messages > 0:
+            return LANDMARK_PROMPTS[index % min(self.hot_messages, len(LANDMARK_PROMPTS))]
+        return f"{LANDMARK_PROMPTS[index % len(LANDMARK_PROMPTS)]}（压测 #{index}）"
+
+    async def prepare_conversations(self, count: int):
+        """为发送消息和历史接口预先创建对话"""
+        for _ in range(count):
+            async with self.session.post(f'{self.backend_url}/api/chat/conversation', json={}) as response:
+                data = await response.json()
+                conversation_id = (data.get('data') or {}).get('conversation_id')
+                if not conversation_id:
+                    raise RuntimeError(f"预创建对话失败: {data}")
+                self.conversation_ids.append(conversation_id)
+
+        # 历史接口需要对话中已有消息
+        for conversation_id in self.conversation_ids:
+            async with self.session.post(f'{self.backend_url}/api/chat/message', json={
+                "conversation_id": conversation_id,
+                "message": self.next_message()
+            }) as response:
+                await response.read()
+
+    def build_request(self, route: str, index: int) -> Dict[str, Any]:
+        """生成某个接口第index次请求的方法、路径和请求体"""
+        conversation_id = self.conversation_ids[index % len(self.conversation_ids)] if self.conversation_ids else None
+        message = self.next_message()
+        requests = {
+            "chat": ("POST", "/api/chat", {"message": message}, False),
+            "conversation": ("POST", "/api/chat/conversation", {}, False),
+            "message": ("POST", "/api/chat/message", {"conversation_id": conversation_id, "message": message}, False),
+            "history": ("GET", f"/api/chat/history/{conversation_id}", None, False),
+            "quick-chat": ("POST", "/api/chat/quick-chat", {"message": message}, False),
+            "quick-chat-stream": ("POST", "/api/chat/quick-chat/stream", {"message": message}, True),
+            "agent-chat": ("POST", "/api/chat/agent-chat", {"message": message}, False),
+            "stream": ("POST", "/api/chat/stream", {"message": message}, True),
+            "agent-chat-stream": ("POST", "/api/chat/agent-chat/stream", {"message": message}, True),
+            "test": ("GET", "/api/chat/test", None, False),
+            "stats": ("GET", "/api/chat/stats", None, False)
+        }
+        method, path, payload, stream = requests[route]
+        return {"method": method, "path": path, "payload": payload, "stream": stream}
+
+    async def timed_request(self, result: RouteResult, method: str, path: str,
+                            payload: Optional[Dict[str, Any]], stream: bool):
+        """发起一次请求并记录延迟；流式接口读到结束标记为止"""
+        started = time.perf_counter()
+        first_byte = None
+        status = 0
+        ok = False
+        try:
+            async with self.session.request(method, f'{self.backend_url}{path}', json=payload) as response:
+                status = response.status
+                if stream:
+                    body = b''
+                    async for chunk in response.content.iter_any():
+                        if first_byte is None:
+                            first_byte = time.perf_counter() - started
+                        body += chunk
+                    ok = status == 200 and b'data: [DONE]' in body and b'event: error' not in body
+                else:
+                    await response.read()
+                    ok = status == 200
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            status = -1
+        result.record(status, time.perf_counter() - started, first_byte, ok)
+
+    async def run_route(self, route: str) -> RouteResult:
+        """对单个接口施加并发负载"""
+        sample = self.build_request(route, 0)
+        path = "/api/chat/history/{conversation_id}" if route == "history" else sample["path"]
+        result = RouteResult(route, sample["method"], path)
+        indices = iter(range(self.requests_per_route))
+
+        async def worker():
+            for index in indices:
+                request = self.build_request(route, index)
+                await self.timed_request(result, request["method"], request["path"],
+                                         request["payload"], request["stream"])
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(self.concurrency)))
+        result.elapsed = time.perf_counter() - started
+        return result
+
+    async def run_load(self, routes: List[str]) -> List[Dict[str, Any]]:
+        """依次压测各接口并打印报告"""
+        print("🌍 球球Terra - 压测")
+        print("=" * 100)
+        print(f"后端: {self.backend_url}  并发: {self.concurrency}  每接口请求数: {self.requests_per_route}  "
+              f"热门问题数: {self.hot_messages or '不重复'}")
+
+        await self.setup()
+        summaries = []
+        try:
+            if not await self.test_health_check():
+                raise RuntimeError("后端不可用")
+            if {"message", "history"} & set(routes):
+                await self.prepare_conversations(min(self.concurrency, 32))
+
+            print(f"\n{'接口':<36} {'请求':>6} {'失败':>6} {'吞吐(req/s)':>12} "
+                  f"{'p50(ms)':>9} {'p95(ms)':>9} {'p99(ms)':>9} {'首字节p50':>10}")
+            for route in routes:
+                summary = (await self.run_route(route)).summary()
+                summaries.append(summary)
+                ttfb = f"{summary['ttfb_p50_ms']:.1f}" if 'ttfb_p50_ms' in summary else "-"
+                print(f"{summary['route']:<36} {summary['requests']:>6} {summary['failures']:>6} "
+                      f"{summary['throughput']:>12.1f} {summary['p50_ms']:>9.1f} {summary['p95_ms']:>9.1f} "
+                      f"{summary['p99_ms']:>9.1f} {ttfb:>10}")
+                if summary['failures']:
+                    print(f"{'':<4}状态码分布: {summary['statuses']}")
+            print("=" * 100)
+        finally:
+            await self.cleanup()
+        return summaries
+
+
+async def wait_until_ready(url: str, timeout: float = 30.0):
+    """等待服务可访问"""
+    deadline = time.monotonic() + timeout
+    async with aiohttp.ClientSession() as session:
+        while time.monotonic() < deadline:
+            try:
+                async with session.get(url) as response:
+                    if response.status < 500:
+                        return
+            except aiohttp.ClientError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"服务启动超时: {url}")
+
+
+def spawn_services(args) -> List[subprocess.Popen]:
+    """启动千帆模拟服务和指向它的后端"""
+    mock_url = f"http://127.0.0.1:{args.mock_port}"
+    mock = subprocess.Popen([
+        sys.executable, str(backend_dir / 'mock_qianfan_server.py'),
+        "--port", str(args.mock_port),
+        "--runs-latency", args.runs_latency,
+        "--first-chunk-latency", args.first_chunk_latency,
+        "--answer-chars", args.answer_chars
+    ])
+
+    env = dict(os.environ)
+    env.update({
+        "QIANFAN_API_BASE_URL": mock_url,
+        "QIANFAN_TOKEN": env.get("QIANFAN_TOKEN") or "load-test-token",
+        "QIANFAN_APP_ID": env.get("QIANFAN_APP_ID") or "load-test-app",
+        "PORT": str(args.backend_port),
+        "HOST": "127.0.0.1"
+    })
+    backend = subprocess.Popen([sys.executable, "main.py"], cwd=str(backend_dir), env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return [mock, backend]
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="球球Terra压测")
+    parser.add_argument("--backend-url", default=TEST_CONFIG['backend_url'])
+    parser.add_argument("--concurrency", type=int, default=16, help="每个接口的并发数")
+    parser.add_argument("--requests", type=int, default=200, help="每个接口的请求数")
+    parser.add_argument("--routes", nargs="+", default=ALL_ROUTES, choices=ALL_ROUTES, help="要压测的接口")
+    parser.add_argument("--hot-messages", type=int, default=0, help="在N个固定问题中循环（测试缓存与请求合并）")
+    parser.add_argument("--output", help="将结果写入JSON文件")
+    parser.add_argument("--spawn", action="store_true", help="自动启动千帆模拟服务和后端")
+    parser.add_argument("--mock-port", type=int, default=8900)
+    parser.add_argument("--backend-port", type=int, default=8800)
+    parser.add_argument("--runs-latency", default="lognormal:-1.5,0.5", help="模拟服务非流式延迟分布")
+    parser.add_argument("--first-chunk-latency", default="lognormal:-1.8,0.5", help="模拟服务流式首块延迟分布")
+    parser.add_argument("--answer-chars", default="200-600", help="模拟答案长度")
+    args = parser.parse_args()
+
+    processes = []
+    backend_url = args.backend_url
+    if args.spawn:
+        processes = spawn_services(args)
+        backend_url = f"http://127.0.0.1:{args.backend_port}"
+        await wait_until_ready(f"http://127.0.0.1:{args.mock_port}/mock/stats")
+        await wait_until_ready(f"{backend_url}/health")
+
+    try:
+        tester = TerraLoadTest(backend_url, args.concurrency, args.requests, args.hot_messages)
+        summaries = await tester.run_load(args.routes)
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait(timeout=10)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(summaries, f, ensure_ascii=False, indent=2)
+        print(f"📄 结果已写入 {args.output}")
+
+    failed = sum(summary['failures'] for summary in summaries)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
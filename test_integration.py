@@ -41,6 +41,11 @@ class TerraIntegrationTest:
         """清理测试环境"""
         if self.session:
             await self.session.close()
+        try:
+            from qianfan_client import close_shared_session
+            await close_shared_session()
+        except ImportError:
+            pass
         print("🧹 清理测试环境完成")
     
     async def test_health_check(self):
@@ -170,14 +175,14 @@ class TerraIntegrationTest:
             client = create_qianfan_client(token)
             
             # 测试创建对话
-            conversation_result = client.create_conversation(app_id)
+            conversation_result = await client.create_conversation(app_id)
             conversation_id = conversation_result.get('conversation_id')
             
             if conversation_id:
                 print(f"✅ 千帆对话创建成功: {conversation_id[:20]}...")
                 
                 # 测试发送消息
-                message_result = client.send_message(app_id, conversation_id, "你好，请简单介绍一下自己", stream=False)
+                message_result = await client.send_message(app_id, conversation_id, "你好，请简单介绍一下自己", stream=False)
                 
                 if 'answer' in message_result:
                     answer = message_result['answer'][:100] + "..." if len(message_result['answer']) > 100 else message_result['answer']